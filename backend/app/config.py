@@ -167,16 +167,55 @@ class Config:
     API_TITLE: str = "Legal AI Vault MVP"
     API_VERSION: str = "0.1.0"
     
+    # Schema management (`python -m app.migrate`)
+    DB_INIT_ON_STARTUP: bool = os.getenv("DB_INIT_ON_STARTUP", "false").lower() == "true"  # Also run init_db on web startup (local development); deploys run the migrate command before starting
+
     # File Upload
     MAX_FILE_SIZE: int = 5 * 1024 * 1024  # 5 MB
     ALLOWED_EXTENSIONS: List[str] = [".pdf", ".docx", ".txt", ".xlsx"]
     MAX_TOTAL_TEXT_CHARS: int = 2_000_000  # Ограничение суммарного текста
 
+    # Background ingestion pipeline (upload -> parse -> classify -> index)
+    INGESTION_WORKERS_PER_STAGE: int = int(os.getenv("INGESTION_WORKERS_PER_STAGE", "2"))  # Concurrent workers per stage
+    INGESTION_QUEUE_SIZE: int = int(os.getenv("INGESTION_QUEUE_SIZE", "16"))  # Bounded queue between stages (backpressure)
+    INGESTION_MAX_THREADS: int = int(os.getenv("INGESTION_MAX_THREADS", "4"))  # Thread pool for blocking parse/classify/index calls
+
+    # Durable background job queue (analysis, tabular extraction) - table background_jobs
+    JOB_WORKER_IN_PROCESS: bool = os.getenv("JOB_WORKER_IN_PROCESS", "true").lower() == "true"  # Run a job worker inside the web process (Procfile sets false for web: jobs run in the `worker` process)
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))  # Jobs executed concurrently per worker process
+    JOB_CASE_CONCURRENCY: int = int(os.getenv("JOB_CASE_CONCURRENCY", "1"))  # Max running jobs per case across all workers
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "60"))  # Lease renewed by heartbeats; expired jobs are re-claimed
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # Attempts before a job is marked failed
+    JOB_RETRY_BASE_SECONDS: float = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))  # Retry backoff: base * 2^(attempt-1)
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))  # Idle worker poll interval
+    JOB_WAIT_TIMEOUT_SECONDS: int = int(os.getenv("JOB_WAIT_TIMEOUT_SECONDS", "1800"))  # Max time a request waits for a job result (wait=true)
+
+    # Workflow execution (DAG scheduler in ExecutionEngine)
+    WORKFLOW_MAX_PARALLEL_STEPS: int = int(os.getenv("WORKFLOW_MAX_PARALLEL_STEPS", "4"))  # Max steps of one execution running at once
+    WORKFLOW_TOOL_CONCURRENCY: int = int(os.getenv("WORKFLOW_TOOL_CONCURRENCY", "2"))  # Default max concurrent steps per tool
+    WORKFLOW_TOOL_CONCURRENCY_LIMITS: str = os.getenv("WORKFLOW_TOOL_CONCURRENCY_LIMITS", "tabular_review=1")  # Per-tool overrides: "tool=limit,tool=limit"
+
+    # Playbook checks (PlaybookChecker)
+    PLAYBOOK_RULE_CONCURRENCY: int = int(os.getenv("PLAYBOOK_RULE_CONCURRENCY", "4"))  # Rules of one document evaluated at once (LLM calls)
+    PLAYBOOK_DOCUMENT_CONCURRENCY: int = int(os.getenv("PLAYBOOK_DOCUMENT_CONCURRENCY", "3"))  # Documents of a batch checked at once
+
+    # Document parsing executor (PDF/DOCX/XLSX parsing in worker processes)
+    PARSING_USE_PROCESS_POOL: bool = os.getenv("PARSING_USE_PROCESS_POOL", "true").lower() == "true"  # false = parse in the calling thread
+    PARSING_MAX_WORKERS: int = int(os.getenv("PARSING_MAX_WORKERS", "0"))  # 0 = os.cpu_count()
+    PARSING_TIMEOUT_SECONDS: float = float(os.getenv("PARSING_TIMEOUT_SECONDS", "120"))  # Per-file (or per page batch) parsing timeout
+    PARSING_MEMORY_LIMIT_MB: int = int(os.getenv("PARSING_MEMORY_LIMIT_MB", "1024"))  # Address space limit per worker process, 0 = unlimited
+    PARSING_PAGE_PARALLEL_THRESHOLD: int = int(os.getenv("PARSING_PAGE_PARALLEL_THRESHOLD", "40"))  # PDFs with more pages are split across workers
+    PARSING_PAGES_PER_TASK: int = int(os.getenv("PARSING_PAGES_PER_TASK", "20"))  # Minimum pages per worker task for large PDFs
+
     # LLM context limits
     MAX_CONTEXT_CHARS: int = 60_000  # Приближённо к лимиту ~32k токенов
     
     # RAG Settings
     RAG_USE_RERANKER: bool = os.getenv("RAG_USE_RERANKER", "false").lower() == "true"  # Use cross-encoder reranker for relevance scoring
+    RERANK_MAX_LENGTH: int = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # Max tokens per (query, chunk) pair; longer chunks are truncated
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", "32"))  # Pairs per cross-encoder forward pass
+    RERANK_SCORE_CACHE_SIZE: int = int(os.getenv("RERANK_SCORE_CACHE_SIZE", "20000"))  # LRU size of the (query, chunk) score cache
+    RERANK_ONNX_MODEL_DIR: str = os.getenv("RERANK_ONNX_MODEL_DIR", "")  # Dir with (quantized) ONNX cross-encoder + tokenizer.json; empty = sentence-transformers
     RAG_MIN_RELEVANCE_SCORE: float = float(os.getenv("RAG_MIN_RELEVANCE_SCORE", "0.5"))  # Minimum relevance score threshold
     RAG_LLM_EVALUATION_ENABLED: bool = os.getenv("RAG_LLM_EVALUATION_ENABLED", "true").lower() == "true"  # Enable LLM-based relevance evaluation
     RAG_REQUIRE_SOURCES: bool = os.getenv("RAG_REQUIRE_SOURCES", "true").lower() == "true"  # Require source citations in answers
@@ -195,6 +234,10 @@ class Config:
     CITATION_MIN_INDEPENDENT_SOURCES: int = int(os.getenv("CITATION_MIN_INDEPENDENT_SOURCES", "1"))  # Minimum independent sources for verified claim
     CITATION_CHAR_OFFSETS_ENABLED: bool = os.getenv("CITATION_CHAR_OFFSETS_ENABLED", "true").lower() == "true"  # Save char offsets for new documents
     
+    # Document Classification Settings
+    LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD: float = float(os.getenv("LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD", "0.85"))  # Below this local confidence, escalate to LLM
+    CLASSIFICATION_CACHE_TTL_SECONDS: int = int(os.getenv("CLASSIFICATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))  # Cache classification by content hash (7 days)
+    
     # Multi-Agent System Settings
     AGENT_ENABLED: bool = os.getenv("AGENT_ENABLED", "true").lower() == "true"
     AGENT_MAX_PARALLEL: int = int(os.getenv("AGENT_MAX_PARALLEL", "5"))  # Max parallel agents (increased from 3)
@@ -204,15 +247,23 @@ class Config:
     # Rate Limiting Settings (Phase 4.1)
     RATE_LIMIT_RPS: float = float(os.getenv("RATE_LIMIT_RPS", "2.0"))  # Requests per second to LLM
     RATE_LIMIT_MAX_BUCKET_SIZE: int = int(os.getenv("RATE_LIMIT_MAX_BUCKET_SIZE", "10"))  # Max burst size
-    RATE_LIMIT_CHECK_INTERVAL: float = float(os.getenv("RATE_LIMIT_CHECK_INTERVAL", "0.1"))  # Check interval in seconds
     MAX_PARALLEL_LLM_CALLS: int = int(os.getenv("MAX_PARALLEL_LLM_CALLS", "8"))  # Max concurrent LLM calls
+    LLM_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))  # Token budget per provider (0 = unlimited)
+    LLM_INTERACTIVE_RESERVED_SLOTS: int = int(os.getenv("LLM_INTERACTIVE_RESERVED_SLOTS", "2"))  # Concurrent slots only interactive chat may use
     RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"  # Enable rate limiting
+    HTTP_RATE_LIMIT_ENABLED: bool = os.getenv("HTTP_RATE_LIMIT_ENABLED", "false").lower() == "true"  # Global/per-endpoint HTTP request limits
+    HTTP_RATE_LIMIT_BACKEND: str = os.getenv("HTTP_RATE_LIMIT_BACKEND", "auto")  # auto | redis | postgres | local (auto: redis -> postgres -> local)
+    HTTP_RATE_LIMIT_MAX_KEYS: int = int(os.getenv("HTTP_RATE_LIMIT_MAX_KEYS", "10000"))  # LRU bound for per-process bucket/lease cache
     
     # Cache Settings (Phase 1.2)
     CACHE_TTL_SECONDS: int = int(os.getenv("CACHE_TTL_SECONDS", "3600"))  # Default cache TTL (1 hour)
     CACHE_SEMANTIC_ENABLED: bool = os.getenv("CACHE_SEMANTIC_ENABLED", "false").lower() == "true"  # Enable semantic cache
     CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.85"))  # Similarity threshold for semantic cache
     CACHE_CLEANUP_INTERVAL: int = int(os.getenv("CACHE_CLEANUP_INTERVAL", "3600"))  # How often to clean expired cache (seconds)
+    LLM_RESPONSE_CACHE_ENABLED: bool = os.getenv("LLM_RESPONSE_CACHE_ENABLED", "true").lower() == "true"  # Cache answers of deterministic LLM calls (opt-in per call site)
+    LLM_RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "86400"))  # Default TTL for cached LLM answers (24 hours)
+    LLM_RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "2000"))  # In-process LRU size
+    LLM_RESPONSE_CACHE_PERSISTENT: bool = os.getenv("LLM_RESPONSE_CACHE_PERSISTENT", "true").lower() == "true"  # Shared Postgres tier (llm_response_cache table)
     
     # Human-in-the-loop Settings
     HUMAN_FEEDBACK_TIMEOUT: int = int(os.getenv("HUMAN_FEEDBACK_TIMEOUT", "300"))  # Timeout for human feedback in seconds (default: 5 minutes)
@@ -279,6 +330,9 @@ class Config:
     # Redis for Caching and Presence (Phase 4.1)
     REDIS_URL: Optional[str] = os.getenv("REDIS_URL", None)
     PRESENCE_TTL_SECONDS: int = int(os.getenv("PRESENCE_TTL_SECONDS", "60"))  # TTL for user presence in seconds
+    EVENT_BUS_BACKEND: str = os.getenv("EVENT_BUS_BACKEND", "auto")  # Cross-worker pub/sub: auto, postgres (LISTEN/NOTIFY), redis (pub/sub), memory
+    WEBSOCKET_SEND_QUEUE_SIZE: int = int(os.getenv("WEBSOCKET_SEND_QUEUE_SIZE", "200"))  # Per-connection outgoing queue; overflow drops oldest messages
+    WEBSOCKET_SEND_TIMEOUT_SECONDS: float = float(os.getenv("WEBSOCKET_SEND_TIMEOUT_SECONDS", "10"))  # Slow client is disconnected after this send timeout
     
     # LangGraph Postgres Checkpointer Pool Settings
     LANGGRAPH_POSTGRES_POOL_MAX_SIZE: int = int(os.getenv("LANGGRAPH_POSTGRES_POOL_MAX_SIZE", "20"))  # Max connections in pool
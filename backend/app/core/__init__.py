@@ -37,7 +37,6 @@ from app.core.resilience import (
 
 from app.core.rate_limiter import (
     RateLimiter,
-    RateLimitMiddleware,
     RateLimitExceeded,
     rate_limit,
     get_rate_limiter,
@@ -71,7 +70,6 @@ from app.core.logging import (
     get_logger,
     get_correlation_id,
     set_correlation_id,
-    RequestLoggingMiddleware,
     log_performance,
     setup_logging,
 )
@@ -117,7 +115,6 @@ __all__ = [
     "EXTERNAL_API_RETRY_CONFIG",
     # Rate Limiting
     "RateLimiter",
-    "RateLimitMiddleware",
     "RateLimitExceeded",
     "rate_limit",
     "get_rate_limiter",
@@ -145,7 +142,6 @@ __all__ = [
     "get_logger",
     "get_correlation_id",
     "set_correlation_id",
-    "RequestLoggingMiddleware",
     "log_performance",
     "setup_logging",
     # Lifecycle
@@ -117,8 +117,9 @@ class Container:
             return self._overrides["llm"]
         
         if self._llm is None:
+            from app.config import config
             from app.services.llm_factory import create_llm
-            self._llm = create_llm(temperature=0.0, max_tokens=500)
+            self._llm = create_llm(temperature=0.0, max_tokens=500, cache_ttl=config.LLM_RESPONSE_CACHE_TTL_SECONDS)
             logger.info("LLM initialized")
         
         return self._llm
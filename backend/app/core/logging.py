@@ -4,8 +4,9 @@ Structured Logging - Структурированное логирование
 Предоставляет:
 - Correlation IDs для трейсинга запросов
 - Structured JSON logging
-- Request/Response logging
 - Performance logging
+
+Request/Response logging выполняет app.middleware.request_context.
 """
 from typing import Optional, Dict, Any
 from contextvars import ContextVar
@@ -15,10 +16,6 @@ from functools import wraps
 import logging
 import json
 import time
-import uuid
-
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
 
 
 # =============================================================================
@@ -160,85 +157,6 @@ def get_logger(name: str) -> ContextLogger:
     return ContextLogger(logger, {})
 
 
-# =============================================================================
-# Middleware для логирования запросов
-# =============================================================================
-
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware для логирования HTTP запросов
-    
-    - Генерирует correlation ID
-    - Логирует request/response
-    - Измеряет время выполнения
-    """
-    
-    # Пути без детального логирования
-    SKIP_PATHS = {
-        "/api/health",
-        "/docs",
-        "/redoc",
-        "/openapi.json",
-        "/favicon.ico",
-    }
-    
-    async def dispatch(self, request: Request, call_next):
-        # Пропускаем некоторые пути
-        if request.url.path in self.SKIP_PATHS:
-            return await call_next(request)
-        
-        # Генерируем или извлекаем correlation ID
-        correlation_id = request.headers.get("X-Correlation-ID")
-        if not correlation_id:
-            correlation_id = str(uuid.uuid4())
-        
-        set_correlation_id(correlation_id)
-        
-        # Устанавливаем контекст запроса
-        request_context = {
-            "method": request.method,
-            "path": request.url.path,
-            "query": str(request.query_params) if request.query_params else None,
-            "client_ip": request.client.host if request.client else None,
-        }
-        set_request_context(request_context)
-        
-        # Логируем начало запроса
-        logger = get_logger("http")
-        logger.info(f"→ {request.method} {request.url.path}")
-        
-        # Измеряем время
-        start_time = time.time()
-        
-        try:
-            response = await call_next(request)
-            
-            # Вычисляем время
-            duration_ms = (time.time() - start_time) * 1000
-            
-            # Логируем ответ
-            logger.info(
-                f"← {request.method} {request.url.path} | {response.status_code} | {duration_ms:.2f}ms"
-            )
-            
-            # Добавляем заголовки
-            response.headers["X-Correlation-ID"] = correlation_id
-            response.headers["X-Response-Time"] = f"{duration_ms:.2f}ms"
-            
-            return response
-            
-        except Exception as e:
-            duration_ms = (time.time() - start_time) * 1000
-            logger.error(
-                f"✗ {request.method} {request.url.path} | ERROR | {duration_ms:.2f}ms | {str(e)}"
-            )
-            raise
-        finally:
-            # Очищаем контекст
-            correlation_id_var.set(None)
-            request_context_var.set(None)
-
-
 # =============================================================================
 # Performance Logging Decorator
 # =============================================================================
@@ -5,22 +5,30 @@ Rate Limiter - Ограничение частоты запросов
 - Token Bucket алгоритм
 - Per-user и per-endpoint лимиты
 - Sliding window counter
-- FastAPI middleware
+- Общие между воркерами бакеты (Redis Lua / Postgres upsert) с локальным LRU-кэшем
+
+HTTP-уровень подключён в app.middleware.request_context.
 """
-from typing import Optional, Dict, Any, Callable
+from typing import Optional, Dict, Any, Callable, List, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from functools import wraps
 import asyncio
+import math
 import time
 import logging
 
 from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
 
 logger = logging.getLogger(__name__)
 
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
 
 # =============================================================================
 # Rate Limit Exceeded Exception
@@ -172,70 +180,377 @@ class SlidingWindowCounter:
         return max(0, self.window_size - (time.time() - oldest))
 
 
+# =============================================================================
+# Backends (общее состояние token bucket между воркерами)
+# =============================================================================
+
+class LocalRateLimitBackend:
+    """
+    Token buckets в памяти процесса (тесты, один воркер)
+
+    Бакеты хранятся в LRU: при превышении max_keys вытесняется самый давно
+    использованный, поэтому память - O(активных ключей).
+    """
+
+    name = "local"
+    is_local = True
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def consume(self, key: str, capacity: int, refill_rate: float, tokens: int = 1) -> Tuple[bool, float, float]:
+        """
+        Атомарно списать tokens из бакета key
+
+        Returns:
+            (allowed, remaining, retry_after_seconds)
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.capacity != capacity or bucket.refill_rate != refill_rate:
+            bucket = TokenBucket(capacity=capacity, refill_rate=refill_rate)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+
+        if bucket.consume(tokens):
+            return True, bucket.available_tokens, 0.0
+        return False, bucket.available_tokens, (tokens - bucket.available_tokens) / refill_rate
+
+    def stats(self) -> Dict[str, Any]:
+        return {"keys": len(self._buckets), "max_keys": self.max_keys}
+
+
+class PostgresRateLimitBackend:
+    """
+    Token buckets в таблице rate_limit_buckets
+
+    Пополнение и списание выполняются одним INSERT ... ON CONFLICT DO UPDATE
+    (блокировка строки), поэтому лимит общий для всех воркеров. Строки бакетов,
+    которые успели полностью пополниться, удаляются периодически.
+    """
+
+    name = "postgres"
+    is_local = False
+
+    _REFILL = (
+        "LEAST(:capacity, rate_limit_buckets.tokens + "
+        "EXTRACT(EPOCH FROM clock_timestamp() - rate_limit_buckets.updated_at) * :rate)"
+    )
+    CONSUME_SQL = f"""
+        INSERT INTO rate_limit_buckets (key, tokens, allowed, updated_at, expires_at)
+        VALUES (
+            :key, GREATEST(:capacity - :cost, 0), :capacity >= :cost, clock_timestamp(),
+            clock_timestamp() + make_interval(secs => :capacity / :rate)
+        )
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = CASE WHEN {_REFILL} >= :cost THEN {_REFILL} - :cost ELSE {_REFILL} END,
+            allowed = {_REFILL} >= :cost,
+            updated_at = clock_timestamp(),
+            expires_at = clock_timestamp() + make_interval(secs => :capacity / :rate)
+        RETURNING tokens, allowed
+    """
+    CREATE_SQL = """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key VARCHAR(512) PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            allowed BOOLEAN NOT NULL DEFAULT TRUE,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+            expires_at TIMESTAMPTZ NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_expires_at ON rate_limit_buckets(expires_at);
+    """
+    CLEANUP_SQL = "DELETE FROM rate_limit_buckets WHERE expires_at < clock_timestamp()"
+    # Очистка полностью пополнившихся бакетов раз в N списаний
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from app.utils.database import engine
+        self.engine = engine
+        self._table_ready = False
+        self._calls = 0
+
+    def _ensure_table(self, conn) -> None:
+        if not self._table_ready:
+            conn.exec_driver_sql(self.CREATE_SQL)
+            self._table_ready = True
+
+    def consume(self, key: str, capacity: int, refill_rate: float, tokens: int = 1) -> Tuple[bool, float, float]:
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            self._ensure_table(conn)
+            remaining, allowed = conn.execute(
+                text(self.CONSUME_SQL),
+                {"key": key, "capacity": float(capacity), "rate": float(refill_rate), "cost": float(tokens)},
+            ).one()
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                conn.execute(text(self.CLEANUP_SQL))
+        if allowed:
+            return True, remaining, 0.0
+        return False, remaining, (tokens - remaining) / refill_rate
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self._calls}
+
+
+class RedisRateLimitBackend:
+    """
+    Token buckets в Redis: пополнение и списание атомарно в Lua-скрипте
+
+    Ключ живёт, пока бакет не пополнится полностью (EXPIRE), после чего
+    Redis удаляет его сам.
+    """
+
+    name = "redis"
+    is_local = False
+
+    LUA_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(data[1]) or capacity
+        local ts = tonumber(data[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, redis_url: str, prefix: str = "ratelimit:"):
+        self.client = redis.from_url(redis_url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.LUA_SCRIPT)
+
+    def consume(self, key: str, capacity: int, refill_rate: float, tokens: int = 1) -> Tuple[bool, float, float]:
+        allowed, remaining = self._script(keys=[self.prefix + key], args=[capacity, refill_rate, tokens])
+        remaining = float(remaining)
+        if int(allowed):
+            return True, remaining, 0.0
+        return False, remaining, (tokens - remaining) / refill_rate
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+def create_rate_limit_backend(backend: Optional[str] = None):
+    """Выбрать backend по HTTP_RATE_LIMIT_BACKEND (auto: redis -> postgres -> local)"""
+    from app.config import config
+
+    backend = (backend or config.HTTP_RATE_LIMIT_BACKEND).lower()
+    if backend == "auto":
+        if REDIS_AVAILABLE and config.REDIS_URL:
+            backend = "redis"
+        elif config.DATABASE_URL.startswith("postgres"):
+            backend = "postgres"
+        else:
+            backend = "local"
+
+    if backend == "redis":
+        if not REDIS_AVAILABLE or not config.REDIS_URL:
+            raise ValueError("Redis rate limit backend requires redis package and REDIS_URL")
+        return RedisRateLimitBackend(config.REDIS_URL)
+    if backend == "postgres":
+        return PostgresRateLimitBackend()
+    if backend == "local":
+        return LocalRateLimitBackend(max_keys=config.HTTP_RATE_LIMIT_MAX_KEYS)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
 # =============================================================================
 # Rate Limiter Service
 # =============================================================================
 
+class _Lease:
+    """Локально выданные токены общего бакета или кэшированный отказ"""
+
+    __slots__ = ("tokens", "remaining", "expires_at", "denied_until")
+
+    def __init__(self):
+        self.tokens = 0
+        self.remaining = 0.0
+        self.expires_at = 0.0
+        self.denied_until = 0.0
+
+
 class RateLimiter:
     """
     Сервис rate limiting
-    
+
     Поддерживает:
     - Per-user лимиты
     - Per-endpoint лимиты
     - Глобальные лимиты
-    - Разные стратегии (token bucket, sliding window)
+    - Общее состояние между воркерами (Redis / Postgres backend)
+
+    Все лимиты - token buckets в backend. Чтобы не ходить в общий backend на
+    каждый запрос, из бакета берётся сразу небольшая пачка токенов (lease) и
+    расходуется локально не дольше LEASE_SECONDS; отказ кэшируется до
+    retry_after. Локальный кэш - LRU на max_keys ключей.
     """
-    
-    def __init__(self):
-        # Per-user buckets
-        self._user_buckets: Dict[str, TokenBucket] = {}
-        
-        # Per-endpoint counters
-        self._endpoint_counters: Dict[str, SlidingWindowCounter] = {}
-        
-        # Global counter
-        self._global_counter = SlidingWindowCounter(
-            window_size=60,
-            max_requests=1000
-        )
-        
+
+    # Время жизни локальной пачки токенов (неизрасходованные сгорают)
+    LEASE_SECONDS = 1.0
+    # Размер пачки: доля ёмкости бакета, но не больше MAX_LEASE_TOKENS
+    LEASE_FRACTION = 0.1
+    MAX_LEASE_TOKENS = 10
+
+    def __init__(self, backend=None, max_keys: int = 10000):
+        self.backend = backend or LocalRateLimitBackend(max_keys=max_keys)
+        self.max_keys = max_keys
+        self._leases: "OrderedDict[str, _Lease]" = OrderedDict()
+
+        # Глобальный лимит
+        self._global_config = {
+            "window_size": 60,
+            "max_requests": 1000
+        }
+
         # Конфигурация по умолчанию
         self._default_user_config = {
             "capacity": 20,
             "refill_rate": 2.0
         }
-        
+
         self._default_endpoint_config = {
             "window_size": 60,
             "max_requests": 100
         }
-        
+
         # Кастомная конфигурация для эндпоинтов
         self._endpoint_configs: Dict[str, Dict] = {
             "/api/assistant/chat": {"window_size": 60, "max_requests": 30},
             "/api/v2/assistant/chat": {"window_size": 60, "max_requests": 30},
             "/api/upload": {"window_size": 60, "max_requests": 10},
         }
-    
-    def _get_user_bucket(self, user_id: str) -> TokenBucket:
-        """Получить или создать bucket для пользователя"""
-        if user_id not in self._user_buckets:
-            self._user_buckets[user_id] = TokenBucket(
-                **self._default_user_config
-            )
-        return self._user_buckets[user_id]
-    
-    def _get_endpoint_counter(self, endpoint: str) -> SlidingWindowCounter:
-        """Получить или создать counter для эндпоинта"""
-        if endpoint not in self._endpoint_counters:
-            config = self._endpoint_configs.get(
-                endpoint,
-                self._default_endpoint_config
-            )
-            self._endpoint_counters[endpoint] = SlidingWindowCounter(**config)
-        return self._endpoint_counters[endpoint]
-    
+
+    # -------------------------------------------------------------------------
+    # Token consumption
+    # -------------------------------------------------------------------------
+
+    def _consume_cached(self, key: str, tokens: int) -> Optional[Tuple[bool, float, float]]:
+        """Ответ из локального кэша или None, если нужен backend"""
+        lease = self._leases.get(key)
+        if lease is None:
+            return None
+        self._leases.move_to_end(key)
+        now = time.monotonic()
+        if lease.denied_until > now:
+            return False, 0.0, lease.denied_until - now
+        if lease.expires_at > now and lease.tokens >= tokens:
+            lease.tokens -= tokens
+            return True, lease.remaining + lease.tokens, 0.0
+        return None
+
+    def _consume_remote(self, key: str, capacity: int, refill_rate: float, tokens: int) -> Tuple[bool, float, float]:
+        """Списать токены в backend, забрав остаток пачки в локальный кэш"""
+        lease_size = tokens
+        if not self.backend.is_local:
+            lease_size = max(tokens, min(int(capacity * self.LEASE_FRACTION), self.MAX_LEASE_TOKENS))
+        try:
+            allowed, remaining, retry_after = self.backend.consume(key, capacity, refill_rate, lease_size)
+            if not allowed and lease_size > tokens:
+                lease_size = tokens
+                allowed, remaining, retry_after = self.backend.consume(key, capacity, refill_rate, tokens)
+        except Exception as e:
+            # Недоступность backend не должна ронять API
+            logger.warning(f"Rate limit backend {self.backend.name} failed, allowing request: {e}")
+            return True, float(capacity), 0.0
+
+        if not self.backend.is_local:
+            lease = self._leases.get(key) or _Lease()
+            now = time.monotonic()
+            if allowed:
+                lease.tokens = lease_size - tokens
+                lease.remaining = remaining
+                lease.expires_at = now + self.LEASE_SECONDS
+                lease.denied_until = 0.0
+            else:
+                lease.tokens = 0
+                lease.denied_until = now + retry_after
+            self._leases[key] = lease
+            self._leases.move_to_end(key)
+            while len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+            remaining += lease.tokens
+        return allowed, remaining, retry_after
+
+    def consume(self, key: str, capacity: int, refill_rate: float, tokens: int = 1) -> Tuple[bool, float, float]:
+        """
+        Списать токены из бакета key
+
+        Returns:
+            (allowed, remaining, retry_after_seconds)
+        """
+        cached = self._consume_cached(key, tokens)
+        if cached is not None:
+            return cached
+        return self._consume_remote(key, capacity, refill_rate, tokens)
+
+    async def aconsume(self, key: str, capacity: int, refill_rate: float, tokens: int = 1) -> Tuple[bool, float, float]:
+        """consume без блокировки event loop: обращение к backend - в потоке"""
+        cached = self._consume_cached(key, tokens)
+        if cached is not None:
+            return cached
+        if self.backend.is_local:
+            return self._consume_remote(key, capacity, refill_rate, tokens)
+        return await asyncio.to_thread(self._consume_remote, key, capacity, refill_rate, tokens)
+
+    # -------------------------------------------------------------------------
+    # Limits
+    # -------------------------------------------------------------------------
+
+    def _limits(self, user_id: Optional[str], endpoint: Optional[str]) -> List[Tuple[str, str, int, float]]:
+        """(kind, key, capacity, refill_rate) для глобального, пользовательского и эндпоинт-лимита"""
+        limits = [(
+            "global", "global",
+            self._global_config["max_requests"],
+            self._global_config["max_requests"] / self._global_config["window_size"],
+        )]
+        if user_id:
+            limits.append((
+                "user", f"user:{user_id}",
+                self._default_user_config["capacity"],
+                self._default_user_config["refill_rate"],
+            ))
+        if endpoint:
+            endpoint_config = self._endpoint_configs.get(endpoint, self._default_endpoint_config)
+            limits.append((
+                "endpoint", f"endpoint:{endpoint}",
+                endpoint_config["max_requests"],
+                endpoint_config["max_requests"] / endpoint_config["window_size"],
+            ))
+        return limits
+
+    @staticmethod
+    def _new_info() -> Dict[str, Any]:
+        return {
+            "user_allowed": True,
+            "endpoint_allowed": True,
+            "global_allowed": True,
+        }
+
+    @staticmethod
+    def _apply_result(info: Dict[str, Any], kind: str, result: Tuple[bool, float, float]) -> bool:
+        allowed, remaining, retry_after = result
+        if kind != "global":
+            info[f"{kind}_remaining"] = int(remaining)
+        if not allowed:
+            info[f"{kind}_allowed"] = False
+            info["retry_after"] = int(math.ceil(retry_after)) or 1
+        return allowed
+
     def check_rate_limit(
         self,
         user_id: Optional[str] = None,
@@ -244,59 +559,44 @@ class RateLimiter:
     ) -> tuple[bool, Dict[str, Any]]:
         """
         Проверить rate limit
-        
+
         Args:
             user_id: ID пользователя (опционально)
             endpoint: Путь эндпоинта (опционально)
             tokens: Количество токенов для потребления
-            
+
         Returns:
             (allowed, info) - разрешён ли запрос и информация о лимитах
         """
-        info = {
-            "user_allowed": True,
-            "endpoint_allowed": True,
-            "global_allowed": True,
-        }
-        
-        # Проверяем глобальный лимит
-        if not self._global_counter.record():
-            info["global_allowed"] = False
-            info["retry_after"] = int(self._global_counter.reset_time)
-            return False, info
-        
-        # Проверяем per-user лимит
-        if user_id:
-            bucket = self._get_user_bucket(user_id)
-            if not bucket.consume(tokens):
-                info["user_allowed"] = False
-                info["retry_after"] = int(bucket.time_until_token) + 1
-                info["user_remaining"] = bucket.available_tokens
+        info = self._new_info()
+        for kind, key, capacity, refill_rate in self._limits(user_id, endpoint):
+            if not self._apply_result(info, kind, self.consume(key, capacity, refill_rate, tokens)):
                 return False, info
-            info["user_remaining"] = bucket.available_tokens
-        
-        # Проверяем per-endpoint лимит
-        if endpoint:
-            counter = self._get_endpoint_counter(endpoint)
-            if not counter.record():
-                info["endpoint_allowed"] = False
-                info["retry_after"] = int(counter.reset_time)
-                info["endpoint_remaining"] = counter.remaining
+        return True, info
+
+    async def acheck_rate_limit(
+        self,
+        user_id: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        tokens: int = 1
+    ) -> tuple[bool, Dict[str, Any]]:
+        """check_rate_limit для async-кода (не блокирует event loop)"""
+        info = self._new_info()
+        for kind, key, capacity, refill_rate in self._limits(user_id, endpoint):
+            if not self._apply_result(info, kind, await self.aconsume(key, capacity, refill_rate, tokens)):
                 return False, info
-            info["endpoint_remaining"] = counter.remaining
-        
         return True, info
-    
+
     def get_status(self) -> Dict[str, Any]:
         """Получить статус rate limiter"""
         return {
+            "backend": self.backend.name,
+            "backend_stats": self.backend.stats(),
             "global": {
-                "current": self._global_counter.current_count,
-                "max": self._global_counter.max_requests,
-                "remaining": self._global_counter.remaining
+                "max": self._global_config["max_requests"],
+                "window_seconds": self._global_config["window_size"],
             },
-            "users_tracked": len(self._user_buckets),
-            "endpoints_tracked": len(self._endpoint_counters)
+            "cached_keys": len(self._leases),
         }
 
 
@@ -311,68 +611,12 @@ def get_rate_limiter() -> RateLimiter:
     """Получить глобальный rate limiter"""
     global _rate_limiter
     if _rate_limiter is None:
-        _rate_limiter = RateLimiter()
-    return _rate_limiter
-
-
-# =============================================================================
-# FastAPI Middleware
-# =============================================================================
-
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """
-    FastAPI middleware для rate limiting
-    
-    Пример использования:
-    ```python
-    app.add_middleware(RateLimitMiddleware)
-    ```
-    """
-    
-    # Эндпоинты без rate limiting
-    EXCLUDED_PATHS = {
-        "/api/health",
-        "/docs",
-        "/redoc",
-        "/openapi.json",
-    }
-    
-    async def dispatch(self, request: Request, call_next):
-        # Пропускаем исключённые пути
-        if request.url.path in self.EXCLUDED_PATHS:
-            return await call_next(request)
-        
-        # Получаем user_id из request state (если есть)
-        user_id = None
-        if hasattr(request.state, "user") and request.state.user:
-            user_id = getattr(request.state.user, "id", None)
-        
-        # Проверяем rate limit
-        limiter = get_rate_limiter()
-        allowed, info = limiter.check_rate_limit(
-            user_id=user_id,
-            endpoint=request.url.path
+        from app.config import config
+        _rate_limiter = RateLimiter(
+            backend=create_rate_limit_backend(),
+            max_keys=config.HTTP_RATE_LIMIT_MAX_KEYS,
         )
-        
-        if not allowed:
-            retry_after = info.get("retry_after", 60)
-            logger.warning(
-                f"Rate limit exceeded: user={user_id}, endpoint={request.url.path}"
-            )
-            raise RateLimitExceeded(
-                detail="Too many requests. Please try again later.",
-                retry_after=retry_after
-            )
-        
-        # Добавляем заголовки с информацией о лимитах
-        response = await call_next(request)
-        
-        if "user_remaining" in info:
-            response.headers["X-RateLimit-Remaining"] = str(int(info["user_remaining"]))
-        if "endpoint_remaining" in info:
-            response.headers["X-RateLimit-Endpoint-Remaining"] = str(info["endpoint_remaining"])
-        
-        return response
+    return _rate_limiter
 
 
 # =============================================================================
@@ -382,11 +626,16 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 def rate_limit(
     max_requests: int = 10,
     window_seconds: int = 60,
-    key_func: Optional[Callable[[Request], str]] = None
+    key_func: Optional[Callable[[Request], str]] = None,
+    scope: Optional[str] = None
 ):
     """
     Декоратор для rate limiting на уровне endpoint
     
+    Токены лежат в backend глобального rate limiter (общие между воркерами, LRU)
+    под ключом scope, по умолчанию "<модуль>.<функция>": одинаковым во всех
+    процессах, поэтому лимит у endpoint общий.
+    
     Пример:
     ```python
     @router.post("/api/chat")
@@ -395,8 +644,6 @@ def rate_limit(
         ...
     ```
     """
-    counters: Dict[str, SlidingWindowCounter] = {}
-    
     def get_key(request: Request) -> str:
         if key_func:
             return key_func(request)
@@ -410,26 +657,22 @@ def rate_limit(
         return f"{client_ip}:{user_id}"
     
     def decorator(func: Callable):
+        route_scope = scope or f"{func.__module__}.{func.__qualname__}"
+        
         @wraps(func)
         async def wrapper(request: Request, *args, **kwargs):
-            key = get_key(request)
-            
-            if key not in counters:
-                counters[key] = SlidingWindowCounter(
-                    window_size=window_seconds,
-                    max_requests=max_requests
-                )
-            
-            counter = counters[key]
+            key = f"route:{route_scope}:{get_key(request)}"
+            allowed, _, retry_after = await get_rate_limiter().aconsume(
+                key, max_requests, max_requests / window_seconds
+            )
             
-            if not counter.record():
+            if not allowed:
                 raise RateLimitExceeded(
                     detail=f"Rate limit exceeded. Max {max_requests} requests per {window_seconds}s.",
-                    retry_after=int(counter.reset_time) + 1
+                    retry_after=int(math.ceil(retry_after)) or 1
                 )
             
             return await func(request, *args, **kwargs)
         
         return wrapper
     return decorator
-
@@ -0,0 +1,66 @@
+"""
+Standalone background job worker
+
+    python -m app.job_worker [--concurrency N] [--worker-id ID]
+
+Выполняет задачи из background_jobs (анализ дел, извлечение tabular review)
+вне веб-процесса. При запуске отдельных воркеров в веб-процессе стоит
+выключить встроенный воркер: JOB_WORKER_IN_PROCESS=false (Procfile делает
+это для web).
+
+Изменения ячеек tabular review, записанные задачами, публикуются через
+tabular_event_bus и доходят до клиентов, подключённых к веб-процессам
+(брокер redis/postgres; memory не выходит за пределы процесса).
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import threading
+
+from app.config import config
+from app.core.logging import setup_logging
+from app.services.entity_index import install_entity_index_hooks
+from app.services.job_queue import JobWorker, get_job_queue
+from app.services.relationship_graph import install_relationship_graph_hooks
+from app.services.tabular_event_bus import get_tabular_event_bus, install_session_hooks
+import app.services.job_handlers  # noqa: F401 - регистрирует обработчики
+
+logger = logging.getLogger(__name__)
+
+
+async def run(worker: JobWorker, stop: threading.Event) -> None:
+    bus = get_tabular_event_bus()
+    if bus.broker.name == "memory":
+        logger.warning("Tabular event bus uses the in-process memory broker: "
+                       "cell updates from this worker will not reach web clients")
+    await bus.start()
+    worker.start()
+    try:
+        await asyncio.to_thread(stop.wait)
+    finally:
+        logger.info(f"Stopping job worker {worker.worker_id}")
+        await asyncio.to_thread(worker.stop)
+        await bus.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Background job worker")
+    parser.add_argument("--concurrency", type=int, default=config.JOB_WORKER_CONCURRENCY)
+    parser.add_argument("--worker-id", default=None)
+    args = parser.parse_args()
+
+    setup_logging()
+    install_entity_index_hooks()
+    install_relationship_graph_hooks()
+    install_session_hooks()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    worker = JobWorker(get_job_queue(), worker_id=args.worker_id, concurrency=args.concurrency)
+    asyncio.run(run(worker, stop))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,18 +6,17 @@ from fastapi.responses import FileResponse, JSONResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import ValidationError
 from pathlib import Path
+import asyncio
 import os
 import logging
 import sys
-from datetime import datetime
 from app.config import config
-from app.routes import upload, chat, auth, cases, dashboard, analysis, reports, settings, websocket, tabular_review, prompts, workflows, folders, review_table, assistant_chat, assistant_chat_v2, workflow_execution, plan_execution, metrics, document_editor, playbooks, workflow_agentic, health
-from app.utils.database import init_db
+from app.routes import upload, chat, auth, cases, dashboard, analysis, reports, settings, websocket, tabular_review, prompts, workflows, folders, review_table, assistant_chat, assistant_chat_v2, workflow_execution, plan_execution, metrics, document_editor, playbooks, workflow_agentic, health, jobs
 
 # Core modules
 from app.core.errors import register_exception_handlers
-from app.core.logging import setup_logging, RequestLoggingMiddleware
-from app.core.rate_limiter import RateLimitMiddleware
+from app.core.logging import setup_logging
+from app.middleware.request_context import RequestContextMiddleware
 
 # Configure structured logging
 is_production = os.getenv("ENVIRONMENT", "development") == "production"
@@ -28,14 +27,8 @@ setup_logging(
 
 logger = logging.getLogger(__name__)
 
-# Initialize database on startup
-logger.info("Initializing database...")
-try:
-    init_db()
-    logger.info("Database initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize database: {e}", exc_info=True)
-    raise
+# Схема БД создаётся командой `python -m app.migrate` перед запуском, а не при импорте:
+# импорт приложения не подключается к БД
 
 app = FastAPI(
     title=config.API_TITLE,
@@ -63,77 +56,11 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         }
 )
 
-# Add request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Log all HTTP requests"""
-    start_time = datetime.utcnow()
-    
-    # Skip logging HEAD requests (usually health checks)
-    is_head_request = request.method == "HEAD"
-    
-    if not is_head_request:
-        # Log request
-        logger.info(
-            f"Request: {request.method} {request.url.path}",
-            extra={
-                "method": request.method,
-                "path": request.url.path,
-                "client": request.client.host if request.client else None,
-            }
-        )
-    
-    try:
-        response = await call_next(request)
-        process_time = (datetime.utcnow() - start_time).total_seconds()
-        
-        # Skip logging HEAD requests with 405 (Method Not Allowed is expected for HEAD)
-        if not (is_head_request and response.status_code == 405):
-            # Log response
-            logger.info(
-                f"Response: {request.method} {request.url.path} - {response.status_code} ({process_time:.3f}s)",
-                extra={
-                    "method": request.method,
-                    "path": request.url.path,
-                    "status_code": response.status_code,
-                    "process_time": process_time,
-                }
-            )
-        
-        # Add CSP header at the end to ensure it's not overwritten
-        if "Content-Security-Policy" not in response.headers:
-            csp_policy = (
-                "default-src 'self'; "
-                "script-src 'self' 'unsafe-eval' 'unsafe-inline' https: http:; "
-                "style-src 'self' 'unsafe-inline' https: http: data:; "
-                "img-src 'self' data: blob: https: http:; "
-                "font-src 'self' data: blob: https: http:; "
-                "connect-src 'self' blob: https: http:; "
-                "worker-src 'self' blob:; "
-                "frame-src 'self' https: http:; "
-                "object-src 'self' blob:;"
-            )
-            response.headers["Content-Security-Policy"] = csp_policy
-        return response
-    except Exception as e:
-        process_time = (datetime.utcnow() - start_time).total_seconds()
-        logger.error(
-            f"Error processing request: {request.method} {request.url.path} - {str(e)} ({process_time:.3f}s)",
-            extra={
-                "method": request.method,
-                "path": request.url.path,
-                "error": str(e),
-                "process_time": process_time,
-            },
-            exc_info=True
-        )
-        raise
+# Correlation ID, request logging, metrics, rate limiting and CSP (pure ASGI)
+app.add_middleware(RequestContextMiddleware, rate_limit=config.HTTP_RATE_LIMIT_ENABLED)
 
-# Metrics middleware (tracking request metrics)
-from app.middleware.metrics import MetricsMiddleware
-app.add_middleware(MetricsMiddleware)
-
-# CORS middleware
+# CORS middleware - outermost: add_middleware prepends, so ответы RequestContextMiddleware
+# (в т.ч. 429 rate limiting) тоже получают CORS-заголовки и читаются браузером
 app.add_middleware(
     CORSMiddleware,
     allow_origins=config.CORS_ORIGINS,
@@ -142,27 +69,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# CSP middleware to allow unsafe-eval for docx-preview (runs after all other middleware)
-@app.middleware("http")
-async def add_csp_header(request: Request, call_next):
-    """Add Content-Security-Policy header to allow unsafe-eval for docx-preview library"""
-    response = await call_next(request)
-    # Force set CSP header (overwrite if exists) to ensure docx-preview works
-    # More permissive CSP to allow docx-preview and other libraries to work
-    csp_policy = (
-        "default-src 'self'; "
-        "script-src 'self' 'unsafe-eval' 'unsafe-inline' https: http:; "
-        "style-src 'self' 'unsafe-inline' https: http: data:; "
-        "img-src 'self' data: blob: https: http:; "
-        "font-src 'self' data: blob: https: http:; "
-        "connect-src 'self' blob: https: http:; "
-        "worker-src 'self' blob:; "
-        "frame-src 'self' https: http:; "
-        "object-src 'self' blob:;"
-    )
-    response.headers["Content-Security-Policy"] = csp_policy
-    return response
-
 # API routes - MUST be registered BEFORE any catch-all routes
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["dashboard"])
@@ -190,11 +96,110 @@ app.include_router(document_editor.router, prefix="/api/documents-editor", tags=
 app.include_router(playbooks.router, prefix="/api", tags=["playbooks"])
 # Health endpoints (includes detailed health checks and metrics)
 app.include_router(health.router, tags=["health"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
 
 # Register custom exception handlers
 register_exception_handlers(app)
 
 
+@app.on_event("startup")
+async def initialize_database():
+    """Local development: create missing tables on startup (DB_INIT_ON_STARTUP=true)"""
+    if not config.DB_INIT_ON_STARTUP:
+        return
+    from app.utils.database import init_db
+    logger.info("Initializing database...")
+    await asyncio.to_thread(init_db)
+    logger.info("Database initialized successfully")
+
+
+@app.on_event("startup")
+async def start_ingestion_pipeline():
+    """Start the background ingestion pipeline and resume abandoned upload jobs"""
+    from app.services.ingestion_pipeline import get_ingestion_pipeline
+    try:
+        await get_ingestion_pipeline().resume_pending()
+    except Exception as e:
+        logger.warning(f"Failed to resume pending ingestion jobs: {e}", exc_info=True)
+
+
+@app.on_event("shutdown")
+async def stop_ingestion_pipeline():
+    """Stop ingestion workers; unfinished files are resumed on next start"""
+    from app.services.ingestion_pipeline import get_ingestion_pipeline
+    await get_ingestion_pipeline().stop()
+
+
+@app.on_event("startup")
+async def start_job_worker():
+    """Run queued analysis/extraction jobs in this process (unless a standalone worker is deployed)"""
+    if not config.JOB_WORKER_IN_PROCESS:
+        return
+    from app.services.job_queue import get_job_worker
+    try:
+        get_job_worker().start()
+    except Exception as e:
+        logger.warning(f"Failed to start in-process job worker: {e}", exc_info=True)
+
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    """Stop claiming jobs; a job still running is re-claimed after its lease expires"""
+    if not config.JOB_WORKER_IN_PROCESS:
+        return
+    from app.services.job_queue import get_job_worker
+    await asyncio.to_thread(get_job_worker().stop, 5)
+
+
+@app.on_event("startup")
+async def install_entity_index():
+    """Keep entity_postings and the relationship graph in sync with entity/node/edge changes"""
+    from app.services.entity_index import install_entity_index_hooks
+    from app.services.relationship_graph import install_relationship_graph_hooks
+    install_entity_index_hooks()
+    install_relationship_graph_hooks()
+
+
+@app.on_event("startup")
+async def start_tabular_event_bus():
+    """Publish tabular review changes on commit and push them to WebSocket subscribers"""
+    from app.services.tabular_event_bus import get_tabular_event_bus, install_session_hooks
+    install_session_hooks()
+    try:
+        await get_tabular_event_bus().start()
+    except Exception as e:
+        logger.warning(f"Failed to start tabular event bus: {e}", exc_info=True)
+
+
+@app.on_event("shutdown")
+async def stop_tabular_event_bus():
+    from app.services.tabular_event_bus import get_tabular_event_bus
+    await get_tabular_event_bus().stop()
+
+
+@app.on_event("startup")
+async def start_websocket_broadcast():
+    """Relay WebSocket broadcasts between uvicorn workers"""
+    from app.services.websocket_manager import websocket_manager
+    try:
+        await websocket_manager.start()
+    except Exception as e:
+        logger.warning(f"Failed to start WebSocket broadcast, delivering per worker only: {e}", exc_info=True)
+
+
+@app.on_event("shutdown")
+async def stop_websocket_broadcast():
+    from app.services.websocket_manager import websocket_manager
+    await websocket_manager.stop()
+
+
+@app.on_event("shutdown")
+async def stop_parsing_executor():
+    """Terminate document parsing worker processes"""
+    from app.services.parsing_executor import get_parsing_executor
+    await asyncio.to_thread(get_parsing_executor().shutdown)
+
+
 # Debug endpoint to check routes
 @app.api_route("/api/debug/routes", methods=["GET"])
 async def debug_routes():
@@ -2,9 +2,7 @@
 
 Provides request tracking, LLM call metrics, and Prometheus integration.
 """
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-import time
+import bisect
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
@@ -15,12 +13,14 @@ logger = logging.getLogger(__name__)
 try:
     from app.services.metrics.prometheus_exporter import (
         get_metrics_collector,
+        HTTP_REQUEST_LATENCY,
         PROMETHEUS_AVAILABLE
     )
     HAS_PROMETHEUS = PROMETHEUS_AVAILABLE
 except ImportError:
     HAS_PROMETHEUS = False
     get_metrics_collector = None
+    HTTP_REQUEST_LATENCY = None
 
 # Try to import rate limiter stats
 try:
@@ -30,10 +30,16 @@ except ImportError:
     HAS_RATE_LIMITER = False
     get_rate_limit_stats = None
 
+# Границы бакетов длительности запросов (как у http_request_latency_seconds);
+# avg и p95 считаются по бакетам, без хранения сырых значений
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
 # Simple in-memory metrics storage
 _metrics_store = {
     "request_count": 0,
-    "request_durations": [],
+    "request_duration_buckets": [0] * (len(DURATION_BUCKETS) + 1),
+    "request_duration_sum": 0.0,
+    "request_duration_count": 0,
     "error_count": 0,
     "llm_calls": 0,
     "llm_total_duration": 0.0,
@@ -43,36 +49,40 @@ _metrics_store = {
 }
 
 
-class MetricsMiddleware(BaseHTTPMiddleware):
-    """Middleware for tracking request metrics with Prometheus integration."""
-    
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # Track request
-        _metrics_store["request_count"] += 1
-        
-        try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            # Track duration (keep last 1000 requests)
-            _metrics_store["request_durations"].append(process_time)
-            if len(_metrics_store["request_durations"]) > 1000:
-                _metrics_store["request_durations"] = _metrics_store["request_durations"][-1000:]
-            
-            # Add timing header
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            # Log slow requests
-            if process_time > 5.0:
-                logger.warning(f"Slow request: {request.method} {request.url.path} took {process_time:.2f}s")
-            
-            return response
-        except Exception as e:
-            _metrics_store["error_count"] += 1
-            logger.error(f"Request error: {request.method} {request.url.path}: {e}", exc_info=True)
-            raise
+def record_request(
+    duration: float,
+    error: bool = False,
+    method: Optional[str] = None,
+    route: Optional[str] = None,
+    status: Optional[int] = None
+) -> None:
+    """Track HTTP request metrics (called by RequestContextMiddleware)."""
+    _metrics_store["request_count"] += 1
+    if route is not None and HTTP_REQUEST_LATENCY is not None:
+        HTTP_REQUEST_LATENCY.labels(
+            method=method or "",
+            route=route,
+            status=str(status) if status is not None else ("error" if error else "")
+        ).observe(duration)
+    if error:
+        _metrics_store["error_count"] += 1
+        return
+
+    _metrics_store["request_duration_buckets"][bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+    _metrics_store["request_duration_sum"] += duration
+    _metrics_store["request_duration_count"] += 1
+
+
+def _duration_quantile(q: float) -> float:
+    """Верхняя граница бакета, в который попадает квантиль q"""
+    buckets = _metrics_store["request_duration_buckets"]
+    target = q * _metrics_store["request_duration_count"]
+    cumulative = 0
+    for index, count in enumerate(buckets):
+        cumulative += count
+        if cumulative >= target:
+            return DURATION_BUCKETS[min(index, len(DURATION_BUCKETS) - 1)]
+    return DURATION_BUCKETS[-1]
 
 
 def track_llm_call(
@@ -133,9 +143,9 @@ def track_agent_execution(
 
 def get_metrics() -> Dict[str, Any]:
     """Get current metrics including Prometheus and rate limiter stats."""
-    durations = _metrics_store["request_durations"]
-    avg_duration = sum(durations) / len(durations) if durations else 0.0
-    p95_duration = sorted(durations)[int(len(durations) * 0.95)] if len(durations) > 20 else 0.0
+    duration_count = _metrics_store["request_duration_count"]
+    avg_duration = _metrics_store["request_duration_sum"] / duration_count if duration_count else 0.0
+    p95_duration = _duration_quantile(0.95) if duration_count > 20 else 0.0
     
     # Calculate agent stats
     agent_stats = {}
@@ -200,7 +210,9 @@ def reset_metrics():
     global _metrics_store
     _metrics_store = {
         "request_count": 0,
-        "request_durations": [],
+        "request_duration_buckets": [0] * (len(DURATION_BUCKETS) + 1),
+        "request_duration_sum": 0.0,
+        "request_duration_count": 0,
         "error_count": 0,
         "llm_calls": 0,
         "llm_total_duration": 0.0,
@@ -0,0 +1,174 @@
+"""Request context middleware (pure ASGI)
+
+Один проход на запрос вместо стека BaseHTTPMiddleware:
+- correlation ID (X-Correlation-ID) и контекст запроса для логов
+- логирование и время обработки (X-Process-Time, X-Response-Time)
+- метрики запросов (app.middleware.metrics) по шаблону маршрута
+- трейс этапов запроса (app.services.metrics.tracing), заголовок Server-Timing
+- rate limiting (app.core.rate_limiter), если включён
+- заголовок Content-Security-Policy
+
+Middleware не оборачивает тело ответа: заголовки дописываются в сообщение
+http.response.start, а чанки тела (SSE, StreamingResponse) передаются
+дальше без буферизации и без дополнительных задач.
+"""
+import logging
+import time
+import uuid
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.logging import correlation_id_var, request_context_var
+from app.core.rate_limiter import get_rate_limiter
+from app.middleware.metrics import record_request
+from app.services.metrics.tracing import finish_trace, get_current_trace, start_trace
+
+logger = logging.getLogger("http")
+
+# CSP, разрешающий unsafe-eval для docx-preview
+CSP_POLICY = (
+    "default-src 'self'; "
+    "script-src 'self' 'unsafe-eval' 'unsafe-inline' https: http:; "
+    "style-src 'self' 'unsafe-inline' https: http: data:; "
+    "img-src 'self' data: blob: https: http:; "
+    "font-src 'self' data: blob: https: http:; "
+    "connect-src 'self' blob: https: http:; "
+    "worker-src 'self' blob:; "
+    "frame-src 'self' https: http:; "
+    "object-src 'self' blob:;"
+)
+
+# Пути без логирования и rate limiting
+SKIP_PATHS = frozenset({
+    "/api/health",
+    "/docs",
+    "/redoc",
+    "/openapi.json",
+    "/favicon.ico",
+})
+
+SLOW_REQUEST_SECONDS = 5.0
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware: correlation ID, timing, metrics, rate limiting and CSP in one pass.
+
+    Пример использования:
+    ```python
+    app.add_middleware(RequestContextMiddleware, rate_limit=True)
+    ```
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        rate_limit: bool = False,
+        csp_policy: Optional[str] = CSP_POLICY,
+    ):
+        self.app = app
+        self.rate_limit = rate_limit
+        self.csp_policy = csp_policy
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+        skip = path in SKIP_PATHS
+
+        correlation_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-correlation-id":
+                correlation_id = value.decode("latin-1")
+                break
+        correlation_id = correlation_id or str(uuid.uuid4())
+
+        client = scope.get("client")
+        correlation_token = correlation_id_var.set(correlation_id)
+        context_token = request_context_var.set({
+            "method": method,
+            "path": path,
+            "query": scope.get("query_string", b"").decode("latin-1") or None,
+            "client_ip": client[0] if client else None,
+        })
+        trace_token = start_trace(correlation_id, scope=scope)
+        start_time = time.perf_counter()
+
+        try:
+            limit_headers = {}
+            if self.rate_limit and not skip and method != "OPTIONS":
+                allowed, info = await get_rate_limiter().acheck_rate_limit(endpoint=path)
+                if not allowed:
+                    logger.warning(f"Rate limit exceeded: endpoint={path}")
+                    response = JSONResponse(
+                        {"detail": "Too many requests. Please try again later."},
+                        status_code=429,
+                        headers={"Retry-After": str(info.get("retry_after", 60))},
+                    )
+                    await response(scope, receive, self._wrap_send(send, correlation_id, start_time, {}))
+                    record_request(time.perf_counter() - start_time, method=method, route="rate_limited", status=429)
+                    return
+                if "endpoint_remaining" in info:
+                    limit_headers["X-RateLimit-Endpoint-Remaining"] = str(info["endpoint_remaining"])
+
+            state = {"status": None, "duration": None}
+            inner_send = self._wrap_send(send, correlation_id, start_time, limit_headers, state)
+            try:
+                await self.app(scope, receive, inner_send)
+            except Exception as e:
+                duration = time.perf_counter() - start_time
+                record_request(duration, error=True, method=method, route=self._route(scope))
+                logger.error(
+                    f"✗ {method} {path} | ERROR | {duration * 1000:.2f}ms | {e}",
+                    exc_info=True,
+                )
+                raise
+
+            # Время до начала ответа: для SSE не включает длительность потока
+            duration = state["duration"] if state["duration"] is not None else time.perf_counter() - start_time
+            record_request(duration, method=method, route=self._route(scope), status=state["status"])
+            if duration > SLOW_REQUEST_SECONDS:
+                logger.warning(f"Slow request: {method} {path} took {duration:.2f}s")
+            # HEAD c 405 - ожидаемый ответ health-check'ов
+            if not skip and method != "HEAD":
+                logger.info(f"← {method} {path} | {state['status']} | {duration * 1000:.2f}ms")
+        finally:
+            finish_trace(trace_token)
+            correlation_id_var.reset(correlation_token)
+            request_context_var.reset(context_token)
+
+    @staticmethod
+    def _route(scope: Scope) -> str:
+        """Шаблон маршрута для меток метрик (сырые пути с ID раздували бы кардинальность)"""
+        route = scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def _wrap_send(self, send: Send, correlation_id: str, start_time: float, extra_headers: dict, state: Optional[dict] = None) -> Send:
+        csp_policy = self.csp_policy
+
+        async def wrapped_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                duration = time.perf_counter() - start_time
+                headers = MutableHeaders(scope=message)
+                headers["X-Correlation-ID"] = correlation_id
+                headers["X-Process-Time"] = str(duration)
+                headers["X-Response-Time"] = f"{duration * 1000:.2f}ms"
+                for name, value in extra_headers.items():
+                    headers[name] = value
+                if csp_policy:
+                    headers["Content-Security-Policy"] = csp_policy
+                trace = get_current_trace()
+                if trace is not None and trace.spans:
+                    headers["Server-Timing"] = trace.server_timing()
+                if state is not None:
+                    state["status"] = message["status"]
+                    state["duration"] = duration
+            await send(message)
+
+        return wrapped_send
@@ -0,0 +1,39 @@
+"""
+Schema management command
+
+    python -m app.migrate
+
+Создаёт недостающие таблицы и колонки (init_db: create_all, ensure_schema,
+таблицы LangGraph checkpointer) и применяет ещё не применённые нумерованные
+SQL-миграции из backend/migrations, начиная с 023 (учёт в schema_migrations).
+Раньше это выполнялось при импорте app.main в каждом воркере; теперь - один
+раз перед запуском приложения (release/start команда деплоя). Для локальной
+разработки можно вернуть запуск на старте веб-процесса: DB_INIT_ON_STARTUP=true.
+
+Миграции до 023 применяются вручную, как и прежде.
+"""
+import logging
+import sys
+import time
+
+from app.core.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    setup_logging()
+    from app.utils.database import init_db
+
+    started = time.perf_counter()
+    try:
+        init_db()
+    except Exception as e:
+        logger.error(f"Database schema migration failed: {e}", exc_info=True)
+        return 1
+    logger.info(f"Database schema is up to date ({time.perf_counter() - started:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 # Models module
 """SQLAlchemy models for Legal AI Vault"""
 
-from app.models.case import Base, Case, ChatMessage, File
+from app.models.case import Base, Case, ChatMessage, File, FileHtmlPage
 from app.models.user import User
 from app.models.analysis import (
     AnalysisResult,
@@ -10,6 +10,7 @@ from app.models.analysis import (
     TimelineEvent,
     DocumentClassification,
     ExtractedEntity,
+    EntityPosting,
     PrivilegeCheck,
     Risk,
     AnalysisPlan,
@@ -35,6 +36,8 @@ from app.models.playbook import (
     CLAUSE_CATEGORIES,
     JURISDICTIONS,
 )
+from app.models.ingestion import IngestionJob, IngestionFile
+from app.models.job import BackgroundJob
 from app.models.workflow import (
     WorkflowDefinition,
     WorkflowExecution,
@@ -51,6 +54,7 @@ __all__ = [
     "Case",
     "ChatMessage",
     "File",
+    "FileHtmlPage",
     "User",
     # Analysis models
     "AnalysisResult",
@@ -59,6 +63,7 @@ __all__ = [
     "TimelineEvent",
     "DocumentClassification",
     "ExtractedEntity",
+    "EntityPosting",
     "PrivilegeCheck",
     "Risk",
     "AnalysisPlan",
@@ -99,4 +104,9 @@ __all__ = [
     "WORKFLOW_CATEGORIES",
     "WORKFLOW_TOOLS",
     "SYSTEM_WORKFLOW_TEMPLATES",
+    # Ingestion
+    "IngestionJob",
+    "IngestionFile",
+    # Background jobs
+    "BackgroundJob",
 ]
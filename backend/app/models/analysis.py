@@ -1,5 +1,5 @@
 """Analysis models for Legal AI Vault"""
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Integer, Date, Float
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Integer, Date, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -107,6 +107,7 @@ class DocumentClassification(Base):
     reasoning = Column(Text, nullable=True)  # Подробное объяснение решения
     needs_human_review = Column(String(10), nullable=False, default="false")  # true/false как строка
     prompt_version = Column(String(20), nullable=True, default="v1")  # Версия промпта
+    classifier = Column(String(20), nullable=True)  # Источник: local, yandex, gigachat, user
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -135,6 +136,22 @@ class ExtractedEntity(Base):
     file = relationship("File")
 
 
+class EntityPosting(Base):
+    """
+    EntityPosting model - инвертированный индекс сущностей дела.
+
+    Одна строка на (нормализованная сущность, файл); обновляется при
+    добавлении/удалении ExtractedEntity (app.services.entity_index).
+    Используется для поиска связанных документов одной SQL-агрегацией.
+    """
+    __tablename__ = "entity_postings"
+
+    case_id = Column(String, ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True)
+    entity_key = Column(String(500), primary_key=True)  # Нормализованный текст сущности
+    file_id = Column(String, ForeignKey("files.id", ondelete="CASCADE"), primary_key=True, index=True)
+    mentions = Column(Integer, nullable=False, default=1)  # Количество упоминаний в файле
+
+
 class PrivilegeCheck(Base):
     """PrivilegeCheck model - stores privilege check results (КРИТИЧНО для e-discovery!)"""
     __tablename__ = "privilege_checks"
@@ -168,8 +185,14 @@ class RelationshipNode(Base):
     properties = Column(JSON, nullable=True)  # Additional properties (title, role, etc.)
     source_document = Column(String(255), nullable=True)  # Source document
     source_page = Column(Integer, nullable=True)
+    degree = Column(Integer, nullable=False, default=0)  # Число рёбер узла (поддерживается app.services.relationship_graph)
+    community = Column(String, nullable=True)  # node_id представителя сообщества (label propagation)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        UniqueConstraint("case_id", "node_id", name="uq_relationship_nodes_case_node"),
+    )
+    
     # Relationships
     case = relationship("Case")
 
@@ -195,6 +218,20 @@ class RelationshipEdge(Base):
     case = relationship("Case")
 
 
+class RelationshipGraphState(Base):
+    """
+    RelationshipGraphState model - версия графа связей дела.
+
+    version увеличивается при каждом добавлении/удалении ребра;
+    communities_version - версия, для которой посчитаны сообщества узлов.
+    """
+    __tablename__ = "relationship_graph_state"
+
+    case_id = Column(String, ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    communities_version = Column(Integer, nullable=False, default=-1)
+
+
 class Risk(Base):
     """Risk model - stores identified risks for a case"""
     __tablename__ = "risks"
@@ -1,5 +1,5 @@
 """SQLAlchemy models for Legal AI Vault"""
-from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, JSON, LargeBinary
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, JSON, LargeBinary, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -80,4 +80,23 @@ class File(Base):
     document_classifications = relationship("DocumentClassification", back_populates="file", cascade="all, delete-orphan")
     extracted_entities = relationship("ExtractedEntity", back_populates="file", cascade="all, delete-orphan")
     privilege_checks = relationship("PrivilegeCheck", back_populates="file", cascade="all, delete-orphan")
+    html_pages = relationship("FileHtmlPage", back_populates="file", cascade="all, delete-orphan", order_by="FileHtmlPage.page_number")
+
+
+class FileHtmlPage(Base):
+    """FileHtmlPage - pre-rendered HTML of one page (PDF) or section (DOCX/TXT/XLSX) of a file"""
+    __tablename__ = "file_html_pages"
+    __table_args__ = (
+        UniqueConstraint('file_id', 'page_number', name='uq_file_html_page'),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    file_id = Column(String, ForeignKey("files.id", ondelete="CASCADE"), nullable=False, index=True)
+    page_number = Column(Integer, nullable=False)  # 1-based
+    html = Column(Text, nullable=False)
+    etag = Column(String(64), nullable=False)  # sha1 содержимого страницы
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    file = relationship("File", back_populates="html_pages")
 
@@ -0,0 +1,89 @@
+"""Ingestion models - background processing of uploaded files"""
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import uuid
+from app.models.case import Base
+
+
+# Стадии обработки файла (в порядке выполнения)
+INGESTION_STAGES = ["received", "parsing", "classifying", "indexing", "done"]
+
+# Статусы файла / задачи
+INGESTION_STATUSES = ["pending", "processing", "completed", "failed"]
+
+
+class IngestionJob(Base):
+    """
+    IngestionJob - фоновая обработка одной загрузки (набора файлов дела).
+
+    Создаётся в момент приёма файлов; parse → classify → chunk/embed/index
+    выполняются пайплайном IngestionPipeline вне HTTP-запроса.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    case_id = Column(String, ForeignKey("cases.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    status = Column(String(50), nullable=False, default="pending")  # pending, processing, completed, failed
+    total_files = Column(Integer, nullable=False, default=0)
+    processed_files = Column(Integer, nullable=False, default=0)  # Успешно обработанные
+    failed_files = Column(Integer, nullable=False, default=0)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    case = relationship("Case")
+    files = relationship("IngestionFile", back_populates="job", cascade="all, delete-orphan")
+
+    def to_dict(self, include_files: bool = True):
+        """Convert to dictionary for API responses"""
+        result = {
+            "id": self.id,
+            "case_id": self.case_id,
+            "status": self.status,
+            "total_files": self.total_files,
+            "processed_files": self.processed_files,
+            "failed_files": self.failed_files,
+            "error_message": self.error_message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+        }
+        if include_files:
+            result["files"] = [f.to_dict() for f in self.files]
+        return result
+
+
+class IngestionFile(Base):
+    """IngestionFile - прогресс обработки одного файла внутри IngestionJob"""
+    __tablename__ = "ingestion_files"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    job_id = Column(String, ForeignKey("ingestion_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    case_id = Column(String, ForeignKey("cases.id", ondelete="CASCADE"), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    file_type = Column(String(50), nullable=False)
+    storage_path = Column(String(512), nullable=False)  # Путь к принятому файлу относительно UPLOAD_DIR
+    stage = Column(String(50), nullable=False, default="received")  # received, parsing, classifying, indexing, done
+    status = Column(String(50), nullable=False, default="pending")  # pending, processing, completed, failed
+    file_id = Column(String, ForeignKey("files.id", ondelete="SET NULL"), nullable=True)  # File, созданный после индексации
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    job = relationship("IngestionJob", back_populates="files")
+
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "stage": self.stage,
+            "status": self.status,
+            "file_id": self.file_id,
+            "error_message": self.error_message,
+        }
@@ -0,0 +1,60 @@
+"""Background job models - durable queue for long-running LLM work"""
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Boolean, JSON
+from sqlalchemy.sql import func
+import uuid
+from app.models.case import Base
+
+
+# Статусы задачи
+JOB_STATUSES = ["queued", "running", "completed", "failed", "cancelled"]
+
+# Терминальные статусы
+JOB_TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class BackgroundJob(Base):
+    """
+    BackgroundJob - задача очереди (анализ дела, извлечение tabular review).
+
+    Воркеры забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED и держат
+    аренду (lease_expires_at), продлевая её heartbeat'ами. Задача упавшего
+    воркера после истечения аренды забирается заново.
+    """
+    __tablename__ = "background_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    job_type = Column(String(100), nullable=False)  # analysis.start, analysis.full, tabular.run_extraction
+    case_id = Column(String, ForeignKey("cases.id", ondelete="CASCADE"), nullable=True, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String(50), nullable=False, default="queued")  # queued, running, completed, failed, cancelled
+    priority = Column(Integer, nullable=False, default=0)  # Больше - раньше
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # Не раньше (backoff ретраев)
+    worker_id = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    result = Column(JSON, nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            "id": self.id,
+            "job_type": self.job_type,
+            "case_id": self.case_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "cancel_requested": self.cancel_requested,
+            "result": self.result,
+            "error_message": self.error_message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
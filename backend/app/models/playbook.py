@@ -312,6 +312,22 @@ class PlaybookCheck(Base):
         return round((passed / total_rules) * 100, 2)
 
 
+class ClauseExtractionCache(Base):
+    """
+    Кэш извлечённых пунктов документа.
+
+    Ключ - (sha256 текста документа, версия ClauseExtractor): повторные
+    проверки того же текста любым playbook не вызывают LLM. При изменении
+    промпта или парсинга меняется версия экстрактора, старые записи не читаются.
+    """
+    __tablename__ = "clause_extraction_cache"
+
+    document_hash = Column(String(64), primary_key=True)
+    extractor_version = Column(String(32), primary_key=True)
+    extraction = Column(JSON, nullable=False)  # ClauseExtractionResult.model_dump()
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 # Константы для типов контрактов
 CONTRACT_TYPES = [
     {"name": "nda", "display_name": "NDA (Соглашение о неразглашении)"},
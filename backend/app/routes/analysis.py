@@ -11,11 +11,13 @@ from app.models.user import User
 from app.models.case import File as FileModel
 from app.models.analysis import (
     AnalysisResult, Discrepancy, TimelineEvent,
-    DocumentClassification, ExtractedEntity, PrivilegeCheck,
-    RelationshipNode, RelationshipEdge
+    DocumentClassification, ExtractedEntity, PrivilegeCheck
 )
 from app.models.case import File
 from app.services.analysis_service import AnalysisService
+from app.services.job_queue import get_job_queue
+from app.services.entity_index import find_related_by_entities
+from app.services.relationship_graph import StaleCursorError, get_communities, get_graph_page, get_neighborhood
 import logging
 
 logger = logging.getLogger(__name__)
@@ -50,7 +52,6 @@ class AnalysisStartRequest(BaseModel):
 async def start_analysis(
     case_id: str,
     request: AnalysisStartRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -76,96 +77,18 @@ async def start_analysis(
         logger.error(f"Ошибка при обновлении статуса дела {case_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ошибка при запуске анализа. Попробуйте позже.")
     
-    # Start analysis in background
-    # Note: We need to create a new DB session inside the background task
-    from app.utils.database import SessionLocal
-    
-    def run_analysis():
-        # Create new DB session for background task
-        background_db = SessionLocal()
-        try:
-            # Reload case in new session
-            background_case = background_db.query(Case).filter(Case.id == case_id).first()
-            if not background_case:
-                logger.error(f"Case {case_id} not found in background task")
-                return
-            
-            analysis_service = AnalysisService(background_db)
-            
-            try:
-                # Use agent system if enabled, otherwise use legacy sequential approach
-                if analysis_service.use_agents:
-                    logger.info(f"Using multi-agent system for case {case_id}")
-                    # Map analysis type names
-                    agent_types = []
-                    for at in request.analysis_types:
-                        if at == "discrepancies":
-                            agent_types.append("discrepancy")
-                        elif at == "risk_analysis":
-                            agent_types.append("risk")
-                        elif at == "document_classifier":
-                            agent_types.append("document_classifier")
-                        elif at == "entity_extraction":
-                            agent_types.append("entity_extraction")
-                        elif at == "privilege_check":
-                            agent_types.append("privilege_check")
-                        else:
-                            agent_types.append(at)
-                    
-                    # Run all analyses through agent coordinator
-                    results = analysis_service.run_agent_analysis(case_id, agent_types)
-                    logger.info(f"Multi-agent analysis completed for case {case_id}, execution time: {results.get('execution_time', 0):.2f}s")
-                else:
-                    # Legacy sequential approach
-                    logger.info(f"Using legacy sequential analysis for case {case_id}")
-                    for analysis_type in request.analysis_types:
-                        logger.info(f"Starting {analysis_type} analysis for case {case_id}")
-                        if analysis_type == "timeline":
-                            analysis_service.extract_timeline(case_id)
-                        elif analysis_type == "discrepancies":
-                            analysis_service.find_discrepancies(case_id)
-                        elif analysis_type == "key_facts":
-                            analysis_service.extract_key_facts(case_id)
-                        elif analysis_type == "summary":
-                            analysis_service.generate_summary(case_id)
-                        elif analysis_type == "risk_analysis":
-                            analysis_service.analyze_risks(case_id)
-                        else:
-                            logger.warning(f"Unknown analysis type: {analysis_type}")
-                
-                # Update case status to completed
-                background_case.status = "completed"
-                if background_case.case_metadata is None:
-                    background_case.case_metadata = {}
-                background_case.case_metadata["analysis_error"] = None
-                background_case.case_metadata["analysis_completed_at"] = datetime.utcnow().isoformat()
-                background_db.commit()
-                logger.info(f"Analysis completed successfully for case {case_id}")
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Ошибка при анализе дела {case_id}: {error_msg}", exc_info=True)
-                
-                # Update case status to failed
-                try:
-                    background_case.status = "failed"
-                    if background_case.case_metadata is None:
-                        background_case.case_metadata = {}
-                    background_case.case_metadata["analysis_error"] = error_msg
-                    background_case.case_metadata["analysis_failed_at"] = datetime.utcnow().isoformat()
-                    background_db.commit()
-                except Exception as commit_error:
-                    background_db.rollback()
-                    logger.error(f"Ошибка при сохранении статуса ошибки для дела {case_id}: {commit_error}", exc_info=True)
-        except Exception as e:
-            logger.error(f"Critical error in background analysis task for case {case_id}: {e}", exc_info=True)
-        finally:
-            background_db.close()
-    
-    background_tasks.add_task(run_analysis)
+    # Analysis runs in a job worker (durable queue, survives web worker restarts)
+    job_id = get_job_queue().enqueue(
+        "analysis.start",
+        {"analysis_types": request.analysis_types},
+        case_id=case_id,
+        user_id=current_user.id
+    )
     
     return {
         "status": "started",
-        "message": f"Анализ запущен для типов: {', '.join(request.analysis_types)}"
+        "message": f"Анализ запущен для типов: {', '.join(request.analysis_types)}",
+        "job_id": job_id
     }
 
 
@@ -383,14 +306,7 @@ async def get_risks(
     }
 
 
-@router.get("/{case_id}/relationship-graph")
-async def get_relationship_graph(
-    case_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get relationship graph for a case"""
-    # Verify case ownership
+def _get_owned_case(db: Session, case_id: str, current_user: User) -> Case:
     case = db.query(Case).filter(
         Case.id == case_id,
         Case.user_id == current_user.id
@@ -398,48 +314,67 @@ async def get_relationship_graph(
     
     if not case:
         raise HTTPException(status_code=404, detail="Дело не найдено")
+    return case
+
+
+@router.get("/{case_id}/relationship-graph")
+async def get_relationship_graph(
+    case_id: str,
+    limit: int = Query(500, ge=1, le=2000, description="Узлов на странице"),
+    cursor: str | None = Query(None, description="next_cursor предыдущей страницы"),
+    min_degree: int = Query(0, ge=0, description="Отсечь узлы с меньшей степенью"),
+    community: str | None = Query(None, description="Только узлы сообщества (раскрытие супер-узла)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get relationship graph for a case, page by page.
     
-    # Get all nodes for this case
-    nodes = db.query(RelationshipNode).filter(
-        RelationshipNode.case_id == case_id
-    ).all()
+    Узлы отдаются по убыванию степени; каждое ребро приходит на странице,
+    где появился последний из его концов. 409 - граф изменился после выдачи
+    cursor, обход нужно начать с первой страницы.
+    """
+    _get_owned_case(db, case_id, current_user)
     
-    # Get all edges for this case
-    edges = db.query(RelationshipEdge).filter(
-        RelationshipEdge.case_id == case_id
-    ).all()
+    try:
+        return get_graph_page(db, case_id, limit=limit, cursor=cursor, min_degree=min_degree, community=community)
+    except StaleCursorError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{case_id}/relationship-graph/neighborhood")
+async def get_relationship_neighborhood(
+    case_id: str,
+    node_id: str = Query(..., description="Центральный узел"),
+    depth: int = Query(1, ge=1, le=3),
+    min_degree: int = Query(0, ge=0),
+    max_nodes: int = Query(500, ge=1, le=2000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Ego graph of depth k around a node"""
+    _get_owned_case(db, case_id, current_user)
     
-    # Format nodes for D3.js
-    formatted_nodes = [
-        {
-            "id": node.node_id,
-            "type": node.node_type,
-            "label": node.node_label,
-            "properties": node.properties if node.properties is not None else {},
-            "source_document": node.source_document,
-            "source_page": node.source_page
-        }
-        for node in nodes
-    ]
-    
-    # Format links for D3.js
-    formatted_links = [
-        {
-            "source": edge.source_node_id,
-            "target": edge.target_node_id,
-            "type": edge.relationship_type,
-            "label": edge.relationship_label,
-            "source_document": edge.source_document,
-            "source_page": edge.source_page,
-            "properties": edge.properties if edge.properties is not None else {}
-        }
-        for edge in edges
-    ]
+    result = get_neighborhood(db, case_id, node_id, depth=depth, min_degree=min_degree, max_nodes=max_nodes)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Узел не найден")
+    return result
+
+
+@router.get("/{case_id}/relationship-graph/communities")
+async def get_relationship_communities(
+    case_id: str,
+    min_size: int = Query(1, ge=1),
+    limit: int = Query(200, ge=1, le=2000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Collapsed graph: one super-node per community"""
+    _get_owned_case(db, case_id, current_user)
     
-    return {
-        "nodes": formatted_nodes,
-        "links": formatted_links
-    }
+    return get_communities(db, case_id, min_size=min_size, limit=limit)
 
 
 class ClassifyRequest(BaseModel):
@@ -808,7 +743,6 @@ async def get_privilege_checks(
 @router.post("/{case_id}/full")
 async def run_full_analysis(
     case_id: str,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -822,50 +756,12 @@ async def run_full_analysis(
     if not case:
         raise HTTPException(status_code=404, detail="Дело не найдено")
     
-    # Start full analysis in background
-    from app.utils.database import SessionLocal
-    
-    def run_full():
-        background_db = SessionLocal()
-        try:
-            background_case = background_db.query(Case).filter(Case.id == case_id).first()
-            if not background_case:
-                return
-            
-            analysis_service = AnalysisService(background_db)
-            
-            if analysis_service.use_agents:
-                # Run all analysis types in correct order
-                all_types = [
-                    "document_classifier",
-                    "privilege_check",
-                    "entity_extraction",
-                    "timeline",
-                    "key_facts",
-                    "discrepancy",
-                    "risk",
-                    "summary"
-                ]
-                results = analysis_service.run_agent_analysis(case_id, all_types)
-                logger.info(f"Full analysis completed for case {case_id}")
-            
-            background_case.status = "completed"
-            background_db.commit()
-        except Exception as e:
-            logger.error(f"Error in full analysis for case {case_id}: {e}", exc_info=True)
-            try:
-                background_case.status = "failed"
-                background_db.commit()
-            except:
-                background_db.rollback()
-        finally:
-            background_db.close()
-    
-    background_tasks.add_task(run_full)
+    job_id = get_job_queue().enqueue("analysis.full", case_id=case_id, user_id=current_user.id)
     
     return {
         "status": "started",
-        "message": "Полный анализ запущен со всеми агентами"
+        "message": "Полный анализ запущен со всеми агентами",
+        "job_id": job_id
     }
 
 
@@ -1238,77 +1134,17 @@ async def get_related_documents(
     if not source_file:
         raise HTTPException(status_code=404, detail="Файл не найден")
     
-    # Get source file entities
-    source_entities = db.query(ExtractedEntity).filter(
-        ExtractedEntity.file_id == file_id,
-        ExtractedEntity.case_id == case_id
-    ).all()
-    
     # Get source file classification
     source_classification = db.query(DocumentClassification).filter(
         DocumentClassification.file_id == file_id,
         DocumentClassification.case_id == case_id
     ).first()
     
-    # Find related documents by shared entities
-    related_files = []
-    file_scores: Dict[str, float] = {}  # Initialize before use in topic matching
-    if source_entities:
-        # Get entity types and values from source file
-        source_entity_types = set(e.entity_type for e in source_entities)
-        source_entity_texts = set(e.text.lower() for e in source_entities)
-        
-        # Find files with shared entities
-        all_entities = db.query(ExtractedEntity).filter(
-            ExtractedEntity.case_id == case_id,
-            ExtractedEntity.file_id != file_id
-        ).all()
-        
-        # Group entities by file_id
-        entities_by_file: Dict[str, List[ExtractedEntity]] = {}
-        for entity in all_entities:
-            if entity.file_id not in entities_by_file:
-                entities_by_file[entity.file_id] = []
-            entities_by_file[entity.file_id].append(entity)
-        
-        # Calculate similarity scores
-        # file_scores already initialized above
-        for file_id, entities in entities_by_file.items():
-            score = 0.0
-            shared_entities = 0
-            
-            for entity in entities:
-                if entity.entity_type in source_entity_types:
-                    score += 0.5
-                if entity.text.lower() in source_entity_texts:
-                    score += 1.0
-                    shared_entities += 1
-            
-            if score > 0:
-                # Normalize score
-                score = min(100, (score / max(len(source_entities), 1)) * 100)
-                file_scores[file_id] = score
-        
-        # Sort by score and get top files
-        sorted_files = sorted(file_scores.items(), key=lambda x: x[1], reverse=True)[:limit]
-        
-        # Get file details
-        for file_id, score in sorted_files:
-            file = db.query(FileModel).filter(FileModel.id == file_id).first()
-            if file:
-                classification = db.query(DocumentClassification).filter(
-                    DocumentClassification.file_id == file_id
-                ).first()
-                
-                related_files.append({
-                    "file_id": file.id,
-                    "filename": file.filename,
-                    "relevance_score": round(score, 1),
-                    "classification": {
-                        "doc_type": classification.doc_type if classification else None,
-                        "relevance_score": classification.relevance_score if classification else 0
-                    } if classification else None
-                })
+    # Find related documents by shared entities (entity_postings, TF-IDF weighted)
+    file_scores: Dict[str, float] = {
+        related.file_id: related.score
+        for related in find_related_by_entities(db, case_id, file_id, limit)
+    }
     
     # Also consider documents with similar topics
     if source_classification and source_classification.key_topics:
@@ -1331,23 +1167,34 @@ async def get_related_documents(
                         topic_scores[classification.file_id] = score
         
         # Add topic-based matches
-        for file_id, score in sorted(topic_scores.items(), key=lambda x: x[1], reverse=True)[:limit]:
-            if file_id not in [f["file_id"] for f in related_files]:
-                file = db.query(FileModel).filter(FileModel.id == file_id).first()
-                if file:
-                    classification = db.query(DocumentClassification).filter(
-                        DocumentClassification.file_id == file_id
-                    ).first()
-                    
-                    related_files.append({
-                        "file_id": file.id,
-                        "filename": file.filename,
-                        "relevance_score": round(score, 1),
-                        "classification": {
-                            "doc_type": classification.doc_type if classification else None,
-                            "relevance_score": classification.relevance_score if classification else 0
-                        } if classification else None
-                    })
+        for related_id, score in sorted(topic_scores.items(), key=lambda x: x[1], reverse=True)[:limit]:
+            file_scores[related_id] = score
+    
+    # Load file details in one query each
+    files_by_id = {
+        f.id: f for f in db.query(FileModel).filter(FileModel.id.in_(list(file_scores))).all()
+    } if file_scores else {}
+    classifications_by_file = {
+        c.file_id: c for c in db.query(DocumentClassification).filter(
+            DocumentClassification.file_id.in_(list(files_by_id))
+        ).all()
+    } if files_by_id else {}
+    
+    related_files = []
+    for related_id, score in file_scores.items():
+        file = files_by_id.get(related_id)
+        if not file:
+            continue
+        classification = classifications_by_file.get(related_id)
+        related_files.append({
+            "file_id": file.id,
+            "filename": file.filename,
+            "relevance_score": round(score, 1),
+            "classification": {
+                "doc_type": classification.doc_type,
+                "relevance_score": classification.relevance_score
+            } if classification else None
+        })
     
     # Sort all related files by relevance score
     related_files.sort(key=lambda x: x["relevance_score"], reverse=True)
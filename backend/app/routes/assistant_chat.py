@@ -20,6 +20,7 @@ from app.services.external_sources.cache_manager import get_cache_manager
 from app.services.langchain_agents.legacy_stubs import PipelineService, PlanningAgent, AdvancedPlanningAgent
 from app.services.langchain_agents.chat_graph_service import ChatGraphService, get_chat_graph_service
 from app.services.thinking_service import get_thinking_service, ThinkingStep
+from app.services.metrics.tracing import trace_sse_stream
 from app.config import config
 import json
 import logging
@@ -31,6 +32,10 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Официальные источники судебной практики для legal_research (ГАРАНТ опрашивается отдельно)
+COURT_PRACTICE_SOURCES = ["vsrf", "kad_arbitr", "pravo_gov", "moyarbitr", "vas_practice"]
+COURT_PRACTICE_SEARCH_DEADLINE = 15.0  # Общий дедлайн поиска по ним (секунды)
+
 # Lazy initialization for services (to allow app startup without Yandex credentials)
 _rag_service = None
 _document_processor = None
@@ -858,6 +863,40 @@ async def stream_chat_response(
             except Exception as garant_error:
                 logger.error(f"[ГАРАНТ] Error searching in ГАРАНТ: {garant_error}", exc_info=True)
         
+        # Судебная практика из официальных источников: опрашиваются параллельно под
+        # общим дедлайном, найденное уходит в UI по мере ответа каждого источника -
+        # зависший kad_arbitr или vsrf не задерживает остальные
+        court_practice_context = ""
+        if legal_research:
+            try:
+                source_router = get_source_router()
+                if source_router.get_source("vsrf") is None:
+                    source_router = initialize_source_router(rag_service=get_rag_service(), register_official_sources=True)
+                practice_results = {}
+                async for source_name, source_results in source_router.search_stream(
+                    query=question,
+                    source_names=COURT_PRACTICE_SOURCES,
+                    max_results_per_source=5,
+                    deadline=COURT_PRACTICE_SEARCH_DEADLINE
+                ):
+                    practice_results[source_name] = source_results
+                    logger.info(f"[SourceRouter] {source_name}: {len(source_results)} results")
+                    if not source_results:
+                        continue
+                    sources_event = {
+                        "type": "sources",
+                        "sources": [
+                            {"title": result.title, "url": result.url}
+                            for results in practice_results.values()
+                            for result in results
+                        ]
+                    }
+                    yield f"data: {json.dumps(sources_event, ensure_ascii=False)}\n\n"
+                aggregated = source_router.aggregate_results(practice_results, max_total=10)
+                court_practice_context = source_router.format_for_llm(aggregated, max_chars=8000)
+            except Exception as practice_error:
+                logger.warning(f"[SourceRouter] Court practice search failed: {practice_error}")
+        
         # Подмешиваем контекст из документов дела (RAG) для вопросов по делу
         rag_context = ""
         rag_docs = []  # Инициализируем для использования в citations
@@ -887,6 +926,8 @@ async def stream_chat_response(
         thinking_context = rag_context or ""
         if garant_context:
             thinking_context += f"\n{garant_context}"
+        if court_practice_context:
+            thinking_context += f"\n{court_practice_context}"
         
         try:
             # Передаем deep_think для выбора режима (GigaChat Pro для глубокого анализа)
@@ -963,6 +1004,11 @@ async def stream_chat_response(
             enhanced_question = f"{enhanced_question}\n\n{garant_context}\n{garant_instructions}"
             logger.info(f"[ChatAgent] Added ГАРАНТ context and instructions to question")
 
+        # Добавляем судебную практику из официальных источников
+        if court_practice_context:
+            enhanced_question = f"{enhanced_question}\n\n=== СУДЕБНАЯ ПРАКТИКА И ОФИЦИАЛЬНЫЕ ИСТОЧНИКИ ===\n{court_practice_context}\n=== КОНЕЦ СУДЕБНОЙ ПРАКТИКИ ===\n"
+            logger.info("[ChatAgent] Added court practice context to question")
+
         # Добавляем RAG контекст по документам дела
         if rag_context:
             enhanced_question = f"{enhanced_question}\n\n=== КОНТЕКСТ ИЗ ДОКУМЕНТОВ ДЕЛА ===\n{rag_context}\n=== КОНЕЦ КОНТЕКСТА ===\n"
@@ -1489,7 +1535,7 @@ async def assistant_chat(
         chat_service = get_chat_graph_service(db, rag_service, document_processor)
         
         return StreamingResponse(
-            chat_service.stream_response(
+            trace_sse_stream(chat_service.stream_response(
                 case_id=case_id,
                 question=question,
                 user=current_user,
@@ -1499,7 +1545,7 @@ async def assistant_chat(
                 document_context=document_context,
                 document_id=document_id,
                 selected_text=selected_text
-            ),
+            )),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
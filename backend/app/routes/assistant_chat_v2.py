@@ -13,6 +13,7 @@ import logging
 from app.utils.database import get_db
 from app.utils.auth import get_current_user
 from app.models.user import User
+from app.services.metrics.tracing import trace_sse_stream
 from app.services.chat import (
     ChatOrchestrator,
     ChatRequest,
@@ -117,7 +118,7 @@ async def assistant_chat_v2(
         orchestrator = get_chat_orchestrator(db)
         
         return StreamingResponse(
-            orchestrator.process_request(chat_request),
+            trace_sse_stream(orchestrator.process_request(chat_request)),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -1,12 +1,14 @@
 """Cases routes for Legal AI Vault"""
+import asyncio
 import logging
 import os
 import time
+import gzip
 import json
-from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File, Request
 from pydantic import BaseModel, Field, field_validator
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 from app.utils.database import get_db
 from app.utils.auth import get_current_user
@@ -14,7 +16,7 @@ from app.models.case import Case, File as FileModel
 from app.models.user import User
 from app.config import config
 from fastapi.responses import Response, StreamingResponse, JSONResponse
-from app.services.langchain_loaders import DocumentLoaderService
+from app.services.parsing_executor import get_parsing_executor
 from app.services.document_classifier_service import DocumentClassifierService
 from app.services.document_processor import DocumentProcessor
 from fastapi import BackgroundTasks
@@ -527,6 +529,9 @@ async def add_files_to_case(
     case_upload_dir = os.path.join(upload_dir, case_id)
     os.makedirs(case_upload_dir, exist_ok=True)
     
+    # Один классификатор на запрос: локальная модель и кэш переиспользуются между файлами
+    classifier_service = None
+    
     try:
         # Process each file
         for file in files:
@@ -563,7 +568,7 @@ async def add_files_to_case(
             
             # Parse file using LangChain loaders
             try:
-                langchain_docs = DocumentLoaderService.load_document(content, filename)
+                langchain_docs = await get_parsing_executor().load_document(content, filename)
                 
                 if not langchain_docs:
                     raise HTTPException(
@@ -583,7 +588,8 @@ async def add_files_to_case(
                 file_classification = None
                 try:
                     logger.info(f"Classifying document: {filename}")
-                    classifier_service = DocumentClassifierService()
+                    if classifier_service is None:
+                        classifier_service = DocumentClassifierService(db=db)
                     classification_result = classifier_service.classify_document(
                         text=text,
                         filename=filename,
@@ -722,7 +728,8 @@ async def add_files_to_case(
                         confidence=str(classification.get("confidence", 0.0)),
                         reasoning=classification.get("reasoning", ""),
                         needs_human_review="true" if classification.get("needs_human_review", False) else "false",
-                        prompt_version="v1"
+                        prompt_version="v1",
+                        classifier=classification.get("classifier")
                     )
                     db.add(doc_classification)
                     logger.info(f"Saved classification for file {file_model.id}: {classification.get('doc_type', 'unknown')}")
@@ -1064,17 +1071,62 @@ async def delete_file_from_case(
         )
 
 
+def _rebuild_case_full_text(case: Case, files: List[FileModel]) -> None:
+    """Пересобрать Case.full_text из текстов файлов"""
+    text_parts = [f"[{file.filename}]\n{file.original_text}" for file in files if file.original_text]
+    if not text_parts:
+        return
+    MAX_TEXT_LENGTH = 100 * 1024 * 1024
+    sanitized_full_text = sanitize_text("\n\n".join(text_parts))
+    if len(sanitized_full_text) > MAX_TEXT_LENGTH:
+        sanitized_full_text = sanitized_full_text[:MAX_TEXT_LENGTH]
+    case.full_text = sanitized_full_text
+
+
+def _reindex_case_incrementally(
+    db: Session,
+    case: Case,
+    document_processor: DocumentProcessor,
+    force: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Инкрементально переиндексировать файлы дела; None если файлов нет"""
+    from app.models.analysis import DocumentClassification
+    from app.services.incremental_indexer import IncrementalIndexer
+    
+    files = db.query(FileModel).filter(FileModel.case_id == case.id).all()
+    if not files:
+        return None
+    
+    file_ids = [f.id for f in files]
+    classifications = db.query(DocumentClassification).filter(
+        DocumentClassification.file_id.in_(file_ids)
+    ).all()
+    classification_map = {c.file_id: c for c in classifications if c.file_id}
+    
+    result = IncrementalIndexer(document_processor).reindex_case(
+        case.id, files, classification_map=classification_map, force=force
+    )
+    
+    # full_text пересобирается, только если набор или содержимое файлов изменились
+    if result["changed"]:
+        _rebuild_case_full_text(case, files)
+        db.commit()
+    return result
+
+
 @router.post("/{case_id}/reindex")
 async def reindex_case_files(
     case_id: str,
+    force: bool = Query(False, description="Переиндексировать все файлы, даже неизменённые"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Reindex all files for a case in PGVector
+    Incrementally reindex the files of a case in PGVector
     
-    This will reindex all files that are not yet in the vector store.
-    Useful for files that were added before automatic indexing was implemented.
+    Only files whose content hash differs from the indexed version are
+    re-split and re-embedded; chunks are upserted by chunk_id, stale chunks
+    and chunks of deleted files are removed. Returns per-file status.
     """
     # Verify case exists and user has access
     case = db.query(Case).filter(
@@ -1085,109 +1137,48 @@ async def reindex_case_files(
     if not case:
         raise HTTPException(status_code=404, detail="Дело не найдено")
     
-    # Get all files for the case
-    files = db.query(FileModel).filter(FileModel.case_id == case_id).all()
-    
-    if not files:
-        raise HTTPException(
-            status_code=400,
-            detail="Нет файлов для переиндексации."
-        )
-    
     try:
-        logger.info(f"Reindexing {len(files)} files for case {case_id}")
-        
-        document_processor = DocumentProcessor()
-        all_documents = []
-        
-        # Get classifications for files
-        from app.models.analysis import DocumentClassification
-        file_ids = [f.id for f in files]
-        classifications = db.query(DocumentClassification).filter(
-            DocumentClassification.file_id.in_(file_ids)
-        ).all() if file_ids else []
-        classification_map = {c.file_id: c for c in classifications if c.file_id}
-        
-        indexed_count = 0
-        for file in files:
-            if not file.original_text:
-                continue
-            
-            # Build metadata
-            metadata = {
-                "source": file.filename,
-                "file_id": file.id,
-                "file_type": file.file_type or "unknown",
-            }
-            
-            # Add classification metadata if available
-            classification = classification_map.get(file.id)
-            if classification:
-                metadata["doc_type"] = classification.doc_type or "other"
-                metadata["is_privileged"] = str(classification.is_privileged) if classification.is_privileged else "false"
-                metadata["relevance_score"] = classification.relevance_score or 0
-            
-            # Split text into chunks
-            file_documents = document_processor.split_documents(
-                text=file.original_text,
-                filename=file.filename,
-                metadata=metadata,
-            )
-            all_documents.extend(file_documents)
-            indexed_count += 1
-        
-        if all_documents:
-            logger.info(f"Storing {len(all_documents)} document chunks in PGVector for case {case_id}")
-            
-            collection_name = document_processor.store_in_vector_db(
-                case_id=case_id,
-                documents=all_documents,
-                db=db,
-                original_files=None
-            )
-            
-            logger.info(f"Successfully reindexed {len(all_documents)} document chunks for case {case_id}")
-        
-        # Update case full_text
-        text_parts = []
-        for file in files:
-            if file.original_text:
-                text_parts.append(f"[{file.filename}]\n{file.original_text}")
-        
-        if text_parts:
-            full_text = "\n\n".join(text_parts)
-            MAX_TEXT_LENGTH = 100 * 1024 * 1024
-            sanitized_full_text = sanitize_text(full_text)
-            if len(sanitized_full_text) > MAX_TEXT_LENGTH:
-                sanitized_full_text = sanitized_full_text[:MAX_TEXT_LENGTH]
-            case.full_text = sanitized_full_text
-            db.commit()
-        
-        return {
-            "status": "success",
-            "message": f"Переиндексировано {indexed_count} файлов ({len(all_documents)} чанков)",
-            "case_id": case_id,
-            "files_indexed": indexed_count,
-            "chunks_created": len(all_documents)
-        }
-        
+        result = await asyncio.to_thread(
+            _reindex_case_incrementally, db, case, DocumentProcessor(), force
+        )
     except Exception as e:
         logger.error(f"Error reindexing case {case_id}: {e}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка при переиндексации: {str(e)}"
         )
+    
+    if result is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Нет файлов для переиндексации."
+        )
+    
+    errors = [f for f in result["files"] if f["status"] == "error"]
+    return {
+        "status": "success" if not errors else "partial",
+        "message": (
+            f"Переиндексировано {result['files_reindexed']} из {len(result['files'])} файлов "
+            f"({result['chunks_embedded']} новых чанков)"
+        ),
+        "case_id": case_id,
+        "files_indexed": result["files_reindexed"],
+        "chunks_created": result["chunks_embedded"],
+        "orphan_chunks_removed": result["orphan_chunks_removed"],
+        "files": result["files"]
+    }
 
 
 @router.post("/reindex-all")
 async def reindex_all_cases(
+    force: bool = Query(False, description="Переиндексировать все файлы, даже неизменённые"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Reindex all files for all cases belonging to the current user.
+    Incrementally reindex all cases belonging to the current user.
     
-    This will reindex all files that are not yet in the vector store.
+    Only changed files are re-embedded (see reindex_case_files).
     """
     # Get all cases for the current user
     cases = db.query(Case).filter(Case.user_id == current_user.id).all()
@@ -1211,75 +1202,19 @@ async def reindex_all_cases(
     
     for case in cases:
         try:
-            # Get all files for the case
-            files = db.query(FileModel).filter(FileModel.case_id == case.id).all()
-            
-            if not files:
+            result = await asyncio.to_thread(
+                _reindex_case_incrementally, db, case, document_processor, force
+            )
+            if result is None:
                 continue
             
-            all_documents = []
-            
-            # Get classifications for files
-            from app.models.analysis import DocumentClassification
-            file_ids = [f.id for f in files]
-            classifications = db.query(DocumentClassification).filter(
-                DocumentClassification.file_id.in_(file_ids)
-            ).all() if file_ids else []
-            classification_map = {c.file_id: c for c in classifications if c.file_id}
-            
-            for file in files:
-                if not file.original_text:
-                    continue
-                
-                # Build metadata
-                metadata = {
-                    "source": file.filename,
-                    "file_id": file.id,
-                    "file_type": file.file_type or "unknown",
-                }
-                
-                # Add classification metadata if available
-                classification = classification_map.get(file.id)
-                if classification:
-                    metadata["doc_type"] = classification.doc_type or "other"
-                    metadata["is_privileged"] = str(classification.is_privileged) if classification.is_privileged else "false"
-                    metadata["relevance_score"] = classification.relevance_score or 0
-                
-                # Split text into chunks
-                file_documents = document_processor.split_documents(
-                    text=file.original_text,
-                    filename=file.filename,
-                    metadata=metadata,
-                )
-                all_documents.extend(file_documents)
-                total_files += 1
-            
-            if all_documents:
-                document_processor.store_in_vector_db(
-                    case_id=case.id,
-                    documents=all_documents,
-                    db=db,
-                    original_files=None
-                )
-                total_chunks += len(all_documents)
-                
-                # Update case full_text
-                text_parts = []
-                for file in files:
-                    if file.original_text:
-                        text_parts.append(f"[{file.filename}]\n{file.original_text}")
-                
-                if text_parts:
-                    full_text = "\n\n".join(text_parts)
-                    MAX_TEXT_LENGTH = 100 * 1024 * 1024
-                    sanitized_full_text = sanitize_text(full_text)
-                    if len(sanitized_full_text) > MAX_TEXT_LENGTH:
-                        sanitized_full_text = sanitized_full_text[:MAX_TEXT_LENGTH]
-                    case.full_text = sanitized_full_text
-                    db.commit()
-            
+            total_files += result["files_reindexed"]
+            total_chunks += result["chunks_embedded"]
             cases_processed += 1
-            logger.info(f"Reindexed case {case.id}: {len(files)} files, {len(all_documents)} chunks")
+            errors.extend(
+                {"case_id": case.id, "file_id": f["file_id"], "error": f["error"]}
+                for f in result["files"] if f["status"] == "error"
+            )
             
         except Exception as e:
             logger.error(f"Error reindexing case {case.id}: {e}", exc_info=True)
@@ -1714,11 +1649,9 @@ async def get_file_html(
         raise HTTPException(status_code=404, detail="Файл не найден")
     
     # Import services
-    from app.services.document_html_cache import DocumentHtmlCacheService
-    from app.services.document_converter_service import DocumentConverterService
+    from app.services.document_html_cache import DocumentHtmlCacheService, html_container_class
     
     cache_service = DocumentHtmlCacheService(db)
-    converter_service = DocumentConverterService()
     
     # Check cache if not forcing refresh
     cached_html = None
@@ -1736,76 +1669,167 @@ async def get_file_html(
             }
         )
     
-    # Need to convert - get file content
-    file_content = None
+    if force_refresh:
+        cache_service.invalidate_cache(file_id)
+    
+    pages = await _render_and_store_html_pages(cache_service, file)
+    html = f'<div class="{html_container_class(file.file_type)}">' + "\n".join(pages) + '</div>'
     
-    # Try to get from file_content field first
+    logger.info(f"Successfully converted file {file_id} to HTML")
+    return JSONResponse(
+        content={
+            "html": html,
+            "cached": False,
+            "file_id": file_id,
+            "filename": file.filename
+        }
+    )
+
+
+def _read_file_content(file: FileModel) -> Optional[bytes]:
+    """Original file bytes from DB or from UPLOAD_DIR (legacy file_path)"""
     if file.file_content:
-        file_content = file.file_content
-    # Fallback to file_path
-    elif file.file_path:
-        import os
-        from app.config import config
-        
-        if os.path.isabs(file.file_path):
-            file_full_path = file.file_path
-        else:
-            file_full_path = os.path.join(config.UPLOAD_DIR, file.file_path)
-        
-        if os.path.exists(file_full_path):
-            try:
-                with open(file_full_path, 'rb') as f:
-                    file_content = f.read()
-            except Exception as e:
-                logger.error(f"Error reading file {file_full_path}: {e}", exc_info=True)
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Ошибка при чтении файла: {str(e)}"
-                )
+        return file.file_content
+    if not file.file_path:
+        return None
+    
+    if os.path.isabs(file.file_path):
+        file_full_path = file.file_path
+    else:
+        file_full_path = os.path.join(config.UPLOAD_DIR, file.file_path)
+    
+    if not os.path.exists(file_full_path):
+        return None
+    try:
+        with open(file_full_path, 'rb') as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"Error reading file {file_full_path}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при чтении файла: {str(e)}"
+        )
+
+
+async def _render_and_store_html_pages(cache_service, file: FileModel) -> List[str]:
+    """
+    Render HTML pages of a file that was not pre-rendered at ingest time
+    
+    Conversion runs in the parsing process pool, so the event loop is not blocked.
+    """
+    from app.services.parsing_executor import get_parsing_executor
     
+    file_content = _read_file_content(file)
     if not file_content:
         raise HTTPException(
             status_code=404,
             detail="Содержимое файла недоступно для конвертации"
         )
     
-    # Convert to HTML
     try:
-        logger.info(f"Converting file {file_id} ({file.filename}) to HTML")
-        html = converter_service.convert_to_html(
-            file_content=file_content,
-            filename=file.filename,
-            file_type=file.file_type
-        )
-        
-        # Cache the result
-        try:
-            cache_service.cache_html(file_id, html)
-        except Exception as cache_error:
-            logger.warning(f"Failed to cache HTML for file {file_id}: {cache_error}")
-            # Continue even if caching fails
-        
-        logger.info(f"Successfully converted file {file_id} to HTML")
-        return JSONResponse(
-            content={
-                "html": html,
-                "cached": False,
-                "file_id": file_id,
-                "filename": file.filename
-            }
-        )
+        logger.info(f"Converting file {file.id} ({file.filename}) to HTML pages")
+        pages = await get_parsing_executor().render_html_pages(file_content, file.filename, file.file_type)
     except ValueError as e:
-        logger.error(f"Conversion error for file {file_id}: {e}", exc_info=True)
+        logger.error(f"Conversion error for file {file.id}: {e}", exc_info=True)
         raise HTTPException(
             status_code=400,
             detail=str(e)
         )
     except Exception as e:
-        logger.error(f"Unexpected error converting file {file_id}: {e}", exc_info=True)
+        logger.error(f"Unexpected error converting file {file.id}: {e}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка при конвертации файла: {str(e)}"
         )
+    
+    try:
+        cache_service.store_pages(file.id, pages)
+    except Exception as cache_error:
+        logger.warning(f"Failed to cache HTML pages for file {file.id}: {cache_error}")
+        # Continue even if caching fails
+    return pages
+
+
+# Ответы меньше этого размера не сжимаются
+HTML_GZIP_MIN_BYTES = 1024
+
+
+@router.get("/{case_id}/files/{file_id}/html/pages")
+async def get_file_html_pages(
+    case_id: str,
+    file_id: str,
+    request: Request,
+    start: int = Query(1, ge=1, description="Первая страница (нумерация с 1)"),
+    limit: int = Query(10, ge=1, le=100, description="Количество страниц"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Response:
+    """
+    Get a range of pre-rendered HTML pages of a file
+    
+    PDF pages map to physical pages, DOCX/TXT to sections, XLSX to sheets.
+    The viewer requests only visible pages; responses carry an ETag
+    (If-None-Match -> 304) and are gzip-compressed when the client accepts it.
+    
+    Returns:
+        JSON with pages [start, start + limit) and total_pages
+    """
+    from app.services.document_html_cache import DocumentHtmlCacheService, html_container_class
+    
+    case = db.query(Case).filter(
+        Case.id == case_id,
+        Case.user_id == current_user.id
+    ).first()
+    if not case:
+        raise HTTPException(status_code=404, detail="Дело не найдено")
+    
+    file = db.query(FileModel).filter(
+        FileModel.id == file_id,
+        FileModel.case_id == case_id
+    ).first()
+    if not file:
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    
+    cache_service = DocumentHtmlCacheService(db)
+    total_pages = cache_service.get_page_count(file_id)
+    if total_pages == 0:
+        # Файлы, загруженные до пререндеринга, конвертируются один раз при первом открытии
+        total_pages = len(await _render_and_store_html_pages(cache_service, file))
+    
+    if start > total_pages:
+        raise HTTPException(
+            status_code=416,
+            detail=f"Страница {start} вне диапазона (всего страниц: {total_pages})"
+        )
+    end = min(start + limit - 1, total_pages)
+    
+    # ETag считается по хешам страниц без загрузки их HTML
+    etag = cache_service.get_page_range_etag(file_id, start, end)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    pages, _ = cache_service.get_pages(file_id, start, end)
+    body = json.dumps({
+        "file_id": file_id,
+        "filename": file.filename,
+        "container_class": html_container_class(file.file_type),
+        "total_pages": total_pages,
+        "start": start,
+        "end": end,
+        "pages": [{"page": number, "html": html} for number, html in pages.items()],
+    }, ensure_ascii=False).encode("utf-8")
+    
+    if len(body) >= HTML_GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", "").lower():
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get("/{case_id}/files/{file_id}/download")
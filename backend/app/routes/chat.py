@@ -619,7 +619,9 @@ async def chat(
         rag_service = get_rag_service()  # Lazy initialization
         if config.RAG_USE_STRUCTURED_OUTPUT:
             # Use structured output with mandatory citations
-            structured_response, sources = rag_service.generate_with_sources_structured(
+            # Поиск, rerank и генерация синхронные - выполняются вне event loop
+            structured_response, sources = await asyncio.to_thread(
+                rag_service.generate_with_sources_structured,
                 case_id=request.case_id,
                 query=request.question,
                 k=5,  # Retrieve top 5 relevant chunks
@@ -630,7 +632,8 @@ async def chat(
             answer = structured_response.answer
         else:
             # Fallback to regular generation
-            answer, sources = rag_service.generate_with_sources(
+            answer, sources = await asyncio.to_thread(
+                rag_service.generate_with_sources,
                 case_id=request.case_id,
                 query=request.question,
                 k=5,  # Retrieve top 5 relevant chunks
@@ -1,4 +1,5 @@
 """Document Editor routes for Legal AI Vault"""
+import asyncio
 import logging
 import re
 from urllib.parse import quote
@@ -472,7 +473,9 @@ async def ai_assist(
                 "suggestions": result.get("suggestions", [])
             }
         else:
-            result = ai_service.ai_assist(
+            # Команды ищут по делу (rerank) и вызывают LLM синхронно - вне event loop
+            result = await asyncio.to_thread(
+                ai_service.ai_assist,
                 command=request.command,
                 selected_text=request.selected_text,
                 case_id=document.case_id,
@@ -0,0 +1,47 @@
+"""Background job routes - status and cancellation of queued work"""
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from app.utils.database import get_db
+from app.utils.auth import get_current_user
+from app.models.user import User
+from app.models.job import BackgroundJob
+from app.services.job_queue import get_job_queue
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _get_user_job(db: Session, job_id: str, user: User) -> BackgroundJob:
+    job = db.query(BackgroundJob).filter(
+        BackgroundJob.id == job_id,
+        BackgroundJob.user_id == user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get job status and result"""
+    return _get_user_job(db, job_id, current_user).to_dict()
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel a queued job or request cancellation of a running one"""
+    job = _get_user_job(db, job_id, current_user)
+    status = get_job_queue().cancel(job.id)
+    if status is None:
+        raise HTTPException(status_code=409, detail=f"Задача уже завершена ({job.status})")
+    return {"id": job.id, "status": status, "cancel_requested": True}
@@ -8,6 +8,7 @@ from app.utils.database import get_db
 from app.utils.auth import get_current_user
 from app.models.user import User
 from app.services.tabular_review_service import TabularReviewService
+from app.config import config
 import logging
 
 logger = logging.getLogger(__name__)
@@ -422,19 +423,49 @@ async def reorder_columns(
 @router.post("/{review_id}/run")
 async def run_extraction(
     review_id: str,
+    wait: bool = Query(True, description="Wait for the job and return its result; false returns job_id immediately"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Run extraction for all documents and columns"""
+    """
+    Run extraction for all documents and columns
+    
+    Extraction is executed by a job worker (durable queue), not inside the
+    request. With wait=true (default) the response is the extraction result,
+    as before; with wait=false it is {"status": "queued", "job_id": ...}.
+    """
+    from app.models.tabular_review import TabularReview
+    from app.services.job_queue import get_job_queue
+    
+    review = db.query(TabularReview).filter(
+        and_(TabularReview.id == review_id, TabularReview.user_id == current_user.id)
+    ).first()
+    if not review:
+        raise HTTPException(status_code=404, detail=f"Tabular review {review_id} not found or access denied")
+    
     try:
-        service = TabularReviewService(db)
-        result = await service.run_extraction(review_id, current_user.id)
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        queue = get_job_queue()
+        job_id = queue.enqueue(
+            "tabular.run_extraction",
+            {"review_id": review_id},
+            case_id=review.case_id,
+            user_id=current_user.id
+        )
+        if not wait:
+            return {"status": "queued", "job_id": job_id}
+        
+        job = await queue.wait_for(job_id, timeout=config.JOB_WAIT_TIMEOUT_SECONDS)
     except Exception as e:
         logger.error(f"Error running extraction: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to run extraction")
+    
+    if job is None or job["status"] in ("failed", "cancelled"):
+        detail = (job or {}).get("error_message") or "Failed to run extraction"
+        raise HTTPException(status_code=500, detail=detail)
+    if job["status"] != "completed":
+        # Задача продолжает выполняться в воркере - клиент может опрашивать /api/jobs/{job_id}
+        return {"status": job["status"], "job_id": job_id}
+    return {**(job["result"] or {}), "job_id": job_id}
 
 
 @router.post("/{review_id}/columns/{column_id}/run")
@@ -1418,25 +1449,10 @@ async def resolve_conflict(
         )
         
         cell.updated_at = datetime.utcnow()
+        # cell_updated рассылается TabularEventBus после commit
         db.commit()
         db.refresh(cell)
         
-        # Broadcast update via WebSocket
-        from app.services.websocket_manager import websocket_manager
-        await websocket_manager.broadcast_to_review(
-            review_id,
-            {
-                "type": "cell_updated",
-                "file_id": file_id,
-                "column_id": column_id,
-                "cell": {
-                    "id": cell.id,
-                    "cell_value": cell.cell_value,
-                    "status": cell.status,
-                }
-            }
-        )
-        
         return {
             "id": cell.id,
             "cell_value": cell.cell_value,
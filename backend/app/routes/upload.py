@@ -1,48 +1,25 @@
 """Upload route for Legal AI Vault"""
+import asyncio
 import logging
 import json
 import os
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional, Dict
+from typing import List, Optional
 from sqlalchemy.orm import Session
-from app.services.langchain_loaders import DocumentLoaderService
-from app.utils.database import get_db
+from app.utils.database import get_db, SessionLocal
 from app.utils.auth import get_current_user
-from app.models.case import Case, File as FileModel
+from app.models.case import Case
+from app.models.ingestion import IngestionJob, IngestionFile
 from app.models.user import User
-from app.services.document_processor import DocumentProcessor
-from app.services.document_classifier_service import DocumentClassifierService
-from langchain_core.documents import Document
+from app.services.ingestion_pipeline import get_ingestion_pipeline, sanitize_text
 from app.config import config
 import uuid
 
 logger = logging.getLogger(__name__)
 
 
-def sanitize_text(text: str) -> str:
-    """
-    Очищает текст от NUL символов и других недопустимых символов для PostgreSQL
-    
-    Args:
-        text: Исходный текст
-        
-    Returns:
-        Очищенный текст без NUL символов
-    """
-    if not text:
-        return text
-    
-    # Удаляем NUL символы (0x00), которые не поддерживаются PostgreSQL
-    # Также заменяем другие недопустимые управляющие символы
-    sanitized = text.replace('\x00', '')
-    
-    # Удаляем другие недопустимые управляющие символы (кроме \n, \r, \t)
-    sanitized = ''.join(char for char in sanitized if ord(char) >= 32 or char in '\n\r\t')
-    
-    return sanitized
-
-
 def _cleanup_uploaded_files(file_paths: List[str]) -> None:
     """
     Удаляет сохранённые файлы с диска при откате транзакции
@@ -70,6 +47,9 @@ def _cleanup_uploaded_files(file_paths: List[str]) -> None:
 
 router = APIRouter()
 
+# Интервал keep-alive SSE и повторной проверки статуса задачи в БД, секунды
+INGESTION_SSE_HEARTBEAT_SECONDS = 15.0
+
 
 class CaseInfoRequest(BaseModel):
     """Request model for case information"""
@@ -119,10 +99,15 @@ async def upload_files(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Upload files and extract text content
+    Upload files for background ingestion
     
     Supports: PDF, DOCX, TXT, XLSX
-    Returns: case_id, num_files, file_names, status, message
+    
+    Files are validated and durably stored, then parsing, classification,
+    chunking, embedding and indexing run in the IngestionPipeline.
+    Progress: GET /api/upload/jobs/{job_id} or SSE /api/upload/jobs/{job_id}/events
+    
+    Returns: case_id, job_id, num_files, file_names, status, message
     """
     if not files:
         raise HTTPException(status_code=400, detail="Не загружено ни одного файла")
@@ -130,10 +115,7 @@ async def upload_files(
     # Validate file extensions
     allowed_extensions = [ext.replace(".", "") for ext in config.ALLOWED_EXTENSIONS]
     file_names: List[str] = []
-    text_parts: List[str] = []
-    total_text_len = 0
-    files_to_create: List[dict] = []
-    original_files: Dict[str, bytes] = {}  # Store original file content for Yandex Vector Store
+    received_files: List[dict] = []
     
     # Создаем директорию для сохранения оригинальных файлов
     upload_dir = config.UPLOAD_DIR
@@ -141,179 +123,65 @@ async def upload_files(
 
     # Генерируем case_id один раз, чтобы использовать его и для Case, и для File
     case_id = str(uuid.uuid4())
+    case_upload_dir = os.path.join(upload_dir, case_id)
     
     # Список путей к сохранённым файлам для отката при ошибке
     saved_file_paths = []
 
-    # Обрабатываем каждый загруженный файл
-    for file in files:
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="Пустое имя файла недопустимо")
-        
-        # Sanitize filename to prevent path traversal
-        filename = file.filename.replace("..", "").replace("/", "").replace("\\", "")
-        if filename != file.filename:
-            logger.warning(f"Sanitized filename from {file.filename} to {filename}")
-        
-        # Check extension
-        _, ext = filename.rsplit(".", 1) if "." in filename else (filename, "")
-        if ext.lower() not in allowed_extensions:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Файл '{filename}' имеет неподдерживаемый формат. Поддерживаются: {', '.join(allowed_extensions)}"
-            )
-        
-        # Check file size and read content
-        content = await file.read()
-        
-        if len(content) == 0:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Файл '{filename}' пуст или не может быть прочитан"
-            )
-        
-        if len(content) > config.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Файл '{filename}' слишком большой. Максимальный размер: {config.MAX_FILE_SIZE / 1024 / 1024} МБ"
-            )
-        
-        # Parse file using LangChain loaders
-        # ВАЖНО: Используем только LangChain loaders, никаких fallback
-        try:
-            langchain_docs = DocumentLoaderService.load_document(content, filename)
+    # Принимаем файлы: валидация и сохранение на диск (без парсинга)
+    try:
+        for file in files:
+            if not file.filename:
+                raise HTTPException(status_code=400, detail="Пустое имя файла недопустимо")
+            
+            # Sanitize filename to prevent path traversal
+            filename = file.filename.replace("..", "").replace("/", "").replace("\\", "")
+            if filename != file.filename:
+                logger.warning(f"Sanitized filename from {file.filename} to {filename}")
             
-            if not langchain_docs:
+            # Check extension
+            _, ext = filename.rsplit(".", 1) if "." in filename else (filename, "")
+            if ext.lower() not in allowed_extensions:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"LangChain loader не вернул документы для файла '{filename}'"
-                )
-            
-            # Combine all documents from file into single text (для валидации)
-            text = "\n\n".join([doc.page_content for doc in langchain_docs])
-            
-            logger.info(
-                f"Extracted text from {filename} using LangChain, "
-                f"total text length: {len(text)} chars"
-            )
-            
-            # Классификация документа
-            file_classification = None
-            try:
-                logger.info(f"Classifying document: {filename}")
-                classifier_service = DocumentClassifierService()
-                classification_result = classifier_service.classify_document(
-                    text=text,
-                    filename=filename,
-                    case_context=None
-                )
-                
-                logger.info(
-                    f"Classified {filename}: type={classification_result['doc_type']}, "
-                    f"confidence={classification_result['confidence']:.2f}, "
-                    f"needs_review={classification_result['needs_human_review']}"
+                    detail=f"Файл '{filename}' имеет неподдерживаемый формат. Поддерживаются: {', '.join(allowed_extensions)}"
                 )
-                
-                file_classification = classification_result
-            except Exception as e:
-                logger.warning(f"Error classifying document {filename}: {e}", exc_info=True)
-                # Не прерываем загрузку при ошибке классификации
-                file_classification = {
-                    "doc_type": "other",
-                    "tags": [],
-                    "confidence": 0.0,
-                    "needs_human_review": True,
-                    "reasoning": f"Ошибка классификации: {str(e)}",
-                    "classifier": "error"
-                }
             
-            # ВАЖНО: Сохраняем оригинальный файл для загрузки в Yandex Vector Store
-            # content уже прочитан выше (await file.read()), сохраняем его в original_files
-            original_files[filename] = content
+            # Check file size and read content
+            content = await file.read()
             
-            # Сохраняем оригинальный файл на диск для просмотра
-            # Создаем поддиректорию для case_id
-            case_upload_dir = os.path.join(upload_dir, case_id)
-            os.makedirs(case_upload_dir, exist_ok=True)
-            
-            # Сохраняем файл
-            file_path = os.path.join(case_upload_dir, filename)
-            with open(file_path, 'wb') as f:
-                f.write(content)
-            logger.info(f"Saved original file to {file_path}")
-            
-            # Remove NULL bytes (PostgreSQL doesn't allow them in strings)
-            text = text.replace('\x00', '')
-            
-            # Check if text is empty after parsing
-            if not text or not text.strip():
+            if len(content) == 0:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Файл '{filename}' не содержит текста или не может быть прочитан"
+                    detail=f"Файл '{filename}' пуст или не может быть прочитан"
                 )
             
-            total_text_len += len(text)
-            if total_text_len > config.MAX_TOTAL_TEXT_CHARS:
+            if len(content) > config.MAX_FILE_SIZE:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Суммарный размер текста превышает лимит {config.MAX_TOTAL_TEXT_CHARS} символов"
+                    detail=f"Файл '{filename}' слишком большой. Максимальный размер: {config.MAX_FILE_SIZE / 1024 / 1024} МБ"
                 )
-            # Add separator with filename
-            text_parts.append(f"[{filename}]\n{text}")
-            file_names.append(filename)
-
-            # Путь к сохраненному файлу (относительно upload_dir)
-            relative_file_path = os.path.join(case_id, filename)
             
-            files_to_create.append(
-                {
-                    "case_id": case_id,
-                    "filename": filename,
-                    "file_type": ext.lower(),
-                    "original_text": sanitize_text(text),
-                    "file_path": relative_file_path,  # Сохраняем путь к оригинальному файлу (для обратной совместимости)
-                    "file_content": content,  # Сохраняем бинарное содержимое файла в БД
-                    "file_classification": file_classification,  # Добавляем классификацию
-                }
-            )
-        except ValueError as e:
-            logger.warning("Ошибка парсинга файла %s: %s", filename, e)
-            # Откатываем транзакцию и удаляем сохранённые файлы
-            db.rollback()
-            _cleanup_uploaded_files(saved_file_paths)
-            raise HTTPException(status_code=400, detail=str(e))
-        except Exception as e:
-            logger.exception("Неизвестная ошибка при обработке файла %s", filename)
-            # Откатываем транзакцию и удаляем сохранённые файлы
-            db.rollback()
-            _cleanup_uploaded_files(saved_file_paths)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ошибка при обработке файла '{filename}'. Попробуйте загрузить файл снова."
-            )
-    
-    # Check if we have any valid text content
-    if not text_parts or not any(text.strip() for text in text_parts):
-        db.rollback()
+            # Сохраняем файл на диск вне event loop
+            os.makedirs(case_upload_dir, exist_ok=True)
+            file_path = os.path.join(case_upload_dir, filename)
+            await asyncio.to_thread(_write_file, file_path, content)
+            saved_file_paths.append(file_path)
+            logger.info(f"Received {filename} ({len(content)} bytes), saved to {file_path}")
+            
+            file_names.append(filename)
+            received_files.append({
+                "filename": filename[:255],
+                "file_type": ext.lower()[:50],
+                "storage_path": os.path.join(case_id, filename),  # Относительно UPLOAD_DIR
+            })
+    except HTTPException:
         _cleanup_uploaded_files(saved_file_paths)
-        raise HTTPException(
-            status_code=400,
-            detail="Все загруженные файлы пусты или не содержат текста. Пожалуйста, загрузите файлы с текстовым содержимым."
-        )
-    
-    # Combine all text
-    full_text = "\n\n".join(text_parts)
-    # Remove NULL bytes (PostgreSQL doesn't allow them in strings)
-    full_text = full_text.replace('\x00', '')
-    
-    # Final check: ensure full_text is not empty
-    if not full_text.strip():
-        db.rollback()
+        raise
+    except Exception as e:
+        logger.exception("Ошибка при приёме файлов")
         _cleanup_uploaded_files(saved_file_paths)
-        raise HTTPException(
-            status_code=400,
-            detail="Не удалось извлечь текст из загруженных файлов"
-        )
+        raise HTTPException(status_code=500, detail=f"Ошибка при приёме файлов: {str(e)}")
     
     # Parse case info if provided
     case_title = f"Дело из {len(file_names)} документов"
@@ -331,50 +199,20 @@ async def upload_files(
         except Exception as e:
             logger.warning(f"Ошибка при парсинге case_info: {e}")
     
-    # Create case
     logger.info(
         f"Creating case for user {current_user.id}",
         extra={
             "user_id": current_user.id,
             "case_id": case_id,
             "num_files": len(file_names),
-            "total_text_length": len(full_text),
         }
     )
     
-    # Убеждаемся, что full_text не пустой и не содержит NULL байты
-    sanitized_full_text = sanitize_text(full_text)
-    if not sanitized_full_text or not sanitized_full_text.strip():
-        db.rollback()
-        _cleanup_uploaded_files(saved_file_paths)
-        raise HTTPException(
-            status_code=400,
-            detail="Не удалось извлечь текст из загруженных файлов"
-        )
-    
-    # Проверяем размер full_text (PostgreSQL Text может хранить до 1GB, но лучше ограничить)
-    MAX_TEXT_LENGTH = 100 * 1024 * 1024  # 100 MB
-    if len(sanitized_full_text) > MAX_TEXT_LENGTH:
-        logger.warning(f"Full text is very large: {len(sanitized_full_text)} bytes, truncating to {MAX_TEXT_LENGTH}")
-        sanitized_full_text = sanitized_full_text[:MAX_TEXT_LENGTH]
-    
-    # Убеждаемся, что file_names - это список
-    if not isinstance(file_names, list):
-        file_names = list(file_names) if file_names else []
-    
-    # Валидация: убеждаемся, что у нас есть хотя бы один файл
-    if not file_names:
-        db.rollback()
-        _cleanup_uploaded_files(saved_file_paths)
-        raise HTTPException(
-            status_code=400,
-            detail="Не удалось обработать ни одного файла"
-        )
-    
+    # full_text заполняется пайплайном после обработки всех файлов
     case = Case(
         id=case_id,
         user_id=current_user.id,
-        full_text=sanitized_full_text,
+        full_text="",
         num_documents=len(file_names),
         file_names=file_names,
         title=case_title[:255] if case_title else None,  # Ограничиваем длину title
@@ -383,205 +221,133 @@ async def upload_files(
         status="pending",
         analysis_config=analysis_config if analysis_config else None
     )
+    job = IngestionJob(
+        case_id=case_id,
+        user_id=current_user.id,
+        status="pending",
+        total_files=len(received_files),
+    )
     
     try:
         db.add(case)
-        db.flush()  # Flush to get case.id
-        
-        # Create File entries
-        # ВАЖНО: LangChain больше НЕ используется для сохранения chunks в БД
-        # LangChain использовался только для извлечения текста (уже сделано выше)
-        # Оригинальные файлы загружаются напрямую в Yandex Vector Store
-        document_processor = DocumentProcessor()
-        
-        for file_info in files_to_create:
-            # Убеждаемся, что original_text не пустой
-            sanitized_original_text = sanitize_text(file_info["original_text"])
-            if not sanitized_original_text or not sanitized_original_text.strip():
-                logger.warning(f"Skipping file {file_info['filename']} - empty text after sanitization")
-                continue
-            
-            # Проверяем размер original_text
-            MAX_FILE_TEXT_LENGTH = 50 * 1024 * 1024  # 50 MB per file
-            if len(sanitized_original_text) > MAX_FILE_TEXT_LENGTH:
-                logger.warning(
-                    f"File {file_info['filename']} text is very large: {len(sanitized_original_text)} bytes, "
-                    f"truncating to {MAX_FILE_TEXT_LENGTH}"
-                )
-                sanitized_original_text = sanitized_original_text[:MAX_FILE_TEXT_LENGTH]
-            
-            # Ограничиваем длину filename (String(255))
-            filename = file_info["filename"][:255] if len(file_info["filename"]) > 255 else file_info["filename"]
-            # Ограничиваем длину file_type (String(50))
-            file_type = file_info["file_type"][:50] if len(file_info["file_type"]) > 50 else file_info["file_type"]
-            
-            # Валидация обязательных полей
-            if not filename or not filename.strip():
-                logger.warning(f"Skipping file with empty filename")
-                continue
-            if not file_type or not file_type.strip():
-                logger.warning(f"Skipping file {filename} - empty file_type")
-                continue
-            
-            try:
-                file_path = file_info.get("file_path")  # Путь к оригинальному файлу
-                file_content = file_info.get("file_content")  # Бинарное содержимое файла
-                file_model = FileModel(
-                    case_id=case_id,
-                    filename=filename,
-                    file_type=file_type,
-                    original_text=sanitized_original_text,
-                    file_path=file_path,  # Сохраняем путь к оригинальному файлу
-                    file_content=file_content,  # Сохраняем бинарное содержимое файла в БД
-                )
-                db.add(file_model)
-                db.flush()  # Flush to get file_model.id
-                
-                # Phase 1: Сохраняем file_id в file_info для использования в split_documents
-                file_info["file_id"] = file_model.id
-                
-                # Сохраняем классификацию документа
-                if file_info.get("file_classification"):
-                    from app.models.analysis import DocumentClassification
-                    classification = file_info["file_classification"]
-                    
-                    doc_classification = DocumentClassification(
-                        case_id=case_id,
-                        file_id=file_model.id,
-                        doc_type=classification.get("doc_type", "other"),
-                        relevance_score=0,  # Можно вычислить на основе типа
-                        is_privileged="false",
-                        privilege_type="none",
-                        key_topics=classification.get("tags", []),
-                        confidence=str(classification.get("confidence", 0.0)),
-                        reasoning=classification.get("reasoning", ""),
-                        needs_human_review="true" if classification.get("needs_human_review", False) else "false",
-                        prompt_version="v1"
-                    )
-                    db.add(doc_classification)
-                    logger.info(f"Saved classification for file {file_model.id}: {classification.get('doc_type', 'unknown')}")
-            except Exception as file_error:
-                logger.warning(
-                    f"Error creating File model for {filename}: {file_error}",
-                    exc_info=True
-                )
-                # Продолжаем с другими файлами, но логируем ошибку
-                continue
-            
-            # ВАЖНО: LangChain больше НЕ используется для сохранения chunks в БД
-            # LangChain использовался только для извлечения текста (уже сделано выше)
-            # Оригинальные файлы загружаются напрямую в Yandex Vector Store
-            # Сохраняем только информацию о файле (File model) в БД
-            logger.info(
-                f"Saved file info for {file_info['filename']} "
-                f"(case {case_id}, file_id {file_model.id})"
-            )
-        
-        # Коммитим транзакцию - все файлы и Case успешно созданы
+        db.add(job)
+        db.flush()
+        for file_info in received_files:
+            db.add(IngestionFile(job_id=job.id, case_id=case_id, **file_info))
         db.commit()
-        logger.info(f"Successfully committed case {case_id} with {len(file_names)} files")
-        
-        # Store documents in PGVector
-        logger.info(
-            f"Preparing documents for PGVector storage for case {case_id}",
-            extra={"case_id": case_id, "num_files": len(file_names)}
-        )
-        
-        # Create documents from all files using document_processor
-        all_documents = []
-        for file_info in files_to_create:
-            filename = file_info["filename"]
-            text = file_info["original_text"]
-            
-            # Получаем классификацию для этого файла
-            classification = file_info.get("file_classification", {})
-            
-            # Подготавливаем метаданные с классификацией
-            metadata = {
-                "case_id": case_id,
-            }
-            
-            # Добавляем информацию о классификации в метаданные
-            if classification:
-                metadata["doc_type"] = classification.get("doc_type", "other")
-                metadata["classification_confidence"] = classification.get("confidence", 0.0)
-                metadata["is_privileged"] = classification.get("is_privileged", False)
-                metadata["key_topics"] = classification.get("tags", [])
-                metadata["relevance_score"] = classification.get("relevance_score", 0)
-            
-            # Split text into chunks with metadata
-            # Phase 1: Pass file_id for doc_id generation
-            file_id = file_info.get("file_id")  # Получаем file_id, сохранённый при создании File
-            file_documents = document_processor.split_documents(
-                text=text,
-                filename=filename,
-                metadata=metadata,
-                file_id=file_id
-            )
-            all_documents.extend(file_documents)
-        
-        logger.info(
-            f"Storing {len(all_documents)} document chunks in PGVector for case {case_id}",
-            extra={"case_id": case_id, "num_chunks": len(all_documents)}
-        )
-        
-        collection_name = document_processor.store_in_vector_db(
-            case_id=case_id,
-            documents=all_documents,
-            db=db,
-            original_files=None  # Not used for PGVector
-        )
-        logger.info(f"Successfully stored {len(all_documents)} document chunks in PGVector collection '{collection_name}' for case {case_id}")
-        
-        # PGVector: No assistant needed, we use direct RAG with YandexGPT
-        logger.info(f"PGVector: Skipping assistant creation for case {case_id} (using direct RAG)")
-        
-        db.refresh(case)
-        
-        logger.info(
-            f"Successfully uploaded {len(file_names)} files for case {case_id}",
-            extra={
-                "case_id": case_id,
-                "num_files": len(file_names),
-                "user_id": current_user.id,
-            }
-        )
-        
-        return {
-            "case_id": case_id,
-            "num_files": len(file_names),
-            "file_names": file_names,
-            "status": "success",
-            "message": f"Загружено {len(file_names)} файлов. Готово к чату!"
-        }
     except Exception as e:
         db.rollback()
-        # Очищаем сохранённые файлы при ошибке
         _cleanup_uploaded_files(saved_file_paths)
-        
-        error_detail = str(e)
-        
-        # Проверяем, является ли это ошибкой SQLAlchemy
-        from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
-        if isinstance(e, IntegrityError):
-            error_detail = f"Ошибка целостности данных: {str(e.orig) if hasattr(e, 'orig') else str(e)}"
-        elif isinstance(e, OperationalError):
-            error_detail = f"Ошибка базы данных: {str(e.orig) if hasattr(e, 'orig') else str(e)}"
-        elif isinstance(e, SQLAlchemyError):
-            error_detail = f"Ошибка SQLAlchemy: {str(e)}"
-        
         logger.error(
-            f"Ошибка при сохранении дела {case_id} в БД: {error_detail}",
-            extra={
-                "case_id": case_id,
-                "user_id": current_user.id,
-                "error_type": type(e).__name__,
-                "error_detail": error_detail
-            },
+            f"Ошибка при сохранении дела {case_id} в БД: {e}",
+            extra={"case_id": case_id, "user_id": current_user.id, "error_type": type(e).__name__},
             exc_info=True
         )
         raise HTTPException(
             status_code=500,
-            detail=f"Ошибка при сохранении дела: {error_detail}. Попробуйте загрузить файлы снова."
+            detail=f"Ошибка при сохранении дела: {str(e)}. Попробуйте загрузить файлы снова."
         )
+    
+    # Файлы приняты - дальнейшая обработка в фоне
+    await get_ingestion_pipeline().submit(job.id)
+    
+    logger.info(
+        f"Accepted {len(file_names)} files for case {case_id}, ingestion job {job.id}",
+        extra={"case_id": case_id, "job_id": job.id, "num_files": len(file_names), "user_id": current_user.id}
+    )
+    
+    return {
+        "case_id": case_id,
+        "job_id": job.id,
+        "num_files": len(file_names),
+        "file_names": file_names,
+        "status": "success",
+        "ingestion_status": job.status,
+        "events_url": f"/api/upload/jobs/{job.id}/events",
+        "message": f"Принято {len(file_names)} файлов. Обработка выполняется в фоне."
+    }
+
+
+def _write_file(path: str, content: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(content)
 
+
+def _get_user_job(job_id: str, db: Session, current_user: User) -> IngestionJob:
+    job = db.query(IngestionJob).filter(
+        IngestionJob.id == job_id,
+        IngestionJob.user_id == current_user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача загрузки не найдена")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get ingestion job status with per-file progress"""
+    return _get_user_job(job_id, db, current_user).to_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_ingestion_events(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """SSE endpoint: snapshot of the job, then per-file progress events until the job finishes"""
+    _get_user_job(job_id, db, current_user)
+    pipeline = get_ingestion_pipeline()
+    
+    def load_job(include_files: bool) -> Optional[dict]:
+        # Отдельная сессия: сессия запроса закрывается раньше, чем закончится поток
+        session = SessionLocal()
+        try:
+            job = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            return job.to_dict(include_files=include_files) if job else None
+        finally:
+            session.close()
+    
+    async def event_generator():
+        # Подписка до снимка: событие, опубликованное между ними, не теряется
+        queue = pipeline.progress.subscribe(job_id)
+        try:
+            snapshot = await asyncio.to_thread(load_job, True)
+            if snapshot is None:
+                return
+            yield f"data: {json.dumps({'type': 'snapshot', 'job': snapshot}, ensure_ascii=False)}\n\n"
+            if snapshot["status"] in ("completed", "failed"):
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=INGESTION_SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Задачу мог завершить другой процесс (или событие потеряно) - сверяемся с БД
+                    state = await asyncio.to_thread(load_job, False)
+                    if state is None:
+                        break
+                    if state["status"] in ("completed", "failed"):
+                        yield f"data: {json.dumps({'type': 'job_completed', **state}, ensure_ascii=False)}\n\n"
+                        break
+                    # Keep-alive комментарий для прокси
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event.get("type") == "job_completed":
+                    break
+        finally:
+            pipeline.progress.unsubscribe(job_id, queue)
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
@@ -11,7 +11,6 @@ from app.utils.auth import get_current_user, decode_token
 from app.models.user import User
 from app.config import config as app_config
 from sqlalchemy.orm import Session
-from datetime import datetime
 from typing import Optional
 import json
 import logging
@@ -244,7 +243,9 @@ async def stream_chat(
                 from app.config import config
                 use_citation_first = config.CITATION_FIRST_ENABLED
                 
-                answer, sources = rag_service.generate_with_sources(
+                # Поиск, rerank и генерация синхронные - выполняются вне event loop
+                answer, sources = await asyncio.to_thread(
+                    rag_service.generate_with_sources,
                     case_id=case_id,
                     query=query,
                     k=k,
@@ -323,17 +324,17 @@ async def stream_tabular_review_updates(
     - Columns are added
     - Extraction progress changes
     - Presence updates
+    
+    Updates are pushed by TabularEventBus when the writer commits; the socket
+    does not poll the database and does not hold a DB session.
     """
     # Initialize presence service
     presence_service = get_presence_service(redis_url=app_config.REDIS_URL)
     
-    # Get database session
-    from app.utils.database import SessionLocal
-    db = SessionLocal()
     user_id: Optional[str] = None
+    user_name: Optional[str] = None
     connection_id: Optional[str] = None
     presence_task: Optional[asyncio.Task] = None
-    message_task: Optional[asyncio.Task] = None
     
     try:
         # Authenticate user if token is provided
@@ -350,10 +351,9 @@ async def stream_tabular_review_updates(
                 await websocket.close()
                 return
         
-        # Verify review exists
-        from app.models.tabular_review import TabularReview
-        review = db.query(TabularReview).filter(TabularReview.id == review_id).first()
-        if not review:
+        # Verify review exists (short-lived session, released before streaming)
+        review_exists, user_name = await asyncio.to_thread(_load_tabular_review_context, review_id, user_id)
+        if not review_exists:
             await websocket.accept()
             await websocket.send_json({
                 "type": "error",
@@ -362,16 +362,13 @@ async def stream_tabular_review_updates(
             await websocket.close()
             return
         
-        # Connect to WebSocketManager (this will accept the websocket)
+        # Connect to WebSocketManager (this will accept the websocket);
+        # anonymous viewers are registered too so they receive broadcasts
+        connection_id = await websocket_manager.connect(websocket, review_id, user_id)
         if user_id:
-            connection_id = await websocket_manager.connect(websocket, review_id, user_id)
             logger.info(f"WebSocket tabular review connection opened for review {review_id}, user {user_id}")
-            # Update presence
-            user = db.query(User).filter(User.id == user_id).first()
-            user_name = user.full_name if user else None
             presence_service.update_presence(review_id, user_id, user_name)
         else:
-            await websocket.accept()
             logger.info(f"WebSocket tabular review connection opened for review {review_id} (anonymous)")
         
         # Send initial connection confirmation
@@ -386,24 +383,18 @@ async def stream_tabular_review_updates(
             present_users = presence_service.get_present_users(review_id)
             await websocket_manager.broadcast_presence_update(review_id, {"users": present_users})
         
-        # Poll for updates (in production, use database triggers or pub/sub)
-        last_update_time = None
-        
-        # Send periodic presence updates
+        # Send periodic presence updates (user name is resolved once at connect)
         async def send_presence_updates():
             while True:
                 try:
                     await asyncio.sleep(30)  # Update every 30 seconds
-                    if user_id:
-                        user = db.query(User).filter(User.id == user_id).first()
-                        user_name = user.full_name if user else None
-                        presence_service.update_presence(review_id, user_id, user_name)
-                        present_users = presence_service.get_present_users(review_id)
-                        await websocket_manager.broadcast_presence_update(
-                            review_id,
-                            {"users": present_users},
-                            exclude_connection_id=connection_id
-                        )
+                    presence_service.update_presence(review_id, user_id, user_name)
+                    present_users = presence_service.get_present_users(review_id)
+                    await websocket_manager.broadcast_presence_update(
+                        review_id,
+                        {"users": present_users},
+                        exclude_connection_id=connection_id
+                    )
                 except asyncio.CancelledError:
                     break
                 except Exception as e:
@@ -413,87 +404,16 @@ async def stream_tabular_review_updates(
             presence_task = asyncio.create_task(send_presence_updates())
         
         # Handle incoming messages (for future features like lock requests)
-        async def handle_messages():
-            while True:
-                try:
-                    data = await websocket.receive_json()
-                    # Handle incoming messages (e.g., lock requests)
-                    # Can be extended for future features
-                except Exception as e:
-                    logger.debug(f"WebSocket message handling error: {e}")
-                    break
-        
-        message_task = asyncio.create_task(handle_messages())
-        
+        # until the client disconnects; updates are pushed by the event bus
         while True:
             try:
-                # Check for new cells
-                from app.models.tabular_review import TabularCell
-                
-                cell_query = db.query(TabularCell).filter(
-                    TabularCell.tabular_review_id == review_id
-                )
-                
-                if last_update_time:
-                    cell_query = cell_query.filter(TabularCell.updated_at > last_update_time)
-                
-                new_cells = cell_query.all()
-                
-                if new_cells:
-                    for cell in new_cells:
-                        await websocket.send_json({
-                            "type": "cell_updated",
-                            "cell_id": cell.id,
-                            "file_id": cell.file_id,
-                            "column_id": cell.column_id,
-                            "cell_value": cell.cell_value,
-                            "reasoning": cell.reasoning,
-                            "source_references": cell.source_references,
-                            "status": cell.status,
-                            "confidence_score": float(cell.confidence_score) if cell.confidence_score else None,
-                        })
-                    
-                    last_update_time = datetime.utcnow()
-                
-                # Check for new columns
-                from app.models.tabular_review import TabularColumn
-                column_query = db.query(TabularColumn).filter(
-                    TabularColumn.tabular_review_id == review_id
-                )
-                if last_update_time:
-                    column_query = column_query.filter(TabularColumn.created_at > last_update_time)
-                new_columns = column_query.all()
-                
-                if new_columns:
-                    for column in new_columns:
-                        await websocket.send_json({
-                            "type": "column_added",
-                            "column": {
-                                "id": column.id,
-                                "column_label": column.column_label,
-                                "column_type": column.column_type,
-                                "prompt": column.prompt,
-                                "column_config": column.column_config,
-                                "order_index": column.order_index,
-                            }
-                        })
-                
-                # Sleep before next poll
-                await asyncio.sleep(1)
-                
+                await websocket.receive_json()
             except WebSocketDisconnect:
                 logger.info(f"WebSocket tabular review disconnected for review {review_id}")
                 break
             except Exception as e:
-                logger.error(f"Error in tabular review WebSocket: {e}", exc_info=True)
-                try:
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": str(e)
-                    })
-                except:
-                    pass
-                await asyncio.sleep(1)
+                logger.debug(f"WebSocket message handling error: {e}")
+                break
                 
     except Exception as e:
         logger.error(f"WebSocket tabular review error for review {review_id}: {e}", exc_info=True)
@@ -512,23 +432,35 @@ async def stream_tabular_review_updates(
                 await presence_task
             except asyncio.CancelledError:
                 pass
-        if message_task:
-            message_task.cancel()
-            try:
-                await message_task
-            except asyncio.CancelledError:
-                pass
         
+        if connection_id:
+            websocket_manager.disconnect(review_id, connection_id)
         if user_id and connection_id:
             presence_service.remove_presence(review_id, user_id)
-            websocket_manager.disconnect(review_id, connection_id)
             # Broadcast updated presence
             present_users = presence_service.get_present_users(review_id)
             await websocket_manager.broadcast_presence_update(review_id, {"users": present_users})
         
-        db.close()
         try:
             await websocket.close()
         except:
             pass
 
+
+def _load_tabular_review_context(review_id: str, user_id: Optional[str]):
+    """Check that review exists and resolve user's display name"""
+    from app.utils.database import SessionLocal
+    from app.models.tabular_review import TabularReview
+    
+    db = SessionLocal()
+    try:
+        review = db.query(TabularReview.id).filter(TabularReview.id == review_id).first()
+        if not review:
+            return False, None
+        user_name = None
+        if user_id:
+            user = db.query(User).filter(User.id == user_id).first()
+            user_name = user.full_name if user else None
+        return True, user_name
+    finally:
+        db.close()
@@ -104,10 +104,11 @@ class ChatOrchestrator:
             self.classifier = classifier
         else:
             try:
+                from app.config import config
                 from app.services.llm_factory import create_llm
                 from app.services.external_sources.cache_manager import get_cache_manager
                 
-                llm = create_llm(temperature=0.0, max_tokens=500)
+                llm = create_llm(temperature=0.0, max_tokens=500, cache_ttl=config.LLM_RESPONSE_CACHE_TTL_SECONDS)
                 cache = get_cache_manager()
                 self.classifier = RequestClassifier(llm=llm, cache=cache)
             except Exception as e:
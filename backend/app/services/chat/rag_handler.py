@@ -27,6 +27,7 @@ from app.services.chat.events import (
     SSESerializer,
 )
 from app.services.chat.metrics import get_metrics, MetricTimer
+from app.services.metrics.tracing import trace_span
 from app.services.rag_service import RAGService
 from app.models.user import User
 from app.core.resilience import (
@@ -109,7 +110,8 @@ class RAGHandler:
                     db=self.db
                 )
                 if rag_docs:
-                    rag_context = self.rag_service.format_sources_for_prompt(rag_docs, max_context_chars=4000)
+                    with trace_span("prompt_build"):
+                        rag_context = self.rag_service.format_sources_for_prompt(rag_docs, max_context_chars=4000)
                     logger.info(f"[RAGHandler] Retrieved {len(rag_docs)} docs for context")
             except Exception as e:
                 logger.warning(f"[RAGHandler] RAG retrieval failed: {e}")
@@ -1,6 +1,7 @@
 """Citation Verifier - проверяет что цитаты и факты действительно присутствуют в документах"""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_core.documents import Document
+from app.services.document_text_index import get_text_index
 import logging
 import re
 from difflib import SequenceMatcher
@@ -100,44 +101,146 @@ class CitationVerifier:
         similarity = SequenceMatcher(None, normalized1, normalized2).ratio()
         return similarity
     
-    def _calculate_semantic_similarity(self, text1: str, text2: str) -> Optional[float]:
+    def _batch_semantic_similarity(self, pairs: List[Tuple[str, str]]) -> List[Optional[float]]:
         """
-        Вычисляет semantic similarity между двумя текстами используя embeddings
+        Вычисляет semantic similarity для списка пар одним вызовом embed_documents
+        (каждый уникальный текст эмбеддится один раз)
         
         Args:
-            text1: Первый текст
-            text2: Второй текст
+            pairs: Пары текстов (цитата, контекст)
             
         Returns:
-            Semantic similarity score (0.0-1.0) или None если embeddings недоступны
+            Similarity для каждой пары (0.0-1.0) или None если embeddings недоступны
         """
-        if not self.embeddings_available:
-            return None
+        if not pairs or not (self.use_embeddings and self.embeddings_available):
+            return [None] * len(pairs)
         
         try:
             embeddings = _get_yandex_embeddings()
             if not embeddings:
-                return None
-            
-            # Получаем embeddings для обоих текстов
-            vec1 = np.array(embeddings.embed_query(text1))
-            vec2 = np.array(embeddings.embed_query(text2))
+                return [None] * len(pairs)
             
-            # Вычисляем cosine similarity
-            dot_product = np.dot(vec1, vec2)
-            norm1 = np.linalg.norm(vec1)
-            norm2 = np.linalg.norm(vec2)
+            texts = list(dict.fromkeys(text for pair in pairs for text in pair))
+            vectors = np.asarray(embeddings.embed_documents(texts), dtype=float)
+            norms = np.linalg.norm(vectors, axis=1)
+            row_of_text = {text: row for row, text in enumerate(texts)}
             
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
-            
-            similarity = dot_product / (norm1 * norm2)
-            # Normalize to [0, 1] range (cosine similarity is [-1, 1], but embeddings usually give [0, 1])
-            return max(0.0, min(1.0, similarity))
+            similarities: List[Optional[float]] = []
+            for text1, text2 in pairs:
+                i, j = row_of_text[text1], row_of_text[text2]
+                if norms[i] == 0 or norms[j] == 0:
+                    similarities.append(0.0)
+                    continue
+                similarity = float(np.dot(vectors[i], vectors[j]) / (norms[i] * norms[j]))
+                similarities.append(max(0.0, min(1.0, similarity)))
+            return similarities
             
         except Exception as e:
             logger.warning(f"Error calculating semantic similarity: {e}")
-            return None
+            return [None] * len(pairs)
+    
+    def _text_match_candidates(
+        self,
+        search_text: str,
+        source_documents: List[Document],
+        tolerance: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Текстовые совпадения цитаты по индексам документов (без semantic проверки):
+        точное вхождение после нормализации, иначе нечёткое по индексу слов
+        """
+        candidates = []
+        for doc in source_documents:
+            if not hasattr(doc, 'page_content'):
+                continue
+            
+            doc_text = doc.page_content
+            index = get_text_index(doc_text)
+            match = index.find_exact(search_text) or index.find_fuzzy(
+                search_text, self.similarity_threshold, tolerance
+            )
+            if match is None:
+                continue
+            
+            candidates.append({
+                "document": doc,
+                "source_file": doc.metadata.get('source_file', 'unknown'),
+                "source_page": doc.metadata.get('source_page'),
+                "match_text": search_text,
+                # Контекст вокруг совпадения в оригинальном тексте
+                "context": doc_text[max(0, match.start - tolerance):match.end + tolerance],
+                # Спан совпадения в page_content для подсветки в UI
+                "char_start": match.start,
+                "char_end": match.end,
+                "text_similarity": match.similarity,
+                "exact": match.exact,
+            })
+        return candidates
+    
+    def _score_match(self, candidate: Dict[str, Any], semantic_similarity: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Комбинирует text и semantic similarity; None если совпадение ниже порога"""
+        exact = candidate.pop("exact")
+        text_similarity = candidate["text_similarity"]
+        
+        if exact:
+            # Для exact match: 30% exact, 70% semantic (если доступно)
+            if semantic_similarity is not None:
+                combined_similarity = 0.3 * 1.0 + 0.7 * semantic_similarity
+            else:
+                combined_similarity = 1.0
+            match_type = "exact_semantic" if semantic_similarity is not None else "exact"
+        else:
+            # Для fuzzy match: 40% text similarity, 60% semantic similarity
+            if semantic_similarity is not None:
+                combined_similarity = 0.4 * text_similarity + 0.6 * semantic_similarity
+            else:
+                combined_similarity = text_similarity
+            if combined_similarity < self.similarity_threshold:
+                return None
+            match_type = "fuzzy_semantic" if semantic_similarity is not None else "fuzzy"
+        
+        return {
+            **candidate,
+            "similarity": combined_similarity,
+            "semantic_similarity": semantic_similarity,
+            "match_type": match_type,
+        }
+    
+    def _find_text_in_documents_batch(
+        self,
+        search_texts: List[str],
+        source_documents: List[Document],
+        tolerance: int = 50
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Ищет несколько текстов в документах; semantic similarity всех найденных
+        совпадений вычисляется одним вызовом embeddings
+        
+        Returns:
+            Для каждого текста - список совпадений, отсортированный по similarity
+        """
+        candidates = [
+            self._text_match_candidates(search_text, source_documents, tolerance)
+            for search_text in search_texts
+        ]
+        pairs = [
+            (search_text, candidate["context"])
+            for search_text, text_candidates in zip(search_texts, candidates)
+            for candidate in text_candidates
+        ]
+        semantic_scores = iter(self._batch_semantic_similarity(pairs))
+        
+        results = []
+        for text_candidates in candidates:
+            matches = []
+            for candidate in text_candidates:
+                match = self._score_match(candidate, next(semantic_scores))
+                if match is not None:
+                    matches.append(match)
+            # Сортируем по similarity (по убыванию)
+            matches.sort(key=lambda x: x['similarity'], reverse=True)
+            results.append(matches)
+        return results
     
     def _find_text_in_documents(
         self,
@@ -154,101 +257,72 @@ class CitationVerifier:
             tolerance: Максимальное количество символов для fuzzy matching
             
         Returns:
-            List of matches with metadata
+            List of matches with metadata (char_start/char_end - спан в page_content)
+        """
+        return self._find_text_in_documents_batch([search_text], source_documents, tolerance)[0]
+    
+    @staticmethod
+    def _empty_verification(error: Optional[str] = None) -> Dict[str, Any]:
+        result = {
+            "verified": False,
+            "matches": [],
+            "confidence": 0.0,
+            "best_match": None,
+        }
+        if error:
+            result["error"] = error
+        return result
+    
+    def verify_citations(
+        self,
+        citation_texts: List[str],
+        source_documents: List[Document],
+        tolerance: int = 50
+    ) -> List[Dict[str, Any]]:
         """
-        matches = []
-        normalized_search = self._normalize_text(search_text)
+        Проверяет несколько цитат: текстовый поиск по индексам документов,
+        semantic проверка всех совпадений одним вызовом embeddings
         
-        for doc in source_documents:
-            if not hasattr(doc, 'page_content'):
-                continue
-            
-            doc_text = doc.page_content
-            normalized_doc = self._normalize_text(doc_text)
+        Args:
+            citation_texts: Цитаты для проверки
+            source_documents: Список документов для поиска
+            tolerance: Максимальное количество символов для fuzzy matching
             
-            # Ищем точное вхождение (после нормализации)
-            if normalized_search in normalized_doc:
-                # Находим позицию в оригинальном тексте
-                start_pos = normalized_doc.find(normalized_search)
-                end_pos = start_pos + len(normalized_search)
-                
-                # Берем контекст вокруг совпадения
-                context_start = max(0, start_pos - tolerance)
-                context_end = min(len(doc_text), end_pos + tolerance)
-                context = doc_text[context_start:context_end]
-                
-                # Даже для exact match проверяем semantic similarity если включено
-                semantic_similarity = None
-                if self.use_embeddings and self.embeddings_available:
-                    semantic_similarity = self._calculate_semantic_similarity(search_text, context)
-                
-                # Для exact match используем semantic similarity если доступно, иначе 1.0
-                if semantic_similarity is not None:
-                    combined_similarity = 0.3 * 1.0 + 0.7 * semantic_similarity  # Weighted: 30% exact, 70% semantic
-                else:
-                    combined_similarity = 1.0
-                
-                matches.append({
-                    "document": doc,
-                    "source_file": doc.metadata.get('source_file', 'unknown'),
-                    "source_page": doc.metadata.get('source_page'),
-                    "match_text": search_text,
-                    "context": context,
-                    "similarity": combined_similarity,
-                    "text_similarity": 1.0,
-                    "semantic_similarity": semantic_similarity,
-                    "match_type": "exact_semantic" if semantic_similarity else "exact"
-                })
+        Returns:
+            Результат verify_citation для каждой цитаты
+        """
+        if not source_documents:
+            return [
+                self._empty_verification("Empty citation text" if not text or not text.strip()
+                                         else "No source documents provided")
+                for text in citation_texts
+            ]
+        
+        searchable = [i for i, text in enumerate(citation_texts) if text and text.strip()]
+        results = [self._empty_verification("Empty citation text") for _ in citation_texts]
+        
+        try:
+            all_matches = self._find_text_in_documents_batch(
+                [citation_texts[i] for i in searchable], source_documents, tolerance
+            )
+        except Exception as e:
+            logger.error(f"Error verifying citation: {e}", exc_info=True)
+            for i in searchable:
+                results[i] = self._empty_verification(str(e))
+            return results
+        
+        for i, matches in zip(searchable, all_matches):
+            if matches:
+                best_match = matches[0]
+                results[i] = {
+                    "verified": best_match['similarity'] >= self.similarity_threshold,
+                    "matches": matches,
+                    "confidence": best_match['similarity'],
+                    "best_match": best_match
+                }
             else:
-                # Fuzzy matching: ищем похожие подстроки
-                # Разбиваем search_text на слова и ищем каждое слово
-                search_words = normalized_search.split()
-                if len(search_words) > 0:
-                    # Ищем первое слово для начала поиска
-                    first_word = search_words[0]
-                    if first_word in normalized_doc:
-                        # Находим позицию первого слова
-                        start_pos = normalized_doc.find(first_word)
-                        # Берем окно текста вокруг
-                        window_start = max(0, start_pos - tolerance)
-                        window_end = min(len(normalized_doc), start_pos + len(normalized_search) + tolerance)
-                        window_text = normalized_doc[window_start:window_end]
-                        
-                        # Вычисляем similarity между search_text и window_text
-                        similarity = self._calculate_similarity(normalized_search, window_text)
-                        
-                        if similarity >= self.similarity_threshold:
-                            # Находим соответствующий текст в оригинальном документе
-                            original_window = doc_text[window_start:window_end]
-                            
-                            # Если используем embeddings, вычисляем semantic similarity
-                            semantic_similarity = None
-                            if self.use_embeddings and self.embeddings_available:
-                                semantic_similarity = self._calculate_semantic_similarity(search_text, window_text)
-                            
-                            # Комбинируем text и semantic similarity (weighted average)
-                            if semantic_similarity is not None:
-                                # Используем взвешенное среднее: 40% text similarity, 60% semantic similarity
-                                combined_similarity = 0.4 * similarity + 0.6 * semantic_similarity
-                            else:
-                                combined_similarity = similarity
-                            
-                            if combined_similarity >= self.similarity_threshold:
-                                matches.append({
-                                    "document": doc,
-                                    "source_file": doc.metadata.get('source_file', 'unknown'),
-                                    "source_page": doc.metadata.get('source_page'),
-                                    "match_text": search_text,
-                                    "context": original_window,
-                                    "similarity": combined_similarity,
-                                    "text_similarity": similarity,
-                                    "semantic_similarity": semantic_similarity,
-                                    "match_type": "fuzzy_semantic" if semantic_similarity else "fuzzy"
-                                })
-        
-        # Сортируем по similarity (по убыванию)
-        matches.sort(key=lambda x: x['similarity'], reverse=True)
-        return matches
+                results[i] = self._empty_verification()
+        return results
     
     def verify_citation(
         self,
@@ -268,59 +342,28 @@ class CitationVerifier:
             Dictionary with verification result:
             {
                 "verified": bool,
-                "matches": List[Dict],  # Список найденных совпадений
+                "matches": List[Dict],  # Список найденных совпадений (с char_start/char_end)
                 "confidence": float,  # Уверенность в верификации (0.0-1.0)
                 "best_match": Optional[Dict]  # Лучшее совпадение
             }
         """
-        if not citation_text or not citation_text.strip():
-            return {
-                "verified": False,
-                "matches": [],
-                "confidence": 0.0,
-                "best_match": None,
-                "error": "Empty citation text"
-            }
-        
-        if not source_documents:
-            return {
-                "verified": False,
-                "matches": [],
-                "confidence": 0.0,
-                "best_match": None,
-                "error": "No source documents provided"
-            }
-        
-        try:
-            matches = self._find_text_in_documents(citation_text, source_documents, tolerance)
-            
-            if matches:
-                best_match = matches[0]
-                verified = best_match['similarity'] >= self.similarity_threshold
-                confidence = best_match['similarity']
-                
-                return {
-                    "verified": verified,
-                    "matches": matches,
-                    "confidence": confidence,
-                    "best_match": best_match
-                }
-            else:
-                return {
-                    "verified": False,
-                    "matches": [],
-                    "confidence": 0.0,
-                    "best_match": None
-                }
-        except Exception as e:
-            logger.error(f"Error verifying citation: {e}", exc_info=True)
-            return {
-                "verified": False,
-                "matches": [],
-                "confidence": 0.0,
-                "best_match": None,
-                "error": str(e)
-            }
+        return self.verify_citations([citation_text], source_documents, tolerance)[0]
+    
+    @staticmethod
+    def _fact_text(fact: Any) -> Optional[str]:
+        """Текст факта для проверки. Приоритет: reasoning > description > value"""
+        if isinstance(fact, dict):
+            return (
+                fact.get('reasoning') or 
+                fact.get('description') or 
+                str(fact.get('value', ''))
+            )
+        # Если fact - объект, пытаемся получить атрибуты
+        return (
+            getattr(fact, 'reasoning', None) or
+            getattr(fact, 'description', None) or
+            str(getattr(fact, 'value', ''))
+        )
     
     def verify_extracted_fact(
         self,
@@ -339,33 +382,9 @@ class CitationVerifier:
         Returns:
             Dictionary with verification result (same format as verify_citation)
         """
-        # Извлекаем текст для проверки из разных полей факта
-        # Приоритет: reasoning > description > value
-        
-        text_to_verify = None
-        
-        if isinstance(fact, dict):
-            text_to_verify = (
-                fact.get('reasoning') or 
-                fact.get('description') or 
-                str(fact.get('value', ''))
-            )
-        else:
-            # Если fact - объект, пытаемся получить атрибуты
-            text_to_verify = (
-                getattr(fact, 'reasoning', None) or
-                getattr(fact, 'description', None) or
-                str(getattr(fact, 'value', ''))
-            )
-        
+        text_to_verify = self._fact_text(fact)
         if not text_to_verify:
-            return {
-                "verified": False,
-                "matches": [],
-                "confidence": 0.0,
-                "best_match": None,
-                "error": "No text found in fact for verification"
-            }
+            return self._empty_verification("No text found in fact for verification")
         
         # Используем verify_citation для проверки
         return self.verify_citation(text_to_verify, source_documents, tolerance)
@@ -377,7 +396,7 @@ class CitationVerifier:
         tolerance: int = 100
     ) -> Dict[str, Any]:
         """
-        Проверяет несколько фактов одновременно
+        Проверяет несколько фактов одновременно (один вызов embeddings на все факты)
         
         Args:
             facts: List of fact dictionaries
@@ -394,12 +413,19 @@ class CitationVerifier:
                 "verification_results": List[Dict]  # Результаты для каждого факта
             }
         """
+        texts = [self._fact_text(fact) for fact in facts]
+        with_text = [i for i, text in enumerate(texts) if text]
+        batch_results = iter(self.verify_citations([texts[i] for i in with_text], source_documents, tolerance))
+        
         verification_results = []
         verified_count = 0
         total_confidence = 0.0
         
-        for fact in facts:
-            result = self.verify_extracted_fact(fact, source_documents, tolerance)
+        for fact, text in zip(facts, texts):
+            if text:
+                result = next(batch_results)
+            else:
+                result = self._empty_verification("No text found in fact for verification")
             verification_results.append({
                 "fact": fact,
                 "verification": result
@@ -8,6 +8,7 @@ from app.services.llm_factory import create_llm
 import logging
 import re
 import json
+import hashlib
 
 logger = logging.getLogger(__name__)
 
@@ -133,6 +134,11 @@ CATEGORY_EXTRACTION_PROMPT = """Ты - эксперт по анализу юри
 
 ВАЖНО: Извлекай ПОЛНЫЙ текст пункта, не сокращай."""
 
+# Версия извлечения - часть ключа clause_extraction_cache.
+# Изменение CLAUSE_EXTRACTION_PROMPT учитывается автоматически, при изменении
+# разбора ответа (_parse_extraction_response) нужно увеличить номер.
+CLAUSE_EXTRACTOR_VERSION = "1-" + hashlib.sha256(CLAUSE_EXTRACTION_PROMPT.encode()).hexdigest()[:12]
+
 
 class ClauseExtractor:
     """
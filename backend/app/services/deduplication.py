@@ -1,11 +1,18 @@
 """Deduplication utilities for timeline events and discrepancies using semantic similarity"""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 from app.services.yandex_embeddings import YandexEmbeddings
+from app.utils.text_similarity import MinHasher, lsh_candidate_pairs
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Блоки не больше этого размера сравниваются полной матрицей сходства,
+# в больших кандидаты отбираются MinHash/LSH
+MATRIX_BLOCK_LIMIT = 2000
+LSH_NUM_PERM = 64
+LSH_BANDS = 16
+
 # Try to import sklearn for cosine similarity
 try:
     from sklearn.metrics.pairwise import cosine_similarity
@@ -91,6 +98,166 @@ def calculate_text_similarity(text1: str, text2: str) -> float:
     return len(intersection) / len(union) if union else 0.0
 
 
+class _UnionFind:
+    """Union-find по индексам элементов с учётом совместимости типов кластеров"""
+
+    def __init__(self, kinds: List[str]):
+        self.parent = list(range(len(kinds)))
+        # Тип кластера - первый непустой тип его элементов
+        self.kinds = list(kinds)
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> bool:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return True
+        kind_a, kind_b = self.kinds[root_a], self.kinds[root_b]
+        # Как и при попарном сравнении: разные непустые типы не объединяются
+        if kind_a and kind_b and kind_a != kind_b:
+            return False
+        # Корень - меньший индекс, чтобы базой слияния оставался первый элемент
+        root, child = min(root_a, root_b), max(root_a, root_b)
+        self.parent[child] = root
+        self.kinds[root] = kind_a or kind_b
+        return True
+
+
+class _SimilarityIndex:
+    """
+    Сходство описаний набора элементов.
+
+    Эмбеддинги считаются одним вызовом embed_documents по уникальным текстам
+    и нормализуются, сходство пары - скалярное произведение. Если эмбеддинги
+    недоступны (или вектор текста нулевой), используется сходство по словам,
+    оцениваемое MinHash-сигнатурами (как calculate_text_similarity).
+    """
+
+    def __init__(self, texts: List[str], embeddings_model: Optional[YandexEmbeddings]):
+        self.texts = texts
+        self.vectors = self._embed(texts, embeddings_model)
+        if self.vectors is not None:
+            self.has_vector = np.linalg.norm(self.vectors, axis=1) > 0
+        else:
+            self.has_vector = np.zeros(len(texts), dtype=bool)
+        self._signatures: Dict[int, List[int]] = {}
+        self._minhasher = MinHasher(num_perm=LSH_NUM_PERM, shingle_size=1)
+
+    @staticmethod
+    def _embed(texts: List[str], embeddings_model: Optional[YandexEmbeddings]) -> Optional[np.ndarray]:
+        unique_texts = list(dict.fromkeys(texts))
+        try:
+            if embeddings_model is None:
+                embeddings_model = YandexEmbeddings()
+            vectors = np.asarray(embeddings_model.embed_documents(unique_texts), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Embeddings unavailable for deduplication, using text similarity: {e}")
+            return None
+        if vectors.ndim != 2 or len(vectors) != len(unique_texts):
+            logger.warning("Unexpected embeddings shape for deduplication, using text similarity")
+            return None
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+        row_of_text = {text: row for row, text in enumerate(unique_texts)}
+        return vectors[[row_of_text[text] for text in texts]]
+
+    def signature(self, index: int) -> List[int]:
+        signature = self._signatures.get(index)
+        if signature is None:
+            signature = self._minhasher.signature(self.texts[index])
+            self._signatures[index] = signature
+        return signature
+
+    def _text_similarity(self, left: List[int], right: List[int]) -> np.ndarray:
+        scores = np.zeros(len(left), dtype=np.float32)
+        for k, (i, j) in enumerate(zip(left, right)):
+            if self.texts[i].strip() and self.texts[j].strip():
+                scores[k] = MinHasher.similarity(self.signature(i), self.signature(j))
+        return scores
+
+    def pair_similarity(self, left: List[int], right: List[int]) -> np.ndarray:
+        """Сходство пар (left[k], right[k])"""
+        left_idx, right_idx = np.asarray(left, dtype=np.intp), np.asarray(right, dtype=np.intp)
+        if self.vectors is None:
+            return self._text_similarity(left, right)
+        scores = np.einsum("ij,ij->i", self.vectors[left_idx], self.vectors[right_idx])
+        fallback = ~(self.has_vector[left_idx] & self.has_vector[right_idx])
+        if fallback.any():
+            scores[fallback] = self._text_similarity(list(left_idx[fallback]), list(right_idx[fallback]))
+        return scores
+
+    def block_pairs(self, block: List[int], threshold: float) -> List[Tuple[int, int]]:
+        """Пары блока со сходством не ниже порога"""
+        if len(block) < 2:
+            return []
+        if len(block) <= MATRIX_BLOCK_LIMIT:
+            # Полная матрица сходства блока (верхний треугольник)
+            left, right = np.triu_indices(len(block), k=1)
+            members = np.asarray(block, dtype=np.intp)
+            if self.vectors is not None and self.has_vector[members].all():
+                block_vectors = self.vectors[members]
+                scores = (block_vectors @ block_vectors.T)[left, right]
+            else:
+                scores = self.pair_similarity(list(members[left]), list(members[right]))
+            hits = scores >= threshold
+            return list(zip(members[left][hits].tolist(), members[right][hits].tolist()))
+        # Большой блок: кандидаты по LSH над MinHash, проверка сходством
+        candidates = sorted(lsh_candidate_pairs([self.signature(i) for i in block], bands=LSH_BANDS))
+        if not candidates:
+            return []
+        left = [block[a] for a, _ in candidates]
+        right = [block[b] for _, b in candidates]
+        scores = self.pair_similarity(left, right)
+        return [(i, j) for i, j, score in zip(left, right, scores) if score >= threshold]
+
+
+def _cluster_duplicates(
+    texts: List[str],
+    kinds: List[str],
+    blocks: List[List[int]],
+    similarity_threshold: float,
+    embeddings_model: Optional[YandexEmbeddings]
+) -> List[List[int]]:
+    """
+    Кластеры почти-дубликатов: пары внутри блоков со сходством >= порога
+    объединяются union-find (транзитивно).
+
+    Returns:
+        Кластеры (списки индексов по возрастанию) в порядке первого элемента
+    """
+    union_find = _UnionFind(kinds)
+    if any(len(block) > 1 for block in blocks):
+        index = _SimilarityIndex(texts, embeddings_model)
+        pairs = []
+        for block in blocks:
+            pairs.extend(index.block_pairs(block, similarity_threshold))
+        for i, j in sorted(pairs):
+            union_find.union(i, j)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(texts)):
+        clusters.setdefault(union_find.find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda members: members[0])
+
+
+def _item_fields(item: Any, fields: Tuple[str, ...]) -> Optional[Tuple[Any, ...]]:
+    """Поля объекта или dict; None, если элемент не поддерживается"""
+    if hasattr(item, fields[0]):
+        return tuple(getattr(item, name, '') for name in fields)
+    if isinstance(item, dict):
+        return tuple(item.get(name, '') for name in fields)
+    return None
+
+
+def _merge_clusters(items: List[Any], clusters: List[List[int]], merge) -> List[Any]:
+    return [merge([items[i] for i in members]) if len(members) > 1 else items[members[0]]
+            for members in clusters]
+
+
 def deduplicate_timeline_events(
     events: List[Any],
     similarity_threshold: float = 0.85,
@@ -99,6 +266,11 @@ def deduplicate_timeline_events(
     """
     Deduplicate timeline events based on date, description, and semantic similarity.
     
+    Events are bucketed by exact date; within a bucket descriptions are
+    compared by one batched embedding pass (similarity matrix, or MinHash/LSH
+    candidates for very large buckets). Events of different non-empty types
+    are never merged.
+    
     Args:
         events: List of TimelineEventModel objects or dicts
         similarity_threshold: Threshold for considering events as duplicates (0-1)
@@ -110,68 +282,25 @@ def deduplicate_timeline_events(
     if len(events) <= 1:
         return events
     
-    deduplicated = []
-    seen_indices = set()
-    
-    for i, event1 in enumerate(events):
-        if i in seen_indices:
-            continue
-        
-        # Extract event data
-        if hasattr(event1, 'date'):
-            date1 = event1.date
-            desc1 = getattr(event1, 'description', '')
-            type1 = getattr(event1, 'event_type', '')
-        elif isinstance(event1, dict):
-            date1 = event1.get('date', '')
-            desc1 = event1.get('description', '')
-            type1 = event1.get('event_type', '')
-        else:
-            deduplicated.append(event1)
+    texts, kinds = [], []
+    date_buckets: Dict[Any, List[int]] = {}
+    for i, event in enumerate(events):
+        fields = _item_fields(event, ('date', 'description', 'event_type'))
+        if fields is None:
+            # Неподдерживаемый элемент остаётся как есть
+            texts.append('')
+            kinds.append('')
             continue
-        
-        # Find similar events
-        similar_events = [event1]
-        
-        for j, event2 in enumerate(events[i+1:], start=i+1):
-            if j in seen_indices:
-                continue
-            
-            # Extract event2 data
-            if hasattr(event2, 'date'):
-                date2 = event2.date
-                desc2 = getattr(event2, 'description', '')
-                type2 = getattr(event2, 'event_type', '')
-            elif isinstance(event2, dict):
-                date2 = event2.get('date', '')
-                desc2 = event2.get('description', '')
-                type2 = event2.get('event_type', '')
-            else:
-                continue
-            
-            # Check if dates match (exact match)
-            if date1 != date2:
-                continue
-            
-            # Check if event types match
-            if type1 and type2 and type1 != type2:
-                continue
-            
-            # Calculate semantic similarity of descriptions
-            similarity = calculate_semantic_similarity(desc1, desc2, embeddings_model)
-            
-            if similarity >= similarity_threshold:
-                similar_events.append(event2)
-                seen_indices.add(j)
-        
-        # Merge similar events
-        if len(similar_events) > 1:
-            merged_event = merge_timeline_events(similar_events)
-            deduplicated.append(merged_event)
-        else:
-            deduplicated.append(event1)
-        
-        seen_indices.add(i)
+        date, description, event_type = fields
+        texts.append(description or '')
+        kinds.append(event_type or '')
+        try:
+            date_buckets.setdefault(date, []).append(i)
+        except TypeError:
+            date_buckets.setdefault(repr(date), []).append(i)
+    
+    clusters = _cluster_duplicates(texts, kinds, list(date_buckets.values()), similarity_threshold, embeddings_model)
+    deduplicated = _merge_clusters(events, clusters, merge_timeline_events)
     
     logger.info(f"Deduplicated {len(events)} events to {len(deduplicated)} events")
     return deduplicated
@@ -229,6 +358,10 @@ def deduplicate_discrepancies(
     """
     Deduplicate discrepancies based on description and semantic similarity.
     
+    All descriptions are embedded in one batch and compared with a similarity
+    matrix (MinHash/LSH candidates for very large sets). Discrepancies of
+    different non-empty types are never merged.
+    
     Args:
         discrepancies: List of DiscrepancyModel objects or dicts
         similarity_threshold: Threshold for considering discrepancies as duplicates (0-1)
@@ -240,64 +373,20 @@ def deduplicate_discrepancies(
     if len(discrepancies) <= 1:
         return discrepancies
     
-    deduplicated = []
-    seen_indices = set()
-    
-    for i, disc1 in enumerate(discrepancies):
-        if i in seen_indices:
-            continue
-        
-        # Extract discrepancy data
-        if hasattr(disc1, 'description'):
-            desc1 = disc1.description
-            type1 = getattr(disc1, 'type', '')
-            docs1 = getattr(disc1, 'source_documents', [])
-        elif isinstance(disc1, dict):
-            desc1 = disc1.get('description', '')
-            type1 = disc1.get('type', '')
-            docs1 = disc1.get('source_documents', [])
-        else:
-            deduplicated.append(disc1)
+    texts, kinds, block = [], [], []
+    for i, disc in enumerate(discrepancies):
+        fields = _item_fields(disc, ('description', 'type'))
+        if fields is None:
+            texts.append('')
+            kinds.append('')
             continue
-        
-        # Find similar discrepancies
-        similar_discs = [disc1]
-        
-        for j, disc2 in enumerate(discrepancies[i+1:], start=i+1):
-            if j in seen_indices:
-                continue
-            
-            # Extract disc2 data
-            if hasattr(disc2, 'description'):
-                desc2 = disc2.description
-                type2 = getattr(disc2, 'type', '')
-                docs2 = getattr(disc2, 'source_documents', [])
-            elif isinstance(disc2, dict):
-                desc2 = disc2.get('description', '')
-                type2 = disc2.get('type', '')
-                docs2 = disc2.get('source_documents', [])
-            else:
-                continue
-            
-            # Check if types match
-            if type1 and type2 and type1 != type2:
-                continue
-            
-            # Calculate semantic similarity
-            similarity = calculate_semantic_similarity(desc1, desc2, embeddings_model)
-            
-            if similarity >= similarity_threshold:
-                similar_discs.append(disc2)
-                seen_indices.add(j)
-        
-        # Merge similar discrepancies
-        if len(similar_discs) > 1:
-            merged_disc = merge_discrepancies(similar_discs)
-            deduplicated.append(merged_disc)
-        else:
-            deduplicated.append(disc1)
-        
-        seen_indices.add(i)
+        description, disc_type = fields
+        texts.append(description or '')
+        kinds.append(disc_type or '')
+        block.append(i)
+    
+    clusters = _cluster_duplicates(texts, kinds, [block], similarity_threshold, embeddings_model)
+    deduplicated = _merge_clusters(discrepancies, clusters, merge_discrepancies)
     
     logger.info(f"Deduplicated {len(discrepancies)} discrepancies to {len(deduplicated)} discrepancies")
     return deduplicated
@@ -358,77 +447,3 @@ def merge_discrepancies(discrepancies: List[Any]) -> Any:
             base_disc.confidence = max([getattr(d, 'confidence', 0.0) or 0.0 for d in discrepancies], default=0.8)
     
     return base_disc
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -5,6 +5,7 @@ from app.services.rag_service import RAGService
 from app.services.llm_factory import create_legal_llm
 from app.services.document_processor import DocumentProcessor
 from langchain_core.messages import HumanMessage, SystemMessage
+import asyncio
 import logging
 import re
 
@@ -147,7 +148,7 @@ class DocumentAIService:
         except Exception as e:
             logger.error(f"[DocumentAIService] Error in generate_contract: {e}", exc_info=True)
             # Fallback на старую логику если template_graph не работает
-            return self._generate_contract_fallback(prompt, case_id)
+            return await asyncio.to_thread(self._generate_contract_fallback, prompt, case_id)
     
     def _generate_contract_fallback(
         self,
@@ -630,7 +631,8 @@ class DocumentAIService:
         context = ""
         sources = []
         try:
-            docs, source_list = self.rag_service.generate_with_sources(
+            docs, source_list = await asyncio.to_thread(
+                self.rag_service.generate_with_sources,
                 case_id=case_id,
                 query=question,
                 k=5,
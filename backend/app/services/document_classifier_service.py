@@ -3,6 +3,7 @@ from typing import Dict, Any, Optional
 from app.services.llm_factory import create_llm
 from app.services.langchain_parsers import DocumentClassificationModel
 from app.services.yandex_classifier import YandexDocumentClassifier
+from app.services.local_document_classifier import get_local_classifier, content_hash
 from app.config import config
 from langchain_core.prompts import ChatPromptTemplate
 import logging
@@ -88,15 +89,36 @@ DOCUMENT_TYPES = [
 
 
 class DocumentClassifierService:
-    """Service for classifying documents during upload"""
+    """
+    Service for classifying documents during upload.
     
-    def __init__(self):
+    First pass is a local classifier (rules + model trained on DocumentClassification
+    history); remote classifiers (Yandex / GigaChat) are used only when local
+    confidence is below config.LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD.
+    Results are cached by content hash.
+    """
+    
+    def __init__(self, db=None, cache=None):
+        """
+        Args:
+            db: Optional DB session used to train the local classifier on history
+            cache: Optional cache manager (defaults to the shared CacheManager)
+        """
         self.yandex_classifier = None
         self.llm = None
-        self._init_classifiers()
+        self._classifiers_initialized = False
+        self.local_classifier = get_local_classifier(db)
+        if cache is None:
+            try:
+                from app.services.external_sources.cache_manager import get_cache_manager
+                cache = get_cache_manager()
+            except Exception as e:
+                logger.warning(f"Classification cache unavailable: {e}")
+        self.cache = cache
     
     def _init_classifiers(self):
         """Initialize classifiers (Yandex preferred, GigaChat fallback)"""
+        self._classifiers_initialized = True
         # #region debug log
         debug_log_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), ".cursor", "debug.log")
         try:
@@ -160,7 +182,7 @@ class DocumentClassifierService:
         
         # Fallback to GigaChat LLM
         try:
-            self.llm = create_llm(temperature=0.1)
+            self.llm = create_llm(temperature=0.1, cache_ttl=config.LLM_RESPONSE_CACHE_TTL_SECONDS)
             # #region debug log
             try:
                 with open(debug_log_path, "a", encoding="utf-8") as f:
@@ -206,7 +228,7 @@ class DocumentClassifierService:
         Classify a document
         
         Args:
-            text: Document text (will be truncated to 15000 chars)
+            text: Document text (will be truncated to 15000 chars for LLM)
             filename: Optional filename for context
             case_context: Optional case context
             
@@ -217,6 +239,72 @@ class DocumentClassifierService:
             logger.warning("Empty text provided for classification")
             return self._default_classification("Empty document")
         
+        text_hash = content_hash(text)
+        cached = self._get_cached(text_hash)
+        if cached:
+            logger.info(f"Classification cache hit for {filename}: {cached.get('doc_type')}")
+            return cached
+        
+        local_result = None
+        try:
+            local_result = self.local_classifier.predict(text, filename)
+        except Exception as e:
+            logger.warning(f"Local classification failed: {e}", exc_info=True)
+        
+        if local_result and local_result["confidence"] >= config.LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD:
+            result = self._build_local_result(local_result)
+        else:
+            if not self._classifiers_initialized:
+                self._init_classifiers()
+            result = self._classify_remote(text, filename, case_context)
+            # Если удалённые классификаторы недоступны, локальный ответ лучше дефолтного
+            if result.get("classifier") == "default" and local_result:
+                result = self._build_local_result(local_result)
+        
+        if result.get("classifier") != "default":
+            self._set_cached(text_hash, result)
+        return result
+    
+    def _build_local_result(self, local_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert LocalDocumentClassifier prediction to the service result format"""
+        doc_type = local_result["doc_type"]
+        confidence = local_result["confidence"]
+        return {
+            "doc_type": doc_type,
+            "tags": self._get_tags_for_type(doc_type),
+            "confidence": confidence,
+            "needs_human_review": confidence < CLASSIFICATION_CONFIDENCE_THRESHOLD,
+            "reasoning": f"{local_result['reasoning']}. Уверенность: {confidence:.0%}",
+            "classifier": "local"
+        }
+    
+    def _get_cached(self, text_hash: str) -> Optional[Dict[str, Any]]:
+        """Get cached classification by content hash"""
+        if not self.cache:
+            return None
+        try:
+            cached = self.cache.get("document_classification", text_hash)
+            return dict(cached) if cached else None
+        except Exception as e:
+            logger.warning(f"Classification cache read failed: {e}")
+            return None
+    
+    def _set_cached(self, text_hash: str, result: Dict[str, Any]) -> None:
+        """Cache classification by content hash"""
+        if not self.cache:
+            return
+        try:
+            self.cache.set("document_classification", text_hash, result, ttl=config.CLASSIFICATION_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Classification cache write failed: {e}")
+    
+    def _classify_remote(
+        self,
+        text: str,
+        filename: Optional[str],
+        case_context: Optional[str]
+    ) -> Dict[str, Any]:
+        """Classify with Yandex AI Studio or GigaChat (slow path)"""
         # Ограничиваем текст для экономии токенов
         prompt_text = text[:15000]
         
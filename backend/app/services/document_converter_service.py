@@ -1,5 +1,5 @@
 """Document Converter Service for Legal AI Vault"""
-from typing import Optional
+from typing import List, Optional
 import logging
 import io
 import tempfile
@@ -9,6 +9,46 @@ from io import BytesIO
 
 logger = logging.getLogger(__name__)
 
+# Максимальный размер секции HTML для документов без физических страниц (DOCX/TXT)
+HTML_SECTION_MAX_CHARS = 20_000
+
+_CONTAINER_RE = re.compile(r'^\s*<div class="([^"]+)">(.*)</div>\s*$', re.DOTALL)
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)[^>]*?(/?)>')
+_VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "col", "wbr"}
+
+
+def split_html_blocks(html: str) -> List[str]:
+    """
+    Split HTML fragment into top-level elements.
+
+    Разбор по тегам с подсчётом вложенности: таблицы и списки
+    никогда не разрываются между страницами.
+    """
+    blocks = []
+    depth = 0
+    block_start = 0
+    for match in _TAG_RE.finditer(html):
+        closing, tag, self_closing = match.group(1), match.group(2).lower(), match.group(3)
+        if tag in _VOID_TAGS or self_closing:
+            if depth == 0:
+                blocks.append(html[block_start:match.end()])
+                block_start = match.end()
+            continue
+        if closing:
+            depth = max(depth - 1, 0)
+            if depth == 0:
+                blocks.append(html[block_start:match.end()])
+                block_start = match.end()
+        else:
+            if depth == 0 and html[block_start:match.start()].strip():
+                # Текст вне тегов - отдельный блок
+                blocks.append(html[block_start:match.start()])
+                block_start = match.start()
+            depth += 1
+    if html[block_start:].strip():
+        blocks.append(html[block_start:])
+    return [block.strip() for block in blocks if block.strip()]
+
 
 class DocumentConverterService:
     """Service for converting documents to HTML format"""
@@ -67,6 +107,49 @@ class DocumentConverterService:
             logger.error(f"Error converting {filename} to HTML: {e}", exc_info=True)
             raise ValueError(f"Не удалось конвертировать файл {filename}: {str(e)}")
     
+    def convert_to_html_pages(
+        self,
+        file_content: bytes,
+        filename: str,
+        file_type: Optional[str] = None,
+        section_max_chars: int = HTML_SECTION_MAX_CHARS
+    ) -> List[str]:
+        """
+        Convert document to HTML split into pages for lazy viewing
+        
+        PDF is split by physical pages, XLSX by sheets, other formats into
+        sections of whole top-level blocks up to section_max_chars.
+        
+        Returns:
+            HTML of pages in order, without the container div (the client
+            renders them inside <div class="pdf-content"> etc.)
+        """
+        html = self.convert_to_html(file_content, filename, file_type)
+        
+        match = _CONTAINER_RE.match(html)
+        if not match:
+            return [html]
+        container_class, inner = match.group(1), match.group(2)
+        blocks = split_html_blocks(inner)
+        
+        if container_class in ("pdf-content", "xlsx-content"):
+            # Одна страница PDF / один лист Excel - одна страница просмотрщика
+            pages = blocks
+        else:
+            pages = []
+            current: List[str] = []
+            current_size = 0
+            for block in blocks:
+                if current and current_size + len(block) > section_max_chars:
+                    pages.append("\n".join(current))
+                    current, current_size = [], 0
+                current.append(block)
+                current_size += len(block)
+            if current:
+                pages.append("\n".join(current))
+        
+        return pages or [""]
+    
     def _convert_docx(self, file_content: bytes) -> str:
         """
         Convert DOCX to HTML using mammoth
@@ -122,16 +205,15 @@ class DocumentConverterService:
             for page_num, page in enumerate(pdf_reader.pages, 1):
                 try:
                     text = page.extract_text()
-                    if text:
-                        # Split text into paragraphs (double newlines)
-                        paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-                        
-                        html_parts.append(f'<div class="pdf-page" data-page="{page_num}">')
-                        for para in paragraphs:
-                            # Replace single newlines with <br> within paragraphs
-                            para_html = para.replace('\n', '<br/>')
-                            html_parts.append(f'<p>{para_html}</p>')
-                        html_parts.append('</div>')
+                    # Пустые страницы сохраняются, чтобы номера совпадали с физическими
+                    paragraphs = [p.strip() for p in (text or '').split('\n\n') if p.strip()]
+                    
+                    html_parts.append(f'<div class="pdf-page" data-page="{page_num}">')
+                    for para in paragraphs:
+                        # Replace single newlines with <br> within paragraphs
+                        para_html = para.replace('\n', '<br/>')
+                        html_parts.append(f'<p>{para_html}</p>')
+                    html_parts.append('</div>')
                 except Exception as e:
                     logger.warning(f"Error extracting text from page {page_num}: {e}")
                     html_parts.append(f'<div class="pdf-page" data-page="{page_num}"><p class="error">Не удалось извлечь текст со страницы {page_num}</p></div>')
@@ -140,7 +222,7 @@ class DocumentConverterService:
             
             html = '\n'.join(html_parts)
             
-            if not html or html == '<div class="pdf-content"></div>':
+            if len(html_parts) == 2:
                 raise ValueError("Не удалось извлечь текст из PDF файла")
             
             logger.info(f"Successfully converted PDF to HTML ({len(pdf_reader.pages)} pages)")
@@ -1,7 +1,9 @@
 """Document HTML Cache Service for Legal AI Vault"""
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from app.models.case import File
+from sqlalchemy import func
+from app.models.case import File, FileHtmlPage
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -29,6 +31,12 @@ class DocumentHtmlCacheService:
             if file and file.html_content:
                 logger.debug(f"Cache hit for file {file_id}")
                 return file.html_content
+            if file and self.get_page_count(file_id):
+                # Страницы, подготовленные при загрузке, собираются в полный HTML
+                pages, _ = self.get_pages(file_id, 1, None)
+                container_class = html_container_class(file.file_type)
+                logger.debug(f"Page cache hit for file {file_id}")
+                return f'<div class="{container_class}">' + "\n".join(pages.values()) + '</div>'
             logger.debug(f"Cache miss for file {file_id}")
             return None
         except Exception as e:
@@ -70,7 +78,8 @@ class DocumentHtmlCacheService:
                 logger.warning(f"File {file_id} not found, cannot invalidate cache")
                 return
             
-            if file.html_content:
+            deleted_pages = self.db.query(FileHtmlPage).filter(FileHtmlPage.file_id == file_id).delete()
+            if file.html_content or deleted_pages:
                 file.html_content = None
                 self.db.commit()
                 logger.info(f"Invalidated HTML cache for file {file_id}")
@@ -96,3 +105,96 @@ class DocumentHtmlCacheService:
             logger.error(f"Error checking cache for file {file_id}: {e}", exc_info=True)
             return False
 
+    
+    # ------------------------------------------------------------------
+    # Per-page HTML (pre-rendered at ingest time)
+    # ------------------------------------------------------------------
+    
+    def store_pages(self, file_id: str, pages: List[str]) -> int:
+        """
+        Replace pre-rendered HTML pages of a file
+        
+        Args:
+            file_id: File identifier
+            pages: HTML of pages/sections in order
+            
+        Returns:
+            Number of stored pages
+        """
+        try:
+            self.db.query(FileHtmlPage).filter(FileHtmlPage.file_id == file_id).delete()
+            self.db.add_all([
+                FileHtmlPage(
+                    file_id=file_id,
+                    page_number=number,
+                    html=html,
+                    etag=hashlib.sha1(html.encode("utf-8")).hexdigest(),
+                )
+                for number, html in enumerate(pages, 1)
+            ])
+            self.db.commit()
+            logger.info(f"Stored {len(pages)} HTML pages for file {file_id}")
+            return len(pages)
+        except Exception as e:
+            logger.error(f"Error storing HTML pages for file {file_id}: {e}", exc_info=True)
+            self.db.rollback()
+            raise
+    
+    def get_page_count(self, file_id: str) -> int:
+        """Number of pre-rendered pages (0 if not rendered yet)"""
+        return self.db.query(func.count(FileHtmlPage.id)).filter(FileHtmlPage.file_id == file_id).scalar() or 0
+    
+    def get_page_range_etag(self, file_id: str, start: int, end: Optional[int]) -> Optional[str]:
+        """
+        ETag of pages [start, end] without loading their HTML
+        
+        Returns:
+            Quoted ETag or None if the range is empty
+        """
+        query = self.db.query(FileHtmlPage.page_number, FileHtmlPage.etag).filter(
+            FileHtmlPage.file_id == file_id,
+            FileHtmlPage.page_number >= start,
+        )
+        if end is not None:
+            query = query.filter(FileHtmlPage.page_number <= end)
+        return _range_etag(query.order_by(FileHtmlPage.page_number).all())
+    
+    def get_pages(self, file_id: str, start: int, end: Optional[int]) -> Tuple[Dict[int, str], Optional[str]]:
+        """
+        Load pages [start, end] (1-based, inclusive; end=None - to the last page)
+        
+        Returns:
+            ({page_number: html}, etag of the range)
+        """
+        query = self.db.query(FileHtmlPage).filter(
+            FileHtmlPage.file_id == file_id,
+            FileHtmlPage.page_number >= start,
+        )
+        if end is not None:
+            query = query.filter(FileHtmlPage.page_number <= end)
+        rows = query.order_by(FileHtmlPage.page_number).all()
+        return {row.page_number: row.html for row in rows}, _range_etag([(row.page_number, row.etag) for row in rows])
+
+
+def _range_etag(rows: List[Tuple[int, str]]) -> Optional[str]:
+    """Combined ETag of (page_number, page_etag) rows"""
+    if not rows:
+        return None
+    digest = hashlib.sha1()
+    for page_number, etag in rows:
+        digest.update(f"{page_number}:{etag};".encode("ascii"))
+    return f'"{digest.hexdigest()}"'
+
+
+def html_container_class(file_type: Optional[str]) -> str:
+    """CSS class of the container div produced by DocumentConverterService for a file type"""
+    file_type = (file_type or "").lower().lstrip(".")
+    if file_type in ("docx", "doc"):
+        return "docx-content"
+    if file_type == "pdf":
+        return "pdf-content"
+    if file_type in ("xlsx", "xls"):
+        return "xlsx-content"
+    if file_type == "txt":
+        return "txt-content"
+    return "markitdown-content"
@@ -5,8 +5,10 @@ from app.config import config
 from app.services.yandex_embeddings import YandexEmbeddings
 from app.services.legal_splitter import LegalTextSplitter
 from app.services.bm25_retriever import BM25Retriever
+from app.services.metrics.tracing import trace_span
 from sqlalchemy.orm import Session
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +54,9 @@ class DocumentProcessor:
         
         # Initialize BM25 retriever for hybrid search
         self.bm25_retriever = BM25Retriever()
+        # {case_id: Lock} - индекс дела строится одним потоком
+        self._bm25_build_locks: Dict[str, threading.Lock] = {}
+        self._bm25_locks_guard = threading.Lock()
     
     def split_documents(
         self,
@@ -224,6 +229,37 @@ class DocumentProcessor:
             logger.error(f"Error retrieving chunks from PGVector for case {case_id}: {e}", exc_info=True)
             raise
     
+    def _ensure_bm25_index(self, case_id: str, dense_docs: List[Document], db: Optional[Session]) -> None:
+        """
+        Построить BM25 индекс дела, если его ещё нет
+
+        Для индекса нужны все чанки дела (выборка k=1000), поэтому параллельные
+        поиски (multi-query) строят его один раз: остальные ждут на блокировке дела.
+        """
+        if self.bm25_retriever.has_index(case_id):
+            return
+        with self._bm25_locks_guard:
+            lock = self._bm25_build_locks.setdefault(case_id, threading.Lock())
+        with lock:
+            if self.bm25_retriever.has_index(case_id):
+                return
+            logger.info(f"BM25 index not found for case {case_id}, building index...")
+            try:
+                # Все документы дела из vector store
+                all_docs = self.retrieve_relevant_chunks(
+                    case_id=case_id,
+                    query="",  # Пустой запрос для получения всех документов (если поддерживается)
+                    k=1000,  # Большое количество для получения всех документов
+                    db=db
+                )
+                if all_docs:
+                    # Если пустой запрос не работает, используем документы из dense search
+                    if len(all_docs) < 10:
+                        all_docs = dense_docs
+                    self.bm25_retriever.build_index(case_id, all_docs)
+            except Exception as e:
+                logger.warning(f"Could not build BM25 index for case {case_id}: {e}")
+    
     def hybrid_search(
         self,
         case_id: str,
@@ -256,71 +292,52 @@ class DocumentProcessor:
             )
             
             # 2. Sparse search (BM25)
-            # Сначала нужно убедиться, что индекс построен
-            # Для этого получаем все документы дела (можно кешировать)
-            if not self.bm25_retriever.has_index(case_id):
-                logger.info(f"BM25 index not found for case {case_id}, building index...")
-                # Получаем все документы дела из vector store для построения индекса
-                # Используем простой запрос для получения всех документов
-                try:
-                    all_docs = self.retrieve_relevant_chunks(
-                        case_id=case_id,
-                        query="",  # Пустой запрос для получения всех документов (если поддерживается)
-                        k=1000,  # Большое количество для получения всех документов
-                        db=db
-                    )
-                    if all_docs:
-                        # Если пустой запрос не работает, используем документы из dense search
-                        if len(all_docs) < 10:
-                            all_docs = dense_docs
-                        
-                        # Строим индекс
-                        self.bm25_retriever.build_index(case_id, all_docs)
-                except Exception as e:
-                    logger.warning(f"Could not build BM25 index for case {case_id}: {e}")
+            with trace_span("bm25"):
+                self._ensure_bm25_index(case_id, dense_docs, db)
             
-            # Выполняем BM25 поиск
-            sparse_docs = self.bm25_retriever.retrieve(case_id, query, k=k * 2)
+                # Выполняем BM25 поиск
+                sparse_docs = self.bm25_retriever.retrieve(case_id, query, k=k * 2)
             
             # 3. Reciprocal Rank Fusion (RRF) для объединения результатов
             # RRF score = sum(1 / (k + rank)) для каждого ранга документа
-            rrf_scores: Dict[str, float] = {}
-            rrf_docs: Dict[str, Document] = {}
+            with trace_span("rrf"):
+                rrf_scores: Dict[str, float] = {}
+                rrf_docs: Dict[str, Document] = {}
             
-            # Добавляем документы из dense search
-            for rank, doc in enumerate(dense_docs, start=1):
-                doc_id = self._get_doc_id(doc)
-                # RRF: alpha weight для dense search
-                rrf_score = alpha * (1.0 / (60 + rank))  # k=60 для RRF
-                if doc_id not in rrf_scores:
-                    rrf_scores[doc_id] = 0.0
-                    rrf_docs[doc_id] = doc
-                rrf_scores[doc_id] += rrf_score
+                # Добавляем документы из dense search
+                for rank, doc in enumerate(dense_docs, start=1):
+                    doc_id = self._get_doc_id(doc)
+                    # RRF: alpha weight для dense search
+                    rrf_score = alpha * (1.0 / (60 + rank))  # k=60 для RRF
+                    if doc_id not in rrf_scores:
+                        rrf_scores[doc_id] = 0.0
+                        rrf_docs[doc_id] = doc
+                    rrf_scores[doc_id] += rrf_score
                 
-                # Сохраняем similarity_score если есть
-                if hasattr(doc, 'metadata') and 'similarity_score' not in doc.metadata:
-                    doc.metadata['similarity_score'] = 1.0 - (rank / len(dense_docs))
+                    # Сохраняем similarity_score если есть
+                    if hasattr(doc, 'metadata') and 'similarity_score' not in doc.metadata:
+                        doc.metadata['similarity_score'] = 1.0 - (rank / len(dense_docs))
             
-            # Добавляем документы из sparse search
-            for rank, doc in enumerate(sparse_docs, start=1):
-                doc_id = self._get_doc_id(doc)
-                # RRF: (1-alpha) weight для sparse search
-                rrf_score = (1.0 - alpha) * (1.0 / (60 + rank))
-                if doc_id not in rrf_scores:
-                    rrf_scores[doc_id] = 0.0
-                    rrf_docs[doc_id] = doc
-                rrf_scores[doc_id] += rrf_score
+                # Добавляем документы из sparse search
+                for rank, doc in enumerate(sparse_docs, start=1):
+                    doc_id = self._get_doc_id(doc)
+                    # RRF: (1-alpha) weight для sparse search
+                    rrf_score = (1.0 - alpha) * (1.0 / (60 + rank))
+                    if doc_id not in rrf_scores:
+                        rrf_scores[doc_id] = 0.0
+                        rrf_docs[doc_id] = doc
+                    rrf_scores[doc_id] += rrf_score
                 
-                # Сохраняем bm25_score если есть
-                if hasattr(doc, 'metadata') and 'bm25_score' not in doc.metadata:
-                    doc.metadata['bm25_score'] = 0.0
+                    # Сохраняем bm25_score если есть
+                    if hasattr(doc, 'metadata') and 'bm25_score' not in doc.metadata:
+                        doc.metadata['bm25_score'] = 0.0
             
-            # Сортируем по RRF score (по убыванию)
-            sorted_docs = sorted(
-                rrf_docs.items(),
-                key=lambda x: rrf_scores[x[0]],
-                reverse=True
-            )
+                # Сортируем по RRF score (по убыванию)
+                sorted_docs = sorted(
+                    rrf_docs.items(),
+                    key=lambda x: rrf_scores[x[0]],
+                    reverse=True
+                )
             
             # Возвращаем top-k документов
             result_docs = [doc for doc_id, doc in sorted_docs[:k]]
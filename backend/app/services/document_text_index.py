@@ -0,0 +1,166 @@
+"""
+Document Text Index - нормализованный текст документа с обратным маппингом смещений.
+
+Проверка цитат (CitationVerifier, TabularReviewVerifier) сравнивает цитату с
+текстом документа после нормализации (нижний регистр, пробельные символы
+схлопнуты в один пробел). Индекс строится один раз на содержимое документа
+(кэш по хешу текста) и хранит:
+- нормализованный текст и смещение каждого его символа в оригинале,
+  чтобы найденное совпадение возвращалось спаном исходного текста;
+- инвертированный индекс слов для нечёткого поиска: позиции слов цитаты
+  голосуют за начало совпадения, лучшие кандидаты проверяются SequenceMatcher.
+"""
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import re
+import threading
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"\S+")
+
+# Слова, встречающиеся чаще, не голосуют (служебные слова длинных документов)
+MAX_WORD_POSITIONS = 2000
+# Сколько лучших по голосам начал проверяется SequenceMatcher
+FUZZY_CANDIDATES = 3
+TEXT_INDEX_CACHE_SIZE = 256
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация, совпадающая с нормализацией индекса"""
+    return _WHITESPACE_RE.sub(" ", (text or "").lower().strip())
+
+
+@dataclass
+class TextMatch:
+    """Совпадение цитаты: спан в оригинальном тексте и в нормализованном"""
+    start: int
+    end: int
+    normalized_start: int
+    normalized_end: int
+    similarity: float
+    exact: bool
+
+
+class DocumentTextIndex:
+    """Нормализованный текст одного документа с маппингом смещений и индексом слов"""
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        parts: List[str] = []
+        offsets = array("l")
+        for match in _TOKEN_RE.finditer(self.text):
+            start, end = match.span()
+            if parts:
+                # Пробельный промежуток -> один пробел, указывает на его начало
+                parts.append(" ")
+                offsets.append(previous_end)
+            token = match.group()
+            lowered = token.lower()
+            parts.append(lowered)
+            if len(lowered) == len(token):
+                offsets.extend(range(start, end))
+            else:
+                # lower() изменил длину (например, 'İ') - посимвольный маппинг
+                for position, char in enumerate(token, start):
+                    offsets.extend([position] * len(char.lower()))
+            previous_end = end
+        self.normalized = "".join(parts)
+        self._offsets = offsets
+        self._word_starts: Optional[List[int]] = None
+        self._word_positions: Optional[Dict[str, List[int]]] = None
+
+    def to_original_span(self, normalized_start: int, normalized_end: int) -> Tuple[int, int]:
+        """Спан нормализованного текста -> спан оригинального текста"""
+        if normalized_end <= normalized_start or not self._offsets:
+            position = self._offsets[normalized_start] if normalized_start < len(self._offsets) else len(self.text)
+            return position, position
+        return self._offsets[normalized_start], self._offsets[normalized_end - 1] + 1
+
+    def find_exact(self, quote: str) -> Optional[TextMatch]:
+        """Точное вхождение цитаты после нормализации"""
+        needle = normalize_text(quote)
+        if not needle:
+            return None
+        position = self.normalized.find(needle)
+        if position < 0:
+            return None
+        start, end = self.to_original_span(position, position + len(needle))
+        return TextMatch(start, end, position, position + len(needle), 1.0, True)
+
+    def _build_word_index(self):
+        starts: List[int] = []
+        positions: Dict[str, List[int]] = {}
+        for match in _TOKEN_RE.finditer(self.normalized):
+            positions.setdefault(match.group(), []).append(len(starts))
+            starts.append(match.start())
+        self._word_starts = starts
+        self._word_positions = positions
+
+    def find_fuzzy(self, quote: str, min_similarity: float, tolerance: int = 50) -> Optional[TextMatch]:
+        """
+        Нечёткий поиск цитаты.
+
+        Каждое вхождение слова цитаты (позиция j в цитате, позиция p в документе)
+        голосует за начало совпадения p - j. Для лучших начал окно
+        [начало - tolerance, начало + len(цитаты) + tolerance] сравнивается с
+        цитатой SequenceMatcher; спан - выровненная часть окна.
+        """
+        needle = normalize_text(quote)
+        if not needle:
+            return None
+        if self._word_positions is None:
+            self._build_word_index()
+
+        query_words = needle.split(" ")
+        frequent_ok = all(len(self._word_positions.get(w, ())) > MAX_WORD_POSITIONS for w in query_words)
+        votes: Dict[int, int] = {}
+        for offset, word in enumerate(query_words):
+            positions = self._word_positions.get(word)
+            if not positions or (len(positions) > MAX_WORD_POSITIONS and not frequent_ok):
+                continue
+            for position in positions:
+                start_word = position - offset
+                if start_word >= 0:
+                    votes[start_word] = votes.get(start_word, 0) + 1
+        if not votes:
+            return None
+
+        best: Optional[TextMatch] = None
+        for start_word, _ in sorted(votes.items(), key=lambda item: (-item[1], item[0]))[:FUZZY_CANDIDATES]:
+            anchor = self._word_starts[min(start_word, len(self._word_starts) - 1)]
+            window_start = max(0, anchor - tolerance)
+            window_end = min(len(self.normalized), anchor + len(needle) + tolerance)
+            matcher = SequenceMatcher(None, needle, self.normalized[window_start:window_end], autojunk=False)
+            similarity = matcher.ratio()
+            if similarity < min_similarity or (best and similarity <= best.similarity):
+                continue
+            blocks = [b for b in matcher.get_matching_blocks() if b.size]
+            normalized_start = window_start + blocks[0].b
+            normalized_end = window_start + blocks[-1].b + blocks[-1].size
+            start, end = self.to_original_span(normalized_start, normalized_end)
+            best = TextMatch(start, end, normalized_start, normalized_end, similarity, False)
+        return best
+
+
+_index_cache: "OrderedDict[str, DocumentTextIndex]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def get_text_index(text: str) -> DocumentTextIndex:
+    """Индекс текста документа из LRU-кэша по хешу содержимого"""
+    key = hashlib.blake2b((text or "").encode("utf-8"), digest_size=16).hexdigest()
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = DocumentTextIndex(text)
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > TEXT_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,197 @@
+"""
+Entity Index - инвертированный индекс сущностей для поиска связанных документов.
+
+Таблица entity_postings: (дело, нормализованная сущность, файл) -> число упоминаний.
+Поддерживается инкрементально хуками маппера ExtractedEntity (insert/update/delete),
+поэтому любое сохранение сущностей через ORM сразу попадает в индекс. Появление и
+исчезновение постинга синхронизируется с рёбрами упоминаний графа связей
+(app.services.relationship_graph).
+Массовые вставки в обход ORM (bulk_save_objects, raw SQL) индекс не обновляют -
+после них нужно вызвать reindex_file.
+
+Связанные документы считаются одной SQL-агрегацией по постингам сущностей
+исходного файла с весами TF-IDF: вес сущности idf = ln(1 + N / df), где N -
+число файлов дела, df - число файлов с этой сущностью. Стороны договора,
+упомянутые во всех документах дела, почти не влияют на оценку.
+"""
+from typing import List, NamedTuple
+import logging
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.models.analysis import ExtractedEntity
+from app.services.relationship_graph import link_entity_document, sync_document_mentions, unlink_entity_document
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 500
+
+_INCREMENT_SQL = text("""
+    INSERT INTO entity_postings (case_id, entity_key, file_id, mentions)
+    VALUES (:case_id, :entity_key, :file_id, 1)
+    ON CONFLICT (case_id, entity_key, file_id) DO UPDATE SET mentions = entity_postings.mentions + 1
+    RETURNING mentions
+""")
+
+_DECREMENT_SQL = text("""
+    UPDATE entity_postings SET mentions = mentions - 1
+    WHERE case_id = :case_id AND entity_key = :entity_key AND file_id = :file_id
+""")
+
+_DELETE_EMPTY_SQL = text("""
+    DELETE FROM entity_postings
+    WHERE case_id = :case_id AND entity_key = :entity_key AND file_id = :file_id AND mentions <= 0
+""")
+
+# Доля TF-IDF массы сущностей исходного файла, общая с каждым другим файлом
+_RELATED_SQL = text("""
+    WITH source AS (
+        SELECT entity_key FROM entity_postings
+        WHERE case_id = :case_id AND file_id = :file_id
+    ),
+    weights AS (
+        SELECT p.entity_key,
+               ln(1.0 + (SELECT COUNT(*) FROM files WHERE case_id = :case_id) * 1.0 / COUNT(*)) AS idf
+        FROM entity_postings p
+        JOIN source s ON s.entity_key = p.entity_key
+        WHERE p.case_id = :case_id
+        GROUP BY p.entity_key
+    ),
+    total AS (
+        SELECT SUM(idf * idf) AS mass FROM weights
+    )
+    SELECT p.file_id,
+           SUM(w.idf * w.idf) / (SELECT mass FROM total) AS score,
+           COUNT(*) AS shared_entities
+    FROM entity_postings p
+    JOIN weights w ON w.entity_key = p.entity_key
+    WHERE p.case_id = :case_id AND p.file_id <> :file_id
+    GROUP BY p.file_id
+    ORDER BY score DESC, p.file_id
+    LIMIT :limit
+""")
+
+
+class RelatedDocument(NamedTuple):
+    file_id: str
+    score: float  # 0-100
+    shared_entities: int
+
+
+def entity_key(entity_text: str) -> str:
+    """
+    Нормализованный ключ сущности: нижний регистр, пробелы схлопнуты.
+    Совпадает с нормализацией в migrations/030_add_entity_postings.sql.
+    """
+    return " ".join((entity_text or "").lower().split())[:MAX_KEY_LENGTH]
+
+
+def _posting_params(case_id, file_id, entity_text):
+    key = entity_key(entity_text)
+    if not case_id or not file_id or not key:
+        return None
+    return {"case_id": case_id, "entity_key": key, "file_id": file_id}
+
+
+def _add_posting(connection, params, entity_text: str, entity_type: str) -> None:
+    if params and connection.execute(_INCREMENT_SQL, params).scalar() == 1:
+        link_entity_document(connection, label=entity_text.strip(), entity_type=entity_type, **params)
+
+
+def _remove_posting(connection, params) -> None:
+    if params:
+        connection.execute(_DECREMENT_SQL, params)
+        if connection.execute(_DELETE_EMPTY_SQL, params).rowcount:
+            unlink_entity_document(connection, **params)
+
+
+def _after_insert(mapper, connection, target: ExtractedEntity) -> None:
+    _add_posting(connection, _posting_params(target.case_id, target.file_id, target.entity_text),
+                 target.entity_text, target.entity_type)
+
+
+def _after_delete(mapper, connection, target: ExtractedEntity) -> None:
+    _remove_posting(connection, _posting_params(target.case_id, target.file_id, target.entity_text))
+
+
+def _before_update(mapper, connection, target: ExtractedEntity) -> None:
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in ("case_id", "file_id", "entity_text")):
+        return
+    # Старые значения могли быть не загружены (expired) - берём их из БД до UPDATE
+    old = connection.execute(
+        text("SELECT case_id, file_id, entity_text FROM extracted_entities WHERE id = :id"),
+        {"id": target.id}
+    ).first()
+    if old is not None:
+        _remove_posting(connection, _posting_params(old.case_id, old.file_id, old.entity_text))
+    _add_posting(connection, _posting_params(target.case_id, target.file_id, target.entity_text),
+                 target.entity_text, target.entity_type)
+
+
+_hooks_installed = False
+
+
+def install_entity_index_hooks() -> None:
+    """Подключить обновление entity_postings к изменениям ExtractedEntity (идемпотентно)"""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    event.listen(ExtractedEntity, "after_insert", _after_insert)
+    event.listen(ExtractedEntity, "before_update", _before_update)
+    event.listen(ExtractedEntity, "after_delete", _after_delete)
+    _hooks_installed = True
+
+
+def reindex_file(db: Session, case_id: str, file_id: str) -> int:
+    """
+    Пересобрать постинги файла и его рёбра упоминаний в графе связей
+    из extracted_entities (после массовых вставок в обход ORM).
+
+    Returns:
+        Количество уникальных сущностей файла
+    """
+    counts = {}
+    labels = {}
+    rows = db.query(ExtractedEntity.entity_text, ExtractedEntity.entity_type).filter(
+        ExtractedEntity.case_id == case_id,
+        ExtractedEntity.file_id == file_id
+    ).all()
+    for entity_text, entity_type in rows:
+        key = entity_key(entity_text)
+        if key:
+            counts[key] = counts.get(key, 0) + 1
+            labels.setdefault(key, (entity_text.strip(), entity_type))
+
+    db.execute(text("DELETE FROM entity_postings WHERE case_id = :case_id AND file_id = :file_id"),
+               {"case_id": case_id, "file_id": file_id})
+    if counts:
+        db.execute(
+            text("INSERT INTO entity_postings (case_id, entity_key, file_id, mentions) "
+                 "VALUES (:case_id, :entity_key, :file_id, :mentions)"),
+            [{"case_id": case_id, "entity_key": key, "file_id": file_id, "mentions": mentions}
+             for key, mentions in counts.items()]
+        )
+    sync_document_mentions(db.connection(), case_id, file_id, labels)
+    return len(counts)
+
+
+def find_related_by_entities(db: Session, case_id: str, file_id: str, limit: int = 5) -> List[RelatedDocument]:
+    """
+    Файлы дела с общими сущностями, по убыванию TF-IDF оценки.
+
+    Args:
+        db: Database session
+        case_id: Case ID
+        file_id: Исходный файл
+        limit: Максимум результатов
+
+    Returns:
+        Список RelatedDocument (score - доля TF-IDF веса сущностей исходного файла, 0-100)
+    """
+    rows = db.execute(_RELATED_SQL, {"case_id": case_id, "file_id": file_id, "limit": limit}).all()
+    return [
+        RelatedDocument(file_id=row.file_id, score=float(row.score) * 100, shared_entities=int(row.shared_entities))
+        for row in rows
+    ]
@@ -0,0 +1,232 @@
+"""Cross-worker pub/sub brokers (Postgres LISTEN/NOTIFY, Redis, in-process)
+
+Брокер доставляет строковые payload всем процессам приложения, включая
+опубликовавший. Используется TabularEventBus и WebSocketManager.
+"""
+import logging
+import queue
+import select
+import threading
+from typing import Callable, List, Optional
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Лимит payload NOTIFY в Postgres - 8000 байт
+POSTGRES_MAX_PAYLOAD_BYTES = 7900
+# Очередь неотправленных NOTIFY; при переполнении событие теряется (клиенты догрузят по REST)
+POSTGRES_PUBLISH_QUEUE_SIZE = 10000
+POSTGRES_PUBLISH_BATCH_SIZE = 100
+
+
+def libpq_url(database_url: str) -> str:
+    """postgresql+psycopg://... -> postgresql://... (psycopg2.connect не понимает суффикс драйвера SQLAlchemy)"""
+    for prefix in ("postgresql+psycopg://", "postgresql+psycopg2://"):
+        if database_url.startswith(prefix):
+            return "postgresql://" + database_url[len(prefix):]
+    return database_url
+
+
+class InMemoryBroker:
+    """Доставка событий внутри процесса"""
+
+    name = "memory"
+    max_payload_bytes: Optional[int] = None
+
+    def __init__(self, channel: str = ""):
+        self.channel = channel
+        self._callback: Optional[Callable[[str], None]] = None
+
+    def publish(self, payload: str) -> None:
+        if self._callback is not None:
+            self._callback(payload)
+
+    def start(self, callback: Callable[[str], None]) -> None:
+        self._callback = callback
+
+    def stop(self) -> None:
+        self._callback = None
+
+
+class _ListenerThreadBroker:
+    """Базовый брокер с одним фоновым потоком-слушателем на процесс"""
+
+    name = ""
+    max_payload_bytes: Optional[int] = None
+
+    def __init__(self, channel: str, poll_interval: float = 1.0):
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, callback: Callable[[str], None]) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen_forever,
+            args=(callback,),
+            name=f"{self.channel}-listener",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+            self._thread = None
+
+    def _listen_forever(self, callback: Callable[[str], None]) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen(callback)
+            except Exception as e:
+                logger.warning(f"{self.name} listener error on channel {self.channel}: {e}, reconnecting")
+                self._stop.wait(self.poll_interval * 5)
+
+    def _listen(self, callback: Callable[[str], None]) -> None:
+        raise NotImplementedError
+
+
+class PostgresNotifyBroker(_ListenerThreadBroker):
+    """
+    Postgres LISTEN/NOTIFY: один слушатель на процесс
+
+    publish вызывается из after_commit на пути запроса, поэтому только ставит
+    payload в очередь; pg_notify выполняет фоновый поток-публикатор (пачками,
+    в порядке публикации).
+    """
+
+    name = "postgres"
+    max_payload_bytes = POSTGRES_MAX_PAYLOAD_BYTES
+
+    def __init__(self, channel: str, database_url: str, poll_interval: float = 1.0):
+        super().__init__(channel, poll_interval)
+        self.database_url = libpq_url(database_url)
+        self._outbox: "queue.Queue[str]" = queue.Queue(maxsize=POSTGRES_PUBLISH_QUEUE_SIZE)
+        self._publisher: Optional[threading.Thread] = None
+        self._publisher_lock = threading.Lock()
+
+    def publish(self, payload: str) -> None:
+        self._ensure_publisher()
+        try:
+            self._outbox.put_nowait(payload)
+        except queue.Full:
+            logger.warning(f"Postgres publish queue for {self.channel} is full, dropping event")
+
+    def stop(self) -> None:
+        super().stop()
+        with self._publisher_lock:
+            publisher, self._publisher = self._publisher, None
+        if publisher is not None:
+            # Публикатор досылает очередь и завершается
+            publisher.join(timeout=self.poll_interval * 2)
+
+    def _ensure_publisher(self) -> None:
+        with self._publisher_lock:
+            if self._publisher is None or not self._publisher.is_alive():
+                self._publisher = threading.Thread(
+                    target=self._publish_forever,
+                    name=f"{self.channel}-publisher",
+                    daemon=True,
+                )
+                self._publisher.start()
+
+    def _publish_forever(self) -> None:
+        while True:
+            try:
+                batch = [self._outbox.get(timeout=self.poll_interval)]
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            while len(batch) < POSTGRES_PUBLISH_BATCH_SIZE:
+                try:
+                    batch.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            except Exception as e:
+                logger.warning(f"Failed to publish {len(batch)} events on channel {self.channel}: {e}")
+
+    def _send(self, payloads: List[str]) -> None:
+        from sqlalchemy import text
+        from app.utils.database import engine
+
+        with engine.connect() as conn:
+            for payload in payloads:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+            conn.commit()
+
+    def _listen(self, callback: Callable[[str], None]) -> None:
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self.database_url)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel};")
+            logger.info(f"Listening for Postgres notifications on {self.channel}")
+            while not self._stop.is_set():
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    callback(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+class RedisBroker(_ListenerThreadBroker):
+    """Redis pub/sub"""
+
+    name = "redis"
+
+    def __init__(self, channel: str, redis_url: str, poll_interval: float = 1.0):
+        super().__init__(channel, poll_interval)
+        self.client = redis.from_url(redis_url, decode_responses=True)
+
+    def publish(self, payload: str) -> None:
+        self.client.publish(self.channel, payload)
+
+    def _listen(self, callback: Callable[[str], None]) -> None:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.channel)
+            while not self._stop.is_set():
+                message = pubsub.get_message(timeout=self.poll_interval)
+                if message and message.get("type") == "message":
+                    callback(message["data"])
+        finally:
+            pubsub.close()
+
+
+def create_broker(channel: str, backend: Optional[str] = None):
+    """Выбрать транспорт по EVENT_BUS_BACKEND (auto: redis -> postgres -> memory)"""
+    backend = (backend or config.EVENT_BUS_BACKEND).lower()
+    if backend == "auto":
+        if REDIS_AVAILABLE and config.REDIS_URL:
+            backend = "redis"
+        elif config.DATABASE_URL.startswith("postgres"):
+            backend = "postgres"
+        else:
+            backend = "memory"
+
+    if backend == "redis":
+        if not REDIS_AVAILABLE or not config.REDIS_URL:
+            raise ValueError("Redis event bus requires redis package and REDIS_URL")
+        return RedisBroker(channel, config.REDIS_URL)
+    if backend == "postgres":
+        return PostgresNotifyBroker(channel, config.DATABASE_URL)
+    if backend == "memory":
+        return InMemoryBroker(channel)
+    raise ValueError(f"Unknown event bus backend: {backend}")
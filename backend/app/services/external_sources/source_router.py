@@ -1,11 +1,16 @@
 """Source router for managing multiple data sources"""
-from typing import List, Dict, Any, Optional, Set
+from typing import List, Dict, Any, Optional, Set, AsyncIterator, Tuple
 from .base_source import BaseSource, SourceResult, VaultSource
+from app.utils.text_similarity import MinHasher
 import asyncio
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Глобальный дедлайн поиска по всем источникам (секунды)
+DEFAULT_SEARCH_DEADLINE = 30.0
+
 
 class SourceRouter:
     """
@@ -13,13 +18,28 @@ class SourceRouter:
     Implements the pattern shown in Harvey's Assistant interface.
     """
     
-    def __init__(self):
-        """Initialize the source router"""
+    def __init__(self, deadline: float = DEFAULT_SEARCH_DEADLINE):
+        """
+        Initialize the source router
+        
+        Args:
+            deadline: Default global deadline for a search across all sources (seconds)
+        """
         self._sources: Dict[str, BaseSource] = {}
         self._source_priority: Dict[str, int] = {}
+        self._source_timeouts: Dict[str, float] = {}
+        self._hedge_delays: Dict[str, float] = {}
         self._default_sources: Set[str] = {"vault"}  # Always include vault by default
+        self.deadline = deadline
+        self._minhasher = MinHasher()
     
-    def register_source(self, source: BaseSource, priority: int = 50) -> None:
+    def register_source(
+        self,
+        source: BaseSource,
+        priority: int = 50,
+        timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None
+    ) -> None:
         """
         Register a data source
         
@@ -28,9 +48,21 @@ class SourceRouter:
             priority: Priority of the source (higher = more priority, default: 50)
                       Прямые парсеры должны иметь priority > 100
                       Web search fallback должен иметь priority < 50
+            timeout: Per-source time budget in seconds (None = bounded only by the global deadline)
+            hedge_after: If set, a second (hedged) request is started when the first one
+                         has not answered within this many seconds or has failed;
+                         the first successful answer wins
         """
         self._sources[source.name] = source
         self._source_priority[source.name] = priority
+        if timeout is not None:
+            self._source_timeouts[source.name] = timeout
+        else:
+            self._source_timeouts.pop(source.name, None)
+        if hedge_after is not None:
+            self._hedge_delays[source.name] = hedge_after
+        else:
+            self._hedge_delays.pop(source.name, None)
         logger.info(f"Registered source: {source.name} with priority {priority}")
     
     def unregister_source(self, name: str) -> bool:
@@ -47,6 +79,8 @@ class SourceRouter:
             del self._sources[name]
             if name in self._source_priority:
                 del self._source_priority[name]
+            self._source_timeouts.pop(name, None)
+            self._hedge_delays.pop(name, None)
             logger.info(f"Unregistered source: {name}")
             return True
         return False
@@ -88,13 +122,153 @@ class SourceRouter:
                 results[name] = False
         return results
     
+    def _resolve_active_sources(self, source_names: Optional[List[str]]) -> List[BaseSource]:
+        """Resolve requested source names to enabled, registered sources"""
+        if source_names is None:
+            sources_to_use = self._default_sources
+        else:
+            sources_to_use = set(source_names)
+        
+        return [
+            self._sources[name]
+            for name in sources_to_use
+            if name in self._sources and self._sources[name].enabled
+        ]
+    
+    async def _hedged_search(
+        self,
+        source: BaseSource,
+        query: str,
+        max_results: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> List[SourceResult]:
+        """
+        Search one source, issuing a hedged retry if it is slow or fails.
+        
+        Raises the last error if every attempt failed.
+        """
+        await source.ensure_initialized()
+        
+        def start_attempt() -> asyncio.Task:
+            return asyncio.ensure_future(
+                source.search(query=query, max_results=max_results, filters=filters)
+            )
+        
+        hedge_after = self._hedge_delays.get(source.name)
+        if hedge_after is None:
+            return await start_attempt()
+        
+        attempts = {start_attempt()}
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while attempts:
+                done, attempts = await asyncio.wait(
+                    attempts,
+                    timeout=None if hedged else hedge_after,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                    last_error = attempt.exception()
+                    logger.warning(f"Source {source.name} attempt failed: {last_error}")
+                if not hedged:
+                    hedged = True
+                    logger.info(f"Source {source.name}: starting hedged request")
+                    attempts.add(start_attempt())
+            raise last_error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+    
+    async def _search_with_budget(
+        self,
+        source: BaseSource,
+        query: str,
+        max_results: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> List[SourceResult]:
+        """Search one source within its time budget; never raises"""
+        timeout = self._source_timeouts.get(source.name)
+        try:
+            return await asyncio.wait_for(
+                self._hedged_search(source, query, max_results, filters),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Source {source.name} exceeded its budget of {timeout}s")
+            return []
+        except Exception as e:
+            logger.error(f"Error searching source {source.name}: {e}", exc_info=True)
+            return []
+    
+    async def search_stream(
+        self,
+        query: str,
+        source_names: Optional[List[str]] = None,
+        max_results_per_source: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, List[SourceResult]]]:
+        """
+        Search across multiple sources, yielding results in completion order
+        
+        Fast sources are emitted as soon as they answer; sources still running
+        when the global deadline expires are cancelled and skipped.
+        
+        Args:
+            query: Search query
+            source_names: List of source names to search (None = default sources)
+            max_results_per_source: Max results from each source
+            filters: Filters to apply (passed to each source)
+            deadline: Global deadline in seconds (None = router default)
+            
+        Yields:
+            Tuples of (source_name, list of SourceResult)
+        """
+        active_sources = self._resolve_active_sources(source_names)
+        if not active_sources:
+            logger.warning("No active sources to search")
+            return
+        
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + (self.deadline if deadline is None else deadline)
+        
+        task_to_name = {
+            asyncio.ensure_future(
+                self._search_with_budget(source, query, max_results_per_source, filters)
+            ): source.name
+            for source in active_sources
+        }
+        pending = set(task_to_name)
+        try:
+            while pending:
+                remaining = deadline_at - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task_to_name[task], task.result()
+        finally:
+            if pending:
+                logger.warning(
+                    f"Search deadline reached, dropping sources: "
+                    f"{sorted(task_to_name[t] for t in pending)}"
+                )
+            for task in pending:
+                task.cancel()
+    
     async def search(
         self,
         query: str,
         source_names: Optional[List[str]] = None,
         max_results_per_source: int = 10,
         filters: Optional[Dict[str, Any]] = None,
-        parallel: bool = True
+        parallel: bool = True,
+        deadline: Optional[float] = None
     ) -> Dict[str, List[SourceResult]]:
         """
         Search across multiple sources
@@ -105,22 +279,13 @@ class SourceRouter:
             max_results_per_source: Max results from each source
             filters: Filters to apply (passed to each source)
             parallel: Whether to search sources in parallel
+            deadline: Global deadline in seconds for parallel search (None = router default)
             
         Returns:
             Dictionary of source_name -> list of SourceResult
+            (sources that failed or missed the deadline map to an empty list)
         """
-        # Determine which sources to use
-        if source_names is None:
-            sources_to_use = self._default_sources
-        else:
-            sources_to_use = set(source_names)
-        
-        # Filter to only enabled and registered sources
-        active_sources = [
-            self._sources[name] 
-            for name in sources_to_use 
-            if name in self._sources and self._sources[name].enabled
-        ]
+        active_sources = self._resolve_active_sources(source_names)
         
         if not active_sources:
             logger.warning("No active sources to search")
@@ -129,39 +294,22 @@ class SourceRouter:
         results: Dict[str, List[SourceResult]] = {}
         
         if parallel:
-            # Search all sources in parallel
-            async def search_source(source: BaseSource) -> tuple:
-                try:
-                    await source.ensure_initialized()
-                    source_results = await source.search(
-                        query=query,
-                        max_results=max_results_per_source,
-                        filters=filters
-                    )
-                    return source.name, source_results
-                except Exception as e:
-                    logger.error(f"Error searching source {source.name}: {e}", exc_info=True)
-                    return source.name, []
-            
-            tasks = [search_source(source) for source in active_sources]
-            search_results = await asyncio.gather(*tasks)
-            
-            for source_name, source_results in search_results:
+            async for source_name, source_results in self.search_stream(
+                query=query,
+                source_names=[source.name for source in active_sources],
+                max_results_per_source=max_results_per_source,
+                filters=filters,
+                deadline=deadline
+            ):
                 results[source_name] = source_results
+            for source in active_sources:
+                results.setdefault(source.name, [])
         else:
             # Search sources sequentially
             for source in active_sources:
-                try:
-                    await source.ensure_initialized()
-                    source_results = await source.search(
-                        query=query,
-                        max_results=max_results_per_source,
-                        filters=filters
-                    )
-                    results[source.name] = source_results
-                except Exception as e:
-                    logger.error(f"Error searching source {source.name}: {e}", exc_info=True)
-                    results[source.name] = []
+                results[source.name] = await self._search_with_budget(
+                    source, query, max_results_per_source, filters
+                )
         
         # Log summary
         total_results = sum(len(r) for r in results.values())
@@ -184,7 +332,8 @@ class SourceRouter:
         Args:
             results: Results from search()
             max_total: Maximum total results to return
-            dedup_threshold: Similarity threshold for deduplication
+            dedup_threshold: Estimated Jaccard similarity (MinHash over word shingles)
+                             above which two results are considered near-duplicates
             
         Returns:
             Sorted and deduplicated list of results
@@ -201,20 +350,30 @@ class SourceRouter:
         # Sort by relevance score (descending)
         all_results.sort(key=lambda r: r.relevance_score, reverse=True)
         
-        # Simple deduplication based on content similarity
+        # Near-duplicate detection: exact digest first, then MinHash similarity
         deduplicated: List[SourceResult] = []
-        seen_content_hashes: Set[int] = set()
+        seen_digests: Set[str] = set()
+        kept_signatures: List[List[int]] = []
         
         for result in all_results:
-            # Simple hash-based dedup (can be improved with semantic similarity)
-            content_hash = hash(result.content[:200] if len(result.content) > 200 else result.content)
+            normalized = " ".join(result.content.lower().split())
+            digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+            if digest in seen_digests:
+                continue
             
-            if content_hash not in seen_content_hashes:
-                seen_content_hashes.add(content_hash)
-                deduplicated.append(result)
-                
-                if len(deduplicated) >= max_total:
-                    break
+            signature = self._minhasher.signature(normalized)
+            if any(
+                MinHasher.similarity(signature, kept) >= dedup_threshold
+                for kept in kept_signatures
+            ):
+                continue
+            
+            seen_digests.add(digest)
+            kept_signatures.append(signature)
+            deduplicated.append(result)
+            
+            if len(deduplicated) >= max_total:
+                break
         
         logger.info(
             f"Aggregated results: {len(all_results)} -> {len(deduplicated)} after dedup"
@@ -317,7 +476,9 @@ def initialize_source_router(rag_service=None, register_official_sources: bool =
             # VSRFSource - прямой парсер для vsrf.ru
             from .vsrf_source import VSRFSource
             vsrf_source = VSRFSource()
-            _global_router.register_source(vsrf_source, priority=150)  # Высокий приоритет (прямой парсер)
+            _global_router.register_source(
+                vsrf_source, priority=150, timeout=15.0, hedge_after=5.0
+            )  # Высокий приоритет (прямой парсер)
             logger.info("Registered VSRFSource")
         except Exception as e:
             logger.warning(f"Failed to register VSRFSource: {e}")
@@ -326,7 +487,9 @@ def initialize_source_router(rag_service=None, register_official_sources: bool =
             # KadArbitrSource - прямой парсер для kad.arbitr.ru
             from .kad_arbitr_source import KadArbitrSource
             kad_source = KadArbitrSource()
-            _global_router.register_source(kad_source, priority=150)  # Высокий приоритет (прямой парсер)
+            _global_router.register_source(
+                kad_source, priority=150, timeout=15.0, hedge_after=5.0
+            )  # Высокий приоритет (прямой парсер)
             logger.info("Registered KadArbitrSource")
         except Exception as e:
             logger.warning(f"Failed to register KadArbitrSource: {e}")
@@ -0,0 +1,167 @@
+"""
+Incremental Indexer - инкрементальная переиндексация файлов дела в PGVector
+
+Для каждого файла хранится content_hash (в metadata его чанков). При
+переиндексации файл, чей текст не изменился, не трогается. Изменённый файл
+заново режется на чанки, и чанки upsert'ятся по стабильному chunk_id
+(legal_splitter.generate_chunk_id от file_id). Эмбеддинги чанков с тем же
+текстом переиспользуются, в embeddings API уходят только новые тексты.
+Чанки, которых больше нет, и чанки удалённых файлов удаляются.
+"""
+from typing import Any, Dict, List, Optional
+import hashlib
+import logging
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """Хэш текста файла, с которым сравнивается проиндексированная версия"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_file_metadata(file, classification=None) -> Dict[str, Any]:
+    """Metadata чанков файла (источник + классификация)"""
+    metadata = {
+        "source": file.filename,
+        "file_id": file.id,
+        "file_type": file.file_type or "unknown",
+    }
+    if classification:
+        metadata["doc_type"] = classification.doc_type or "other"
+        metadata["is_privileged"] = str(classification.is_privileged) if classification.is_privileged else "false"
+        metadata["relevance_score"] = classification.relevance_score or 0
+    return metadata
+
+
+class IncrementalIndexer:
+    """Переиндексация только изменившихся файлов дела"""
+
+    def __init__(self, document_processor):
+        self.document_processor = document_processor
+        self.vector_store = document_processor.vector_store
+
+    def index_file(
+        self,
+        case_id: str,
+        file_id: str,
+        filename: str,
+        text: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        file_hash: Optional[str] = None,
+    ) -> Dict[str, int]:
+        """
+        Проиндексировать один файл: upsert чанков по chunk_id, удаление устаревших
+
+        Returns:
+            {"chunks", "embedded", "reused", "deleted"}
+        """
+        file_hash = file_hash or content_hash(text)
+        documents: List[Document] = self.document_processor.split_documents(
+            text=text,
+            filename=filename,
+            metadata={**(metadata or {}), "case_id": case_id, "content_hash": file_hash},
+            file_id=file_id,
+        )
+
+        existing = self.vector_store.get_file_chunk_embeddings(case_id, file_id) if documents else {}
+        embeddings: List[Optional[str]] = []
+        to_embed: List[Document] = []
+        for doc in documents:
+            embedding = existing.get(hashlib.md5(doc.page_content.encode("utf-8")).hexdigest())
+            embeddings.append(embedding)
+            if embedding is None:
+                to_embed.append(doc)
+
+        if to_embed:
+            fresh = iter(self.document_processor.create_embeddings(to_embed))
+            embeddings = [
+                embedding if embedding is not None
+                else "[" + ",".join(str(float(x)) for x in next(fresh)) + "]"
+                for embedding in embeddings
+            ]
+
+        chunks = [
+            (doc.metadata["chunk_id"], embedding, {"page_content": doc.page_content, "metadata": doc.metadata})
+            for doc, embedding in zip(documents, embeddings)
+        ]
+        deleted = self.vector_store.replace_file_chunks(case_id, file_id, chunks)
+
+        return {
+            "chunks": len(documents),
+            "embedded": len(to_embed),
+            "reused": len(documents) - len(to_embed),
+            "deleted": deleted,
+        }
+
+    def reindex_case(
+        self,
+        case_id: str,
+        files: List[Any],
+        classification_map: Optional[Dict[str, Any]] = None,
+        force: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Переиндексировать дело: только файлы, чей content_hash отличается от проиндексированного
+
+        Args:
+            case_id: ID дела
+            files: Файлы дела (модели File)
+            classification_map: file_id -> DocumentClassification
+            force: Переиндексировать все файлы независимо от хэша
+
+        Returns:
+            {"files": [статус по каждому файлу], "changed": bool, ...}
+        """
+        classification_map = classification_map or {}
+        indexed = self.vector_store.get_indexed_files(case_id)
+        results = []
+
+        for file in files:
+            status = {"file_id": file.id, "filename": file.filename}
+            if not file.original_text:
+                results.append({**status, "status": "skipped", "chunks": 0})
+                continue
+
+            file_hash = content_hash(file.original_text)
+            indexed_hash, indexed_chunks = indexed.get(file.id, (None, 0))
+            if not force and indexed_hash == file_hash:
+                results.append({**status, "status": "unchanged", "chunks": indexed_chunks})
+                continue
+
+            try:
+                stats = self.index_file(
+                    case_id,
+                    file.id,
+                    file.filename,
+                    file.original_text,
+                    metadata=build_file_metadata(file, classification_map.get(file.id)),
+                    file_hash=file_hash,
+                )
+                results.append({**status, "status": "updated" if file.id in indexed else "indexed", **stats})
+            except Exception as e:
+                logger.error(f"Failed to reindex file {file.id} of case {case_id}: {e}", exc_info=True)
+                results.append({**status, "status": "error", "error": str(e)})
+
+        orphans = [file_id for file_id in indexed if file_id not in {file.id for file in files}]
+        removed = self.vector_store.delete_orphan_vectors(case_id, [file.id for file in files]) if orphans else 0
+
+        changed = removed > 0 or any(r["status"] in ("indexed", "updated") for r in results)
+        if changed:
+            # BM25 индекс дела строится из чанков - после изменений перестраивается
+            self.document_processor.bm25_retriever.remove_index(case_id)
+
+        touched = [r for r in results if r["status"] in ("indexed", "updated")]
+        logger.info(
+            f"Incremental reindex of case {case_id}: {len(touched)}/{len(files)} files reindexed, "
+            f"{sum(r.get('embedded', 0) for r in touched)} chunks embedded, {removed} orphan chunks removed"
+        )
+        return {
+            "files": results,
+            "changed": changed,
+            "files_reindexed": len(touched),
+            "chunks_embedded": sum(r.get("embedded", 0) for r in touched),
+            "orphan_chunks_removed": removed,
+        }
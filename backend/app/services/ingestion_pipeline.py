@@ -0,0 +1,626 @@
+"""
+Ingestion Pipeline - фоновая обработка загруженных файлов
+
+Загрузка (routes/upload.py) только сохраняет файлы и создаёт IngestionJob,
+а дальнейшая обработка идёт стадиями:
+
+    parse -> classify -> index (chunk + embed + store)
+
+Между стадиями - ограниченные очереди (backpressure), блокирующие вызовы
+(парсеры, LLM-классификатор, embeddings, БД) выполняются в пуле потоков,
+поэтому event loop воркера не блокируется. Прогресс по каждому файлу
+сохраняется в ingestion_files и публикуется подписчикам (SSE).
+"""
+from typing import Any, Callable, Dict, List, Optional
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+
+from app.config import config
+from app.services.rate_limiter import LLMPriority, llm_priority
+
+logger = logging.getLogger(__name__)
+
+# Терминальные статусы файла
+_TERMINAL_STATUSES = ("completed", "failed")
+
+# Задача без активности дольше этого времени считается брошенной (воркер упал) и возобновляется
+STALE_JOB_SECONDS = 600
+
+
+def sanitize_text(text: str) -> str:
+    """
+    Очищает текст от NUL символов и других недопустимых символов для PostgreSQL
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Очищенный текст без NUL символов
+    """
+    if not text:
+        return text
+
+    # Удаляем NUL символы (0x00), которые не поддерживаются PostgreSQL
+    sanitized = text.replace('\x00', '')
+
+    # Удаляем другие недопустимые управляющие символы (кроме \n, \r, \t)
+    sanitized = ''.join(char for char in sanitized if ord(char) >= 32 or char in '\n\r\t')
+
+    return sanitized
+
+
+@dataclass
+class IngestionItem:
+    """Файл, проходящий через стадии пайплайна"""
+    ingestion_file_id: str
+    job_id: str
+    case_id: str
+    filename: str
+    file_type: str
+    storage_path: str
+    text: Optional[str] = None
+    classification: Optional[Dict[str, Any]] = None
+    file_id: Optional[str] = None
+
+
+class IngestionProgressBroker:
+    """In-process pub/sub событий прогресса по job_id (для SSE)"""
+
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """Подписаться на события задачи"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        """Отписаться от событий задачи"""
+        queues = self._subscribers.get(job_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._subscribers.pop(job_id, None)
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        """Отправить событие всем подписчикам (медленный подписчик теряет старые события)"""
+        for queue in self._subscribers.get(job_id, []):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+
+class IngestionPipeline:
+    """
+    Staged ingestion pipeline with bounded queues between stages.
+
+    Stage methods (parse_file, classify_file, index_file) are synchronous and
+    run in a thread pool; they can be overridden in tests.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable] = None,
+        workers_per_stage: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        max_threads: Optional[int] = None,
+    ):
+        """
+        Args:
+            session_factory: Фабрика сессий БД (по умолчанию SessionLocal)
+            workers_per_stage: Количество параллельных обработчиков на стадию
+            queue_size: Размер очереди между стадиями
+            max_threads: Размер пула потоков для блокирующих операций
+        """
+        if session_factory is None:
+            from app.utils.database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.workers_per_stage = workers_per_stage or config.INGESTION_WORKERS_PER_STAGE
+        self.queue_size = queue_size or config.INGESTION_QUEUE_SIZE
+        self.max_threads = max_threads or config.INGESTION_MAX_THREADS
+        self.progress = IngestionProgressBroker()
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._feeders: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._document_processor = None
+        self._classifier_service = None
+        self._classifier_job_id: Optional[str] = None
+        self._classifier_lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers) and self._loop is not None and not self._loop.is_closed()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Запустить обработчики стадий на текущем event loop"""
+        if self.is_running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="ingestion")
+        self._queues = {
+            "parse": asyncio.Queue(maxsize=self.queue_size),
+            "classify": asyncio.Queue(maxsize=self.queue_size),
+            "index": asyncio.Queue(maxsize=self.queue_size),
+        }
+        stages = [
+            ("parse", "parsing", self.parse_file, "classify"),
+            ("classify", "classifying", self.classify_file, "index"),
+            ("index", "indexing", self.index_file, None),
+        ]
+        for queue_name, stage, handler, next_queue in stages:
+            for i in range(self.workers_per_stage):
+                self._workers.append(asyncio.create_task(
+                    self._stage_worker(queue_name, stage, handler, next_queue),
+                    name=f"ingestion-{queue_name}-{i}"
+                ))
+        logger.info(
+            f"Ingestion pipeline started: {self.workers_per_stage} workers/stage, "
+            f"queue size {self.queue_size}, {self.max_threads} threads"
+        )
+
+    async def stop(self) -> None:
+        """Остановить обработчики (незавершённые файлы будут возобновлены при следующем старте)"""
+        tasks = self._workers + list(self._feeders)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._feeders = set()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        logger.info("Ingestion pipeline stopped")
+
+    async def join(self) -> None:
+        """Дождаться обработки всех поставленных в очередь файлов"""
+        while self._feeders:
+            await asyncio.gather(*list(self._feeders), return_exceptions=True)
+        for name in ("parse", "classify", "index"):
+            await self._queues[name].join()
+
+    async def submit(self, job_id: str) -> None:
+        """
+        Поставить файлы задачи в очередь обработки и сразу вернуть управление
+
+        Файлы подаются в ограниченную очередь фоновой задачей: ожидание на
+        заполненной очереди - это backpressure, и HTTP-запрос его не ждёт.
+        """
+        await self.start()
+        feeder = asyncio.create_task(self._feed(job_id), name=f"ingestion-feed-{job_id}")
+        self._feeders.add(feeder)
+        feeder.add_done_callback(self._feeders.discard)
+
+    async def _feed(self, job_id: str) -> None:
+        try:
+            items = await self._run_blocking(self._load_pending_items, job_id)
+            for item in items:
+                await self._queues["parse"].put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to enqueue ingestion job {job_id}: {e}", exc_info=True)
+
+    async def resume_pending(self) -> int:
+        """Возобновить незавершённые задачи (например, после рестарта воркера)"""
+        await self.start()
+        job_ids = await self._run_blocking(self._load_unfinished_job_ids)
+        for job_id in job_ids:
+            await self.submit(job_id)
+        if job_ids:
+            logger.info(f"Resumed {len(job_ids)} unfinished ingestion jobs")
+        return len(job_ids)
+
+    # ------------------------------------------------------------------
+    # Stage workers
+    # ------------------------------------------------------------------
+
+    async def _run_blocking(self, func: Callable, *args):
+        # Контекст (полоса допуска LLM) передаётся в рабочий поток, как в asyncio.to_thread
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, func, *args)
+
+    @llm_priority(LLMPriority.BULK)
+    async def _stage_worker(
+        self,
+        queue_name: str,
+        stage: str,
+        handler: Callable[[IngestionItem], None],
+        next_queue: Optional[str],
+    ) -> None:
+        queue = self._queues[queue_name]
+        while True:
+            item: IngestionItem = await queue.get()
+            try:
+                await self._set_file_state(item, stage=stage, status="processing")
+                await self._run_blocking(handler, item)
+                if next_queue:
+                    await self._queues[next_queue].put(item)
+                else:
+                    await self._set_file_state(item, stage="done", status="completed")
+                    await self._maybe_finalize_job(item.job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    f"Ingestion of {item.filename} failed at stage '{stage}': {e}",
+                    exc_info=True
+                )
+                try:
+                    await self._set_file_state(item, stage=stage, status="failed", error=str(e))
+                    await self._maybe_finalize_job(item.job_id)
+                except Exception as report_error:
+                    # Обработчик стадии должен пережить недоступность БД
+                    logger.error(
+                        f"Failed to record ingestion failure for {item.filename}: {report_error}",
+                        exc_info=True
+                    )
+            finally:
+                queue.task_done()
+
+    async def _set_file_state(
+        self,
+        item: IngestionItem,
+        stage: str,
+        status: str,
+        error: Optional[str] = None,
+    ) -> None:
+        await self._run_blocking(self._persist_file_state, item, stage, status, error)
+        self.progress.publish(item.job_id, {
+            "type": "file_progress",
+            "job_id": item.job_id,
+            "ingestion_file_id": item.ingestion_file_id,
+            "filename": item.filename,
+            "stage": stage,
+            "status": status,
+            "file_id": item.file_id,
+            "error": error,
+        })
+
+    async def _maybe_finalize_job(self, job_id: str) -> None:
+        job_state = await self._run_blocking(self._finalize_job_if_done, job_id)
+        if job_state:
+            self.progress.publish(job_id, {"type": "job_completed", **job_state})
+
+    # ------------------------------------------------------------------
+    # Stage handlers (blocking, run in thread pool)
+    # ------------------------------------------------------------------
+
+    def parse_file(self, item: IngestionItem) -> None:
+        """Извлечь текст из принятого файла"""
+        from app.services.parsing_executor import get_parsing_executor
+
+        with open(os.path.join(config.UPLOAD_DIR, item.storage_path), "rb") as f:
+            content = f.read()
+        # CPU-bound разбор выполняется в пуле процессов, поток только ждёт результат
+        documents = get_parsing_executor().load_document_sync(content, item.filename)
+        if not documents:
+            raise ValueError(f"Loader не вернул документы для файла '{item.filename}'")
+
+        text = sanitize_text("\n\n".join(doc.page_content for doc in documents))
+        if not text or not text.strip():
+            raise ValueError(f"Файл '{item.filename}' не содержит текста или не может быть прочитан")
+        item.text = text
+
+    def classify_file(self, item: IngestionItem) -> None:
+        """Классифицировать документ (ошибка классификации не прерывает обработку)"""
+        try:
+            item.classification = self._get_classifier_service(item.job_id).classify_document(
+                text=item.text,
+                filename=item.filename,
+                case_context=None
+            )
+        except Exception as e:
+            logger.warning(f"Error classifying document {item.filename}: {e}", exc_info=True)
+            item.classification = {
+                "doc_type": "other",
+                "tags": [],
+                "confidence": 0.0,
+                "needs_human_review": True,
+                "reasoning": f"Ошибка классификации: {str(e)}",
+                "classifier": "error"
+            }
+
+    def _get_classifier_service(self, job_id: str):
+        """
+        Сервис классификации, общий для всех файлов; в начале каждого задания
+        локальный классификатор запрашивается заново, чтобы переобучение на
+        свежей истории (get_local_classifier, раз в RETRAIN_INTERVAL) срабатывало
+        и в долгоживущем процессе
+        """
+        from app.services.document_classifier_service import DocumentClassifierService
+        from app.services.local_document_classifier import get_local_classifier
+
+        with self._classifier_lock:
+            if self._classifier_service is None or self._classifier_job_id != job_id:
+                db = self.session_factory()
+                try:
+                    if self._classifier_service is None:
+                        self._classifier_service = DocumentClassifierService(db=db)
+                    else:
+                        self._classifier_service.local_classifier = get_local_classifier(db)
+                finally:
+                    db.close()
+                self._classifier_job_id = job_id
+            return self._classifier_service
+
+    def index_file(self, item: IngestionItem) -> None:
+        """Сохранить File, классификацию и чанки в PGVector"""
+        from app.services.document_processor import DocumentProcessor
+        from app.services.incremental_indexer import IncrementalIndexer
+
+        if self._document_processor is None:
+            self._document_processor = DocumentProcessor()
+
+        with open(os.path.join(config.UPLOAD_DIR, item.storage_path), "rb") as f:
+            content = f.read()
+
+        db = self.session_factory()
+        try:
+            file_model = self._save_file_records(db, item, content)
+            classification = item.classification or {}
+
+            metadata = {"case_id": item.case_id}
+            if classification:
+                metadata["doc_type"] = classification.get("doc_type", "other")
+                metadata["classification_confidence"] = classification.get("confidence", 0.0)
+                metadata["is_privileged"] = classification.get("is_privileged", False)
+                metadata["key_topics"] = classification.get("tags", [])
+                metadata["relevance_score"] = classification.get("relevance_score", 0)
+
+            # Чанки сохраняются с content_hash и стабильными chunk_id - повторная
+            # переиндексация дела этот файл не трогает, пока текст не изменится
+            IncrementalIndexer(self._document_processor).index_file(
+                item.case_id,
+                file_model.id,
+                item.filename,
+                item.text,
+                metadata=metadata,
+            )
+            self._prerender_html(db, file_model.id, content, item)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        # Текст больше не нужен - освобождаем память до финализации задачи
+        item.text = None
+
+    def _save_file_records(self, db, item: IngestionItem, content: bytes):
+        """
+        Создать File и DocumentClassification файла загрузки (или обновить ранее созданные)
+
+        File привязывается к ingestion_files.file_id в той же транзакции, поэтому
+        повторная индексация файла после падения воркера (resume_pending)
+        находит уже созданные записи и не дублирует их.
+        """
+        from app.models.case import File as FileModel
+        from app.models.analysis import DocumentClassification
+        from app.models.ingestion import IngestionFile
+
+        ingestion_file = db.query(IngestionFile).filter(IngestionFile.id == item.ingestion_file_id).first()
+        file_model = None
+        if ingestion_file is not None and ingestion_file.file_id:
+            file_model = db.query(FileModel).filter(FileModel.id == ingestion_file.file_id).first()
+        if file_model is None:
+            file_model = FileModel(
+                case_id=item.case_id,
+                filename=item.filename[:255],
+                file_type=item.file_type[:50],
+                file_path=item.storage_path,
+            )
+            db.add(file_model)
+        file_model.original_text = item.text
+        file_model.file_content = content
+        db.flush()
+        item.file_id = file_model.id
+        if ingestion_file is not None:
+            ingestion_file.file_id = file_model.id
+
+        classification = item.classification or {}
+        if classification:
+            record = db.query(DocumentClassification).filter(
+                DocumentClassification.file_id == file_model.id
+            ).first()
+            if record is None:
+                record = DocumentClassification(
+                    case_id=item.case_id,
+                    file_id=file_model.id,
+                    relevance_score=0,
+                    is_privileged="false",
+                    privilege_type="none",
+                    prompt_version="v1"
+                )
+                db.add(record)
+            record.doc_type = classification.get("doc_type", "other")
+            record.key_topics = classification.get("tags", [])
+            record.confidence = str(classification.get("confidence", 0.0))
+            record.reasoning = classification.get("reasoning", "")
+            record.needs_human_review = "true" if classification.get("needs_human_review", False) else "false"
+            record.classifier = classification.get("classifier")
+        db.commit()
+        return file_model
+
+    def _prerender_html(self, db, file_id: str, content: bytes, item: IngestionItem) -> None:
+        """Подготовить постраничный HTML для просмотрщика (ошибка не прерывает обработку)"""
+        from app.services.document_html_cache import DocumentHtmlCacheService
+        from app.services.parsing_executor import get_parsing_executor
+
+        try:
+            pages = get_parsing_executor().render_html_pages_sync(content, item.filename, item.file_type)
+            DocumentHtmlCacheService(db).store_pages(file_id, pages)
+        except Exception as e:
+            # Просмотрщик отрендерит файл при первом открытии
+            logger.warning(f"HTML pre-render failed for {item.filename}: {e}")
+
+    # ------------------------------------------------------------------
+    # Persistence helpers (blocking)
+    # ------------------------------------------------------------------
+
+    def _load_pending_items(self, job_id: str) -> List[IngestionItem]:
+        from app.models.ingestion import IngestionJob, IngestionFile
+
+        db = self.session_factory()
+        try:
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if not job:
+                logger.warning(f"Ingestion job {job_id} not found")
+                return []
+            if job.status == "pending":
+                job.status = "processing"
+                db.commit()
+            files = db.query(IngestionFile).filter(
+                IngestionFile.job_id == job_id,
+                IngestionFile.status.notin_(_TERMINAL_STATUSES)
+            ).all()
+            return [
+                IngestionItem(
+                    ingestion_file_id=f.id,
+                    job_id=f.job_id,
+                    case_id=f.case_id,
+                    filename=f.filename,
+                    file_type=f.file_type,
+                    storage_path=f.storage_path,
+                )
+                for f in files
+            ]
+        finally:
+            db.close()
+
+    def _load_unfinished_job_ids(self) -> List[str]:
+        """Claim stale unfinished jobs (atomic update so only one worker resumes each job)"""
+        from datetime import timedelta
+        from app.models.ingestion import IngestionJob
+
+        cutoff = datetime.utcnow() - timedelta(seconds=STALE_JOB_SECONDS)
+        db = self.session_factory()
+        try:
+            rows = db.query(IngestionJob.id).filter(
+                IngestionJob.status.in_(("pending", "processing")),
+                IngestionJob.updated_at < cutoff
+            ).all()
+            claimed = []
+            for (job_id,) in rows:
+                updated = db.query(IngestionJob).filter(
+                    IngestionJob.id == job_id,
+                    IngestionJob.updated_at < cutoff
+                ).update({IngestionJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+                if updated:
+                    claimed.append(job_id)
+            return claimed
+        finally:
+            db.close()
+
+    def _persist_file_state(
+        self,
+        item: IngestionItem,
+        stage: str,
+        status: str,
+        error: Optional[str],
+    ) -> None:
+        from app.models.ingestion import IngestionJob, IngestionFile
+
+        db = self.session_factory()
+        try:
+            ingestion_file = db.query(IngestionFile).filter(IngestionFile.id == item.ingestion_file_id).first()
+            if ingestion_file:
+                ingestion_file.stage = stage
+                ingestion_file.status = status
+                ingestion_file.error_message = error
+                if item.file_id:
+                    ingestion_file.file_id = item.file_id
+                # Heartbeat задачи: по нему другие воркеры отличают живую задачу от брошенной
+                db.query(IngestionJob).filter(IngestionJob.id == item.job_id).update(
+                    {IngestionJob.updated_at: datetime.utcnow()}, synchronize_session=False
+                )
+                db.commit()
+        finally:
+            db.close()
+
+    def _finalize_job_if_done(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Если все файлы задачи обработаны - собрать Case.full_text и закрыть задачу"""
+        from app.models.ingestion import IngestionJob, IngestionFile
+        from app.models.case import Case, File as FileModel
+
+        db = self.session_factory()
+        try:
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).with_for_update().first()
+            if not job or job.status in _TERMINAL_STATUSES:
+                return None
+
+            files = db.query(IngestionFile).filter(IngestionFile.job_id == job_id).all()
+            processed_files = sum(1 for f in files if f.status == "completed")
+            failed_files = sum(1 for f in files if f.status == "failed")
+            if any(f.status not in _TERMINAL_STATUSES for f in files):
+                # Прогресс пишется только в незакрытую задачу: без блокировки строки (SQLite)
+                # устаревший снимок не перетирает счётчики, записанные при завершении
+                db.query(IngestionJob).filter(
+                    IngestionJob.id == job_id, IngestionJob.status.notin_(_TERMINAL_STATUSES)
+                ).update(
+                    {IngestionJob.processed_files: processed_files, IngestionJob.failed_files: failed_files},
+                    synchronize_session=False,
+                )
+                db.commit()
+                return None
+            job.processed_files = processed_files
+            job.failed_files = failed_files
+
+            case = db.query(Case).filter(Case.id == job.case_id).first()
+            if case:
+                case_files = db.query(FileModel.filename, FileModel.original_text).filter(
+                    FileModel.case_id == job.case_id
+                ).order_by(FileModel.created_at).all()
+                full_text = "\n\n".join(f"[{name}]\n{text}" for name, text in case_files)
+                if len(full_text) > config.MAX_TOTAL_TEXT_CHARS:
+                    logger.warning(
+                        f"Case {job.case_id} text exceeds {config.MAX_TOTAL_TEXT_CHARS} chars, truncating full_text"
+                    )
+                    full_text = full_text[:config.MAX_TOTAL_TEXT_CHARS]
+                case.full_text = full_text
+                case.file_names = [name for name, _ in case_files]
+                case.num_documents = len(case_files)
+
+            job.status = "completed" if job.processed_files > 0 else "failed"
+            if job.failed_files:
+                failed_names = ", ".join(f.filename for f in files if f.status == "failed")
+                job.error_message = f"Не удалось обработать: {failed_names}"
+            job.completed_at = datetime.utcnow()
+            db.commit()
+
+            logger.info(
+                f"Ingestion job {job_id} finished: {job.processed_files} processed, {job.failed_files} failed"
+            )
+            return job.to_dict(include_files=False)
+        finally:
+            db.close()
+
+
+# Global pipeline instance (один на процесс воркера)
+_ingestion_pipeline: Optional[IngestionPipeline] = None
+
+
+def get_ingestion_pipeline() -> IngestionPipeline:
+    """Get the global ingestion pipeline instance"""
+    global _ingestion_pipeline
+    if _ingestion_pipeline is None:
+        _ingestion_pipeline = IngestionPipeline()
+    return _ingestion_pipeline
@@ -0,0 +1,134 @@
+"""
+Обработчики задач durable-очереди (background_jobs)
+
+Модуль импортируется воркером (app.job_worker и воркер внутри веб-процесса),
+декоратор job_handler регистрирует обработчики по job_type.
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+import logging
+
+from app.services.job_queue import JobContext, PermanentJobError, job_handler
+
+logger = logging.getLogger(__name__)
+
+# Имена типов анализа API -> имена агентов
+_AGENT_TYPE_NAMES = {
+    "discrepancies": "discrepancy",
+    "risk_analysis": "risk",
+}
+
+# Полный анализ: все агенты в порядке зависимостей
+FULL_ANALYSIS_TYPES = [
+    "document_classifier",
+    "privilege_check",
+    "entity_extraction",
+    "timeline",
+    "key_facts",
+    "discrepancy",
+    "risk",
+    "summary",
+]
+
+
+def _set_case_status(db, case, status: str, error: str = None) -> None:
+    case.status = status
+    metadata = dict(case.case_metadata or {})
+    metadata["analysis_error"] = error
+    metadata["analysis_failed_at" if error else "analysis_completed_at"] = datetime.utcnow().isoformat()
+    case.case_metadata = metadata
+    db.commit()
+
+
+def _run_case_analysis(ctx: JobContext, analysis_types: List[str]) -> Dict[str, Any]:
+    from app.models.case import Case
+    from app.services.analysis_service import AnalysisService
+    from app.utils.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        case = db.query(Case).filter(Case.id == ctx.case_id).first()
+        if not case:
+            raise PermanentJobError(f"Case {ctx.case_id} not found")
+
+        ctx.check_cancelled()
+        case.status = "processing"
+        db.commit()
+        analysis_service = AnalysisService(db)
+        try:
+            if analysis_service.use_agents:
+                logger.info(f"Using multi-agent system for case {ctx.case_id}")
+                agent_types = [_AGENT_TYPE_NAMES.get(t, t) for t in analysis_types]
+
+                def on_step(*args, **kwargs):
+                    # Отмена проверяется между шагами агентов
+                    ctx.check_cancelled()
+
+                results = analysis_service.run_agent_analysis(ctx.case_id, agent_types, step_callback=on_step)
+                ctx.check_cancelled()
+                logger.info(
+                    f"Multi-agent analysis completed for case {ctx.case_id}, "
+                    f"execution time: {results.get('execution_time', 0):.2f}s"
+                )
+            else:
+                # Legacy sequential approach - отмена проверяется между типами анализа
+                logger.info(f"Using legacy sequential analysis for case {ctx.case_id}")
+                legacy = {
+                    "timeline": analysis_service.extract_timeline,
+                    "discrepancies": analysis_service.find_discrepancies,
+                    "key_facts": analysis_service.extract_key_facts,
+                    "summary": analysis_service.generate_summary,
+                    "risk_analysis": analysis_service.analyze_risks,
+                    # Имена агентов (полный анализ)
+                    "discrepancy": analysis_service.find_discrepancies,
+                    "risk": analysis_service.analyze_risks,
+                }
+                for analysis_type in analysis_types:
+                    ctx.check_cancelled()
+                    run = legacy.get(analysis_type)
+                    if run is None:
+                        logger.warning(f"Unknown analysis type: {analysis_type}")
+                        continue
+                    logger.info(f"Starting {analysis_type} analysis for case {ctx.case_id}")
+                    run(ctx.case_id)
+        except Exception as e:
+            db.rollback()
+            _set_case_status(db, case, "failed", str(e))
+            raise
+
+        _set_case_status(db, case, "completed")
+        logger.info(f"Analysis completed successfully for case {ctx.case_id}")
+        return {"status": "completed", "analysis_types": analysis_types}
+    finally:
+        db.close()
+
+
+@job_handler("analysis.start")
+def run_analysis(ctx: JobContext) -> Dict[str, Any]:
+    """Анализ дела по выбранным типам (POST /api/analysis/{case_id}/start)"""
+    return _run_case_analysis(ctx, ctx.payload["analysis_types"])
+
+
+@job_handler("analysis.full")
+def run_full_analysis(ctx: JobContext) -> Dict[str, Any]:
+    """Полный анализ всеми агентами (POST /api/analysis/{case_id}/full)"""
+    return _run_case_analysis(ctx, FULL_ANALYSIS_TYPES)
+
+
+@job_handler("tabular.run_extraction")
+async def run_tabular_extraction(ctx: JobContext) -> Dict[str, Any]:
+    """Извлечение всех ячеек tabular review (POST /api/tabular-review/{review_id}/run)"""
+    from app.services.tabular_review_service import TabularReviewService
+    from app.utils.database import SessionLocal
+
+    ctx.check_cancelled()
+    db = SessionLocal()
+    try:
+        return await TabularReviewService(db).run_extraction(
+            ctx.payload["review_id"], ctx.user_id, check_cancelled=ctx.check_cancelled
+        )
+    except ValueError as e:
+        # Ревью удалено или принадлежит другому пользователю
+        raise PermanentJobError(str(e)) from e
+    finally:
+        db.close()
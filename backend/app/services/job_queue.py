@@ -0,0 +1,514 @@
+"""
+Job Queue - durable очередь фоновых задач в Postgres
+
+Долгая LLM-работа (анализ дела, извлечение tabular review) не выполняется в
+BackgroundTasks веб-воркера, а ставится в таблицу background_jobs. Задачи
+забирают воркеры (`python -m app.job_worker` или воркер внутри веб-процесса):
+
+- claim: SELECT ... FOR UPDATE SKIP LOCKED - несколько воркеров не берут одну задачу
+- аренда: воркер продлевает lease_expires_at heartbeat'ами; задача упавшего
+  воркера после истечения аренды забирается заново
+- лимит одновременно выполняемых задач на дело (JOB_CASE_CONCURRENCY)
+- ретраи с экспоненциальной задержкой (run_after)
+- отмена: queued - сразу, running - через флаг cancel_requested, который
+  обработчик видит в JobContext.check_cancelled()
+
+Пример:
+```python
+@job_handler("analysis.start")
+def run_analysis(ctx: JobContext):
+    for analysis_type in ctx.payload["analysis_types"]:
+        ctx.check_cancelled()
+        ...
+    return {"status": "completed"}
+
+job_id = get_job_queue().enqueue("analysis.start", {"analysis_types": [...]}, case_id=case_id)
+```
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from sqlalchemy import text
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Задача отменена пользователем (бросается из JobContext.check_cancelled)"""
+
+
+class PermanentJobError(Exception):
+    """Ошибка, при которой повторять задачу бессмысленно (нет дела/ревью и т.п.)"""
+
+
+@dataclass
+class ClaimedJob:
+    """Задача, захваченная воркером"""
+    id: str
+    job_type: str
+    payload: Dict[str, Any]
+    case_id: Optional[str]
+    user_id: Optional[str]
+    attempts: int
+    max_attempts: int
+
+
+class JobContext:
+    """Контекст выполнения задачи для обработчика"""
+
+    def __init__(self, job: ClaimedJob):
+        self.job = job
+        self._cancel = threading.Event()
+        self.lease_lost = False
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        return self.job.payload
+
+    @property
+    def case_id(self) -> Optional[str]:
+        return self.job.case_id
+
+    @property
+    def user_id(self) -> Optional[str]:
+        return self.job.user_id
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self) -> None:
+        """Прервать обработчик, если задача отменена или аренда потеряна"""
+        if self._cancel.is_set():
+            raise JobCancelled(self.job.id)
+
+
+# job_type -> обработчик (sync или async), регистрируется декоратором job_handler
+_handlers: Dict[str, Callable[[JobContext], Any]] = {}
+
+
+def job_handler(job_type: str) -> Callable:
+    """Декоратор: зарегистрировать обработчик задач job_type"""
+    def decorator(func: Callable[[JobContext], Any]) -> Callable[[JobContext], Any]:
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+def get_job_handlers() -> Dict[str, Callable[[JobContext], Any]]:
+    return _handlers
+
+
+class JobQueue:
+    """Операции над таблицей background_jobs (все переходы статусов - атомарные UPDATE)"""
+
+    def __init__(
+        self,
+        engine=None,
+        lease_seconds: Optional[float] = None,
+        case_concurrency: Optional[int] = None,
+        retry_base_seconds: Optional[float] = None,
+        retry_max_seconds: float = 600.0,
+    ):
+        self._engine = engine
+        self.lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        self.case_concurrency = case_concurrency or config.JOB_CASE_CONCURRENCY
+        self.retry_base_seconds = retry_base_seconds or config.JOB_RETRY_BASE_SECONDS
+        self.retry_max_seconds = retry_max_seconds
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app.utils.database import engine
+            self._engine = engine
+        return self._engine
+
+    def retry_delay(self, attempts: int) -> float:
+        """Экспоненциальная задержка перед повтором после attempts попыток"""
+        return min(self.retry_base_seconds * (2 ** max(attempts - 1, 0)), self.retry_max_seconds)
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: Optional[Dict[str, Any]] = None,
+        case_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        priority: int = 0,
+        max_attempts: Optional[int] = None,
+    ) -> str:
+        """Поставить задачу в очередь; вернуть её ID"""
+        job_id = str(uuid.uuid4())
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO background_jobs
+                        (id, job_type, case_id, user_id, payload, status, priority, attempts, max_attempts, run_after)
+                    VALUES
+                        (:id, :job_type, :case_id, :user_id, CAST(:payload AS JSON), 'queued', :priority, 0, :max_attempts, now())
+                """),
+                {
+                    "id": job_id,
+                    "job_type": job_type,
+                    "case_id": case_id,
+                    "user_id": user_id,
+                    "payload": json.dumps(payload or {}, default=str),
+                    "priority": priority,
+                    "max_attempts": max_attempts or config.JOB_MAX_ATTEMPTS,
+                },
+            )
+        logger.info(f"Enqueued job {job_id} ({job_type}, case {case_id})")
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[ClaimedJob]:
+        """
+        Захватить следующую задачу: queued с наступившим run_after или running
+        с истёкшей арендой, не превышая лимит выполняемых задач на дело
+        """
+        with self.engine.begin() as conn:
+            # Отмена задач, чей воркер умер до того, как увидел cancel_requested
+            conn.execute(text("""
+                UPDATE background_jobs
+                SET status = 'cancelled', finished_at = now(), lease_expires_at = NULL
+                WHERE status = 'running' AND cancel_requested AND lease_expires_at < now()
+            """))
+
+            candidate = conn.execute(
+                text("""
+                    SELECT j.id, j.case_id
+                    FROM background_jobs j
+                    WHERE NOT j.cancel_requested
+                      AND ((j.status = 'queued' AND j.run_after <= now())
+                           OR (j.status = 'running' AND j.lease_expires_at < now()))
+                      AND (j.case_id IS NULL OR (
+                            SELECT count(*) FROM background_jobs r
+                            WHERE r.case_id = j.case_id AND r.status = 'running'
+                              AND r.lease_expires_at >= now()
+                          ) < :cap)
+                    ORDER BY j.priority DESC, j.run_after
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                """),
+                {"cap": self.case_concurrency},
+            ).fetchone()
+            if candidate is None:
+                return None
+
+            job_id, case_id = candidate
+            if case_id is not None:
+                # Два воркера могли выбрать разные задачи одного дела - лимит
+                # перепроверяется под advisory-блокировкой дела до конца транзакции
+                locked = conn.execute(
+                    text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+                    {"key": f"background_jobs:{case_id}"},
+                ).scalar()
+                running = conn.execute(
+                    text("""
+                        SELECT count(*) FROM background_jobs
+                        WHERE case_id = :case_id AND status = 'running' AND lease_expires_at >= now()
+                    """),
+                    {"case_id": case_id},
+                ).scalar()
+                if not locked or running >= self.case_concurrency:
+                    return None
+
+            row = conn.execute(
+                text("""
+                    UPDATE background_jobs
+                    SET status = 'running',
+                        worker_id = :worker_id,
+                        attempts = attempts + 1,
+                        lease_expires_at = now() + make_interval(secs => :lease),
+                        heartbeat_at = now(),
+                        started_at = COALESCE(started_at, now()),
+                        error_message = CASE WHEN status = 'running'
+                                             THEN 'lease expired on worker ' || COALESCE(worker_id, '?')
+                                             ELSE error_message END
+                    WHERE id = :id
+                    RETURNING id, job_type, payload, case_id, user_id, attempts, max_attempts
+                """),
+                {"id": job_id, "worker_id": worker_id, "lease": float(self.lease_seconds)},
+            ).fetchone()
+
+            job = ClaimedJob(
+                id=row[0],
+                job_type=row[1],
+                payload=row[2] if isinstance(row[2], dict) else json.loads(row[2] or "{}"),
+                case_id=row[3],
+                user_id=row[4],
+                attempts=row[5],
+                max_attempts=row[6],
+            )
+            if job.attempts > job.max_attempts:
+                # Аренда истекала слишком много раз (воркер падает на этой задаче)
+                conn.execute(
+                    text("""
+                        UPDATE background_jobs
+                        SET status = 'failed', finished_at = now(), lease_expires_at = NULL
+                        WHERE id = :id
+                    """),
+                    {"id": job.id},
+                )
+                logger.error(f"Job {job.id} ({job.job_type}) failed: lease expired {job.max_attempts} times")
+                return None
+            return job
+
+    def heartbeat(self, job_id: str, worker_id: str) -> Optional[bool]:
+        """
+        Продлить аренду
+
+        Returns:
+            None - аренда потеряна (задачу забрал другой воркер),
+            иначе флаг cancel_requested
+        """
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                text("""
+                    UPDATE background_jobs
+                    SET lease_expires_at = now() + make_interval(secs => :lease), heartbeat_at = now()
+                    WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+                    RETURNING cancel_requested
+                """),
+                {"id": job_id, "worker_id": worker_id, "lease": float(self.lease_seconds)},
+            ).fetchone()
+        return None if row is None else bool(row[0])
+
+    def complete(self, job_id: str, worker_id: str, result: Any = None) -> bool:
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                text("""
+                    UPDATE background_jobs
+                    SET status = 'completed', result = CAST(:result AS JSON), error_message = NULL,
+                        finished_at = now(), lease_expires_at = NULL
+                    WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+                """),
+                {"id": job_id, "worker_id": worker_id, "result": json.dumps(result, default=str)},
+            ).rowcount
+        return updated == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True, delay: float = 0.0) -> Optional[str]:
+        """
+        Записать ошибку; вернуть новый статус (queued - будет повтор, failed,
+        cancelled - отмена запрошена во время выполнения: такую задачу claim
+        больше не заберёт, повтор оставил бы её в queued навсегда)
+        """
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                text("""
+                    UPDATE background_jobs
+                    SET status = CASE WHEN cancel_requested THEN 'cancelled'
+                                      WHEN :retry AND attempts < max_attempts THEN 'queued'
+                                      ELSE 'failed' END,
+                        run_after = now() + make_interval(secs => :delay),
+                        error_message = :error,
+                        lease_expires_at = NULL,
+                        finished_at = CASE WHEN :retry AND attempts < max_attempts AND NOT cancel_requested
+                                           THEN NULL ELSE now() END
+                    WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+                    RETURNING status
+                """),
+                {"id": job_id, "worker_id": worker_id, "error": error[:4000], "retry": retry, "delay": float(delay)},
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_cancelled(self, job_id: str, worker_id: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    UPDATE background_jobs
+                    SET status = 'cancelled', finished_at = now(), lease_expires_at = NULL
+                    WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+                """),
+                {"id": job_id, "worker_id": worker_id},
+            )
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Отменить задачу: queued - сразу, running - запросом воркеру
+
+        Returns:
+            Новый статус или None, если задача уже завершена / не найдена
+        """
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                text("""
+                    UPDATE background_jobs
+                    SET cancel_requested = TRUE,
+                        status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                        finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END
+                    WHERE id = :id AND status IN ('queued', 'running')
+                    RETURNING status
+                """),
+                {"id": job_id},
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("""
+                    SELECT status, attempts, result, error_message
+                    FROM background_jobs WHERE id = :id
+                """),
+                {"id": job_id},
+            ).fetchone()
+        if row is None:
+            return None
+        result = row[2]
+        if isinstance(result, str):
+            result = json.loads(result)
+        return {"id": job_id, "status": row[0], "attempts": row[1], "result": result, "error_message": row[3]}
+
+    async def wait_for(self, job_id: str, timeout: float, poll_interval: float = 1.0) -> Optional[Dict[str, Any]]:
+        """Дождаться терминального статуса задачи (не дольше timeout)"""
+        from app.models.job import JOB_TERMINAL_STATUSES
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            status = await asyncio.to_thread(self.get_status, job_id)
+            if status is None or status["status"] in JOB_TERMINAL_STATUSES or loop.time() >= deadline:
+                return status
+            await asyncio.sleep(poll_interval)
+
+
+class JobWorker:
+    """
+    Воркер очереди: потоки, которые забирают и выполняют задачи
+
+    Обработчик выполняется в потоке воркера; параллельно поток heartbeat
+    продлевает аренду и передаёт в JobContext запрос отмены.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        worker_id: Optional[str] = None,
+        concurrency: int = 1,
+        poll_interval: Optional[float] = None,
+        handlers: Optional[Dict[str, Callable[[JobContext], Any]]] = None,
+    ):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval if poll_interval is not None else config.JOB_POLL_INTERVAL_SECONDS
+        self.handlers = handlers if handlers is not None else _handlers
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def run_once(self) -> bool:
+        """Захватить и выполнить одну задачу в текущем потоке; False - очередь пуста"""
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return False
+        self._execute(job)
+        return True
+
+    def _execute(self, job: ClaimedJob) -> None:
+        handler = self.handlers.get(job.job_type)
+        if handler is None:
+            self.queue.fail(job.id, self.worker_id, f"No handler for job type {job.job_type}", retry=False)
+            return
+
+        ctx = JobContext(job)
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop, args=(ctx, stop_heartbeat), name=f"job-heartbeat-{job.id[:8]}", daemon=True
+        )
+        heartbeat.start()
+        logger.info(f"Worker {self.worker_id} running job {job.id} ({job.job_type}, attempt {job.attempts})")
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                result = asyncio.run(handler(ctx))
+            else:
+                result = handler(ctx)
+            if ctx.lease_lost:
+                logger.warning(f"Job {job.id} finished after its lease was lost; result discarded")
+            else:
+                self.queue.complete(job.id, self.worker_id, result)
+        except JobCancelled:
+            if not ctx.lease_lost:
+                self.queue.mark_cancelled(job.id, self.worker_id)
+            logger.info(f"Job {job.id} cancelled")
+        except Exception as e:
+            retry = not isinstance(e, PermanentJobError)
+            status = self.queue.fail(
+                job.id, self.worker_id, str(e) or e.__class__.__name__,
+                retry=retry, delay=self.queue.retry_delay(job.attempts),
+            )
+            logger.error(f"Job {job.id} ({job.job_type}) failed on attempt {job.attempts}: {e} -> {status}", exc_info=True)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+
+    def _heartbeat_loop(self, ctx: JobContext, stop: threading.Event) -> None:
+        interval = max(self.queue.lease_seconds / 3, 0.05)
+        while not stop.wait(interval):
+            try:
+                cancel_requested = self.queue.heartbeat(ctx.job.id, self.worker_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {ctx.job.id} failed: {e}")
+                continue
+            if cancel_requested is None:
+                ctx.lease_lost = True
+                ctx._cancel.set()
+                return
+            if cancel_requested:
+                ctx._cancel.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                ran = self.run_once()
+            except Exception as e:
+                logger.error(f"Job worker {self.worker_id} error: {e}", exc_info=True)
+                ran = False
+            if not ran:
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job worker {self.worker_id} started ({self.concurrency} threads)")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Остановить после текущих задач (незавершённые заберутся по истечении аренды)"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+# Global instances
+_job_queue: Optional[JobQueue] = None
+_job_worker: Optional[JobWorker] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Get or create the global job queue"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
+
+
+def get_job_worker() -> JobWorker:
+    """Get or create the in-process job worker (handlers from app.services.job_handlers)"""
+    global _job_worker
+    if _job_worker is None:
+        import app.services.job_handlers  # noqa: F401 - регистрирует обработчики
+        _job_worker = JobWorker(get_job_queue(), concurrency=config.JOB_WORKER_CONCURRENCY)
+    return _job_worker
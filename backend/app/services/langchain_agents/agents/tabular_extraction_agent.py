@@ -20,7 +20,7 @@ TabularExtractionAgent - агент для извлечения структур
 - Нужен анализ или выводы → используй ChatReActAgent
 - Один документ, один вопрос → используй rag_search
 """
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from dataclasses import dataclass, field
 from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
@@ -30,7 +30,6 @@ from sqlalchemy.orm import Session
 import logging
 import json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +55,7 @@ class ExtractionResult:
     source_page: Optional[int] = None
     needs_clarification: bool = False
     clarification_question: Optional[str] = None
+    needs_retry: bool = False  # Не уложилось в дедлайн ячейки - повторить позже
 
 
 @dataclass
@@ -67,7 +67,8 @@ class TabularExtractionConfig:
     columns: List[ExtractionColumn]
     file_ids: List[str]
     confidence_threshold: float = 0.8  # Порог уверенности для HITL
-    max_parallel_docs: int = 5
+    max_parallel_cells: int = 8  # Одновременных LLM-вызовов (ячеек)
+    cell_timeout_seconds: float = 60.0  # Дедлайн одной ячейки (с момента начала её LLM-вызова)
     enable_hitl: bool = True
 
 
@@ -104,6 +105,7 @@ class TabularExtractionAgent:
         # Результаты извлечения
         self.results: List[ExtractionResult] = []
         self.pending_clarifications: List[ExtractionResult] = []
+        self.pending_retries: List[ExtractionResult] = []
         
         logger.info(
             f"[TabularAgent] Initialized for review {config.review_id} "
@@ -126,23 +128,13 @@ class TabularExtractionAgent:
         text = file.original_text or ""
         return file.filename, text
     
-    def _extract_cell_value(
+    def _build_cell_prompt(
         self,
         column: ExtractionColumn,
         document_text: str,
         filename: str
-    ) -> ExtractionResult:
-        """
-        Извлечь значение для одной ячейки.
-        
-        Args:
-            column: Определение колонки
-            document_text: Текст документа
-            filename: Имя файла
-        
-        Returns:
-            Результат извлечения
-        """
+    ) -> str:
+        """Сформировать промпт извлечения значения одной ячейки."""
         # Формируем промпт на основе типа колонки с подробными инструкциями
         type_instructions = {
             "text": """Извлеки текстовое значение.
@@ -244,9 +236,29 @@ class TabularExtractionAgent:
     "source_page": null
 }}
 """
+        return prompt
+    
+    async def _extract_cell_value(
+        self,
+        column: ExtractionColumn,
+        document_text: str,
+        filename: str
+    ) -> ExtractionResult:
+        """
+        Извлечь значение для одной ячейки.
+        
+        Args:
+            column: Определение колонки
+            document_text: Текст документа
+            filename: Имя файла
+        
+        Returns:
+            Результат извлечения
+        """
+        prompt = self._build_cell_prompt(column, document_text, filename)
         
         try:
-            response = self.llm.invoke([HumanMessage(content=prompt)])
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
             response_text = response.content if hasattr(response, 'content') else str(response)
             
             # Парсим JSON
@@ -295,87 +307,136 @@ class TabularExtractionAgent:
                 clarification_question=f"Ошибка извлечения '{column.label}': {str(e)}"
             )
     
-    def _extract_from_document(self, file_id: str) -> List[ExtractionResult]:
-        """
-        Извлечь все значения из одного документа (Map операция).
-        
-        Args:
-            file_id: ID файла
-        
-        Returns:
-            Список результатов извлечения для всех колонок
-        """
-        filename, document_text = self._get_document_text(file_id)
-        
-        if not document_text:
-            logger.warning(f"[TabularAgent] No text for file {file_id}")
-            return [
-                ExtractionResult(
-                    column_id=col.id,
+    def _empty_document_results(self, file_id: str, filename: str) -> List[ExtractionResult]:
+        """Результаты для документа без текста: все ячейки требуют уточнения."""
+        return [
+            ExtractionResult(
+                column_id=col.id,
+                file_id=file_id,
+                value="",
+                confidence=0.0,
+                needs_clarification=True,
+                clarification_question=f"Документ '{filename}' пуст или не содержит текста"
+            )
+            for col in self.config.columns
+        ]
+    
+    async def _extract_cell_with_deadline(
+        self,
+        column: ExtractionColumn,
+        file_id: str,
+        document: Tuple[str, str],
+        semaphore: asyncio.Semaphore
+    ) -> ExtractionResult:
+        """Извлечь ячейку; по истечении дедлайна ячейка помечается для повтора."""
+        filename, document_text = document
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(
+                    self._extract_cell_value(column, document_text, filename),
+                    timeout=self.config.cell_timeout_seconds
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"[TabularAgent] Cell {file_id}/{column.id} timed out after "
+                    f"{self.config.cell_timeout_seconds}s, marked for retry"
+                )
+                result = ExtractionResult(
+                    column_id=column.id,
                     file_id=file_id,
                     value="",
                     confidence=0.0,
-                    needs_clarification=True,
-                    clarification_question=f"Документ '{filename}' пуст или не содержит текста"
+                    needs_retry=True
                 )
-                for col in self.config.columns
-            ]
-        
-        results = []
-        for column in self.config.columns:
-            result = self._extract_cell_value(column, document_text, filename)
-            result.file_id = file_id
-            results.append(result)
-        
-        logger.info(f"[TabularAgent] Extracted {len(results)} values from {filename}")
-        return results
+        result.file_id = file_id
+        return result
     
-    async def extract_all(self) -> Dict[str, Any]:
+    async def extract_all(self, on_result: Optional[Callable[[ExtractionResult], Any]] = None) -> Dict[str, Any]:
         """
         Извлечь данные из всех документов (Map-Reduce).
         
+        Map выполняется на текущем event loop: каждая ячейка (документ × колонка) -
+        отдельная задача, одновременно не больше max_parallel_cells LLM-вызовов.
+        Результаты обрабатываются в порядке завершения: медленная ячейка не
+        задерживает остальные, у каждой ячейки свой дедлайн.
+        
+        Args:
+            on_result: Вызывается (sync или async) для каждой ячейки сразу после
+                её завершения - например, чтобы сохранить и отправить клиентам
+        
         Returns:
-            Словарь с результатами и запросами на уточнение
+            Словарь с результатами, запросами на уточнение и ячейками для повтора
         """
         logger.info(f"[TabularAgent] Starting extraction for {len(self.config.file_ids)} documents")
         
-        all_results = []
+        # Тексты документов читаются один раз (Session не потокобезопасна)
+        documents = {file_id: self._get_document_text(file_id) for file_id in self.config.file_ids}
+        semaphore = asyncio.Semaphore(max(1, self.config.max_parallel_cells))
+        cells: Dict[Tuple[str, str], ExtractionResult] = {}
+        
+        tasks = []
+        for file_id in self.config.file_ids:
+            filename, document_text = documents[file_id]
+            if not document_text:
+                logger.warning(f"[TabularAgent] No text for file {file_id}")
+                for result in self._empty_document_results(file_id, filename):
+                    cells[(file_id, result.column_id)] = result
+                continue
+            for column in self.config.columns:
+                tasks.append(asyncio.ensure_future(
+                    self._extract_cell_with_deadline(column, file_id, documents[file_id], semaphore)
+                ))
+        
+        # Map: результаты в порядке завершения
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                cells[(result.file_id, result.column_id)] = result
+                if on_result is not None:
+                    try:
+                        callback_result = on_result(result)
+                        if asyncio.iscoroutine(callback_result):
+                            await callback_result
+                    except Exception as e:
+                        logger.error(f"[TabularAgent] on_result failed for {result.file_id}/{result.column_id}: {e}", exc_info=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        # Порядок результатов: документ за документом, колонки в порядке конфигурации
+        all_results = [
+            cells[(file_id, column.id)]
+            for file_id in self.config.file_ids
+            for column in self.config.columns
+        ]
         
-        # Map: параллельное извлечение из документов
-        with ThreadPoolExecutor(max_workers=self.config.max_parallel_docs) as executor:
-            futures = [
-                executor.submit(self._extract_from_document, file_id)
-                for file_id in self.config.file_ids
-            ]
-            
-            for future in futures:
-                try:
-                    results = future.result(timeout=60)
-                    all_results.extend(results)
-                except Exception as e:
-                    logger.error(f"[TabularAgent] Extraction error: {e}", exc_info=True)
-        
-        # Reduce: разделяем на успешные и требующие уточнения
+        # Reduce: разделяем на успешные, требующие уточнения и повтора
         successful = []
         needs_clarification = []
+        needs_retry = []
         
         for result in all_results:
-            if result.needs_clarification and self.config.enable_hitl:
+            if result.needs_retry:
+                needs_retry.append(result)
+            elif result.needs_clarification and self.config.enable_hitl:
                 needs_clarification.append(result)
             else:
                 successful.append(result)
         
         self.results = successful
         self.pending_clarifications = needs_clarification
+        self.pending_retries = needs_retry
         
         logger.info(
             f"[TabularAgent] Extraction complete: "
-            f"{len(successful)} successful, {len(needs_clarification)} need clarification"
+            f"{len(successful)} successful, {len(needs_clarification)} need clarification, "
+            f"{len(needs_retry)} timed out"
         )
         
         return {
             "successful": [self._result_to_dict(r) for r in successful],
             "needs_clarification": [self._result_to_dict(r) for r in needs_clarification],
+            "needs_retry": [self._result_to_dict(r) for r in needs_retry],
             "total_cells": len(all_results),
             "success_rate": len(successful) / len(all_results) if all_results else 0
         }
@@ -390,7 +451,8 @@ class TabularExtractionAgent:
             "source_quote": result.source_quote,
             "source_page": result.source_page,
             "needs_clarification": result.needs_clarification,
-            "clarification_question": result.clarification_question
+            "clarification_question": result.clarification_question,
+            "needs_retry": result.needs_retry
         }
     
     def get_clarification_requests(self) -> List[Dict[str, Any]]:
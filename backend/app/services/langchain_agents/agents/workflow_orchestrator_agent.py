@@ -412,7 +412,7 @@ class WorkflowOrchestratorAgent:
 }}
 """
         
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
         response_text = response.content if hasattr(response, 'content') else str(response)
         
         from app.services.langchain_agents.utils import extract_json_from_response
@@ -491,7 +491,7 @@ class WorkflowOrchestratorAgent:
 }}
 """
             
-            response = self.llm.invoke([HumanMessage(content=prompt)])
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
             response_text = response.content if hasattr(response, 'content') else str(response)
             
             from app.services.langchain_agents.utils import extract_json_from_response
@@ -536,7 +536,7 @@ class WorkflowOrchestratorAgent:
 Сгенерируй документ в формате HTML с правильной структурой.
 """
         
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
         content = response.content if hasattr(response, 'content') else str(response)
         
         # Сохраняем документ если указано
@@ -607,7 +607,7 @@ class WorkflowOrchestratorAgent:
 }}
 """
         
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
         response_text = response.content if hasattr(response, 'content') else str(response)
         
         from app.services.langchain_agents.utils import extract_json_from_response
@@ -670,7 +670,7 @@ class WorkflowOrchestratorAgent:
 }}
 """
         
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
         response_text = response.content if hasattr(response, 'content') else str(response)
         
         from app.services.langchain_agents.utils import extract_json_from_response
@@ -695,7 +695,7 @@ class WorkflowOrchestratorAgent:
 Если задачу невозможно выполнить, верни частичный результат или объясни проблему.
 """
         
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
         response_text = response.content if hasattr(response, 'content') else str(response)
         
         return {
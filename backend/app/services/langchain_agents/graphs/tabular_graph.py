@@ -48,6 +48,7 @@ from app.services.llm_factory import create_llm
 from app.services.rag_service import RAGService
 from app.utils.checkpointer_setup import get_checkpointer_instance
 from sqlalchemy.orm import Session
+import asyncio
 import logging
 import operator
 
@@ -178,11 +179,12 @@ def validate_node(state: TabularGraphState, db: Session = None) -> TabularGraphS
     return new_state
 
 
-def map_extract_node(state: TabularGraphState, db: Session = None) -> TabularGraphState:
+async def map_extract_node(state: TabularGraphState, db: Session = None) -> TabularGraphState:
     """
     Узел Map - параллельное извлечение из документов.
     
-    Для каждого документа извлекает значения всех колонок.
+    Для каждого документа извлекает значения всех колонок. Узел асинхронный:
+    извлечение идёт на event loop сервера, без отдельного потока и loop на вызов.
     """
     logger.info(f"[TabularGraph] Starting Map extraction for {len(state['file_ids'])} files")
     
@@ -221,31 +223,54 @@ def map_extract_node(state: TabularGraphState, db: Session = None) -> TabularGra
         
         # Создаём агента и запускаем извлечение
         agent = TabularExtractionAgent(config, db)
+        persisted = set()
         
-        import asyncio
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(asyncio.run, agent.extract_all())
-                    result = future.result(timeout=300)  # 5 минут timeout
-            else:
-                result = loop.run_until_complete(agent.extract_all())
-        except RuntimeError:
-            result = asyncio.run(agent.extract_all())
+        def save_cell(cell) -> None:
+            from app.services.tabular_review_service import TabularReviewService
+            try:
+                TabularReviewService(db).save_extracted_cell(
+                    review_id=state["review_id"],
+                    file_id=cell.file_id,
+                    column_id=cell.column_id,
+                    cell_value=cell.value,  # как в save_results: "0", "" и т.п. сохраняются без подмены на NULL
+                    confidence=cell.confidence,
+                    verbatim_extract=cell.source_quote,
+                    source_page=cell.source_page,
+                    status="pending" if cell.needs_retry else "completed"  # pending - повторить извлечение
+                )
+            except Exception:
+                db.rollback()
+                raise
         
+        async def persist_cell(cell) -> None:
+            """Сохранить ячейку сразу по завершении (event bus отправит её клиентам)"""
+            if db is None or (cell.needs_clarification and config.enable_hitl):
+                return
+            # Запрос и commit - в потоке, чтобы не блокировать event loop с остальными ячейками.
+            # Колбэки extract_all выполняются по одному, так что Session не используется параллельно
+            await asyncio.to_thread(save_cell, cell)
+            persisted.add((cell.file_id, cell.column_id))
+        
+        result = await agent.extract_all(on_result=persist_cell)
+        
+        for cell in result.get("successful", []):
+            cell["persisted"] = (cell["file_id"], cell["column_id"]) in persisted
         new_state["extraction_results"] = result.get("successful", [])
         new_state["clarification_requests"] = result.get("needs_clarification", [])
         
         success_count = len(result.get("successful", []))
         clarify_count = len(result.get("needs_clarification", []))
+        retry_count = len(result.get("needs_retry", []))
         
         new_state["messages"] = [AIMessage(
             content=f"📊 Извлечено {success_count} значений, {clarify_count} требуют уточнения"
+            + (f", {retry_count} не уложились в таймаут и будут повторены" if retry_count else "")
         )]
         
-        logger.info(f"[TabularGraph] Map extraction complete: {success_count} successful, {clarify_count} need clarification")
+        logger.info(
+            f"[TabularGraph] Map extraction complete: {success_count} successful, "
+            f"{clarify_count} need clarification, {retry_count} timed out"
+        )
         
     except Exception as e:
         logger.error(f"[TabularGraph] Map extraction error: {e}", exc_info=True)
@@ -432,19 +457,23 @@ def save_results_node(state: TabularGraphState, db: Session = None) -> TabularGr
         errors = []
         
         for result in merged_results:
+            if result.get("persisted"):
+                # Уже сохранена в map_extract сразу после извлечения
+                saved_count += 1
+                continue
             try:
-                service.update_cell(
+                service.save_extracted_cell(
                     review_id=state["review_id"],
                     file_id=result["file_id"],
                     column_id=result["column_id"],
-                    value=result.get("value", ""),
-                    user_id=state["user_id"],
-                    is_manual=False,
+                    cell_value=result.get("value"),
                     confidence=result.get("confidence"),
-                    source_quote=result.get("source_quote")
+                    verbatim_extract=result.get("source_quote"),
+                    source_page=result.get("source_page")
                 )
                 saved_count += 1
             except Exception as e:
+                db.rollback()
                 errors.append(f"Cell {result['file_id']}/{result['column_id']}: {str(e)}")
         
         new_state["saved_count"] = saved_count
@@ -530,8 +559,8 @@ def create_tabular_graph(
     def validate_wrapper(state):
         return validate_node(state, db)
     
-    def map_extract_wrapper(state):
-        return map_extract_node(state, db)
+    async def map_extract_wrapper(state):
+        return await map_extract_node(state, db)
     
     def save_results_wrapper(state):
         return save_results_node(state, db)
@@ -56,6 +56,7 @@ from app.services.llm_factory import create_llm
 from app.services.rag_service import RAGService
 from app.utils.checkpointer_setup import get_checkpointer_instance
 from sqlalchemy.orm import Session
+import asyncio
 import logging
 import operator
 import json
@@ -321,9 +322,12 @@ def apply_approval_node(state: WorkflowGraphState) -> WorkflowGraphState:
     return new_state
 
 
-def execute_level_node(state: WorkflowGraphState, db: Session = None, rag_service: RAGService = None) -> WorkflowGraphState:
+async def execute_level_node(state: WorkflowGraphState, db: Session = None, rag_service: RAGService = None) -> WorkflowGraphState:
     """
     Узел выполнения одного уровня шагов.
+    
+    Шаги уровня независимы и выполняются конкурентно (asyncio.TaskGroup,
+    не больше max_parallel_steps одновременно) на event loop сервера.
     """
     current_level = state.get("current_level", 0)
     plan = state.get("plan", {})
@@ -366,44 +370,31 @@ def execute_level_node(state: WorkflowGraphState, db: Session = None, rag_servic
     orchestrator = WorkflowOrchestratorAgent(config, db, rag_service)
     orchestrator.results = step_results  # Передаём предыдущие результаты
     
-    import asyncio
-    
-    async def execute_steps():
-        results = {}
-        errors = []
+    semaphore = asyncio.Semaphore(max(1, state.get("max_parallel_steps", 3)))
+    results = {}
+    errors = []
+    
+    async def execute_step(step_data: Dict[str, Any]) -> None:
+        step = WorkflowStep(
+            id=step_data["id"],
+            name=step_data["name"],
+            description=step_data.get("description", ""),
+            step_type=step_data.get("type", "custom"),
+            dependencies=step_data.get("dependencies", []),
+            config=step_data.get("config", {})
+        )
         
-        for step_data in steps:
-            if step_data.get("status") == "skipped":
-                continue
-            
-            step = WorkflowStep(
-                id=step_data["id"],
-                name=step_data["name"],
-                description=step_data.get("description", ""),
-                step_type=step_data.get("type", "custom"),
-                dependencies=step_data.get("dependencies", []),
-                config=step_data.get("config", {})
-            )
-            
+        async with semaphore:
             try:
-                result = await orchestrator.execute_step(step)
-                results[step.id] = result
+                results[step.id] = await orchestrator.execute_step(step)
             except Exception as e:
                 errors.append({"step_id": step.id, "error": str(e)})
-        
-        return results, errors
-    
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, execute_steps())
-                results, errors = future.result(timeout=300)
-        else:
-            results, errors = loop.run_until_complete(execute_steps())
-    except RuntimeError:
-        results, errors = asyncio.run(execute_steps())
+    
+    async with asyncio.TaskGroup() as group:
+        for step_data in steps:
+            if step_data.get("status") == "skipped":
+                continue
+            group.create_task(execute_step(step_data))
     
     step_results.update(results)
     step_errors.extend(errors)
@@ -575,8 +566,8 @@ def create_workflow_graph(
     def generate_plan_wrapper(state):
         return generate_plan_node(state, db)
     
-    def execute_level_wrapper(state):
-        return execute_level_node(state, db, rag_service)
+    async def execute_level_wrapper(state):
+        return await execute_level_node(state, db, rag_service)
     
     def synthesize_wrapper(state):
         return synthesize_node(state, db)
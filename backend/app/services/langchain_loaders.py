@@ -1,13 +1,12 @@
 """LangChain document loaders for Legal AI Vault"""
 from typing import List, Dict, Any, Optional
 from langchain_community.document_loaders import (
-    PyPDFLoader,
     UnstructuredWordDocumentLoader,
-    TextLoader,
     CSVLoader,
 )
 from langchain_core.documents import Document
 from app.config import config
+from app.utils.file_parser import extract_pdf_pages
 import logging
 import io
 import tempfile
@@ -23,54 +22,50 @@ class DocumentLoaderService:
     @staticmethod
     def load_pdf(content: bytes, filename: str) -> List[Document]:
         """
-        Load PDF document using PyPDFLoader
+        Load PDF document page by page from memory (no temporary files)
         
         Args:
             content: PDF file content as bytes
             filename: Original filename
             
         Returns:
-            List of Document objects with metadata
+            List of Document objects (one per page) with metadata
         """
         try:
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(content)
-                tmp_path = tmp_file.name
-            
-            try:
-                loader = PyPDFLoader(tmp_path)
-                documents = loader.load()
-                
-                # Add filename and page info to metadata
-                for doc in documents:
-                    # Устанавливаем source_file для всех документов
-                    doc.metadata["source_file"] = filename
-                    
-                    # Извлекаем номер страницы из source метаданных PyPDFLoader
-                    source = doc.metadata.get("source", "")
-                    if source and "page" in source.lower():
-                        try:
-                            # PyPDFLoader формат: ".../filename.pdf:page=N"
-                            # Ищем номер страницы
-                            import re
-                            page_match = re.search(r'page[=:]?\s*(\d+)', source, re.IGNORECASE)
-                            if page_match:
-                                page_num = int(page_match.group(1))
-                                doc.metadata["source_page"] = page_num
-                        except Exception as e:
-                            logger.debug(f"Could not extract page number from source '{source}': {e}")
-                
-                logger.info(f"Loaded PDF {filename}: {len(documents)} pages")
-                return documents
-            finally:
-                # Clean up temp file
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
+            documents = DocumentLoaderService.load_pdf_pages(content, filename)
+            logger.info(f"Loaded PDF {filename}: {len(documents)} pages")
+            return documents
         except Exception as e:
             logger.error(f"Error loading PDF {filename}: {e}", exc_info=True)
             raise
     
+    @staticmethod
+    def load_pdf_pages(
+        content: bytes,
+        filename: str,
+        start: int = 0,
+        end: Optional[int] = None
+    ) -> List[Document]:
+        """
+        Load PDF pages [start, end) as Documents
+        
+        Used by ParsingExecutor to extract large PDFs in parallel page batches.
+        Metadata matches PyPDFLoader ("page" is 0-based) plus 1-based "source_page".
+        """
+        texts = extract_pdf_pages(content, start, end)
+        return [
+            Document(
+                page_content=text,
+                metadata={
+                    "source": filename,
+                    "source_file": filename,
+                    "page": start + offset,
+                    "source_page": start + offset + 1,
+                }
+            )
+            for offset, text in enumerate(texts)
+        ]
+    
     @staticmethod
     def load_docx(content: bytes, filename: str) -> List[Document]:
         """
@@ -96,11 +91,7 @@ class DocumentLoaderService:
             )
         
         try:
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
-                tmp_file.write(content)
-                tmp_path = tmp_file.name
-            
+            tmp_path = None
             try:
                 documents = None
                 unstructured_error = None
@@ -137,6 +128,10 @@ class DocumentLoaderService:
                 # If python-docx failed or returned empty, try UnstructuredWordDocumentLoader
                 if not documents or not documents[0].page_content.strip():
                     try:
+                        # unstructured работает только с путём к файлу
+                        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
+                            tmp_file.write(content)
+                            tmp_path = tmp_file.name
                         loader = UnstructuredWordDocumentLoader(tmp_path, mode="elements")
                         documents = loader.load()
                         logger.info(f"Loaded DOCX {filename} using UnstructuredWordDocumentLoader: {len(documents)} elements")
@@ -198,7 +193,7 @@ class DocumentLoaderService:
                 return documents
             finally:
                 # Clean up temp file
-                if os.path.exists(tmp_path):
+                if tmp_path and os.path.exists(tmp_path):
                     os.unlink(tmp_path)
         except ValueError:
             raise
@@ -212,7 +207,7 @@ class DocumentLoaderService:
     @staticmethod
     def load_txt(content: bytes, filename: str) -> List[Document]:
         """
-        Load text document using TextLoader
+        Load text document (decoded in memory)
         
         Args:
             content: Text file content as bytes
@@ -228,25 +223,9 @@ class DocumentLoaderService:
             except UnicodeDecodeError:
                 text_content = content.decode('latin-1')
             
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as tmp_file:
-                tmp_file.write(text_content)
-                tmp_path = tmp_file.name
-            
-            try:
-                loader = TextLoader(tmp_path, encoding='utf-8')
-                documents = loader.load()
-                
-                # Add filename to metadata
-                for doc in documents:
-                    doc.metadata["source_file"] = filename
-                
-                logger.info(f"Loaded TXT {filename}: {len(documents)} documents")
-                return documents
-            finally:
-                # Clean up temp file
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
+            documents = [Document(page_content=text_content, metadata={"source": filename, "source_file": filename})]
+            logger.info(f"Loaded TXT {filename}: {len(documents)} documents")
+            return documents
         except Exception as e:
             logger.error(f"Error loading TXT {filename}: {e}", exc_info=True)
             raise
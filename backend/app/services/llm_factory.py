@@ -1,10 +1,12 @@
 """Factory for creating LLM instances (GigaChat only)
 
-Phase 4.1: Added rate limiting and throttling support.
+Phase 4.1: Added rate limiting and throttling support (admission control, see rate_limiter).
 Phase 5.0: Added dynamic model selection (Lite/Pro) with connection pooling.
+Response cache for deterministic calls (opt-in via cache_ttl, see llm_response_cache).
 """
 from typing import Optional, Any, Dict
 from app.config import config
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,6 +21,7 @@ def create_llm(
     temperature: float = 0.1,
     use_rate_limiting: bool = True,
     timeout: float = 120.0,  # Timeout для HTTP запросов (секунды)
+    cache_ttl: Optional[int] = None,
     **kwargs
 ) -> Any:
     """
@@ -30,10 +33,12 @@ def create_llm(
         temperature: Temperature for generation
         use_rate_limiting: Whether to wrap with rate limiter (default: True)
         timeout: HTTP request timeout in seconds (default: 120s for complex legal queries)
+        cache_ttl: Cache answers for this many seconds (only for calls that are pure
+            functions of their input: classification, query rewriting, template planning)
         **kwargs: Additional arguments
     
     Returns:
-        LLM instance (ChatGigaChat), optionally wrapped with rate limiting
+        LLM instance (ChatGigaChat), optionally wrapped with rate limiting and response cache
     """
     provider = provider or config.LLM_PROVIDER or "gigachat"
     provider = provider.lower()
@@ -59,29 +64,28 @@ def create_llm(
                 **kwargs
             )
             
-            # Wrap with rate limiting if enabled
+            # Wrap with admission control (rate/token budgets, priority lanes) if enabled
             if use_rate_limiting and config.RATE_LIMIT_ENABLED:
-                try:
-                    from app.services.rate_limiter import (
-                        RateLimitedLLMWrapper,
-                        get_rate_limiter,
-                        get_llm_semaphore
-                    )
-                    
-                    llm = RateLimitedLLMWrapper(
-                        llm=llm,
-                        rate_limiter=get_rate_limiter(),
-                        semaphore=get_llm_semaphore()
-                    )
-                    logger.info(
-                        f"Using GigaChat LLM with rate limiting "
-                        f"(rps={config.RATE_LIMIT_RPS}, max_parallel={config.MAX_PARALLEL_LLM_CALLS})"
-                    )
-                except ImportError as rate_error:
-                    logger.warning(f"Rate limiting not available: {rate_error}")
+                from app.services.rate_limiter import AdmissionControlledLLM, get_admission_controller
+
+                llm = AdmissionControlledLLM(llm=llm, controller=get_admission_controller(provider))
+                logger.info(
+                    f"Using GigaChat LLM with admission control "
+                    f"(rps={config.RATE_LIMIT_RPS}, max_parallel={config.MAX_PARALLEL_LLM_CALLS})"
+                )
             else:
                 logger.info("Using GigaChat LLM without rate limiting")
             
+            # Cache outside admission control: cached answers take no slot and no tokens
+            if cache_ttl and config.LLM_RESPONSE_CACHE_ENABLED:
+                from app.services.llm_response_cache import CachedLLM, get_llm_response_cache
+
+                namespace = json.dumps(
+                    {"provider": provider, "model": model or config.GIGACHAT_MODEL, "temperature": temperature, **kwargs},
+                    sort_keys=True, default=str
+                )
+                llm = CachedLLM(llm, get_llm_response_cache(), namespace=namespace, ttl=cache_ttl)
+            
             return llm
             
         except ImportError as e:
@@ -0,0 +1,429 @@
+"""LLM response cache for deterministic calls
+
+Классификация, переформулирование запросов и планирование по шаблону - чистые
+функции от входа: одинаковые сообщения дают одинаковый ответ. CachedLLM
+сохраняет такие ответы и при повторе не обращается к GigaChat (0 токенов).
+
+Ключ - sha256 от модели, температуры, параметров (bind, structured output,
+tools) и сообщений. Два уровня:
+- LRU в памяти процесса (ограничен LLM_RESPONSE_CACHE_MAX_ENTRIES)
+- таблица llm_response_cache в Postgres - общая для воркеров и рестартов
+
+Кэш включается на месте вызова:
+```python
+llm = create_llm(temperature=0.0, cache_ttl=3600)
+llm.invoke(messages)                  # кэшируется на час
+llm.invoke(messages, cache_ttl=0)     # мимо кэша
+```
+"""
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, AsyncIterator, Optional, Tuple
+
+from langchain_core.runnables import Runnable
+
+from app.config import config
+from app.services.metrics.prometheus_exporter import LLM_RESPONSE_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+# =============================================================================
+# Ключ и сериализация
+# =============================================================================
+
+def _normalize_input(input: Any) -> Any:
+    """Привести вход LLM к JSON-совместимому виду для ключа"""
+    if hasattr(input, "to_messages"):
+        input = input.to_messages()
+    if isinstance(input, str):
+        return [["human", input]]
+    if isinstance(input, (list, tuple)):
+        normalized = []
+        for item in input:
+            if hasattr(item, "type") and hasattr(item, "content"):
+                entry = [item.type, item.content]
+                extra = getattr(item, "additional_kwargs", None) or {}
+                tool_calls = getattr(item, "tool_calls", None)
+                if extra or tool_calls:
+                    entry.append({"kwargs": extra, "tool_calls": tool_calls or []})
+                normalized.append(entry)
+            elif isinstance(item, (list, tuple)):
+                normalized.append(list(item))
+            else:
+                normalized.append(item)
+        return normalized
+    return input
+
+
+def make_cache_key(namespace: str, input: Any, params: Optional[Dict[str, Any]] = None) -> str:
+    """sha256 от пространства имён (модель, температура, bind) + параметров + сообщений"""
+    key_data = {
+        "namespace": namespace,
+        "params": params or {},
+        "input": _normalize_input(input),
+    }
+    key_str = json.dumps(key_data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+class _NotCacheable(Exception):
+    """Результат нельзя сохранить (неизвестный тип)"""
+
+
+def encode_result(value: Any) -> Any:
+    """Результат LLM -> JSON (сообщения, pydantic-модели, dict/list, скаляры)"""
+    from langchain_core.messages import BaseMessage, message_to_dict
+    from pydantic import BaseModel
+
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return {"kind": "value", "data": value}
+    if isinstance(value, BaseMessage):
+        return {"kind": "message", "data": message_to_dict(value)}
+    if isinstance(value, BaseModel):
+        cls = type(value)
+        return {
+            "kind": "model",
+            "cls": f"{cls.__module__}:{cls.__qualname__}",
+            "data": value.model_dump(mode="json"),
+        }
+    if isinstance(value, dict):
+        return {"kind": "dict", "data": {str(k): encode_result(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"kind": "list", "data": [encode_result(v) for v in value]}
+    raise _NotCacheable(type(value).__name__)
+
+
+def decode_result(payload: Dict[str, Any]) -> Any:
+    """Обратное преобразование encode_result (каждый раз новый объект)"""
+    kind = payload["kind"]
+    data = payload["data"]
+    if kind == "value":
+        return data
+    if kind == "message":
+        from langchain_core.messages import messages_from_dict
+        return messages_from_dict([data])[0]
+    if kind == "model":
+        module_name, qualname = payload["cls"].split(":", 1)
+        cls = importlib.import_module(module_name)
+        for part in qualname.split("."):
+            cls = getattr(cls, part)
+        return cls.model_validate(data)
+    if kind == "dict":
+        return {k: decode_result(v) for k, v in data.items()}
+    if kind == "list":
+        return [decode_result(v) for v in data]
+    raise ValueError(f"Unknown cached payload kind: {kind}")
+
+
+# =============================================================================
+# Persistent tier
+# =============================================================================
+
+class PostgresResponseStore:
+    """Таблица llm_response_cache: ответы, общие для воркеров и рестартов"""
+
+    CREATE_SQL = """
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            key VARCHAR(64) PRIMARY KEY,
+            namespace VARCHAR(255) NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            expires_at TIMESTAMPTZ NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_llm_response_cache_expires_at ON llm_response_cache(expires_at);
+    """
+    GET_SQL = "SELECT payload FROM llm_response_cache WHERE key = :key AND expires_at > now()"
+    SET_SQL = """
+        INSERT INTO llm_response_cache (key, namespace, payload, expires_at)
+        VALUES (:key, :namespace, :payload, now() + make_interval(secs => :ttl))
+        ON CONFLICT (key) DO UPDATE SET
+            payload = EXCLUDED.payload,
+            created_at = now(),
+            expires_at = EXCLUDED.expires_at
+    """
+    CLEANUP_SQL = "DELETE FROM llm_response_cache WHERE expires_at <= now()"
+    # Удаление просроченных строк раз в N записей
+    CLEANUP_EVERY = 500
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from app.utils.database import engine
+        self.engine = engine
+        self._table_ready = False
+        self._writes = 0
+
+    def _ensure_table(self, conn) -> None:
+        if not self._table_ready:
+            conn.exec_driver_sql(self.CREATE_SQL)
+            self._table_ready = True
+
+    def get(self, key: str) -> Optional[str]:
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            self._ensure_table(conn)
+            return conn.execute(text(self.GET_SQL), {"key": key}).scalar()
+
+    def set(self, key: str, namespace: str, payload: str, ttl: int) -> None:
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            self._ensure_table(conn)
+            conn.execute(
+                text(self.SET_SQL),
+                {"key": key, "namespace": namespace[:255], "payload": payload, "ttl": float(ttl)},
+            )
+            self._writes += 1
+            if self._writes % self.CLEANUP_EVERY == 0:
+                conn.execute(text(self.CLEANUP_SQL))
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+class LLMResponseCache:
+    """
+    Двухуровневый кэш ответов LLM: LRU в памяти + persistent store
+
+    Ошибки persistent store не ломают вызов - ответ берётся у модели.
+    """
+
+    def __init__(self, max_entries: int = 2000, store: Optional[Any] = None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    def _count(self, result: str) -> None:
+        self._stats[result] += 1
+        LLM_RESPONSE_CACHE_REQUESTS.labels(result=result).inc()
+
+    def _remember(self, key: str, payload: Any, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str, ttl: int) -> Tuple[bool, Any]:
+        """
+        Найти ответ по ключу
+
+        Returns:
+            (found, result)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                else:
+                    del self._entries[key]
+                    entry = None
+        if entry is not None:
+            self._count("memory_hits")
+            return True, decode_result(entry[1])
+
+        if self.store is not None:
+            try:
+                raw = self.store.get(key)
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"LLM response cache store read failed: {e}")
+                raw = None
+            if raw is not None:
+                payload = json.loads(raw)
+                # Время жизни в памяти не дольше TTL вызова
+                self._remember(key, payload, time.time() + ttl)
+                self._count("persistent_hits")
+                return True, decode_result(payload)
+
+        self._count("misses")
+        return False, None
+
+    def set(self, key: str, namespace: str, result: Any, ttl: int) -> None:
+        """Сохранить ответ (несериализуемые результаты пропускаются)"""
+        try:
+            payload = encode_result(result)
+        except _NotCacheable as e:
+            logger.debug(f"LLM result of type {e} is not cacheable")
+            return
+        self._remember(key, payload, time.time() + ttl)
+        self._count("stores")
+        if self.store is not None:
+            try:
+                self.store.set(key, namespace, json.dumps(payload, ensure_ascii=False), ttl)
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"LLM response cache store write failed: {e}")
+
+    async def aget(self, key: str, ttl: int) -> Tuple[bool, Any]:
+        """get без блокировки event loop: обращение к store - в потоке"""
+        if self.store is None or key in self._entries:
+            return self.get(key, ttl)
+        return await asyncio.to_thread(self.get, key, ttl)
+
+    async def aset(self, key: str, namespace: str, result: Any, ttl: int) -> None:
+        if self.store is None:
+            self.set(key, namespace, result, ttl)
+        else:
+            await asyncio.to_thread(self.set, key, namespace, result, ttl)
+
+    def clear(self) -> None:
+        """Очистить уровень в памяти"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self._stats["memory_hits"] + self._stats["persistent_hits"] + self._stats["misses"]
+        hits = self._stats["memory_hits"] + self._stats["persistent_hits"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "persistent": self.store is not None,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class CachedLLM(Runnable):
+    """
+    Wrapper that answers repeated LLM calls from LLMResponseCache.
+
+    Runnable, поэтому работает в цепочках (prompt | llm). Кэшируются invoke и
+    ainvoke; потоковые вызовы идут к модели напрямую. Остальные атрибуты
+    проксируются к обёрнутой модели.
+    """
+
+    def __init__(self, llm: Any, cache: LLMResponseCache, namespace: str, ttl: int):
+        """
+        Args:
+            llm: The underlying LLM instance (possibly AdmissionControlledLLM)
+            cache: Response cache
+            namespace: Модель и параметры генерации - часть ключа
+            ttl: Время жизни ответа в секундах
+        """
+        self.__dict__['_llm'] = llm
+        self.__dict__['_cache'] = cache
+        self.__dict__['_namespace'] = namespace
+        self.__dict__['_ttl'] = ttl
+
+    def _wrap(self, llm: Any, suffix: str, params: Any) -> "CachedLLM":
+        detail = json.dumps(params, sort_keys=True, ensure_ascii=False, default=_describe)
+        return CachedLLM(llm, self._cache, f"{self._namespace}|{suffix}:{detail}", self._ttl)
+
+    def invoke(self, input: Any, config: Any = None, cache_ttl: Optional[int] = None, **kwargs):
+        """Invoke the LLM unless the same call is cached."""
+        ttl = self._ttl if cache_ttl is None else cache_ttl
+        if ttl <= 0:
+            return self._llm.invoke(input, config, **kwargs)
+        key = make_cache_key(self._namespace, input, kwargs)
+        found, result = self._cache.get(key, ttl)
+        if found:
+            return result
+        result = self._llm.invoke(input, config, **kwargs)
+        self._cache.set(key, self._namespace, result, ttl)
+        return result
+
+    async def ainvoke(self, input: Any, config: Any = None, cache_ttl: Optional[int] = None, **kwargs):
+        """Async invoke the LLM unless the same call is cached."""
+        ttl = self._ttl if cache_ttl is None else cache_ttl
+        if ttl <= 0:
+            return await self._llm.ainvoke(input, config, **kwargs)
+        key = make_cache_key(self._namespace, input, kwargs)
+        found, result = await self._cache.aget(key, ttl)
+        if found:
+            return result
+        result = await self._llm.ainvoke(input, config, **kwargs)
+        await self._cache.aset(key, self._namespace, result, ttl)
+        return result
+
+    def stream(self, input: Any, config: Any = None, **kwargs) -> Iterator[Any]:
+        """Streaming is not cached."""
+        yield from self._llm.stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Any = None, **kwargs) -> AsyncIterator[Any]:
+        """Streaming is not cached."""
+        async for chunk in self._llm.astream(input, config, **kwargs):
+            yield chunk
+
+    def bind(self, **kwargs):
+        """Bind arguments; they become part of the cache key."""
+        return self._wrap(self._llm.bind(**kwargs), "bind", kwargs)
+
+    def bind_tools(self, tools, **kwargs):
+        """Bind tools; tool names and options become part of the cache key."""
+        return self._wrap(self._llm.bind_tools(tools, **kwargs), "tools", {"tools": tools, **kwargs})
+
+    def with_structured_output(self, schema, **kwargs):
+        """Structured output; the schema becomes part of the cache key."""
+        return self._wrap(
+            self._llm.with_structured_output(schema, **kwargs), "structured", {"schema": schema, **kwargs}
+        )
+
+    def with_config(self, config: Any = None, **kwargs):
+        """Configure the LLM (config does not affect the answer)."""
+        if hasattr(self._llm, 'with_config'):
+            return CachedLLM(self._llm.with_config(config, **kwargs), self._cache, self._namespace, self._ttl)
+        return self
+
+    def __getattr__(self, name):
+        """Proxy all other attributes to the underlying LLM."""
+        return getattr(self.__dict__['_llm'], name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            self.__dict__[name] = value
+        else:
+            setattr(self._llm, name, value)
+
+    @property
+    def InputType(self):
+        return getattr(self._llm, 'InputType', Any)
+
+    @property
+    def OutputType(self):
+        return getattr(self._llm, 'OutputType', Any)
+
+
+def _describe(value: Any) -> str:
+    """Стабильное описание схем и инструментов для ключа"""
+    if isinstance(value, type):
+        try:
+            return json.dumps(value.model_json_schema(), sort_keys=True, ensure_ascii=False)
+        except Exception:
+            return f"{value.__module__}.{value.__qualname__}"
+    name = getattr(value, "name", None) or getattr(value, "__name__", None)
+    return str(name) if name else repr(value)
+
+
+# Global instance
+_response_cache: Optional[LLMResponseCache] = None
+_init_lock = threading.Lock()
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    """Get or create the global LLM response cache."""
+    global _response_cache
+    with _init_lock:
+        if _response_cache is None:
+            store = None
+            if config.LLM_RESPONSE_CACHE_PERSISTENT:
+                try:
+                    store = PostgresResponseStore()
+                except Exception as e:
+                    logger.warning(f"LLM response cache: persistent tier disabled: {e}")
+            _response_cache = LLMResponseCache(
+                max_entries=config.LLM_RESPONSE_CACHE_MAX_ENTRIES,
+                store=store,
+            )
+    return _response_cache
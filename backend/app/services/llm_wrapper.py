@@ -21,14 +21,14 @@ from app.core.resilience import (
     RetryConfig,
     with_timeout,
     with_fallback,
-    Bulkhead,
 )
 from app.services.chat.metrics import get_metrics
+from app.services.rate_limiter import AdmissionControlledLLM, get_admission_controller
 
 logger = logging.getLogger(__name__)
 
 # =============================================================================
-# Circuit Breaker и Bulkhead для LLM
+# Circuit Breaker для LLM
 # =============================================================================
 
 LLM_CIRCUIT_CONFIG = CircuitBreakerConfig(
@@ -39,8 +39,7 @@ LLM_CIRCUIT_CONFIG = CircuitBreakerConfig(
 
 llm_circuit = CircuitBreakerRegistry.get("llm", LLM_CIRCUIT_CONFIG)
 
-# Ограничиваем параллельные вызовы LLM
-llm_bulkhead = Bulkhead("llm_calls", max_concurrent=10)
+# Параллелизм и бюджеты LLM ограничивает общий admission controller (app.services.rate_limiter)
 
 # Retry конфигурация для LLM
 LLM_RETRY_CONFIG = RetryConfig(
@@ -64,7 +63,7 @@ class ResilientLLM:
     - Retry с exponential backoff
     - Circuit Breaker
     - Timeout
-    - Bulkhead (ограничение параллелизма)
+    - Admission control (параллелизм, бюджеты, приоритетные полосы)
     - Метрики
     """
     
@@ -84,8 +83,10 @@ class ResilientLLM:
             timeout: Таймаут для вызовов (секунды)
             max_retries: Максимальное количество попыток
             enable_circuit_breaker: Включить circuit breaker
-            enable_bulkhead: Включить ограничение параллелизма
+            enable_bulkhead: Допускать вызовы через общий admission controller
         """
+        if enable_bulkhead and not isinstance(llm, AdmissionControlledLLM):
+            llm = AdmissionControlledLLM(llm, get_admission_controller())
         self.llm = llm
         self.timeout = timeout
         self.max_retries = max_retries
@@ -117,12 +118,8 @@ class ResilientLLM:
                 self.metrics.record_external_call("llm", success=False, reason="circuit_open")
                 raise CircuitBreakerError("LLM service unavailable")
             
-            # Выполняем с bulkhead
-            if self.enable_bulkhead:
-                async with llm_bulkhead:
-                    result = await self._invoke_with_retry(messages, **kwargs)
-            else:
-                result = await self._invoke_with_retry(messages, **kwargs)
+            # Допуск выполняется на каждую попытку: паузы между retry не держат слот
+            result = await self._invoke_with_retry(messages, **kwargs)
             
             # Записываем успех
             duration = time.time() - start_time
@@ -213,13 +210,8 @@ class ResilientLLM:
                 self.metrics.record_external_call("llm", success=False, reason="circuit_open")
                 raise CircuitBreakerError("LLM service unavailable")
             
-            if self.enable_bulkhead:
-                async with llm_bulkhead:
-                    async for chunk in self._stream_with_timeout(messages, **kwargs):
-                        yield chunk
-            else:
-                async for chunk in self._stream_with_timeout(messages, **kwargs):
-                    yield chunk
+            async for chunk in self._stream_with_timeout(messages, **kwargs):
+                yield chunk
             
             duration = time.time() - start_time
             self.metrics.record_external_call("llm", success=True)
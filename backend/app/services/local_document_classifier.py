@@ -0,0 +1,369 @@
+"""Локальный (без LLM) классификатор типов документов для первого прохода при загрузке"""
+from typing import Dict, Any, Optional, List, Tuple
+from collections import Counter, defaultdict
+import bisect
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько символов начала документа анализируем: тип почти всегда виден в шапке
+HEADER_CHARS = 3000
+
+# Правила по заголовкам документов арбитражного процесса.
+# Паттерны применяются к шапке документа в верхнем регистре; вес отражает надёжность признака.
+KEYWORD_RULES: List[Tuple[str, str, float]] = [
+    ("court_order", r"\bСУДЕБНЫЙ\s+ПРИКАЗ\b", 0.95),
+    ("court_decision", r"\bРЕШЕНИЕ\b[\s\S]{0,200}ИМЕНЕМ\s+РОССИЙСКОЙ\s+ФЕДЕРАЦИИ", 0.95),
+    ("court_resolution", r"\bПОСТАНОВЛЕНИЕ\b[\s\S]{0,300}(АПЕЛЛЯЦИОНН|КАССАЦИОНН|АРБИТРАЖНЫЙ\s+СУД\s+\w+\s+ОКРУГА)", 0.9),
+    ("court_ruling", r"\bОПРЕДЕЛЕНИЕ\b[\s\S]{0,400}(АРБИТРАЖН\w*\s+СУД|СУДЬЯ)", 0.9),
+    ("statement_of_claim", r"\bИСКОВОЕ\s+ЗАЯВЛЕНИЕ\b", 0.92),
+    ("order_application", r"\bЗАЯВЛЕНИЕ\s+О\s+ВЫДАЧЕ\s+СУДЕБНОГО\s+ПРИКАЗА\b", 0.95),
+    ("bankruptcy_application", r"\bЗАЯВЛЕНИЕ\b[\s\S]{0,120}\bБАНКРОТОМ\b", 0.92),
+    ("response_to_claim", r"\bОТЗЫВ\b[\s\S]{0,60}\bИСКОВОЕ\s+ЗАЯВЛЕНИЕ\b", 0.95),
+    ("counterclaim", r"\bВСТРЕЧНОЕ\s+ИСКОВОЕ\s+ЗАЯВЛЕНИЕ\b", 0.96),
+    ("motion_security", r"\bХОДАТАЙСТВО\b[\s\S]{0,80}\bОБЕСПЕЧЕНИ\w*\s+ИСКА\b", 0.93),
+    ("motion_reinstatement", r"\bХОДАТАЙСТВО\b[\s\S]{0,80}\bВОССТАНОВЛЕНИ\w*\b[\s\S]{0,40}\bСРОКА\b", 0.93),
+    ("motion_evidence", r"\bХОДАТАЙСТВО\b[\s\S]{0,80}\b(ИСТРЕБОВАНИ\w*|ПРИОБЩЕНИ\w*)\b", 0.9),
+    ("motion", r"\bХОДАТАЙСТВО\b", 0.8),
+    ("appeal", r"\bАПЕЛЛЯЦИОННАЯ\s+ЖАЛОБА\b", 0.95),
+    ("cassation", r"\bКАССАЦИОННАЯ\s+ЖАЛОБА\b", 0.95),
+    ("settlement_agreement", r"\bМИРОВОЕ\s+СОГЛАШЕНИЕ\b", 0.9),
+    ("pre_claim", r"\bПРЕТЕНЗИЯ\b", 0.85),
+    ("power_of_attorney", r"\bДОВЕРЕННОСТЬ\b", 0.88),
+    ("egrul_extract", r"\bВЫПИСКА\s+ИЗ\s+ЕДИНОГО\s+ГОСУДАРСТВЕННОГО\s+РЕЕСТРА\b|\bВЫПИСКА\s+ИЗ\s+ЕГРЮЛ\b", 0.96),
+    ("state_duty", r"\bПЛАТ[ЕЁ]ЖНОЕ\s+ПОРУЧЕНИЕ\b[\s\S]{0,1500}\bГОСПОШЛИН\w*\b", 0.9),
+    ("contract", r"\bДОГОВОР\b[\s\S]{0,60}№|\bДОГОВОР\s+(ПОСТАВКИ|ПОДРЯДА|АРЕНДЫ|ЗАЙМА|ОКАЗАНИЯ\s+УСЛУГ|КУПЛИ-ПРОДАЖИ)\b", 0.85),
+    ("act", r"\bАКТ\s+(СВЕРКИ|ПРИ[ЕЁ]МА|ВЫПОЛНЕННЫХ|ОКАЗАННЫХ)\b", 0.85),
+    ("expert_opinion", r"\bЗАКЛЮЧЕНИЕ\s+ЭКСПЕРТА\b|\bЭКСПЕРТНОЕ\s+ЗАКЛЮЧЕНИЕ\b", 0.9),
+    ("protocol_remarks", r"\bЗАМЕЧАНИЯ\s+НА\s+ПРОТОКОЛ\b", 0.93),
+    ("written_explanation", r"\bПИСЬМЕННЫЕ\s+ОБЪЯСНЕНИЯ\b", 0.88),
+]
+
+_COMPILED_RULES = [(doc_type, re.compile(pattern), weight) for doc_type, pattern, weight in KEYWORD_RULES]
+
+_TOKEN_RE = re.compile(r"[а-яёa-z]{3,}", re.IGNORECASE)
+
+# Переобучение на истории классификаций не чаще, чем раз в этот интервал (секунды)
+RETRAIN_INTERVAL_SECONDS = 3600
+# Минимальная уверенность записи в истории, чтобы использовать её как обучающий пример
+MIN_TRAINING_CONFIDENCE = 0.75
+# Источники разметки для обучения: LLM и ручное исправление (user). Собственные
+# ответы классификатора ("local") в обучение не попадают - иначе модель учится на себе
+TRAINING_CLASSIFIERS = ("yandex", "gigachat", "user")
+# Доля истории, отложенная для калибровки уверенности модели (каждый N-й документ по хешу)
+CALIBRATION_HOLDOUT_EVERY = 5
+# Примеров в одном интервале калибровки; меньше одного интервала - модель не калибруется
+CALIBRATION_BIN_SIZE = 20
+# Уверенность некалиброванной модели: ниже порога, решение остаётся за LLM
+UNCALIBRATED_MODEL_CONFIDENCE = 0.6
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 текста документа (ключ кэша классификации)"""
+    return hashlib.sha256((text or "").encode("utf-8", errors="ignore")).hexdigest()
+
+
+def _tokenize(text: str) -> List[str]:
+    # Грубый стемминг: обрезаем окончания, чтобы "договора"/"договору" совпадали
+    return [token.lower()[:7] for token in _TOKEN_RE.findall(text)]
+
+
+def _is_holdout(text: str) -> bool:
+    return int(content_hash(text)[:8], 16) % CALIBRATION_HOLDOUT_EVERY == 0
+
+
+def _estimate(samples: List[Tuple[List[str], str]], alpha: float):
+    """Параметры наивного Байеса по токенизированным примерам (None - меньше двух классов)"""
+    class_counts: Counter = Counter()
+    token_counts: Dict[str, Counter] = defaultdict(Counter)
+    vocabulary = set()
+    for tokens, doc_type in samples:
+        class_counts[doc_type] += 1
+        token_counts[doc_type].update(tokens)
+        vocabulary.update(tokens)
+
+    total = sum(class_counts.values())
+    if total == 0 or len(class_counts) < 2:
+        return None
+
+    vocab_size = len(vocabulary)
+    class_log_prior = {}
+    token_log_prob = {}
+    unknown_log_prob = {}
+    for doc_type, count in class_counts.items():
+        class_log_prior[doc_type] = math.log(count / total)
+        counts = token_counts[doc_type]
+        denominator = sum(counts.values()) + alpha * vocab_size
+        token_log_prob[doc_type] = {
+            token: math.log((n + alpha) / denominator) for token, n in counts.items()
+        }
+        unknown_log_prob[doc_type] = math.log(alpha / denominator)
+    return class_log_prior, token_log_prob, unknown_log_prob
+
+
+def _best_with_margin(model, tokens: List[str]) -> Tuple[str, float]:
+    """
+    Лучший класс и отрыв его лог-правдоподобия от второго
+
+    Апостериорная вероятность наивного Байеса на сотнях токенов почти всегда
+    ~1.0, а отрыв в лог-пространстве остаётся информативным - по нему и калибруем.
+    """
+    class_log_prior, token_log_prob, unknown_log_prob = model
+    scores = {}
+    for doc_type, prior in class_log_prior.items():
+        probs = token_log_prob[doc_type]
+        unknown = unknown_log_prob[doc_type]
+        scores[doc_type] = prior + sum(probs.get(token, unknown) for token in tokens)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return ranked[0][0], ranked[0][1] - ranked[1][1]
+
+
+def _calibration_bins(points: List[Tuple[float, bool]]) -> List[Tuple[float, float]]:
+    """
+    Гистограммная калибровка: [(нижняя граница отрыва, доля верных ответов)]
+
+    Интервалы равной наполненности по возрастанию отрыва; доля сглажена
+    по Лапласу и сделана неубывающей.
+    """
+    points = sorted(points)
+    num_bins = len(points) // CALIBRATION_BIN_SIZE
+    bins = []
+    accuracy_floor = 0.0
+    for i in range(num_bins):
+        chunk = points[len(points) * i // num_bins:len(points) * (i + 1) // num_bins]
+        correct = sum(1 for _, is_correct in chunk if is_correct)
+        accuracy_floor = max(accuracy_floor, (correct + 1) / (len(chunk) + 2))
+        bins.append((chunk[0][0], accuracy_floor))
+    return bins
+
+
+class LocalDocumentClassifier:
+    """
+    Быстрый локальный классификатор документов.
+
+    Комбинирует:
+    - правила по заголовкам (KEYWORD_RULES), работающие без обучения;
+    - мультиномиальный наивный Байес по токенам шапки, обученный на истории
+      DocumentClassification (линейная модель в лог-пространстве, без внешних зависимостей).
+
+    Возвращает None, если ни один из компонентов не дал ответа, —
+    тогда решение остаётся за LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+        # [(нижняя граница отрыва, уверенность)] по отложенной выборке
+        self._calibration: List[Tuple[float, float]] = []
+        self._trained_at: Optional[float] = None
+        self.num_training_samples = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self._model is not None
+
+    def fit(self, samples: List[Tuple[str, str]], alpha: float = 1.0) -> None:
+        """
+        Обучить модель на парах (текст, doc_type)
+
+        Каждый CALIBRATION_HOLDOUT_EVERY-й документ (по хешу текста) откладывается:
+        модель, обученная без него, даёт на нём отрывы и ошибки для калибровки
+        уверенности. Итоговая модель обучается на всех примерах.
+
+        Args:
+            samples: Обучающие примеры
+            alpha: Сглаживание Лапласа
+        """
+        train, holdout = [], []
+        for text, doc_type in samples:
+            header = (text or "")[:HEADER_CHARS]
+            tokens = _tokenize(header)
+            if tokens:
+                (holdout if _is_holdout(header) else train).append((tokens, doc_type))
+
+        model = _estimate(train + holdout, alpha)
+        if model is None:
+            logger.info("Local classifier: not enough labeled history to train the model")
+            return
+
+        calibration: List[Tuple[float, float]] = []
+        partial = _estimate(train, alpha) if len(holdout) >= CALIBRATION_BIN_SIZE else None
+        if partial is not None:
+            points = []
+            for tokens, doc_type in holdout:
+                predicted, margin = _best_with_margin(partial, tokens)
+                points.append((margin, predicted == doc_type))
+            calibration = _calibration_bins(points)
+
+        with self._lock:
+            self._model = model
+            self._calibration = calibration
+            self._trained_at = time.time()
+            self.num_training_samples = len(train) + len(holdout)
+
+        logger.info(
+            f"Local classifier trained on {self.num_training_samples} samples, {len(model[0])} doc types, "
+            f"{len(calibration)} calibration bins"
+        )
+
+    def needs_training(self) -> bool:
+        """Пора ли (пере)обучить модель на истории"""
+        return self._trained_at is None or time.time() - self._trained_at > RETRAIN_INTERVAL_SECONDS
+
+    def train_from_history(self, db, limit: int = 5000) -> int:
+        """
+        Обучить модель на классификациях LLM и ручных исправлениях из БД
+
+        Args:
+            db: Сессия SQLAlchemy
+            limit: Максимум обучающих примеров
+
+        Returns:
+            Количество использованных примеров
+        """
+        from sqlalchemy import func, or_
+        from app.models.analysis import DocumentClassification
+        from app.models.case import File
+
+        # Отмечаем попытку сразу, чтобы не ходить в БД на каждый файл, если истории мало
+        self._trained_at = time.time()
+        rows = (
+            db.query(
+                DocumentClassification.doc_type,
+                DocumentClassification.confidence,
+                func.substr(File.original_text, 1, HEADER_CHARS),
+            )
+            .join(File, File.id == DocumentClassification.file_id)
+            .filter(
+                DocumentClassification.needs_human_review == "false",
+                # NULL - записи LLM до появления источника (свои помечены миграцией 032)
+                or_(
+                    DocumentClassification.classifier.in_(TRAINING_CLASSIFIERS),
+                    DocumentClassification.classifier.is_(None),
+                ),
+            )
+            .order_by(DocumentClassification.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+
+        samples = []
+        for doc_type, confidence, header in rows:
+            try:
+                if float(confidence or 0.0) < MIN_TRAINING_CONFIDENCE:
+                    continue
+            except (TypeError, ValueError):
+                continue
+            if header and doc_type:
+                samples.append((header, doc_type))
+
+        self.fit(samples)
+        return len(samples)
+
+    def _predict_rules(self, header: str) -> Optional[Tuple[str, float]]:
+        upper = header.upper()
+        best: Optional[Tuple[str, float]] = None
+        for doc_type, pattern, weight in _COMPILED_RULES:
+            match = pattern.search(upper)
+            if not match:
+                continue
+            # Заголовок в самом начале документа надёжнее упоминания в тексте
+            score = weight if match.start() < 500 else weight - 0.15
+            if best is None or score > best[1]:
+                best = (doc_type, score)
+        return best
+
+    def _predict_model(self, header: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            model = self._model
+            calibration = self._calibration
+        if model is None:
+            return None
+
+        tokens = _tokenize(header)
+        if not tokens:
+            return None
+
+        doc_type, margin = _best_with_margin(model, tokens)
+        if not calibration:
+            return doc_type, UNCALIBRATED_MODEL_CONFIDENCE
+        index = bisect.bisect_right([lower for lower, _ in calibration], margin) - 1
+        return doc_type, calibration[max(index, 0)][1]
+
+    def predict(self, text: str, filename: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Классифицировать документ локально
+
+        Args:
+            text: Текст документа
+            filename: Имя файла (используется как дополнительный признак)
+
+        Returns:
+            {"doc_type", "confidence", "reasoning"} или None, если признаков нет
+        """
+        header = (text or "")[:HEADER_CHARS]
+        if filename:
+            header = f"{filename.rsplit('.', 1)[0].replace('_', ' ')}\n{header}"
+
+        rule_prediction = self._predict_rules(header)
+        model_prediction = self._predict_model(header)
+
+        if rule_prediction and model_prediction:
+            if rule_prediction[0] == model_prediction[0]:
+                # Независимые признаки согласны — усиливаем уверенность
+                confidence = 1 - (1 - rule_prediction[1]) * (1 - model_prediction[1])
+                return {
+                    "doc_type": rule_prediction[0],
+                    "confidence": min(confidence, 0.99),
+                    "reasoning": "Локальная классификация: правила и модель согласны",
+                }
+            # Противоречие — снижаем уверенность, чтобы решение принял LLM
+            best = max(rule_prediction, model_prediction, key=lambda p: p[1])
+            return {
+                "doc_type": best[0],
+                "confidence": best[1] * 0.6,
+                "reasoning": "Локальная классификация: правила и модель расходятся",
+            }
+
+        if rule_prediction:
+            return {
+                "doc_type": rule_prediction[0],
+                "confidence": rule_prediction[1],
+                "reasoning": "Локальная классификация по заголовку документа",
+            }
+
+        if model_prediction:
+            return {
+                "doc_type": model_prediction[0],
+                "confidence": model_prediction[1],
+                "reasoning": f"Локальная модель, обученная на {self.num_training_samples} документах",
+            }
+
+        return None
+
+
+# Global classifier instance (модель переиспользуется между запросами)
+_local_classifier: Optional[LocalDocumentClassifier] = None
+
+
+def get_local_classifier(db=None) -> LocalDocumentClassifier:
+    """
+    Get the global local classifier, (re)training it from history when a DB session is given
+
+    Args:
+        db: Optional SQLAlchemy session used to train on DocumentClassification history
+    """
+    global _local_classifier
+    if _local_classifier is None:
+        _local_classifier = LocalDocumentClassifier()
+    if db is not None and _local_classifier.needs_training():
+        try:
+            _local_classifier.train_from_history(db)
+        except Exception as e:
+            logger.warning(f"Failed to train local classifier from history: {e}")
+    return _local_classifier
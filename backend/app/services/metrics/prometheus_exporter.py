@@ -8,6 +8,7 @@ Metrics:
 - Error rates
 - Rate limiting stats
 - Agent execution metrics
+- Per-route HTTP latency and per-stage RAG/chat pipeline latency
 """
 import time
 import logging
@@ -110,6 +111,25 @@ LLM_CONCURRENT_REQUESTS = Gauge(
     ['provider']
 )
 
+LLM_ADMISSION_QUEUE_DEPTH = Gauge(
+    'llm_admission_queue_depth',
+    'LLM calls waiting for admission',
+    ['provider', 'lane']
+)
+
+LLM_ADMISSION_WAIT = Histogram(
+    'llm_admission_wait_seconds',
+    'Time LLM calls spent waiting for admission',
+    ['provider', 'lane'],
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0]
+)
+
+LLM_RESPONSE_CACHE_REQUESTS = Counter(
+    'llm_response_cache_requests_total',
+    'LLM response cache lookups and writes',
+    ['result']
+)
+
 # Agent metrics
 AGENT_EXECUTION_LATENCY = Histogram(
     'agent_execution_latency_seconds',
@@ -152,6 +172,22 @@ RAG_RELEVANCE_SCORE = Histogram(
     buckets=[0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
 )
 
+# Pipeline stage metrics (app.services.metrics.tracing)
+PIPELINE_STAGE_LATENCY = Histogram(
+    'pipeline_stage_latency_seconds',
+    'Latency of RAG/chat pipeline stages (condense, embed, pgvector, bm25, rrf, rerank, prompt_build, first_token, last_token)',
+    ['route', 'stage'],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+)
+
+# HTTP metrics (RequestContextMiddleware)
+HTTP_REQUEST_LATENCY = Histogram(
+    'http_request_latency_seconds',
+    'HTTP request latency until response start, by route template',
+    ['method', 'route', 'status'],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+
 # System info
 SYSTEM_INFO = Info(
     'legal_ai_vault_info',
@@ -0,0 +1,187 @@
+"""Per-stage latency tracing for request pipelines (RAG, chat)
+
+Лёгкие span'ы без внешнего трейсера: каждый этап (condense, embed, pgvector,
+bm25, rrf, rerank, prompt_build, first_token, last_token) пишется в гистограмму
+pipeline_stage_latency_seconds{route, stage} и в трейс текущего запроса.
+
+Трейс создаётся RequestContextMiddleware и связан с correlation ID: по
+завершении запроса в лог пишется одна строка со всеми этапами, а для обычных
+(не потоковых) ответов этапы уходят в заголовок Server-Timing.
+
+Пример использования:
+```python
+with trace_span("rerank"):
+    reranked = reranker.rerank(query, docs)
+
+@traced("condense")
+def condense_query(self, query, history):
+    ...
+```
+"""
+import asyncio
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.services.metrics.prometheus_exporter import PIPELINE_STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Метка route для этапов вне HTTP-запроса (фоновые задачи, ingestion)
+BACKGROUND_ROUTE = "background"
+
+# Верхняя граница числа span'ов в одном трейсе (длинные SSE-сессии)
+MAX_SPANS_PER_TRACE = 256
+
+
+class RequestTrace:
+    """Этапы одного запроса: (stage, offset от начала запроса, длительность)"""
+
+    __slots__ = ("correlation_id", "started", "spans", "_route", "_scope", "_marked")
+
+    def __init__(
+        self,
+        correlation_id: Optional[str] = None,
+        route: Optional[str] = None,
+        scope: Optional[Dict[str, Any]] = None,
+    ):
+        self.correlation_id = correlation_id
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+        self._route = route
+        self._scope = scope
+        self._marked: set = set()
+
+    @property
+    def route(self) -> str:
+        """Шаблон пути (/api/cases/{case_id}), а не сам путь - чтобы не раздувать метки"""
+        if self._route is None and self._scope is not None:
+            route = self._scope.get("route")
+            if route is not None:
+                self._route = getattr(route, "path", None)
+        return self._route or "unknown"
+
+    def add(self, stage: str, offset: float, duration: float) -> None:
+        if len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append((stage, offset, duration))
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Суммарное время по этапам (этап может встречаться несколько раз)"""
+        totals: Dict[str, float] = {}
+        for stage, _, duration in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + duration
+        return totals
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        return ", ".join(
+            f"{stage};dur={duration * 1000:.1f}" for stage, duration in self.stage_totals().items()
+        )
+
+    def summary(self) -> str:
+        return " ".join(
+            f"{stage}={duration * 1000:.1f}ms" for stage, duration in self.stage_totals().items()
+        )
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def get_current_trace() -> Optional[RequestTrace]:
+    """Трейс текущего запроса (None вне HTTP-запроса)"""
+    return _current_trace.get()
+
+
+def start_trace(
+    correlation_id: Optional[str] = None,
+    route: Optional[str] = None,
+    scope: Optional[Dict[str, Any]] = None,
+):
+    """Начать трейс запроса; вернуть токен для finish_trace"""
+    return _current_trace.set(RequestTrace(correlation_id, route, scope))
+
+
+def finish_trace(token) -> Optional[RequestTrace]:
+    """Завершить трейс и записать строку с этапами в лог"""
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is not None and trace.spans:
+        logger.info(f"trace {trace.correlation_id} {trace.route} | {trace.summary()}")
+    return trace
+
+
+def record_stage(stage: str, duration: float, started: Optional[float] = None) -> None:
+    """Записать длительность этапа в гистограмму и в трейс текущего запроса"""
+    trace = _current_trace.get()
+    route = trace.route if trace is not None else BACKGROUND_ROUTE
+    PIPELINE_STAGE_LATENCY.labels(route=route, stage=stage).observe(duration)
+    if trace is not None:
+        offset = (started if started is not None else time.perf_counter() - duration) - trace.started
+        trace.add(stage, offset, duration)
+
+
+def mark_stage(stage: str) -> Optional[float]:
+    """
+    Отметить момент от начала запроса (first_token, last_token)
+
+    Повторные отметки того же этапа в рамках запроса игнорируются.
+
+    Returns:
+        Время от начала запроса в секундах или None вне запроса
+    """
+    trace = _current_trace.get()
+    if trace is None or stage in trace._marked:
+        return None
+    trace._marked.add(stage)
+    elapsed = time.perf_counter() - trace.started
+    PIPELINE_STAGE_LATENCY.labels(route=trace.route, stage=stage).observe(elapsed)
+    trace.add(stage, 0.0, elapsed)
+    return elapsed
+
+
+@contextmanager
+def trace_span(stage: str) -> Iterator[None]:
+    """Измерить этап; работает и в sync, и в async коде"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, started)
+
+
+def traced(stage: str) -> Callable:
+    """Декоратор: обернуть функцию (sync или async) в trace_span(stage)"""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with trace_span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def trace_sse_stream(events: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Отметить first_token и last_token для SSE-потока ответа
+
+    first_token - первое событие с textDelta, last_token - конец потока.
+    """
+    first_pending = True
+    try:
+        async for event in events:
+            if first_pending and "textDelta" in event:
+                first_pending = False
+                mark_stage("first_token")
+            yield event
+    finally:
+        mark_stage("last_token")
@@ -0,0 +1,390 @@
+"""Process-pool executor for CPU-bound document parsing (PDF/DOCX/XLSX)
+
+pypdf, python-docx и openpyxl - чистый Python и держат GIL, поэтому разбор
+больших файлов в потоке API-процесса блокирует остальные запросы. Executor
+выполняет разбор в отдельных процессах:
+
+- вход передаётся в памяти (bytes -> BytesIO), без временных файлов;
+- у каждой задачи есть таймаут, у каждого процесса - лимит памяти;
+- большие PDF делятся на пакеты страниц, которые разбираются параллельно.
+"""
+import asyncio
+import logging
+import math
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_EXCEPTION
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# Запас времени поверх таймаута воркера, после которого задача считается зависшей
+TIMEOUT_GRACE_SECONDS = 5.0
+# Как часто проверяются дедлайны задач, секунды
+DEADLINE_POLL_SECONDS = 0.5
+
+SerializedDocument = Tuple[str, Dict[str, Any]]
+
+
+class ParsingError(ValueError):
+    """Файл не удалось разобрать (таймаут, лимит памяти, падение воркера)"""
+
+
+class _WorkerTimeout(Exception):
+    """Таймаут внутри процесса-воркера (через SIGALRM)"""
+
+
+class _PoolRetired(Exception):
+    """Пул выведен из работы из-за зависшего разбора другого файла - задачи можно повторить"""
+
+
+# ----------------------------------------------------------------------
+# Worker side (module-level functions, must be picklable)
+# ----------------------------------------------------------------------
+
+def _init_worker(memory_limit_mb: int) -> None:
+    """Initializer процесса-воркера: лимит адресного пространства"""
+    # Ctrl+C обрабатывает родительский процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit_mb <= 0:
+        return
+    try:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Could not set parsing worker memory limit: {e}")
+
+
+def _raise_timeout(signum, frame):
+    raise _WorkerTimeout()
+
+
+def _run_with_limits(func: Callable, timeout: float, filename: str, *args):
+    """Выполнить func в воркере с таймаутом; ошибки приводятся к ParsingError"""
+    use_alarm = timeout > 0 and hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    except _WorkerTimeout:
+        raise ParsingError(f"Превышено время разбора файла {filename} ({timeout:.0f} с)")
+    except MemoryError:
+        raise ParsingError(f"Файл {filename} требует слишком много памяти для разбора")
+    except ParsingError:
+        raise
+    except ValueError as e:
+        raise ParsingError(str(e))
+    except Exception as e:
+        raise ParsingError(f"Ошибка при чтении файла {filename}: {str(e)[:200]}")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _serialize(documents: List[Document]) -> List[SerializedDocument]:
+    return [(doc.page_content, dict(doc.metadata)) for doc in documents]
+
+
+def _count_pdf_pages(content: bytes) -> int:
+    from app.utils.file_parser import count_pdf_pages
+    return count_pdf_pages(content)
+
+
+def _load_pdf_pages(content: bytes, filename: str, start: int, end: int) -> List[SerializedDocument]:
+    from app.services.langchain_loaders import DocumentLoaderService
+    return _serialize(DocumentLoaderService.load_pdf_pages(content, filename, start, end))
+
+
+def _load_document(content: bytes, filename: str) -> List[SerializedDocument]:
+    from app.services.langchain_loaders import DocumentLoaderService
+    return _serialize(DocumentLoaderService.load_document(content, filename))
+
+
+def _parse_text(content: bytes, filename: str) -> str:
+    from app.utils.file_parser import parse_file
+    return parse_file(content, filename)
+
+
+def _render_html_pages(content: bytes, filename: str, file_type: Optional[str]) -> List[str]:
+    from app.services.document_converter_service import DocumentConverterService
+    return DocumentConverterService().convert_to_html_pages(content, filename, file_type)
+
+
+# ----------------------------------------------------------------------
+# Executor
+# ----------------------------------------------------------------------
+
+class ParsingExecutor:
+    """
+    Parses documents in a process pool.
+
+    Sync methods (load_document_sync, parse_text_sync) are meant for worker
+    threads (IngestionPipeline stages); async methods for request handlers.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout: Optional[float] = None,
+        memory_limit_mb: Optional[int] = None,
+        page_parallel_threshold: Optional[int] = None,
+        pages_per_task: Optional[int] = None,
+        use_process_pool: Optional[bool] = None,
+    ):
+        """
+        Args:
+            max_workers: Количество процессов (по умолчанию os.cpu_count())
+            timeout: Таймаут задачи разбора (файл или пакет страниц), секунды
+            memory_limit_mb: Лимит памяти процесса-воркера, 0 - без лимита
+            page_parallel_threshold: С какого числа страниц PDF делится на пакеты
+            pages_per_task: Минимальный размер пакета страниц
+            use_process_pool: False - разбор в вызывающем потоке (dev/tests)
+        """
+        self.max_workers = max_workers or config.PARSING_MAX_WORKERS or os.cpu_count() or 1
+        self.timeout = timeout if timeout is not None else config.PARSING_TIMEOUT_SECONDS
+        self.memory_limit_mb = memory_limit_mb if memory_limit_mb is not None else config.PARSING_MEMORY_LIMIT_MB
+        self.page_parallel_threshold = page_parallel_threshold or config.PARSING_PAGE_PARALLEL_THRESHOLD
+        self.pages_per_task = pages_per_task or config.PARSING_PAGES_PER_TASK
+        self.use_process_pool = config.PARSING_USE_PROCESS_POOL if use_process_pool is None else use_process_pool
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Незавершённые задачи каждого пула и пулы с зависшими воркерами (-> их зависшие задачи)
+        self._inflight: Dict[ProcessPoolExecutor, Set[Future]] = {}
+        self._retired: "weakref.WeakKeyDictionary[ProcessPoolExecutor, Set[Future]]" = weakref.WeakKeyDictionary()
+
+    # ------------------------------------------------------------------
+    # Pool management
+    # ------------------------------------------------------------------
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: воркеры не наследуют потоки/event loop API-процесса
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb,),
+                )
+                self._inflight[self._pool] = set()
+            return self._pool
+
+    def _submit(self, pool: ProcessPoolExecutor, filename: str, func: Callable, args: tuple) -> Future:
+        future = pool.submit(_run_with_limits, func, self.timeout, filename, *args)
+        with self._lock:
+            inflight = self._inflight.get(pool)
+            if inflight is not None:
+                inflight.add(future)
+        future.add_done_callback(lambda done, pool=pool: self._task_done(pool, done))
+        return future
+
+    def _task_done(self, pool: ProcessPoolExecutor, future: Future) -> None:
+        with self._lock:
+            inflight = self._inflight.get(pool)
+            if inflight is not None:
+                inflight.discard(future)
+        self._reap_if_idle(pool)
+
+    def _retire_pool(self, pool: ProcessPoolExecutor, stuck: Set[Future]) -> None:
+        """
+        Вывести из работы пул с зависшим воркером.
+
+        Новые задачи идут в новый пул; процессы старого убиваются (у
+        ProcessPoolExecutor нет способа прервать одну задачу), только когда
+        в нём не останется задач других файлов, кроме зависших.
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+            self._retired.setdefault(pool, set()).update(stuck)
+        logger.warning(f"Parsing process pool retired: {len(stuck)} task(s) stuck past the deadline")
+        self._reap_if_idle(pool)
+
+    def _reap_if_idle(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            stuck = self._retired.get(pool)
+            inflight = self._inflight.get(pool)
+            if stuck is None or inflight is None or inflight - stuck:
+                return
+            del self._inflight[pool]
+        # Колбэки future вызываются из служебного потока пула - останавливаем его из отдельного потока
+        threading.Thread(target=self._kill_pool, args=(pool,), name="parsing-pool-reaper", daemon=True).start()
+
+    @staticmethod
+    def _kill_pool(pool: ProcessPoolExecutor) -> None:
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            try:
+                process.kill()
+            except Exception:
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("Parsing process pool recycled")
+
+    def _pool_broken(self, pool: ProcessPoolExecutor, filename: str, error: BaseException) -> None:
+        """Пул недоступен: повтор, если его остановили мы, иначе - ParsingError с причиной"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+            retired = pool in self._retired
+            self._inflight.pop(pool, None)
+        if retired:
+            raise _PoolRetired()
+        pool.shutdown(wait=False, cancel_futures=True)
+        if isinstance(error, BrokenProcessPool):
+            logger.warning(f"Parsing process pool broken while parsing {filename}: {error}")
+            raise ParsingError(
+                f"Процесс разбора аварийно завершился во время обработки файла {filename} "
+                f"(воркер убит системой или упал в native-коде)"
+            )
+        raise ParsingError(f"Пул разбора документов остановлен, файл {filename} не обработан")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._inflight.clear()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _run_many(self, filename: str, calls: List[Tuple[Callable, tuple]]) -> List[Any]:
+        """
+        Выполнить задачи разбора одного файла; результаты в порядке calls.
+
+        Первая ошибка прерывает ожидание остальных задач файла. Если пул
+        остановлен из-за зависшего разбора другого файла, файл повторяется
+        один раз на новом пуле.
+        """
+        if not self.use_process_pool:
+            return [_run_with_limits(func, 0, filename, *args) for func, args in calls]
+
+        try:
+            return self._run_on_pool(filename, calls)
+        except _PoolRetired:
+            logger.info(f"Parsing pool was recycled during {filename}, retrying on a fresh pool")
+        try:
+            return self._run_on_pool(filename, calls)
+        except _PoolRetired:
+            raise ParsingError(f"Пул разбора документов перезапускается, файл {filename} не обработан")
+
+    def _run_on_pool(self, filename: str, calls: List[Tuple[Callable, tuple]]) -> List[Any]:
+        pool = self._get_pool()
+        futures: List[Future] = []
+        try:
+            for func, args in calls:
+                futures.append(self._submit(pool, filename, func, args))
+        except (BrokenProcessPool, RuntimeError) as e:
+            for future in futures:
+                future.cancel()
+            self._pool_broken(pool, filename, e)
+
+        # Дедлайн у каждой задачи свой и отсчитывается с момента, когда она пошла в работу
+        # (ожидание в очереди пула за задачами других файлов не считается). running() становится
+        # True уже в очереди вызовов пула (max_workers + 1 мест), поэтому задача может ещё
+        # дождаться одной чужой задачи - отсюда 2 * timeout. SIGALRM в воркере обычно
+        # срабатывает раньше; дедлайн ловит воркеры, зависшие в C-коде.
+        hard_deadline = 2 * self.timeout + TIMEOUT_GRACE_SECONDS
+        started: Dict[Future, float] = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=DEADLINE_POLL_SECONDS, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.cancelled():
+                    for other in pending:
+                        other.cancel()
+                    self._pool_broken(pool, filename, RuntimeError("cancelled"))
+                error = future.exception()
+                if error is None:
+                    continue
+                for other in pending:
+                    other.cancel()
+                if isinstance(error, BrokenProcessPool):
+                    self._pool_broken(pool, filename, error)
+                raise error
+
+            now = time.monotonic()
+            overdue = False
+            for future in pending:
+                if future.running():
+                    started.setdefault(future, now)
+                    overdue = overdue or now - started[future] > hard_deadline
+            if overdue:
+                # Ещё не начатые задачи файла отменяются, выполняющиеся считаются зависшими
+                stuck = {future for future in pending if not future.cancel()}
+                self._retire_pool(pool, stuck)
+                raise ParsingError(f"Превышено время разбора файла {filename} ({self.timeout:.0f} с)")
+
+        return [future.result() for future in futures]
+
+    def _run(self, filename: str, func: Callable, *args) -> Any:
+        return self._run_many(filename, [(func, args)])[0]
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def page_batches(self, page_count: int) -> List[Tuple[int, int]]:
+        """Разбить страницы PDF на пакеты [start, end) для параллельного разбора"""
+        if page_count <= self.page_parallel_threshold:
+            return [(0, page_count)]
+        batch_size = max(self.pages_per_task, math.ceil(page_count / self.max_workers))
+        return [(start, min(start + batch_size, page_count)) for start in range(0, page_count, batch_size)]
+
+    def load_document_sync(self, content: bytes, filename: str) -> List[Document]:
+        """Аналог DocumentLoaderService.load_document, выполняемый в пуле процессов"""
+        _, ext = os.path.splitext(filename)
+        if ext.lower() == ".pdf":
+            page_count = self._run(filename, _count_pdf_pages, content)
+            batches = self.page_batches(page_count)
+            results = self._run_many(
+                filename,
+                [(_load_pdf_pages, (content, filename, start, end)) for start, end in batches],
+            )
+            serialized = [doc for batch in results for doc in batch]
+            logger.info(f"Parsed PDF {filename}: {page_count} pages in {len(batches)} batch(es)")
+        else:
+            serialized = self._run(filename, _load_document, content, filename)
+        return [Document(page_content=text, metadata=metadata) for text, metadata in serialized]
+
+    def parse_text_sync(self, content: bytes, filename: str) -> str:
+        """Аналог utils.file_parser.parse_file, выполняемый в пуле процессов"""
+        _, ext = os.path.splitext(filename)
+        if ext.lower() == ".pdf":
+            return "\n".join(doc.page_content for doc in self.load_document_sync(content, filename))
+        return self._run(filename, _parse_text, content, filename)
+
+    def render_html_pages_sync(self, content: bytes, filename: str, file_type: Optional[str] = None) -> List[str]:
+        """DocumentConverterService.convert_to_html_pages в пуле процессов"""
+        return self._run(filename, _render_html_pages, content, filename, file_type)
+
+    async def load_document(self, content: bytes, filename: str) -> List[Document]:
+        """Async-обёртка: ожидание пула не блокирует event loop"""
+        return await asyncio.to_thread(self.load_document_sync, content, filename)
+
+    async def parse_text(self, content: bytes, filename: str) -> str:
+        return await asyncio.to_thread(self.parse_text_sync, content, filename)
+
+    async def render_html_pages(self, content: bytes, filename: str, file_type: Optional[str] = None) -> List[str]:
+        return await asyncio.to_thread(self.render_html_pages_sync, content, filename, file_type)
+
+
+# Global instance
+_parsing_executor: Optional[ParsingExecutor] = None
+
+
+def get_parsing_executor() -> ParsingExecutor:
+    """Get global ParsingExecutor instance (process pool starts lazily)"""
+    global _parsing_executor
+    if _parsing_executor is None:
+        _parsing_executor = ParsingExecutor()
+    return _parsing_executor
@@ -1,11 +1,12 @@
 """PGVector Vector Store service for multi-tenant document storage using direct SQLAlchemy approach"""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine, text, Column, String, JSON, bindparam, Table, MetaData
 from sqlalchemy.ext.declarative import declarative_base
 from langchain_core.documents import Document
 from app.config import config
 from app.services.yandex_embeddings import YandexEmbeddings
+from app.services.metrics.tracing import trace_span
 import logging
 import json
 import uuid
@@ -118,6 +119,15 @@ class CaseVectorStore:
                 except Exception as e:
                     logger.debug(f"Could not create case_id index: {e}")
                 
+                # Index on metadata file_id for per-file incremental reindexing
+                try:
+                    conn.execute(text(f"""
+                        CREATE INDEX IF NOT EXISTS idx_{VectorEmbedding.__tablename__}_file_id 
+                        ON {VectorEmbedding.__tablename__} ((document->'metadata'->>'file_id'))
+                    """))
+                except Exception as e:
+                    logger.debug(f"Could not create file_id index: {e}")
+                
                 # Check if embedding column has correct dimension (256)
                 # If table was created with wrong dimension (1536), we need to fix it
                 try:
@@ -398,7 +408,8 @@ class CaseVectorStore:
             List of Document objects
         """
         # Create query embedding
-        query_embedding = self.embeddings.embed_query(query)
+        with trace_span("embed"):
+            query_embedding = self.embeddings.embed_query(query)
         # Convert to PostgreSQL array format string
         query_embedding_str = '[' + ','.join(str(float(x)) for x in query_embedding) + ']'
         
@@ -446,10 +457,12 @@ class CaseVectorStore:
                 raw_conn = conn.connection
                 cursor = raw_conn.cursor()
                 try:
-                    cursor.execute(sql, params)
+                    with trace_span("pgvector"):
+                        cursor.execute(sql, params)
+                        rows = cursor.fetchall()
                     
                     documents = []
-                    for row in cursor.fetchall():
+                    for row in rows:
                         doc_data = row[1]  # document column is at index 1
                         if isinstance(doc_data, str):
                             doc_data = json.loads(doc_data)
@@ -492,7 +505,8 @@ class CaseVectorStore:
             List of (Document, score) tuples
         """
         # Create query embedding
-        query_embedding = self.embeddings.embed_query(query)
+        with trace_span("embed"):
+            query_embedding = self.embeddings.embed_query(query)
         # Convert to PostgreSQL array format string
         query_embedding_str = '[' + ','.join(str(float(x)) for x in query_embedding) + ']'
         
@@ -539,10 +553,12 @@ class CaseVectorStore:
                 raw_conn = conn.connection
                 cursor = raw_conn.cursor()
                 try:
-                    cursor.execute(sql, params)
+                    with trace_span("pgvector"):
+                        cursor.execute(sql, params)
+                        rows = cursor.fetchall()
                     
                     documents_with_scores = []
-                    for row in cursor.fetchall():
+                    for row in rows:
                         doc_data = row[1]  # document column is at index 1
                         similarity = row[2] if len(row) > 2 else 0.0  # similarity column
                         
@@ -567,6 +583,121 @@ class CaseVectorStore:
             logger.error(f"Failed to search PGVector store with scores: {e}", exc_info=True)
             raise
     
+    def chunk_uuid(self, case_id: str, chunk_id: str) -> str:
+        """Deterministic row id for a chunk, so re-indexing upserts instead of duplicating"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.collection_name}:{case_id}:{chunk_id}"))
+    
+    def get_indexed_files(self, case_id: str) -> Dict[Optional[str], Tuple[Optional[str], int]]:
+        """
+        Indexed files of a case: file_id -> (content_hash, chunk count)
+        
+        content_hash is None when the file's chunks have no hash or carry
+        different hashes (rows left by older full reindexes).
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT document->'metadata'->>'file_id' AS file_id,
+                           CASE WHEN COUNT(DISTINCT document->'metadata'->>'content_hash') = 1
+                                 AND COUNT(document->'metadata'->>'content_hash') = COUNT(*)
+                                THEN MAX(document->'metadata'->>'content_hash') END AS content_hash,
+                           COUNT(*) AS chunks
+                    FROM {VectorEmbedding.__tablename__}
+                    WHERE collection_id = :collection_id AND case_id = :case_id
+                    GROUP BY 1
+                """),
+                {"collection_id": self.collection_name, "case_id": case_id}
+            ).fetchall()
+        return {row[0]: (row[1], int(row[2])) for row in rows}
+    
+    def get_file_chunk_embeddings(self, case_id: str, file_id: str) -> Dict[str, str]:
+        """Existing embeddings of a file's chunks: md5(page_content) -> vector literal"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT md5(document->>'page_content'), embedding::text
+                    FROM {VectorEmbedding.__tablename__}
+                    WHERE collection_id = :collection_id AND case_id = :case_id
+                      AND document->'metadata'->>'file_id' = :file_id
+                      AND embedding IS NOT NULL
+                """),
+                {"collection_id": self.collection_name, "case_id": case_id, "file_id": file_id}
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+    
+    def replace_file_chunks(
+        self,
+        case_id: str,
+        file_id: str,
+        chunks: List[Tuple[str, str, Dict[str, Any]]]
+    ) -> int:
+        """
+        Upsert a file's chunks by chunk_id and delete its chunks that are gone
+        
+        Args:
+            case_id: Case identifier
+            file_id: File identifier (document metadata file_id)
+            chunks: (chunk_id, vector literal, document JSON) for every current chunk
+            
+        Returns:
+            Number of deleted stale rows
+        """
+        from psycopg2.extras import execute_values
+        
+        table_name = VectorEmbedding.__tablename__
+        values = []
+        for chunk_id, embedding_str, doc_json in chunks:
+            row_id = self.chunk_uuid(case_id, chunk_id)
+            values.append((row_id, self.collection_name, case_id, embedding_str, json.dumps(doc_json), chunk_id))
+        
+        self._fix_vector_dimension_if_needed()
+        
+        with self.engine.begin() as conn:
+            cursor = conn.connection.cursor()
+            try:
+                if values:
+                    execute_values(
+                        cursor,
+                        f"""
+                            INSERT INTO {table_name}
+                            (uuid, collection_id, case_id, embedding, document, custom_id)
+                            VALUES %s
+                            ON CONFLICT (uuid) DO UPDATE SET
+                                embedding = EXCLUDED.embedding,
+                                document = EXCLUDED.document,
+                                custom_id = EXCLUDED.custom_id
+                        """,
+                        values,
+                        template="(%s, %s, %s, %s::vector, %s::jsonb, %s)"
+                    )
+                cursor.execute(
+                    f"""
+                        DELETE FROM {table_name}
+                        WHERE collection_id = %s AND case_id = %s
+                          AND document->'metadata'->>'file_id' = %s
+                          AND NOT (uuid = ANY(%s))
+                    """,
+                    [self.collection_name, case_id, file_id, [row[0] for row in values]]
+                )
+                deleted = cursor.rowcount
+            finally:
+                cursor.close()
+        return deleted
+    
+    def delete_orphan_vectors(self, case_id: str, file_ids: List[str]) -> int:
+        """Delete a case's chunks that belong to no current file (deleted files, rows without file_id)"""
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                text(f"""
+                    DELETE FROM {VectorEmbedding.__tablename__}
+                    WHERE collection_id = :collection_id AND case_id = :case_id
+                      AND (document->'metadata'->>'file_id' IS NULL
+                           OR NOT (document->'metadata'->>'file_id' = ANY(:file_ids)))
+                """),
+                {"collection_id": self.collection_name, "case_id": case_id, "file_ids": list(file_ids)}
+            )
+        return result.rowcount
+    
     def delete_case_vectors(self, case_id: str) -> bool:
         """
         Delete all vectors for a specific case
@@ -3,12 +3,17 @@ from typing import List, Dict, Any, Optional
 from dataclasses import dataclass, field
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
-from app.models.playbook import Playbook, PlaybookRule, PlaybookCheck
+from sqlalchemy.exc import IntegrityError
+from app.config import config
+from app.models.playbook import Playbook, PlaybookRule, PlaybookCheck, ClauseExtractionCache
 from app.models.case import File
-from app.services.clause_extractor import ClauseExtractor, ExtractedClause, ClauseExtractionResult
+from app.services.clause_extractor import (
+    ClauseExtractor, ExtractedClause, ClauseExtractionResult, CLAUSE_EXTRACTOR_VERSION
+)
 from app.services.llm_factory import create_llm
 from langchain_core.prompts import ChatPromptTemplate
 from datetime import datetime
+import asyncio
 import logging
 import json
 import re
@@ -100,12 +105,16 @@ class PlaybookChecker:
     
     Процесс проверки:
     1. Загрузить документ и playbook
-    2. Извлечь пункты контракта (clause extraction)
-    3. Для каждого правила:
+    2. Извлечь пункты контракта (clause extraction) или взять их из
+       clause_extraction_cache по (sha256 текста, версия экстрактора)
+    3. Для каждого правила (параллельно, не больше PLAYBOOK_RULE_CONCURRENCY):
        - Найти соответствующий пункт
        - Проверить соответствие условию
        - Если нарушение - сгенерировать redline
     4. Сформировать итоговый отчёт
+    
+    Все операции с self.db выполняются в потоке event loop между await,
+    поэтому параллельные проверки документов batch_check используют одну сессию.
     """
     
     def __init__(self, db: Session):
@@ -113,6 +122,8 @@ class PlaybookChecker:
         self.db = db
         self.clause_extractor = ClauseExtractor()
         self.llm = None
+        # Извлечения, выполняющиеся сейчас: одинаковые документы в batch ждут одно извлечение
+        self._extractions_in_flight: Dict[str, asyncio.Future] = {}
         self._init_llm()
     
     def _init_llm(self):
@@ -173,6 +184,7 @@ class PlaybookChecker:
         document_text = file.original_text or ""
         if not document_text:
             raise ValueError(f"Document {document_id} has no text content")
+        document_hash = hashlib.sha256(document_text.encode()).hexdigest()[:64]
         
         # Create check record
         check = PlaybookCheck(
@@ -181,7 +193,7 @@ class PlaybookChecker:
             case_id=case_id,
             user_id=user_id,
             document_name=file.filename,
-            document_hash=hashlib.sha256(document_text.encode()).hexdigest()[:64],
+            document_hash=document_hash,
             overall_status="in_progress",
             started_at=start_time,
         )
@@ -189,28 +201,31 @@ class PlaybookChecker:
         self.db.flush()
         
         try:
-            # Extract clauses from document
-            logger.info(f"Extracting clauses from document {document_id}")
-            extraction_result = await self.clause_extractor.extract_all_clauses(document_text)
+            # Extract clauses from document (cached by document hash)
+            extraction_result = await self._get_extraction(document_id, document_text, document_hash)
             
-            # Check each rule
-            results: List[RuleCheckResult] = []
+            # Check rules concurrently, results keep rule order
             active_rules = [r for r in playbook.rules if r.is_active]
+            semaphore = asyncio.Semaphore(max(1, config.PLAYBOOK_RULE_CONCURRENCY))
             
-            for rule in active_rules:
-                try:
-                    result = await self._check_rule(rule, extraction_result, document_text)
-                    results.append(result)
-                except Exception as e:
-                    logger.error(f"Error checking rule {rule.id}: {e}")
-                    results.append(RuleCheckResult(
-                        rule_id=rule.id,
-                        rule_name=rule.rule_name,
-                        rule_type=rule.rule_type,
-                        clause_category=rule.clause_category,
-                        status="error",
-                        issue_description=str(e)
-                    ))
+            async def check_rule(rule: PlaybookRule) -> RuleCheckResult:
+                async with semaphore:
+                    try:
+                        return await self._check_rule(rule, extraction_result, document_text)
+                    except Exception as e:
+                        logger.error(f"Error checking rule {rule.id}: {e}")
+                        return RuleCheckResult(
+                            rule_id=rule.id,
+                            rule_name=rule.rule_name,
+                            rule_type=rule.rule_type,
+                            clause_category=rule.clause_category,
+                            status="error",
+                            issue_description=str(e)
+                        )
+            
+            results: List[RuleCheckResult] = list(
+                await asyncio.gather(*(check_rule(rule) for rule in active_rules))
+            )
             
             # Calculate statistics
             red_line_violations = sum(1 for r in results if r.rule_type == "red_line" and r.status == "violation")
@@ -302,6 +317,59 @@ class PlaybookChecker:
             self.db.commit()
             raise
     
+    async def _get_extraction(
+        self,
+        document_id: str,
+        document_text: str,
+        document_hash: str
+    ) -> ClauseExtractionResult:
+        """
+        Get clauses of a document: clause_extraction_cache, then in-flight
+        extraction of the same text, then LLM extraction.
+        """
+        cached = self.db.get(ClauseExtractionCache, (document_hash, CLAUSE_EXTRACTOR_VERSION))
+        if cached is not None:
+            logger.info(f"Using cached clauses for document {document_id}")
+            return ClauseExtractionResult.model_validate(cached.extraction)
+        
+        in_flight = self._extractions_in_flight.get(document_hash)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._extractions_in_flight[document_hash] = future
+        try:
+            logger.info(f"Extracting clauses from document {document_id}")
+            extraction_result = await self.clause_extractor.extract_all_clauses(document_text)
+            # Пустой результат - обычно ошибка LLM/парсинга, такой не кэшируем
+            if extraction_result.clauses:
+                self._store_extraction(document_hash, extraction_result)
+            future.set_result(extraction_result)
+            return extraction_result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Ожидающих может не быть - исключение считается полученным
+            future.exception()
+            raise
+        finally:
+            self._extractions_in_flight.pop(document_hash, None)
+    
+    def _store_extraction(self, document_hash: str, extraction_result: ClauseExtractionResult):
+        """Save extraction to clause_extraction_cache (committed together with the check)"""
+        try:
+            with self.db.begin_nested():
+                self.db.add(ClauseExtractionCache(
+                    document_hash=document_hash,
+                    extractor_version=CLAUSE_EXTRACTOR_VERSION,
+                    extraction=extraction_result.model_dump(),
+                ))
+        except IntegrityError:
+            # Тот же документ уже сохранил другой процесс
+            logger.debug(f"Clause extraction for {document_hash[:12]} already cached")
+    
     async def _check_rule(
         self,
         rule: PlaybookRule,
@@ -815,6 +883,9 @@ class PlaybookChecker:
         """
         Check multiple documents against a playbook
         
+        Documents are checked concurrently (PLAYBOOK_DOCUMENT_CONCURRENCY),
+        results keep the order of document_ids.
+        
         Args:
             document_ids: List of document IDs
             playbook_id: Playbook ID
@@ -824,34 +895,34 @@ class PlaybookChecker:
         Returns:
             List of PlaybookCheckResults
         """
-        results = []
-        
-        for document_id in document_ids:
-            try:
-                result = await self.check_document(
-                    document_id=document_id,
-                    playbook_id=playbook_id,
-                    user_id=user_id,
-                    case_id=case_id
-                )
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Error checking document {document_id}: {e}")
-                # Add failed result
-                results.append(PlaybookCheckResult(
-                    check_id="",
-                    playbook_id=playbook_id,
-                    document_id=document_id,
-                    overall_status="failed",
-                    compliance_score=0,
-                    red_line_violations=0,
-                    fallback_issues=0,
-                    no_go_violations=0,
-                    passed_rules=0,
-                    results=[],
-                    redlines=[],
-                    extracted_clauses=[]
-                ))
+        semaphore = asyncio.Semaphore(max(1, config.PLAYBOOK_DOCUMENT_CONCURRENCY))
         
-        return results
+        async def check_one(document_id: str) -> PlaybookCheckResult:
+            async with semaphore:
+                try:
+                    return await self.check_document(
+                        document_id=document_id,
+                        playbook_id=playbook_id,
+                        user_id=user_id,
+                        case_id=case_id
+                    )
+                except Exception as e:
+                    logger.error(f"Error checking document {document_id}: {e}")
+                    # Add failed result
+                    return PlaybookCheckResult(
+                        check_id="",
+                        playbook_id=playbook_id,
+                        document_id=document_id,
+                        overall_status="failed",
+                        compliance_score=0,
+                        red_line_violations=0,
+                        fallback_issues=0,
+                        no_go_violations=0,
+                        passed_rules=0,
+                        results=[],
+                        redlines=[],
+                        extracted_clauses=[]
+                    )
+        
+        return list(await asyncio.gather(*(check_one(document_id) for document_id in document_ids)))
 
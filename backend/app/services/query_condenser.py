@@ -11,6 +11,7 @@ Features:
 """
 from typing import List, Optional, Dict, Any
 from app.config import config
+from app.services.metrics.tracing import traced
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,11 +39,13 @@ class QueryCondenserService:
         if self._llm is None:
             try:
                 from app.services.llm_factory import create_llm
-                self._llm = create_llm(temperature=0.0)
+                # Переформулировки - чистая функция от запроса: повторы берутся из кэша
+                self._llm = create_llm(temperature=0.0, cache_ttl=config.LLM_RESPONSE_CACHE_TTL_SECONDS)
             except Exception as e:
                 logger.warning(f"Failed to initialize LLM for query condensation: {e}")
         return self._llm
     
+    @traced("condense")
     def condense_query(
         self,
         query: str,
@@ -158,6 +161,7 @@ class QueryCondenserService:
             logger.warning(f"Query expansion failed: {e}")
             return [query]
     
+    @traced("condense")
     def generate_multi_queries(self, query: str, num_queries: int = 3) -> List[str]:
         """
         Generate multiple diverse queries for ensemble retrieval.
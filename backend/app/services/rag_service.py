@@ -6,6 +6,8 @@ from typing import List, Dict, Any, Tuple, Optional, Type
 import json
 import time
 import inspect
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm import Session
 from langchain_core.documents import Document
 from app.config import config
@@ -13,6 +15,7 @@ from app.services.document_processor import DocumentProcessor
 # YandexAssistantService imported conditionally - only for yandex vector store
 from app.services.langchain_retrievers import AdvancedRetrieverService
 from app.services.langchain_memory import MemoryService
+from app.services.metrics.tracing import traced
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +27,23 @@ RERANK_TOP_K = 20  # Second stage: rerank to top candidates
 CONDENSE_TOP_K = 10  # Third stage: condense context
 FINAL_TOP_K = 5  # Final stage: use for synthesis
 
+# Multi-query retrieval: веса вариантов запроса во взвешенном RRF
+MULTI_QUERY_ORIGINAL_WEIGHT = 1.0  # Исходный запрос пользователя
+MULTI_QUERY_VARIANT_WEIGHT = 0.7  # Сгенерированные переформулировки
+MULTI_QUERY_RRF_K = 60
+MULTI_QUERY_MAX_WORKERS = 4  # Параллельные hybrid_search по вариантам
+
+_multi_query_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_multi_query_executor() -> ThreadPoolExecutor:
+    global _multi_query_executor
+    if _multi_query_executor is None:
+        _multi_query_executor = ThreadPoolExecutor(
+            max_workers=MULTI_QUERY_MAX_WORKERS, thread_name_prefix="multi-query"
+        )
+    return _multi_query_executor
+
 # Словарь для перевода типов документов на русский язык
 DOC_TYPE_LABELS = {
     # Судебные акты
@@ -415,8 +435,10 @@ class RAGService:
         """
         Retrieve using multiple query formulations.
         
-        Generates diverse query formulations and retrieves documents for each,
-        then deduplicates and reranks the combined results.
+        Generates diverse query formulations and runs hybrid search for all
+        variants concurrently (each task embeds its own variant). Results are fused
+        with weighted RRF (original query weighs more than variants),
+        deduplicated by chunk_id and reranked against the original query.
         
         Args:
             case_id: Case identifier
@@ -437,27 +459,26 @@ class RAGService:
                 queries = self._query_condenser.generate_multi_queries(query, num_queries)
                 logger.debug(f"Generated {len(queries)} query variants")
             
-            # Retrieve for each query
-            all_docs = []
-            seen_content_hashes = set()
-            
-            for q in queries:
-                docs = self.document_processor.hybrid_search(
+            # Эмбеддинг варианта считается внутри его задачи: YandexEmbeddings
+            # обрабатывает тексты по одному, батч на все варианты был бы последовательным
+            def search(q: str) -> List[Document]:
+                return self.document_processor.hybrid_search(
                     case_id=case_id,
                     query=q,
                     k=k_per_query,
                     alpha=0.7,
                     db=db
                 )
-                
-                # Deduplicate by content hash
-                for doc in docs:
-                    if doc is None:
-                        continue
-                    content_hash = hash(doc.page_content[:500])
-                    if content_hash not in seen_content_hashes:
-                        seen_content_hashes.add(content_hash)
-                        all_docs.append(doc)
+            
+            # Поиск по вариантам параллельно (контекст - трейс запроса - переносится в потоки)
+            if len(queries) > 1:
+                executor = _get_multi_query_executor()
+                futures = [executor.submit(contextvars.copy_context().run, search, q) for q in queries]
+                results = [future.result() for future in futures]
+            else:
+                results = [search(queries[0])]
+            
+            all_docs = self._fuse_multi_query_results(results)
             
             # Rerank combined results
             if self._reranker and len(all_docs) > final_k:
@@ -476,6 +497,32 @@ class RAGService:
             logger.error(f"Multi-query retrieval error: {e}")
             return self.retrieve_context(case_id, query, k=final_k, db=db)
     
+    def _fuse_multi_query_results(self, results: List[List[Document]]) -> List[Document]:
+        """
+        Взвешенный RRF по результатам вариантов запроса
+        
+        results[0] - результаты исходного запроса. Документы дедуплицируются по
+        chunk_id (или source_file:chunk_index, если chunk_id нет).
+        """
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        
+        for position, variant_docs in enumerate(results):
+            weight = MULTI_QUERY_ORIGINAL_WEIGHT if position == 0 else MULTI_QUERY_VARIANT_WEIGHT
+            for rank, doc in enumerate(variant_docs, start=1):
+                if doc is None:
+                    continue
+                key = doc.metadata.get("chunk_id") or self.document_processor._get_doc_id(doc)
+                if key not in docs:
+                    docs[key] = doc
+                    scores[key] = 0.0
+                scores[key] += weight / (MULTI_QUERY_RRF_K + rank)
+        
+        ranked = sorted(docs, key=lambda key: scores[key], reverse=True)
+        for key in ranked:
+            docs[key].metadata["multi_query_score"] = scores[key]
+        return [docs[key] for key in ranked]
+    
     def format_sources(self, documents: List[Document]) -> List[Dict[str, Any]]:
         """
         Format source documents with precise references
@@ -1563,6 +1610,7 @@ class RAGService:
                 confidence=0.0
             )
     
+    @traced("prompt_build")
     def _prepare_context_with_positions(self, documents: List[Document]) -> str:
         """Подготавливает контекст с позициями для точного цитирования"""
         context_parts = []
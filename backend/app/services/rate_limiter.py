@@ -1,391 +1,768 @@
-"""Rate Limiter for LLM calls - Phase 4.1 Implementation
+"""Admission control for LLM calls
 
-This module provides rate limiting and throttling for LLM calls to prevent
-API overload and 429 errors.
+Единая asyncio-native точка допуска для всех вызовов LLM (create_llm, ResilientLLM):
+- бюджеты запросов/сек и токенов/мин на провайдера (token bucket без sleep-циклов)
+- ограничение числа параллельных вызовов
+- приоритетные полосы: интерактивный чат > шаги workflow > массовое извлечение (табличные ревью)
+- честная очередь по пользователям внутри полосы (round-robin)
+- метрики глубины очередей и времени ожидания
 
-Features:
-- Token bucket rate limiting (InMemoryRateLimiter)
-- Global semaphore for concurrency control
-- Configurable via environment variables
+Ожидание допуска никогда не блокирует event loop. Полоса и пользователь берутся
+из контекста (contextvars), поэтому код, вызывающий LLM, их не передаёт:
+фоновые операции помечаются декоратором llm_priority, по умолчанию - INTERACTIVE.
 """
+import asyncio
+import functools
+import inspect
 import threading
 import time
 import logging
-from typing import Optional, Callable, Any
-from functools import wraps
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+from langchain_core.runnables import Runnable
 from app.config import config
 
 logger = logging.getLogger(__name__)
 
+try:
+    from app.services.metrics.prometheus_exporter import (
+        LLM_ADMISSION_QUEUE_DEPTH,
+        LLM_ADMISSION_WAIT,
+        LLM_CONCURRENT_REQUESTS,
+        RATE_LIMIT_WAITS,
+    )
+    HAS_PROMETHEUS_METRICS = True
+except ImportError:
+    HAS_PROMETHEUS_METRICS = False
 
-class InMemoryRateLimiter:
+# Грубая оценка для русского текста (уточняется по фактическому ответу)
+CHARS_PER_TOKEN = 3
+# Ожидаемая длина ответа, пока он не получен
+DEFAULT_OUTPUT_TOKENS = 256
+
+
+class LLMPriority(IntEnum):
+    """Полосы допуска (меньше - важнее)"""
+    INTERACTIVE = 0
+    WORKFLOW = 1
+    BULK = 2
+
+
+_current_priority: ContextVar[LLMPriority] = ContextVar("llm_priority", default=LLMPriority.INTERACTIVE)
+_current_user: ContextVar[Optional[str]] = ContextVar("llm_user_id", default=None)
+
+
+@contextmanager
+def llm_request_context(priority: Optional[LLMPriority] = None, user_id: Optional[str] = None):
     """
-    Token bucket rate limiter for controlling request rate.
-    
-    Based on LangChain's InMemoryRateLimiter pattern.
-    Uses a token bucket algorithm to allow burst capacity while
-    maintaining an average request rate.
+    Set the admission lane and user for LLM calls inside the block.
+
+    Значения наследуются дочерними задачами и asyncio.to_thread.
     """
-    
-    def __init__(
-        self,
-        requests_per_second: float = 1.0,
-        check_every_n_seconds: float = 0.1,
-        max_bucket_size: int = 10
-    ):
+    tokens = []
+    if priority is not None:
+        tokens.append((_current_priority, _current_priority.set(LLMPriority(priority))))
+    if user_id is not None:
+        tokens.append((_current_user, _current_user.set(str(user_id))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_llm_priority() -> LLMPriority:
+    """Get the admission lane of the current context"""
+    return _current_priority.get()
+
+
+def llm_priority(priority: LLMPriority, user_arg: str = "user_id"):
+    """
+    Decorator: run all LLM calls of a coroutine / async generator in the given lane.
+
+    Пользователь для честной очереди берётся из аргумента user_arg (строка
+    или объект с атрибутом user_id, например WorkflowExecution), если он есть.
+
+    Example:
+        @llm_priority(LLMPriority.BULK)
+        async def run_extraction(self, review_id, user_id): ...
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def resolve_user(args, kwargs) -> Optional[str]:
+            if user_arg not in signature.parameters:
+                return None
+            try:
+                value = signature.bind_partial(*args, **kwargs).arguments.get(user_arg)
+            except TypeError:
+                return None
+            if value is None or isinstance(value, str):
+                return value
+            return getattr(value, "user_id", None)
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def generator_wrapper(*args, **kwargs):
+                user_id = resolve_user(args, kwargs)
+                agen = func(*args, **kwargs)
+                try:
+                    while True:
+                        # Контекст действует только на время шага генератора и не протекает к потребителю
+                        with llm_request_context(priority, user_id):
+                            try:
+                                item = await agen.__anext__()
+                            except StopAsyncIteration:
+                                return
+                        yield item
+                finally:
+                    await agen.aclose()
+            return generator_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with llm_request_context(priority, resolve_user(args, kwargs)):
+                return await func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def _text_length(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value)
+    content = getattr(value, "content", None)
+    if isinstance(content, str):
+        return len(content)
+    if hasattr(value, "to_messages"):
+        return sum(_text_length(m) for m in value.to_messages())
+    if isinstance(value, (list, tuple)):
+        return sum(_text_length(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_text_length(v) for v in value.values())
+    return len(str(value))
+
+
+def estimate_tokens(value: Any) -> int:
+    """Estimate tokens of a prompt (str, messages, PromptValue) plus the expected answer"""
+    return _text_length(value) // CHARS_PER_TOKEN + DEFAULT_OUTPUT_TOKENS
+
+
+def _used_tokens(prompt: Any, result: Any) -> int:
+    usage = getattr(result, "usage_metadata", None)
+    if isinstance(usage, dict) and usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    return (_text_length(prompt) + _text_length(result)) // CHARS_PER_TOKEN
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket without waiting loops.
+
+    Ведро не ждёт само: delay_for сообщает, через сколько секунд наберётся
+    нужное количество, а контроллер планирует повторную проверку на loop.
+    """
+
+    def __init__(self, rate: float, capacity: float):
         """
-        Initialize the rate limiter.
-        
         Args:
-            requests_per_second: Target rate of requests per second
-            check_every_n_seconds: How often to check if we can proceed
-            max_bucket_size: Maximum burst capacity (tokens in bucket)
+            rate: Tokens added per second
+            capacity: Maximum burst (bucket size)
         """
-        self.requests_per_second = requests_per_second
-        self.check_every_n_seconds = check_every_n_seconds
-        self.max_bucket_size = max_bucket_size
-        
-        # Token bucket state
-        self._tokens = float(max_bucket_size)
+        self.rate = rate
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
         self._last_update = time.monotonic()
-        self._lock = threading.Lock()
-        
-        logger.info(
-            f"InMemoryRateLimiter initialized: "
-            f"rps={requests_per_second}, bucket_size={max_bucket_size}"
-        )
-    
-    def _refill_tokens(self) -> None:
-        """Refill tokens based on elapsed time."""
+
+    def _refill(self) -> None:
         now = time.monotonic()
-        elapsed = now - self._last_update
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_update) * self.rate)
         self._last_update = now
-        
-        # Add tokens based on elapsed time
-        tokens_to_add = elapsed * self.requests_per_second
-        self._tokens = min(self.max_bucket_size, self._tokens + tokens_to_add)
-    
-    def acquire(self, timeout: Optional[float] = None) -> bool:
-        """
-        Acquire a token from the bucket, blocking if necessary.
-        
-        Args:
-            timeout: Maximum time to wait for a token (None = wait indefinitely)
-            
-        Returns:
-            True if token was acquired, False if timeout
-        """
-        start_time = time.monotonic()
-        
-        while True:
-            with self._lock:
-                self._refill_tokens()
-                
-                if self._tokens >= 1.0:
-                    self._tokens -= 1.0
-                    return True
-            
-            # Check timeout
-            if timeout is not None:
-                elapsed = time.monotonic() - start_time
-                if elapsed >= timeout:
-                    logger.warning(f"Rate limiter timeout after {elapsed:.2f}s")
-                    return False
-            
-            # Wait before checking again
-            time.sleep(self.check_every_n_seconds)
-    
-    def try_acquire(self) -> bool:
-        """
-        Try to acquire a token without blocking.
-        
-        Returns:
-            True if token was acquired, False otherwise
-        """
-        with self._lock:
-            self._refill_tokens()
-            
-            if self._tokens >= 1.0:
-                self._tokens -= 1.0
-                return True
-            return False
-    
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until amount is available (0 - available now)"""
+        self._refill()
+        # Запрос больше ведра не должен ждать вечно - ограничиваем ёмкостью
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    def consume(self, amount: float) -> float:
+        """Take tokens from the bucket and return the amount taken"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        self._tokens -= amount
+        return amount
+
+    def adjust(self, delta: float) -> None:
+        """Correct the bucket after a call (delta > 0 - spent more than reserved, bucket goes into debt)"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - delta)
+
     @property
-    def available_tokens(self) -> float:
-        """Get current number of available tokens."""
-        with self._lock:
-            self._refill_tokens()
-            return self._tokens
+    def available(self) -> float:
+        """Current number of tokens in the bucket"""
+        self._refill()
+        return self._tokens
+
+
+def _resolve_waiter(future: asyncio.Future) -> None:
+    """Set the admission result in the waiter's own event loop"""
+    if not future.done():
+        future.set_result(None)
+
+
+def _in_event_loop_thread() -> bool:
+    """True when the calling thread is running an event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class AdmissionTicket:
+    """Permission to run one LLM call; must be released after the call"""
+
+    __slots__ = ("priority", "user_key", "estimated_tokens", "reserved_tokens", "used_tokens",
+                 "enqueued_at", "loop", "future", "event", "managed", "released")
 
+    def __init__(self, priority: LLMPriority, user_key: str, estimated_tokens: int = 0):
+        self.priority = priority
+        self.user_key = user_key
+        self.estimated_tokens = estimated_tokens
+        self.reserved_tokens = 0.0
+        self.used_tokens: Optional[int] = None
+        self.enqueued_at = time.monotonic()
+        # Асинхронный ожидающий: его event loop и future в этом loop
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        # Синхронный ожидающий (рабочий поток)
+        self.event: Optional[threading.Event] = None
+        # True - допуск выдан и слот занят
+        self.managed = False
+        self.released = False
 
-class LLMSemaphore:
+
+class LLMAdmissionController:
     """
-    Global semaphore for controlling concurrent LLM calls.
-    
-    Limits the number of simultaneous LLM API calls to prevent
-    overwhelming the provider and ensure fair resource usage.
+    Admission controller for one LLM provider.
+
+    Порядок допуска: сначала более приоритетная полоса, внутри полосы -
+    пользователи по кругу. reserved_interactive_slots слотов доступны только
+    интерактивной полосе, поэтому фоновое извлечение на тысячи ячеек не
+    занимает все слоты и чат получает допуск сразу.
+
+    Контроллер общий для всех event loop процесса (веб-приложение, asyncio.run
+    в потоках JobWorker) и рабочих потоков: состояние защищено threading.Lock,
+    каждый ожидающий будится в своём loop через call_soon_threadsafe.
     """
-    
-    def __init__(self, max_concurrent: int = 8):
+
+    def __init__(
+        self,
+        provider: str = "gigachat",
+        requests_per_second: float = 0.0,
+        max_bucket_size: int = 10,
+        tokens_per_minute: int = 0,
+        max_concurrent: int = 8,
+        reserved_interactive_slots: int = 0,
+    ):
         """
-        Initialize the semaphore.
-        
         Args:
-            max_concurrent: Maximum number of concurrent LLM calls
+            provider: Provider name (metrics label)
+            requests_per_second: Request budget (0 = unlimited)
+            max_bucket_size: Request burst size
+            tokens_per_minute: Token budget (0 = unlimited)
+            max_concurrent: Maximum concurrent calls
+            reserved_interactive_slots: Slots usable only by the interactive lane
         """
-        self._semaphore = threading.Semaphore(max_concurrent)
-        self._max_concurrent = max_concurrent
-        self._current_count = 0
+        self.provider = provider
+        self.max_concurrent = max(1, max_concurrent)
+        self.reserved_interactive_slots = min(max(0, reserved_interactive_slots), self.max_concurrent - 1)
+        self._request_bucket = AsyncTokenBucket(requests_per_second, max_bucket_size) if requests_per_second > 0 else None
+        self._token_bucket = AsyncTokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute > 0 else None
+
         self._lock = threading.Lock()
-        
-        logger.info(f"LLMSemaphore initialized: max_concurrent={max_concurrent}")
-    
-    def acquire(self, timeout: Optional[float] = None) -> bool:
+        # {lane: {user_key: deque[AdmissionTicket]}}; порядок пользователей - очередь round-robin
+        self._lanes: Dict[LLMPriority, "OrderedDict[str, Deque[AdmissionTicket]]"] = {
+            lane: OrderedDict() for lane in LLMPriority
+        }
+        self._in_flight = 0
+        # Повторная проверка бюджета не привязана ни к одному event loop
+        self._timer: Optional[threading.Timer] = None
+
+        self._admitted = {lane: 0 for lane in LLMPriority}
+        self._wait_seconds = {lane: 0.0 for lane in LLMPriority}
+        self._max_wait_seconds = {lane: 0.0 for lane in LLMPriority}
+        self._loop_thread_warned = False
+
+        logger.info(
+            f"LLMAdmissionController[{provider}] initialized: rps={requests_per_second}, "
+            f"tpm={tokens_per_minute}, max_concurrent={self.max_concurrent}, "
+            f"reserved_interactive={self.reserved_interactive_slots}"
+        )
+
+    # ------------------------------------------------------------------
+    # Async API
+    # ------------------------------------------------------------------
+
+    async def acquire(
+        self,
+        priority: Optional[LLMPriority] = None,
+        user_id: Optional[str] = None,
+        estimated_tokens: int = 0,
+        timeout: Optional[float] = None,
+    ) -> AdmissionTicket:
         """
-        Acquire the semaphore.
-        
+        Wait for admission without blocking the event loop.
+
         Args:
-            timeout: Maximum time to wait (None = wait indefinitely)
-            
-        Returns:
-            True if acquired, False if timeout
+            priority: Lane (default: from context)
+            user_id: User for fair queuing (default: from context)
+            estimated_tokens: Expected tokens of the call
+            timeout: Maximum wait (None = wait indefinitely)
+
+        Raises:
+            asyncio.TimeoutError: Not admitted within timeout
         """
-        result = self._semaphore.acquire(timeout=timeout)
-        if result:
+        ticket = self._new_ticket(priority, user_id, estimated_tokens)
+        ticket.loop = asyncio.get_running_loop()
+        ticket.future = ticket.loop.create_future()
+        self._enqueue(ticket)
+
+        try:
+            if timeout is None:
+                await ticket.future
+            else:
+                await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: AdmissionTicket, used_tokens: Optional[int] = None) -> None:
+        """Return the slot and correct the token budget by the actual usage (any thread)"""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.managed:
+                return
+            self._in_flight -= 1
+            if used_tokens is not None and self._token_bucket is not None:
+                self._token_bucket.adjust(used_tokens - ticket.reserved_tokens)
+            admitted = self._schedule()
+        self._wake(admitted)
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        priority: Optional[LLMPriority] = None,
+        user_id: Optional[str] = None,
+        estimated_tokens: int = 0,
+    ):
+        """
+        Context manager around one LLM call.
+
+        Example:
+            async with controller.admit(estimated_tokens=500) as ticket:
+                result = await llm.ainvoke(prompt)
+                ticket.used_tokens = 420
+        """
+        ticket = await self.acquire(priority, user_id, estimated_tokens)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, ticket.used_tokens)
+
+    # ------------------------------------------------------------------
+    # Sync API (вызовы из рабочих потоков, например asyncio.to_thread)
+    # ------------------------------------------------------------------
+
+    def acquire_sync(
+        self,
+        priority: Optional[LLMPriority] = None,
+        user_id: Optional[str] = None,
+        estimated_tokens: int = 0,
+    ) -> AdmissionTicket:
+        """
+        Wait for admission in the calling thread.
+
+        Вызов проходит общую очередь, поток ждёт на threading.Event. В потоке
+        работающего event loop ждать нельзя: loop бы остановился, а слоты,
+        которые должны освободиться, держат его же корутины. Такой вызов
+        допускается сразу, но слот и бюджеты учитываются - очередь остальных
+        вызовов это видит. Из loop следует вызывать ainvoke.
+        """
+        ticket = self._new_ticket(priority, user_id, estimated_tokens)
+        if _in_event_loop_thread():
             with self._lock:
-                self._current_count += 1
-        return result
-    
-    def release(self) -> None:
-        """Release the semaphore."""
-        self._semaphore.release()
+                self._admit(ticket)
+                self._update_gauges()
+                warn = not self._loop_thread_warned
+                self._loop_thread_warned = True
+            if warn:
+                logger.warning(
+                    f"LLMAdmissionController[{self.provider}]: sync LLM call from the event loop thread "
+                    f"admitted without queueing; use ainvoke"
+                )
+            return ticket
+        ticket.event = threading.Event()
+        self._enqueue(ticket)
+        try:
+            ticket.event.wait()
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def _new_ticket(self, priority, user_id, estimated_tokens) -> AdmissionTicket:
+        lane = LLMPriority(priority if priority is not None else _current_priority.get())
+        user_key = str(user_id or _current_user.get() or "anonymous")
+        return AdmissionTicket(lane, user_key, estimated_tokens)
+
+    def _enqueue(self, ticket: AdmissionTicket) -> None:
         with self._lock:
-            self._current_count = max(0, self._current_count - 1)
-    
-    @property
-    def current_usage(self) -> int:
-        """Get current number of active LLM calls."""
+            self._lanes[ticket.priority].setdefault(ticket.user_key, deque()).append(ticket)
+            admitted = self._schedule()
+        self._wake(admitted)
+
+    def _abandon(self, ticket: AdmissionTicket) -> None:
+        """Leave the queue after cancellation/timeout, or return a slot admitted concurrently"""
+        with self._lock:
+            admitted_already = ticket.managed
+            if not admitted_already:
+                self._remove(ticket)
+        if admitted_already:
+            self.release(ticket)
+        else:
+            self._dispatch()
+
+    def _next_waiter(self) -> Optional[AdmissionTicket]:
+        for lane in LLMPriority:
+            users = self._lanes[lane]
+            if users:
+                return users[next(iter(users))][0]
+        return None
+
+    def _pop(self, ticket: AdmissionTicket) -> None:
+        users = self._lanes[ticket.priority]
+        queue = users[ticket.user_key]
+        queue.popleft()
+        if queue:
+            # Следующим в полосе обслуживается другой пользователь
+            users.move_to_end(ticket.user_key)
+        else:
+            del users[ticket.user_key]
+
+    def _remove(self, ticket: AdmissionTicket) -> None:
+        users = self._lanes[ticket.priority]
+        queue = users.get(ticket.user_key)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+        except ValueError:
+            return
+        if not queue:
+            del users[ticket.user_key]
+
+    def _slot_limit(self, lane: LLMPriority) -> int:
+        if lane == LLMPriority.INTERACTIVE:
+            return self.max_concurrent
+        return self.max_concurrent - self.reserved_interactive_slots
+
+    def _budget_delay(self, ticket: AdmissionTicket) -> float:
+        delay = 0.0
+        if self._request_bucket is not None:
+            delay = max(delay, self._request_bucket.delay_for(1))
+        if self._token_bucket is not None and ticket.estimated_tokens:
+            delay = max(delay, self._token_bucket.delay_for(ticket.estimated_tokens))
+        return delay
+
+    def _dispatch(self) -> None:
+        """Admit waiters while slots and budgets allow; otherwise schedule a re-check"""
         with self._lock:
-            return self._current_count
-    
+            admitted = self._schedule()
+        self._wake(admitted)
+
+    def _schedule(self) -> List[AdmissionTicket]:
+        """Pick admitted waiters; caller holds the lock and wakes them after releasing it"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        admitted = []
+        while True:
+            ticket = self._next_waiter()
+            if ticket is None:
+                break
+            if self._in_flight >= self._slot_limit(ticket.priority):
+                break
+            delay = self._budget_delay(ticket)
+            if delay > 0:
+                self._timer = threading.Timer(delay, self._dispatch)
+                self._timer.daemon = True
+                self._timer.start()
+                if HAS_PROMETHEUS_METRICS:
+                    RATE_LIMIT_WAITS.labels(provider=self.provider).inc()
+                break
+            self._pop(ticket)
+            self._admit(ticket)
+            admitted.append(ticket)
+
+        self._update_gauges()
+        return admitted
+
+    def _admit(self, ticket: AdmissionTicket) -> None:
+        if self._request_bucket is not None:
+            self._request_bucket.consume(1)
+        if self._token_bucket is not None and ticket.estimated_tokens:
+            ticket.reserved_tokens = self._token_bucket.consume(ticket.estimated_tokens)
+        ticket.managed = True
+        self._in_flight += 1
+
+        waited = time.monotonic() - ticket.enqueued_at
+        self._admitted[ticket.priority] += 1
+        self._wait_seconds[ticket.priority] += waited
+        self._max_wait_seconds[ticket.priority] = max(self._max_wait_seconds[ticket.priority], waited)
+        if HAS_PROMETHEUS_METRICS:
+            LLM_ADMISSION_WAIT.labels(provider=self.provider, lane=ticket.priority.name.lower()).observe(waited)
+
+    def _wake(self, admitted: List[AdmissionTicket]) -> None:
+        """Wake admitted waiters, each in its own thread or event loop"""
+        for ticket in admitted:
+            if ticket.event is not None:
+                ticket.event.set()
+                continue
+            try:
+                ticket.loop.call_soon_threadsafe(_resolve_waiter, ticket.future)
+            except RuntimeError:
+                # Loop ожидающего уже закрыт - слот никто не использует
+                self.release(ticket)
+
+    def _update_gauges(self) -> None:
+        if not HAS_PROMETHEUS_METRICS:
+            return
+        for lane, depth in self._queue_depth().items():
+            LLM_ADMISSION_QUEUE_DEPTH.labels(provider=self.provider, lane=lane).set(depth)
+        LLM_CONCURRENT_REQUESTS.labels(provider=self.provider).set(self._in_flight)
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+
     @property
-    def available_slots(self) -> int:
-        """Get number of available slots for LLM calls."""
+    def in_flight(self) -> int:
+        """Number of admitted calls not yet released"""
+        return self._in_flight
+
+    def _queue_depth(self) -> Dict[str, int]:
+        return {
+            lane.name.lower(): sum(len(queue) for queue in self._lanes[lane].values())
+            for lane in LLMPriority
+        }
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Waiting calls per lane"""
         with self._lock:
-            return self._max_concurrent - self._current_count
-    
-    def __enter__(self):
-        """Context manager entry."""
-        self.acquire()
-        return self
-    
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit."""
-        self.release()
-        return False
+            return self._queue_depth()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get admission statistics"""
+        with self._lock:
+            lanes = {}
+            for lane in LLMPriority:
+                admitted = self._admitted[lane]
+                lanes[lane.name.lower()] = {
+                    "admitted": admitted,
+                    "waiting_users": len(self._lanes[lane]),
+                    "avg_wait_seconds": round(self._wait_seconds[lane] / admitted, 3) if admitted else 0.0,
+                    "max_wait_seconds": round(self._max_wait_seconds[lane], 3),
+                }
+            return {
+                "provider": self.provider,
+                "in_flight": self._in_flight,
+                "max_concurrent": self.max_concurrent,
+                "reserved_interactive_slots": self.reserved_interactive_slots,
+                "queue_depth": self._queue_depth(),
+                "lanes": lanes,
+                "available_requests": round(self._request_bucket.available, 2) if self._request_bucket else None,
+                "available_tokens": round(self._token_bucket.available, 2) if self._token_bucket else None,
+            }
 
 
-class RateLimitedLLMWrapper:
+class AdmissionControlledLLM(Runnable):
     """
-    Wrapper that adds rate limiting to any LLM instance.
-    
-    This wrapper proxies all calls to the underlying LLM while adding
-    rate limiting. It's compatible with LangChain's Runnable interface
-    by implementing __or__ and __ror__ for pipe operators.
-    
+    Wrapper that admits every call of an LLM through LLMAdmissionController.
+
+    Runnable, поэтому работает в цепочках (prompt | llm | parser). invoke,
+    ainvoke, stream и astream проходят допуск; остальные атрибуты
+    проксируются к обёрнутой модели.
+
     Note: Pydantic models (like ChatGigaChat) don't allow monkey-patching,
     so we use a wrapper class instead.
     """
-    
-    def __init__(
-        self,
-        llm: Any,
-        rate_limiter: Optional[InMemoryRateLimiter] = None,
-        semaphore: Optional[LLMSemaphore] = None
-    ):
+
+    def __init__(self, llm: Any, controller: "LLMAdmissionController"):
         """
         Initialize the wrapper.
-        
+
         Args:
             llm: The underlying LLM instance
-            rate_limiter: Rate limiter for request rate control
-            semaphore: Semaphore for concurrency control
+            controller: Admission controller of the LLM provider
         """
         # Store in __dict__ directly to avoid __setattr__ issues
         self.__dict__['_llm'] = llm
-        self.__dict__['_rate_limiter'] = rate_limiter
-        self.__dict__['_semaphore'] = semaphore
-    
-    def _wait_for_rate_limit(self) -> None:
-        """Wait for rate limiter if configured."""
-        if self._rate_limiter:
-            self._rate_limiter.acquire()
-    
-    def invoke(self, *args, **kwargs):
-        """Invoke the LLM with rate limiting."""
-        self._wait_for_rate_limit()
-        
-        if self._semaphore:
-            with self._semaphore:
-                return self._llm.invoke(*args, **kwargs)
-        return self._llm.invoke(*args, **kwargs)
-    
-    async def ainvoke(self, *args, **kwargs):
-        """Async invoke the LLM with rate limiting."""
-        self._wait_for_rate_limit()
-        
-        if self._semaphore:
-            with self._semaphore:
-                return await self._llm.ainvoke(*args, **kwargs)
-        return await self._llm.ainvoke(*args, **kwargs)
-    
-    def __or__(self, other):
-        """Support pipe operator for LangChain chains: llm | parser"""
-        # Create a RunnableSequence manually
-        from langchain_core.runnables import RunnableSequence
-        return RunnableSequence(first=self, last=other)
-    
-    def __ror__(self, other):
-        """Support reverse pipe operator for LangChain chains: prompt | llm"""
-        # Create a RunnableSequence manually
-        from langchain_core.runnables import RunnableSequence
-        return RunnableSequence(first=other, last=self)
-    
+        self.__dict__['_controller'] = controller
+
+    def invoke(self, input: Any, config: Any = None, **kwargs):
+        """Invoke the LLM after admission (the calling thread waits for its slot)."""
+        ticket = self._controller.acquire_sync(estimated_tokens=estimate_tokens(input))
+        used_tokens = None
+        try:
+            result = self._llm.invoke(input, config, **kwargs)
+            used_tokens = _used_tokens(input, result)
+            return result
+        finally:
+            self._controller.release(ticket, used_tokens)
+
+    async def ainvoke(self, input: Any, config: Any = None, **kwargs):
+        """Async invoke the LLM after admission."""
+        async with self._controller.admit(estimated_tokens=estimate_tokens(input)) as ticket:
+            result = await self._llm.ainvoke(input, config, **kwargs)
+            ticket.used_tokens = _used_tokens(input, result)
+            return result
+
+    def stream(self, input: Any, config: Any = None, **kwargs) -> Iterator[Any]:
+        """Stream from the LLM; the slot is held until the stream ends."""
+        ticket = self._controller.acquire_sync(estimated_tokens=estimate_tokens(input))
+        output_chars = 0
+        try:
+            for chunk in self._llm.stream(input, config, **kwargs):
+                output_chars += _text_length(chunk)
+                yield chunk
+        finally:
+            self._controller.release(ticket, (_text_length(input) + output_chars) // CHARS_PER_TOKEN)
+
+    async def astream(self, input: Any, config: Any = None, **kwargs) -> AsyncIterator[Any]:
+        """Stream from the LLM; the slot is held until the stream ends."""
+        async with self._controller.admit(estimated_tokens=estimate_tokens(input)) as ticket:
+            output_chars = 0
+            async for chunk in self._llm.astream(input, config, **kwargs):
+                output_chars += _text_length(chunk)
+                yield chunk
+            ticket.used_tokens = (_text_length(input) + output_chars) // CHARS_PER_TOKEN
+
     def __getattr__(self, name):
         """Proxy all other attributes to the underlying LLM."""
         # This is called only when attribute is not found in __dict__
-        return getattr(self._llm, name)
-    
+        return getattr(self.__dict__['_llm'], name)
+
     def __setattr__(self, name, value):
         """Allow setting attributes on the wrapper."""
         if name.startswith('_'):
             self.__dict__[name] = value
         else:
             setattr(self._llm, name, value)
-    
-    # Runnable interface properties
+
     @property
     def InputType(self):
         """Return InputType from underlying LLM for Runnable compatibility."""
         return getattr(self._llm, 'InputType', Any)
-    
+
     @property
     def OutputType(self):
         """Return OutputType from underlying LLM for Runnable compatibility."""
         return getattr(self._llm, 'OutputType', Any)
-    
+
     def get_input_schema(self, *args, **kwargs):
         """Proxy to underlying LLM's get_input_schema."""
         if hasattr(self._llm, 'get_input_schema'):
             return self._llm.get_input_schema(*args, **kwargs)
-        return None
-    
+        return super().get_input_schema(*args, **kwargs)
+
     def get_output_schema(self, *args, **kwargs):
         """Proxy to underlying LLM's get_output_schema."""
         if hasattr(self._llm, 'get_output_schema'):
             return self._llm.get_output_schema(*args, **kwargs)
-        return None
-    
+        return super().get_output_schema(*args, **kwargs)
+
     def bind(self, **kwargs):
         """Bind arguments to the LLM."""
         if hasattr(self._llm, 'bind'):
-            bound_llm = self._llm.bind(**kwargs)
-            return RateLimitedLLMWrapper(bound_llm, self._rate_limiter, self._semaphore)
+            return AdmissionControlledLLM(self._llm.bind(**kwargs), self._controller)
         raise NotImplementedError("Underlying LLM does not support bind()")
-    
-    def with_config(self, **kwargs):
+
+    def bind_tools(self, *args, **kwargs):
+        """Bind tools keeping admission control."""
+        return AdmissionControlledLLM(self._llm.bind_tools(*args, **kwargs), self._controller)
+
+    def with_structured_output(self, *args, **kwargs):
+        """Structured output keeping admission control."""
+        return AdmissionControlledLLM(self._llm.with_structured_output(*args, **kwargs), self._controller)
+
+    def with_config(self, config: Any = None, **kwargs):
         """Configure the LLM."""
         if hasattr(self._llm, 'with_config'):
-            configured_llm = self._llm.with_config(**kwargs)
-            return RateLimitedLLMWrapper(configured_llm, self._rate_limiter, self._semaphore)
+            return AdmissionControlledLLM(self._llm.with_config(config, **kwargs), self._controller)
         return self
 
 
-# Global instances (singletons)
-_global_rate_limiter: Optional[InMemoryRateLimiter] = None
-_global_semaphore: Optional[LLMSemaphore] = None
+# Global instances (one controller per provider)
+_controllers: Dict[str, LLMAdmissionController] = {}
 _init_lock = threading.Lock()
 
 
-def get_rate_limiter() -> Optional[InMemoryRateLimiter]:
-    """
-    Get or create the global rate limiter instance.
-    
-    Returns:
-        InMemoryRateLimiter instance or None if disabled
+def get_admission_controller(provider: Optional[str] = None) -> LLMAdmissionController:
     """
-    global _global_rate_limiter
-    
-    if not config.RATE_LIMIT_ENABLED:
-        return None
-    
-    with _init_lock:
-        if _global_rate_limiter is None:
-            _global_rate_limiter = InMemoryRateLimiter(
-                requests_per_second=config.RATE_LIMIT_RPS,
-                check_every_n_seconds=config.RATE_LIMIT_CHECK_INTERVAL,
-                max_bucket_size=config.RATE_LIMIT_MAX_BUCKET_SIZE
-            )
-        return _global_rate_limiter
+    Get or create the admission controller of an LLM provider.
 
+    Args:
+        provider: Provider name (default: config.LLM_PROVIDER)
 
-def get_llm_semaphore() -> LLMSemaphore:
-    """
-    Get or create the global LLM semaphore instance.
-    
     Returns:
-        LLMSemaphore instance
+        LLMAdmissionController instance
     """
-    global _global_semaphore
-    
+    provider = (provider or config.LLM_PROVIDER or "gigachat").lower()
     with _init_lock:
-        if _global_semaphore is None:
-            _global_semaphore = LLMSemaphore(
-                max_concurrent=config.MAX_PARALLEL_LLM_CALLS
+        if provider not in _controllers:
+            _controllers[provider] = LLMAdmissionController(
+                provider=provider,
+                requests_per_second=config.RATE_LIMIT_RPS if config.RATE_LIMIT_ENABLED else 0.0,
+                max_bucket_size=config.RATE_LIMIT_MAX_BUCKET_SIZE,
+                tokens_per_minute=config.LLM_TOKENS_PER_MINUTE if config.RATE_LIMIT_ENABLED else 0,
+                max_concurrent=config.MAX_PARALLEL_LLM_CALLS,
+                reserved_interactive_slots=config.LLM_INTERACTIVE_RESERVED_SLOTS,
             )
-        return _global_semaphore
-
-
-def rate_limited(func: Callable) -> Callable:
-    """
-    Decorator to add rate limiting to a function.
-    
-    Example:
-        @rate_limited
-        def call_llm(prompt):
-            return llm.invoke(prompt)
-    """
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        rate_limiter = get_rate_limiter()
-        semaphore = get_llm_semaphore()
-        
-        if rate_limiter:
-            rate_limiter.acquire()
-        
-        with semaphore:
-            return func(*args, **kwargs)
-    
-    return wrapper
+        return _controllers[provider]
 
 
 def get_rate_limit_stats() -> dict:
     """
     Get current rate limiting statistics.
-    
+
     Returns:
         Dictionary with rate limiting stats
     """
-    rate_limiter = get_rate_limiter()
-    semaphore = get_llm_semaphore()
-    
+    controller = get_admission_controller()
     return {
         "rate_limit_enabled": config.RATE_LIMIT_ENABLED,
         "rate_limit_rps": config.RATE_LIMIT_RPS,
         "rate_limit_bucket_size": config.RATE_LIMIT_MAX_BUCKET_SIZE,
-        "available_tokens": rate_limiter.available_tokens if rate_limiter else None,
+        "tokens_per_minute": config.LLM_TOKENS_PER_MINUTE,
         "max_parallel_llm_calls": config.MAX_PARALLEL_LLM_CALLS,
-        "current_llm_usage": semaphore.current_usage if semaphore else 0,
-        "available_llm_slots": semaphore.available_slots if semaphore else config.MAX_PARALLEL_LLM_CALLS
+        "current_llm_usage": controller.in_flight,
+        "available_llm_slots": max(0, controller.max_concurrent - controller.in_flight),
+        "providers": {name: c.get_stats() for name, c in list(_controllers.items())},
     }
-
@@ -0,0 +1,579 @@
+"""
+Relationship Graph - материализованный граф связей дела.
+
+Узлы (relationship_nodes) хранят степень (degree) и сообщество (community):
+- degree поддерживается инкрементально: хуки маппера RelationshipEdge для рёбер,
+  сохраняемых через ORM, и явные обновления для рёбер упоминаний;
+- при извлечении сущностей (app.services.entity_index) граф пополняется
+  узлами "entity:<ключ>" и "document:<file_id>" и ребром mentioned_in
+  на каждую пару (сущность, документ);
+- сообщества считаются label propagation лениво: только если версия графа
+  (relationship_graph_state.version) изменилась с последнего расчёта.
+
+Запросы для клиента: страница узлов по убыванию степени с курсором,
+эго-граф глубины k вокруг узла и свёрнутые супер-узлы сообществ.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import base64
+import hashlib
+import json
+import logging
+import uuid
+
+from sqlalchemy import and_, event, func, inspect, or_, text
+from sqlalchemy.orm import Session, aliased
+
+from app.models.analysis import RelationshipEdge, RelationshipGraphState, RelationshipNode
+
+logger = logging.getLogger(__name__)
+
+ENTITY_NODE_PREFIX = "entity:"
+DOCUMENT_NODE_PREFIX = "document:"
+MENTION_EDGE_TYPE = "mentioned_in"
+MENTION_EDGE_LABEL = "упоминается в"
+LABEL_PROPAGATION_ITERATIONS = 20
+IN_CLAUSE_CHUNK = 500
+
+_ADD_DEGREE_SQL = text("""
+    UPDATE relationship_nodes SET degree = degree + :delta
+    WHERE case_id = :case_id AND (node_id = :source OR node_id = :target)
+""")
+
+_BUMP_VERSION_SQL = text("""
+    INSERT INTO relationship_graph_state (case_id, version, communities_version)
+    VALUES (:case_id, 1, -1)
+    ON CONFLICT (case_id) DO UPDATE SET version = relationship_graph_state.version + 1
+""")
+
+_INSERT_STATE_SQL = text("""
+    INSERT INTO relationship_graph_state (case_id, version, communities_version)
+    VALUES (:case_id, :version, :version)
+    ON CONFLICT (case_id) DO NOTHING
+""")
+
+_ENSURE_NODE_SQL = text("""
+    INSERT INTO relationship_nodes (id, case_id, node_id, node_type, node_label, source_document, degree, created_at)
+    VALUES (:id, :case_id, :node_id, :node_type, :node_label, :source_document, 0, :created_at)
+    ON CONFLICT (case_id, node_id) DO NOTHING
+""")
+
+_INSERT_MENTION_SQL = text("""
+    INSERT INTO relationship_edges (id, case_id, source_node_id, target_node_id, relationship_type,
+                                    relationship_label, created_at)
+    VALUES (:id, :case_id, :source, :target, :relationship_type, :relationship_label, :created_at)
+    ON CONFLICT (id) DO NOTHING
+""")
+
+_NODE_DEGREE_SQL = text("""
+    UPDATE relationship_nodes SET degree = (
+        SELECT COUNT(*) FROM relationship_edges e
+        WHERE e.case_id = :case_id AND (e.source_node_id = :node_id OR e.target_node_id = :node_id)
+    )
+    WHERE id = :id
+""")
+
+
+def entity_node_id(key: str) -> str:
+    return ENTITY_NODE_PREFIX + key
+
+
+def document_node_id(file_id: str) -> str:
+    return DOCUMENT_NODE_PREFIX + file_id
+
+
+def mention_edge_id(case_id: str, key: str, file_id: str) -> str:
+    """Детерминированный id ребра упоминания (совпадает с migrations/031)"""
+    return hashlib.md5(f"{case_id}|{key}|{file_id}".encode("utf-8")).hexdigest()
+
+
+def _bump_version(connection, case_id: str) -> None:
+    connection.execute(_BUMP_VERSION_SQL, {"case_id": case_id})
+
+
+def _add_degree(connection, case_id: str, source: str, target: str, delta: int) -> None:
+    connection.execute(_ADD_DEGREE_SQL, {"case_id": case_id, "source": source, "target": target, "delta": delta})
+
+
+def _ensure_node(connection, case_id: str, node_id: str, node_type: str, label: str,
+                 source_document: Optional[str] = None) -> None:
+    connection.execute(_ENSURE_NODE_SQL, {
+        "id": str(uuid.uuid4()),
+        "case_id": case_id,
+        "node_id": node_id,
+        "node_type": (node_type or "Entity")[:50],
+        "node_label": (label or node_id)[:255],
+        "source_document": source_document[:255] if source_document else None,
+        "created_at": datetime.utcnow(),
+    })
+
+
+# ---------------------------------------------------------------------------
+# Рёбра упоминаний (вызываются из app.services.entity_index внутри flush)
+# ---------------------------------------------------------------------------
+
+def link_entity_document(connection, case_id: str, entity_key: str, file_id: str,
+                         label: Optional[str] = None, entity_type: Optional[str] = None) -> bool:
+    """Добавить ребро entity -> document (и недостающие узлы). True, если ребро новое"""
+    entity_node, document_node = entity_node_id(entity_key), document_node_id(file_id)
+    inserted = connection.execute(_INSERT_MENTION_SQL, {
+        "id": mention_edge_id(case_id, entity_key, file_id),
+        "case_id": case_id,
+        "source": entity_node,
+        "target": document_node,
+        "relationship_type": MENTION_EDGE_TYPE,
+        "relationship_label": MENTION_EDGE_LABEL,
+        "created_at": datetime.utcnow(),
+    }).rowcount
+    if not inserted:
+        return False
+
+    _ensure_node(connection, case_id, entity_node, entity_type, label or entity_key)
+    filename = connection.execute(text("SELECT filename FROM files WHERE id = :id"), {"id": file_id}).scalar()
+    _ensure_node(connection, case_id, document_node, "Document", filename, filename)
+    _add_degree(connection, case_id, entity_node, document_node, 1)
+    _bump_version(connection, case_id)
+    return True
+
+
+def unlink_entity_document(connection, case_id: str, entity_key: str, file_id: str) -> bool:
+    """Удалить ребро entity -> document; узлы без рёбер удаляются. True, если ребро было"""
+    entity_node, document_node = entity_node_id(entity_key), document_node_id(file_id)
+    deleted = connection.execute(
+        text("DELETE FROM relationship_edges WHERE id = :id"),
+        {"id": mention_edge_id(case_id, entity_key, file_id)}
+    ).rowcount
+    if not deleted:
+        return False
+
+    _add_degree(connection, case_id, entity_node, document_node, -1)
+    connection.execute(text("""
+        DELETE FROM relationship_nodes
+        WHERE case_id = :case_id AND (node_id = :source OR node_id = :target) AND degree <= 0
+    """), {"case_id": case_id, "source": entity_node, "target": document_node})
+    _bump_version(connection, case_id)
+    return True
+
+
+def sync_document_mentions(connection, case_id: str, file_id: str,
+                           entities: Dict[str, Tuple[str, str]]) -> None:
+    """
+    Привести рёбра упоминаний документа к набору сущностей.
+
+    Args:
+        entities: ключ сущности -> (текст, тип)
+    """
+    existing = {
+        row[0][len(ENTITY_NODE_PREFIX):]
+        for row in connection.execute(text("""
+            SELECT source_node_id FROM relationship_edges
+            WHERE case_id = :case_id AND target_node_id = :target AND relationship_type = :relationship_type
+        """), {"case_id": case_id, "target": document_node_id(file_id), "relationship_type": MENTION_EDGE_TYPE})
+    }
+    for key in existing - set(entities):
+        unlink_entity_document(connection, case_id, key, file_id)
+    for key in set(entities) - existing:
+        label, entity_type = entities[key]
+        link_entity_document(connection, case_id, key, file_id, label=label, entity_type=entity_type)
+
+
+# ---------------------------------------------------------------------------
+# Хуки маппера для узлов и рёбер, сохраняемых через ORM
+# ---------------------------------------------------------------------------
+
+def _edge_after_insert(mapper, connection, target: RelationshipEdge) -> None:
+    _add_degree(connection, target.case_id, target.source_node_id, target.target_node_id, 1)
+    _bump_version(connection, target.case_id)
+
+
+def _edge_after_delete(mapper, connection, target: RelationshipEdge) -> None:
+    _add_degree(connection, target.case_id, target.source_node_id, target.target_node_id, -1)
+    _bump_version(connection, target.case_id)
+
+
+def _edge_before_update(mapper, connection, target: RelationshipEdge) -> None:
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in ("case_id", "source_node_id", "target_node_id")):
+        return
+    old = connection.execute(
+        text("SELECT case_id, source_node_id, target_node_id FROM relationship_edges WHERE id = :id"),
+        {"id": target.id}
+    ).first()
+    if old is not None:
+        _add_degree(connection, old.case_id, old.source_node_id, old.target_node_id, -1)
+        _bump_version(connection, old.case_id)
+    _add_degree(connection, target.case_id, target.source_node_id, target.target_node_id, 1)
+    _bump_version(connection, target.case_id)
+
+
+def _node_after_insert(mapper, connection, target: RelationshipNode) -> None:
+    # Рёбра могли быть сохранены раньше узла
+    connection.execute(_NODE_DEGREE_SQL, {"case_id": target.case_id, "node_id": target.node_id, "id": target.id})
+    _bump_version(connection, target.case_id)
+
+
+_hooks_installed = False
+
+
+def install_relationship_graph_hooks() -> None:
+    """Подключить поддержку степеней и версии графа к изменениям узлов и рёбер (идемпотентно)"""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    event.listen(RelationshipEdge, "after_insert", _edge_after_insert)
+    event.listen(RelationshipEdge, "before_update", _edge_before_update)
+    event.listen(RelationshipEdge, "after_delete", _edge_after_delete)
+    event.listen(RelationshipNode, "after_insert", _node_after_insert)
+    _hooks_installed = True
+
+
+# ---------------------------------------------------------------------------
+# Сообщества
+# ---------------------------------------------------------------------------
+
+def label_propagation(node_ids: Sequence[str], edges: Iterable[Tuple[str, str]],
+                      max_iterations: int = LABEL_PROPAGATION_ITERATIONS) -> Dict[str, str]:
+    """
+    Асинхронный label propagation.
+
+    Голос соседа весит 1/степень соседа, чтобы узлы-хабы (стороны дела,
+    упомянутые во всех документах) не сливали граф в одно сообщество.
+    Узлы обходятся в порядке node_ids, ничьи решаются минимальной меткой -
+    результат детерминирован.
+    """
+    neighbours: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    for source, target in edges:
+        if source != target and source in neighbours and target in neighbours:
+            neighbours[source].append(target)
+            neighbours[target].append(source)
+
+    labels = {node_id: node_id for node_id in node_ids}
+    for _ in range(max_iterations):
+        changed = False
+        for node_id in node_ids:
+            if not neighbours[node_id]:
+                continue
+            weights: Dict[str, float] = defaultdict(float)
+            for neighbour in neighbours[node_id]:
+                weights[labels[neighbour]] += 1.0 / len(neighbours[neighbour])
+            best = max(weights.values())
+            if weights.get(labels[node_id], 0.0) >= best - 1e-12:
+                continue
+            labels[node_id] = min(label for label, weight in weights.items() if weight >= best - 1e-12)
+            changed = True
+        if not changed:
+            break
+    return labels
+
+
+def ensure_communities(db: Session, case_id: str) -> None:
+    """Пересчитать сообщества узлов дела, если граф изменился с последнего расчёта"""
+    state = db.get(RelationshipGraphState, case_id)
+    version = state.version if state is not None else 0
+    if state is not None and state.communities_version == version:
+        return
+
+    nodes = db.query(RelationshipNode.node_id, RelationshipNode.community).filter(
+        RelationshipNode.case_id == case_id
+    ).order_by(RelationshipNode.degree.desc(), RelationshipNode.node_id).all()
+    edges = db.query(RelationshipEdge.source_node_id, RelationshipEdge.target_node_id).filter(
+        RelationshipEdge.case_id == case_id
+    ).all()
+    labels = label_propagation([node.node_id for node in nodes], edges)
+
+    changed = [
+        {"case_id": case_id, "node_id": node.node_id, "community": labels[node.node_id]}
+        for node in nodes if node.community != labels[node.node_id]
+    ]
+    if changed:
+        db.execute(
+            text("UPDATE relationship_nodes SET community = :community WHERE case_id = :case_id AND node_id = :node_id"),
+            changed
+        )
+    if state is None:
+        # Параллельный расчёт или первое ребро могли создать строку состояния -
+        # тогда она не трогается, и сообщества пересчитаются при следующем запросе
+        db.execute(_INSERT_STATE_SQL, {"case_id": case_id, "version": version})
+    else:
+        state.communities_version = version
+    db.commit()
+    logger.info(f"Relationship graph communities for case {case_id}: {len(set(labels.values()))} "
+                f"communities, {len(changed)} nodes updated")
+
+
+# ---------------------------------------------------------------------------
+# Запросы
+# ---------------------------------------------------------------------------
+
+def format_node(node: RelationshipNode) -> Dict[str, Any]:
+    """Узел в формате D3.js"""
+    return {
+        "id": node.node_id,
+        "type": node.node_type,
+        "label": node.node_label,
+        "properties": node.properties if node.properties is not None else {},
+        "source_document": node.source_document,
+        "source_page": node.source_page,
+        "degree": node.degree or 0,
+        "community": node.community,
+    }
+
+
+def format_link(edge: RelationshipEdge) -> Dict[str, Any]:
+    """Ребро в формате D3.js"""
+    return {
+        "source": edge.source_node_id,
+        "target": edge.target_node_id,
+        "type": edge.relationship_type,
+        "label": edge.relationship_label,
+        "source_document": edge.source_document,
+        "source_page": edge.source_page,
+        "properties": edge.properties if edge.properties is not None else {},
+    }
+
+
+class StaleCursorError(Exception):
+    """Граф изменился после выдачи курсора: порядок узлов по степени уже другой"""
+
+
+def graph_version(db: Session, case_id: str) -> int:
+    """Версия графа дела (0 - граф ещё не менялся)"""
+    return db.query(RelationshipGraphState.version).filter(
+        RelationshipGraphState.case_id == case_id
+    ).scalar() or 0
+
+
+def encode_cursor(version: int, degree: int, node_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([version, degree, node_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int, str]:
+    """Raises ValueError для некорректного курсора"""
+    try:
+        version, degree, node_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return int(version), int(degree), str(node_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _sort_key(degree: int, node_id: str) -> Tuple[int, str]:
+    return -(degree or 0), node_id
+
+
+def _chunks(items: Sequence[str], size: int = IN_CLAUSE_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_graph_page(db: Session, case_id: str, limit: int = 500, cursor: Optional[str] = None,
+                   min_degree: int = 0, community: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Страница графа: узлы по убыванию степени (затем node_id) после курсора.
+
+    Каждое ребро возвращается ровно один раз - на странице, где появляется
+    последний из его концов, поэтому клиент дорисовывает граф постранично.
+    Курсор привязан к версии графа: после любого изменения рёбер степени и
+    порядок узлов другие, и обход нужно начать заново.
+
+    Args:
+        limit: Узлов на странице
+        cursor: next_cursor предыдущей страницы
+        min_degree: Отсечь узлы со степенью ниже порога (и их рёбра)
+        community: Только узлы сообщества (раскрытие супер-узла)
+
+    Raises:
+        ValueError: некорректный курсор
+        StaleCursorError: граф изменился после выдачи курсора
+    """
+    if community is not None:
+        ensure_communities(db, case_id)
+    version = graph_version(db, case_id)
+
+    filters = [RelationshipNode.case_id == case_id]
+    if min_degree:
+        filters.append(RelationshipNode.degree >= min_degree)
+    if community is not None:
+        filters.append(RelationshipNode.community == community)
+
+    query = db.query(RelationshipNode).filter(*filters)
+    total_nodes = query.count()
+    if cursor:
+        cursor_version, after_degree, after_node_id = decode_cursor(cursor)
+        if cursor_version != version:
+            raise StaleCursorError(f"Relationship graph of case {case_id} changed, restart pagination")
+        query = query.filter(or_(
+            RelationshipNode.degree < after_degree,
+            and_(RelationshipNode.degree == after_degree, RelationshipNode.node_id > after_node_id)
+        ))
+    nodes = query.order_by(RelationshipNode.degree.desc(), RelationshipNode.node_id).limit(limit + 1).all()
+    has_more = len(nodes) > limit
+    nodes = nodes[:limit]
+    if not nodes:
+        return {"nodes": [], "links": [], "next_cursor": None, "total_nodes": total_nodes, "version": version}
+
+    page_last = _sort_key(nodes[-1].degree, nodes[-1].node_id)
+    source_node, target_node = aliased(RelationshipNode), aliased(RelationshipNode)
+    edge_filters = [RelationshipEdge.case_id == case_id]
+    if min_degree:
+        edge_filters += [source_node.degree >= min_degree, target_node.degree >= min_degree]
+    if community is not None:
+        edge_filters += [source_node.community == community, target_node.community == community]
+
+    links: Dict[str, Dict[str, Any]] = {}
+    for chunk in _chunks([node.node_id for node in nodes]):
+        rows = db.query(RelationshipEdge, source_node.degree, target_node.degree).join(
+            source_node, and_(source_node.case_id == RelationshipEdge.case_id,
+                              source_node.node_id == RelationshipEdge.source_node_id)
+        ).join(
+            target_node, and_(target_node.case_id == RelationshipEdge.case_id,
+                              target_node.node_id == RelationshipEdge.target_node_id)
+        ).filter(
+            *edge_filters,
+            or_(RelationshipEdge.source_node_id.in_(chunk), RelationshipEdge.target_node_id.in_(chunk))
+        ).all()
+        for edge, source_degree, target_degree in rows:
+            if (_sort_key(source_degree, edge.source_node_id) <= page_last
+                    and _sort_key(target_degree, edge.target_node_id) <= page_last):
+                links[edge.id] = format_link(edge)
+
+    return {
+        "nodes": [format_node(node) for node in nodes],
+        "links": list(links.values()),
+        "next_cursor": encode_cursor(version, nodes[-1].degree or 0, nodes[-1].node_id) if has_more else None,
+        "total_nodes": total_nodes,
+        "version": version,
+    }
+
+
+def get_neighborhood(db: Session, case_id: str, node_id: str, depth: int = 1,
+                     min_degree: int = 0, max_nodes: int = 500) -> Optional[Dict[str, Any]]:
+    """
+    Эго-граф глубины depth вокруг узла (BFS по уровням, по запросу на уровень).
+
+    Соседи со степенью ниже min_degree отсекаются; если узлов больше max_nodes,
+    на каждом уровне берутся соседи с наибольшей степенью и truncated = True.
+
+    Returns:
+        None, если узла нет в деле
+    """
+    center = db.query(RelationshipNode).filter(
+        RelationshipNode.case_id == case_id,
+        RelationshipNode.node_id == node_id
+    ).first()
+    if center is None:
+        return None
+
+    visited: Dict[str, RelationshipNode] = {center.node_id: center}
+    distances = {center.node_id: 0}
+    frontier = [center.node_id]
+    truncated = False
+    for distance in range(1, depth + 1):
+        if not frontier:
+            break
+        candidates = set()
+        for chunk in _chunks(frontier):
+            rows = db.query(RelationshipEdge.source_node_id, RelationshipEdge.target_node_id).filter(
+                RelationshipEdge.case_id == case_id,
+                or_(RelationshipEdge.source_node_id.in_(chunk), RelationshipEdge.target_node_id.in_(chunk))
+            ).all()
+            for source, target in rows:
+                candidates.update(n for n in (source, target) if n not in visited)
+
+        neighbours: List[RelationshipNode] = []
+        for chunk in _chunks(sorted(candidates)):
+            query = db.query(RelationshipNode).filter(
+                RelationshipNode.case_id == case_id,
+                RelationshipNode.node_id.in_(chunk)
+            )
+            if min_degree:
+                query = query.filter(RelationshipNode.degree >= min_degree)
+            neighbours.extend(query.all())
+        neighbours.sort(key=lambda node: _sort_key(node.degree, node.node_id))
+
+        capacity = max_nodes - len(visited)
+        if len(neighbours) > capacity:
+            truncated = True
+            neighbours = neighbours[:max(capacity, 0)]
+        for node in neighbours:
+            visited[node.node_id] = node
+            distances[node.node_id] = distance
+        frontier = [node.node_id for node in neighbours]
+
+    ids = list(visited)
+    links: Dict[str, Dict[str, Any]] = {}
+    for chunk in _chunks(ids):
+        edges = db.query(RelationshipEdge).filter(
+            RelationshipEdge.case_id == case_id,
+            RelationshipEdge.source_node_id.in_(chunk),
+            RelationshipEdge.target_node_id.in_(ids)
+        ).all()
+        links.update((edge.id, format_link(edge)) for edge in edges)
+
+    nodes = []
+    for node in visited.values():
+        formatted = format_node(node)
+        formatted["distance"] = distances[node.node_id]
+        nodes.append(formatted)
+    return {"center": center.node_id, "nodes": nodes, "links": list(links.values()), "truncated": truncated}
+
+
+def get_communities(db: Session, case_id: str, min_size: int = 1, limit: int = 200) -> Dict[str, Any]:
+    """
+    Свёрнутый граф: супер-узел на сообщество и супер-рёбра с числом рёбер между ними.
+
+    Супер-узел подписан узлом сообщества с наибольшей степенью; раскрывается
+    через get_graph_page(community=...).
+    """
+    ensure_communities(db, case_id)
+
+    ranked = db.query(
+        RelationshipNode.community.label("community"),
+        RelationshipNode.node_id.label("node_id"),
+        RelationshipNode.node_label.label("node_label"),
+        RelationshipNode.node_type.label("node_type"),
+        func.count().over(partition_by=RelationshipNode.community).label("size"),
+        func.sum(RelationshipNode.degree).over(partition_by=RelationshipNode.community).label("total_degree"),
+        func.row_number().over(
+            partition_by=RelationshipNode.community,
+            order_by=(RelationshipNode.degree.desc(), RelationshipNode.node_id)
+        ).label("rank")
+    ).filter(RelationshipNode.case_id == case_id).subquery()
+    rows = db.query(ranked).filter(ranked.c.rank == 1, ranked.c.size >= min_size).order_by(
+        ranked.c.size.desc(), ranked.c.community
+    ).limit(limit).all()
+
+    communities = [
+        {
+            "id": row.community,
+            "size": row.size,
+            "degree": int(row.total_degree or 0),
+            "label": row.node_label,
+            "type": row.node_type,
+            "representative": row.node_id,
+        }
+        for row in rows
+    ]
+    shown = {community["id"] for community in communities}
+
+    source_node, target_node = aliased(RelationshipNode), aliased(RelationshipNode)
+    pairs = db.query(source_node.community, target_node.community, func.count()).select_from(RelationshipEdge).join(
+        source_node, and_(source_node.case_id == RelationshipEdge.case_id,
+                          source_node.node_id == RelationshipEdge.source_node_id)
+    ).join(
+        target_node, and_(target_node.case_id == RelationshipEdge.case_id,
+                          target_node.node_id == RelationshipEdge.target_node_id)
+    ).filter(
+        RelationshipEdge.case_id == case_id,
+        source_node.community != target_node.community
+    ).group_by(source_node.community, target_node.community).all()
+
+    weights: Dict[Tuple[str, str], int] = defaultdict(int)
+    for source, target, count in pairs:
+        if source in shown and target in shown:
+            weights[tuple(sorted((source, target)))] += count
+    links = [
+        {"source": source, "target": target, "weight": weight}
+        for (source, target), weight in sorted(weights.items(), key=lambda item: (-item[1], item[0]))
+    ]
+    return {"communities": communities, "links": links}
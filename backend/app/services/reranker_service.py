@@ -8,22 +8,180 @@ Features:
 - Cohere reranker integration (optional)
 - Local lightweight cross-encoder fallback
 - Score normalization
+- Batched scoring with a (query, chunk) score cache; model calls are serialized
+  by an inference lock in the caller's thread (async callers use asyncio.to_thread)
+- Optional quantized ONNX model for CPU inference
 """
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Tuple
 from langchain_core.documents import Document
 from app.config import config
+from app.services.metrics.tracing import traced
+import hashlib
+import importlib.util
 import logging
+import os
+import threading
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
-# Try to import cross-encoder
-try:
-    from sentence_transformers import CrossEncoder
-    CROSS_ENCODER_AVAILABLE = True
-except ImportError:
-    CROSS_ENCODER_AVAILABLE = False
+# Cross-encoder (sentence-transformers тянет torch - секунды на импорт).
+# Наличие проверяется без импорта, сама библиотека загружается вместе с моделью.
+CROSS_ENCODER_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+if not CROSS_ENCODER_AVAILABLE:
     logger.warning("sentence-transformers not installed. Reranking will use fallback.")
 
+# Optional ONNX runtime path (quantized cross-encoder on CPU)
+ONNX_AVAILABLE = (
+    importlib.util.find_spec("onnxruntime") is not None
+    and importlib.util.find_spec("tokenizers") is not None
+)
+
+# Rough chars-per-token ratio used to cut text before tokenization
+CHARS_PER_TOKEN = 4
+
+
+class OnnxCrossEncoder:
+    """
+    Cross-encoder exported to ONNX (e.g. via optimum), run with onnxruntime.
+
+    The model directory must contain tokenizer.json and model_quantized.onnx
+    (int8, preferred) or model.onnx. Exposes the same predict() signature as
+    sentence_transformers.CrossEncoder.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 256, num_threads: Optional[int] = None):
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime and tokenizers are required for the ONNX reranker")
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, "model.onnx")
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        # Query is kept intact, only the chunk is truncated
+        self.tokenizer.enable_truncation(max_length=max_length, strategy="only_second")
+        self.tokenizer.enable_padding()
+        self.model_path = model_path
+
+    def predict(self, pairs: List[List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores: List[float] = []
+        for start in range(0, len(pairs), batch_size):
+            encoded = self.tokenizer.encode_batch([tuple(pair) for pair in pairs[start:start + batch_size]])
+            feed = {
+                "input_ids": np.array([e.ids for e in encoded], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encoded], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encoded], dtype=np.int64),
+            }
+            logits = self.session.run(None, {k: v for k, v in feed.items() if k in self.input_names})[0]
+            scores.extend(logits[:, 0] if logits.ndim == 2 else logits)
+        return np.asarray(scores, dtype=np.float32)
+
+
+def _chunk_key(doc: Document) -> str:
+    """
+    Chunk identifier for the score cache
+
+    Хеш содержимого входит в ключ: после переиндексации файла чанк с тем же
+    chunk_id/chunk_index, но другим текстом, пересчитывается.
+    """
+    content_hash = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    metadata = doc.metadata or {}
+    chunk_id = metadata.get("chunk_id") or metadata.get("id")
+    if chunk_id:
+        return f"{chunk_id}:{content_hash}"
+    source = metadata.get("file_id") or metadata.get("source_file")
+    if source is not None and metadata.get("chunk_index") is not None:
+        return f"{source}:{metadata['chunk_index']}:{content_hash}"
+    return content_hash
+
+
+class RerankEngine:
+    """
+    Batched cross-encoder scoring.
+
+    - chunks are cut to the model's max sequence length before tokenization
+    - pairs are sorted by length so each batch pads to a similar size
+    - model calls are serialized by a lock (in the caller's thread), so concurrent
+      requests don't oversubscribe CPU cores with parallel model calls; scoring is
+      blocking, async code calls it via asyncio.to_thread
+    - scores are cached by (query hash, chunk id + content hash): multi-query
+      retrieval and repeated questions don't rescore the same chunks
+    """
+
+    def __init__(self, model, max_length: int = 256, batch_size: int = 32, cache_size: int = 20000):
+        self.model = model
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inference_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        """Scores aligned with documents; only uncached pairs reach the model"""
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [(query_hash, _chunk_key(doc)) for doc in documents]
+        scores: List[Optional[float]] = [None] * len(documents)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    scores[i] = cached
+            missing = [i for i, value in enumerate(scores) if value is None]
+            self._hits += len(documents) - len(missing)
+            self._misses += len(missing)
+
+        if missing:
+            texts = [documents[i].page_content for i in missing]
+            with self._inference_lock:
+                computed = self._predict(query, texts)
+            with self._lock:
+                for i, value in zip(missing, computed):
+                    scores[i] = value
+                    self._cache[keys[i]] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    def _predict(self, query: str, texts: List[str]) -> List[float]:
+        max_chars = self.max_length * CHARS_PER_TOKEN
+        truncated = [text[:max_chars] for text in texts]
+        order = sorted(range(len(truncated)), key=lambda i: len(truncated[i]))
+        raw = self.model.predict(
+            [[query, truncated[i]] for i in order],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        )
+        result = [0.0] * len(truncated)
+        for position, i in enumerate(order):
+            result[i] = float(raw[position])
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cached_scores": len(self._cache),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
 
 class RerankerService:
     """
@@ -37,7 +195,8 @@ class RerankerService:
         self,
         model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
         use_cohere: bool = False,
-        cohere_api_key: Optional[str] = None
+        cohere_api_key: Optional[str] = None,
+        model=None
     ):
         """
         Initialize the reranker service.
@@ -46,12 +205,13 @@ class RerankerService:
             model_name: Name of the cross-encoder model to use
             use_cohere: Whether to use Cohere reranker (requires API key)
             cohere_api_key: Cohere API key for reranking
+            model: Ready scorer with a CrossEncoder-compatible predict() (optional)
         """
         self.model_name = model_name
         self.use_cohere = use_cohere
         self.cohere_api_key = cohere_api_key
         
-        self._cross_encoder = None
+        self._cross_encoder = model
         self._cohere_client = None
         
         # Initialize Cohere if requested
@@ -65,13 +225,42 @@ class RerankerService:
                 self.use_cohere = False
         
         # Initialize cross-encoder as fallback or primary
-        if CROSS_ENCODER_AVAILABLE and not self.use_cohere:
+        if self._cross_encoder is None and not self.use_cohere:
+            self._cross_encoder = self._load_cross_encoder(model_name)
+        
+        self._engine = None
+        if self._cross_encoder is not None:
+            self._engine = RerankEngine(
+                self._cross_encoder,
+                max_length=config.RERANK_MAX_LENGTH,
+                batch_size=config.RERANK_BATCH_SIZE,
+                cache_size=config.RERANK_SCORE_CACHE_SIZE,
+            )
+    
+    def _load_cross_encoder(self, model_name: str):
+        """Quantized ONNX model if configured, otherwise sentence-transformers."""
+        onnx_dir = config.RERANK_ONNX_MODEL_DIR
+        if onnx_dir and ONNX_AVAILABLE:
             try:
-                self._cross_encoder = CrossEncoder(model_name)
+                model = OnnxCrossEncoder(onnx_dir, max_length=config.RERANK_MAX_LENGTH)
+                logger.info(f"✅ ONNX cross-encoder reranker initialized: {model.model_path}")
+                return model
+            except Exception as e:
+                logger.warning(f"Failed to load ONNX cross-encoder: {e}")
+        elif onnx_dir:
+            logger.warning("RERANK_ONNX_MODEL_DIR is set but onnxruntime/tokenizers are not installed")
+        
+        if CROSS_ENCODER_AVAILABLE:
+            try:
+                from sentence_transformers import CrossEncoder
+                model = CrossEncoder(model_name, max_length=config.RERANK_MAX_LENGTH)
                 logger.info(f"✅ Cross-encoder reranker initialized: {model_name}")
+                return model
             except Exception as e:
                 logger.warning(f"Failed to load cross-encoder: {e}")
+        return None
     
+    @traced("rerank")
     def rerank(
         self,
         query: str,
@@ -96,7 +285,7 @@ class RerankerService:
         
         if self.use_cohere and self._cohere_client:
             return self._rerank_with_cohere(query, documents, top_k, score_threshold)
-        elif self._cross_encoder:
+        elif self._engine:
             return self._rerank_with_cross_encoder(query, documents, top_k, score_threshold)
         else:
             # Fallback: return original documents with default scores
@@ -112,11 +301,8 @@ class RerankerService:
     ) -> List[Tuple[Document, float]]:
         """Rerank using local cross-encoder model."""
         try:
-            # Prepare pairs for cross-encoder
-            pairs = [[query, doc.page_content] for doc in documents]
-            
-            # Get scores
-            scores = self._cross_encoder.predict(pairs)
+            # Batched, truncated and cached scoring
+            scores = self._engine.score(query, documents)
             
             # Combine documents with scores
             doc_scores = list(zip(documents, scores))
@@ -0,0 +1,364 @@
+"""Event bus for push-based tabular review updates
+
+Изменения ячеек, колонок и статуса таблицы публикуются один раз - при commit
+сессии, которая их записала (SQLAlchemy session events), - и раздаются всем
+WebSocket-подписчикам через WebSocketManager. Нагрузка на БД не зависит от
+числа зрителей: каждый воркер загружает изменённые строки один раз на пакет
+событий и только если у него есть подписчики на эту таблицу.
+
+Транспорт между воркерами (app/services/event_broker.py):
+- postgres: LISTEN/NOTIFY, один слушающий поток на воркер;
+- redis: pub/sub (если настроен REDIS_URL);
+- memory: внутри процесса (один воркер, SQLite, тесты).
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app.services.event_broker import create_broker
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "tabular_review_events"
+
+# Лимит payload NOTIFY - 8000 байт; id передаются пачками
+MAX_IDS_PER_EVENT = 100
+
+# Статусы ячейки, которые считаются завершёнными для прогресса извлечения
+PENDING_CELL_STATUSES = ("pending", "processing")
+
+
+# ----------------------------------------------------------------------
+# Event bus
+# ----------------------------------------------------------------------
+
+class TabularEventBus:
+    """
+    Publishes compact change events and fans them out to local WebSocket subscribers.
+
+    Событие содержит только id изменённых строк; данные загружаются
+    получателем одной выборкой на пакет. События одной таблицы, пришедшие
+    во время загрузки, объединяются в следующий пакет.
+    """
+
+    def __init__(self, broker=None, session_factory: Optional[Callable] = None, manager=None):
+        """
+        Args:
+            broker: Транспорт (по умолчанию create_broker(CHANNEL))
+            session_factory: Фабрика сессий БД (по умолчанию SessionLocal)
+            manager: WebSocketManager (по умолчанию глобальный websocket_manager)
+        """
+        if session_factory is None:
+            from app.utils.database import SessionLocal
+            session_factory = SessionLocal
+        if manager is None:
+            from app.services.websocket_manager import websocket_manager
+            manager = websocket_manager
+        self.broker = broker or create_broker(CHANNEL)
+        self.session_factory = session_factory
+        self.manager = manager
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # {review_id: {"cells": set, "columns_added": set, "columns_deleted": set, "review_status": str}}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._draining: Dict[str, asyncio.Task] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self) -> None:
+        """Начать приём событий в текущем event loop"""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.broker.start(self._on_payload)
+        logger.info(f"Tabular event bus started ({self.broker.name})")
+
+    async def stop(self) -> None:
+        self.broker.stop()
+        tasks = list(self._draining.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._draining.clear()
+        self._pending.clear()
+        self._loop = None
+
+    async def join(self) -> None:
+        """Дождаться доставки уже полученных событий"""
+        await asyncio.sleep(0)
+        while self._draining:
+            await asyncio.gather(*list(self._draining.values()), return_exceptions=True)
+
+    # ------------------------------------------------------------------
+    # Publishing (any thread)
+    # ------------------------------------------------------------------
+
+    def publish(self, review_id: str, changes: Dict[str, Any]) -> None:
+        """
+        Опубликовать изменения таблицы.
+
+        Args:
+            review_id: ID таблицы
+            changes: {"cells": [...], "columns_added": [...], "columns_deleted": [...], "review_status": str}
+        """
+        for event in _split_event(review_id, changes):
+            try:
+                self.broker.publish(json.dumps(event))
+            except Exception as e:
+                # Ошибка доставки не должна ломать запись данных
+                logger.warning(f"Failed to publish tabular event for review {review_id}: {e}")
+
+    # ------------------------------------------------------------------
+    # Delivery (event loop)
+    # ------------------------------------------------------------------
+
+    def _on_payload(self, payload: str) -> None:
+        """Вызывается брокером из любого потока"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            event_data = json.loads(payload)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid tabular event payload: {payload!r}")
+            return
+        try:
+            if _running_loop() is loop:
+                self._enqueue(event_data)
+            else:
+                loop.call_soon_threadsafe(self._enqueue, event_data)
+        except RuntimeError:
+            # Loop уже закрыт
+            pass
+
+    def _enqueue(self, event_data: Dict[str, Any]) -> None:
+        review_id = event_data.get("review_id")
+        if not review_id or self.manager.get_connection_count(review_id) == 0:
+            # Нет подписчиков в этом воркере - ничего не загружаем
+            return
+        pending = self._pending.setdefault(review_id, _empty_changes())
+        pending["cells"].update(event_data.get("cells", []))
+        pending["columns_added"].update(event_data.get("columns_added", []))
+        pending["columns_deleted"].update(event_data.get("columns_deleted", []))
+        if event_data.get("review_status"):
+            pending["review_status"] = event_data["review_status"]
+
+        if review_id not in self._draining:
+            task = asyncio.get_running_loop().create_task(self._drain(review_id))
+            self._draining[review_id] = task
+
+    async def _drain(self, review_id: str) -> None:
+        try:
+            while review_id in self._pending:
+                changes = self._pending.pop(review_id)
+                try:
+                    messages = await asyncio.to_thread(self._load_messages, review_id, changes)
+                except Exception as e:
+                    logger.error(f"Failed to load tabular changes for review {review_id}: {e}", exc_info=True)
+                    continue
+                # Другие воркеры получают событие сами - рассылаем только локально
+                for message in messages:
+                    await self.manager.broadcast_local(review_id, message)
+        finally:
+            self._draining.pop(review_id, None)
+
+    def _load_messages(self, review_id: str, changes: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Загрузить изменённые строки одним запросом на тип и собрать WebSocket-сообщения"""
+        from app.models.case import File
+        from app.models.tabular_review import TabularCell, TabularColumn, TabularReview
+
+        messages: List[Dict[str, Any]] = []
+        db = self.session_factory()
+        try:
+            if changes["columns_added"]:
+                columns = db.query(TabularColumn).filter(
+                    TabularColumn.id.in_(changes["columns_added"])
+                ).order_by(TabularColumn.order_index).all()
+                for column in columns:
+                    messages.append({
+                        "type": "column_added",
+                        "review_id": review_id,
+                        "column": {
+                            "id": column.id,
+                            "column_label": column.column_label,
+                            "column_type": column.column_type,
+                            "prompt": column.prompt,
+                            "column_config": column.column_config,
+                            "order_index": column.order_index,
+                        }
+                    })
+
+            for column_id in changes["columns_deleted"]:
+                messages.append({"type": "column_deleted", "review_id": review_id, "column_id": column_id})
+
+            touched_columns: Set[str] = set()
+            if changes["cells"]:
+                cells = db.query(TabularCell).filter(TabularCell.id.in_(changes["cells"])).all()
+                for cell in cells:
+                    touched_columns.add(cell.column_id)
+                    messages.append({
+                        "type": "cell_updated",
+                        "review_id": review_id,
+                        "cell_id": cell.id,
+                        "file_id": cell.file_id,
+                        "column_id": cell.column_id,
+                        "cell_value": cell.cell_value,
+                        "reasoning": cell.reasoning,
+                        "source_references": cell.source_references,
+                        "status": cell.status,
+                        "confidence_score": float(cell.confidence_score) if cell.confidence_score else None,
+                    })
+
+            if touched_columns:
+                review = db.query(TabularReview).filter(TabularReview.id == review_id).first()
+                if review is not None:
+                    if review.selected_file_ids:
+                        total = len(review.selected_file_ids)
+                    else:
+                        total = db.query(func.count(File.id)).filter(File.case_id == review.case_id).scalar() or 0
+                    done_by_column = dict(
+                        db.query(TabularCell.column_id, func.count(TabularCell.id)).filter(
+                            TabularCell.tabular_review_id == review_id,
+                            TabularCell.column_id.in_(touched_columns),
+                            TabularCell.status.notin_(PENDING_CELL_STATUSES),
+                        ).group_by(TabularCell.column_id).all()
+                    )
+                    for column_id in sorted(touched_columns):
+                        messages.append({
+                            "type": "extraction_progress",
+                            "review_id": review_id,
+                            "progress": {
+                                "column_id": column_id,
+                                "progress": done_by_column.get(column_id, 0),
+                                "total": total,
+                            }
+                        })
+
+            if changes.get("review_status"):
+                messages.append({
+                    "type": "review_status_changed",
+                    "review_id": review_id,
+                    "status": changes["review_status"],
+                })
+        finally:
+            db.close()
+        return messages
+
+
+def _empty_changes() -> Dict[str, Any]:
+    return {"cells": set(), "columns_added": set(), "columns_deleted": set(), "review_status": None}
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _split_event(review_id: str, changes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Разбить изменения на события с не более чем MAX_IDS_PER_EVENT id каждого типа"""
+    keys = ("cells", "columns_added", "columns_deleted")
+    ids = {key: sorted(changes.get(key) or []) for key in keys}
+    batches = max([(len(values) + MAX_IDS_PER_EVENT - 1) // MAX_IDS_PER_EVENT for values in ids.values()] + [1])
+    events = []
+    for i in range(batches):
+        event_data: Dict[str, Any] = {"review_id": review_id}
+        for key in keys:
+            chunk = ids[key][i * MAX_IDS_PER_EVENT:(i + 1) * MAX_IDS_PER_EVENT]
+            if chunk:
+                event_data[key] = chunk
+        if i == 0 and changes.get("review_status"):
+            event_data["review_status"] = changes["review_status"]
+        if len(event_data) > 1:
+            events.append(event_data)
+    return events
+
+
+# ----------------------------------------------------------------------
+# SQLAlchemy hooks: publish once per commit of the writer
+# ----------------------------------------------------------------------
+
+_SESSION_KEY = "tabular_event_changes"
+
+
+def _collect_changes(session: Session, flush_context) -> None:
+    from app.models.tabular_review import TabularCell, TabularColumn, TabularReview
+
+    collected = None
+
+    def review_changes(review_id: str) -> Dict[str, Any]:
+        nonlocal collected
+        if collected is None:
+            collected = session.info.setdefault(_SESSION_KEY, {})
+        return collected.setdefault(review_id, _empty_changes())
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, TabularCell) and obj.tabular_review_id:
+            if obj in session.new or session.is_modified(obj, include_collections=False):
+                review_changes(obj.tabular_review_id)["cells"].add(obj.id)
+        elif isinstance(obj, TabularColumn) and obj.tabular_review_id and obj in session.new:
+            review_changes(obj.tabular_review_id)["columns_added"].add(obj.id)
+        elif isinstance(obj, TabularReview) and obj not in session.new:
+            history = _attribute_history(obj, "status")
+            if history is not None and history.added:
+                review_changes(obj.id)["review_status"] = obj.status
+
+    for obj in session.deleted:
+        if isinstance(obj, TabularColumn) and obj.tabular_review_id:
+            changes = review_changes(obj.tabular_review_id)
+            changes["columns_added"].discard(obj.id)
+            changes["columns_deleted"].add(obj.id)
+
+
+def _attribute_history(obj, attribute: str):
+    from sqlalchemy import inspect as sa_inspect
+    try:
+        return sa_inspect(obj).attrs[attribute].history
+    except Exception:
+        return None
+
+
+def _publish_after_commit(session: Session) -> None:
+    collected = session.info.pop(_SESSION_KEY, None)
+    if not collected:
+        return
+    bus = get_tabular_event_bus()
+    for review_id, changes in collected.items():
+        bus.publish(review_id, changes)
+
+
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+_hooks_installed = False
+
+
+def install_session_hooks() -> None:
+    """Подключить публикацию событий ко всем сессиям SQLAlchemy (идемпотентно)"""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    event.listen(Session, "after_flush", _collect_changes)
+    event.listen(Session, "after_commit", _publish_after_commit)
+    event.listen(Session, "after_soft_rollback", lambda session, previous_transaction: _discard_after_rollback(session))
+    _hooks_installed = True
+
+
+# Global instance
+_tabular_event_bus: Optional[TabularEventBus] = None
+
+
+def get_tabular_event_bus() -> TabularEventBus:
+    """Get global TabularEventBus instance"""
+    global _tabular_event_bus
+    if _tabular_event_bus is None:
+        _tabular_event_bus = TabularEventBus()
+    return _tabular_event_bus
@@ -1,5 +1,5 @@
 """Tabular Review service for Legal AI Vault"""
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from app.models.tabular_review import (
@@ -9,6 +9,7 @@ from app.models.tabular_review import (
 from app.models.case import Case, File
 from app.models.user import User
 from app.services.llm_factory import create_llm
+from app.services.rate_limiter import LLMPriority, llm_priority
 from app.config import config
 from app.services.tabular_review_models import TabularCellExtractionModel
 from langchain_core.documents import Document
@@ -20,6 +21,9 @@ from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Как часто run_extraction проверяет отмену фоновой задачи, секунды
+CANCEL_CHECK_INTERVAL_SECONDS = 1.0
+
 
 class TabularReviewService:
     """Service for managing tabular reviews"""
@@ -1576,12 +1580,15 @@ class TabularReviewService:
             
             # Build source_references from best result
             source_references = []
-            if best_result.source_page or best_result.source_section:
+            if best_result.source_page or best_result.source_section or verification_result.quote_span:
                 source_ref = {
                     "page": best_result.source_page,
                     "section": best_result.source_section,
                     "text": best_result.verbatim_extract or best_result.cell_value[:200]  # First 200 chars as quote
                 }
+                if verification_result.quote_span:
+                    # Спан цитаты в тексте документа для подсветки
+                    source_ref["char_start"], source_ref["char_end"] = verification_result.quote_span
                 source_references.append(source_ref)
             
             # Add any additional source_references from result
@@ -1623,8 +1630,20 @@ class TabularReviewService:
         logger.debug(f"Using extraction strategy '{strategy}' for file {file.id}, column {column.id}")
         return await self.extract_cell_value_improved(file, column, strategy=strategy)
     
-    async def run_extraction(self, review_id: str, user_id: str) -> Dict[str, Any]:
-        """Run parallel extraction for all documents and columns"""
+    @llm_priority(LLMPriority.BULK)
+    async def run_extraction(
+        self,
+        review_id: str,
+        user_id: str,
+        check_cancelled: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run parallel extraction for all documents and columns
+
+        Args:
+            check_cancelled: Бросает исключение, если задачу отменили (JobContext.check_cancelled);
+                проверяется, пока извлекаются ячейки, и перед сохранением - незавершённые ячейки отменяются
+        """
         # Verify review belongs to user
         review = self.db.query(TabularReview).filter(
             and_(TabularReview.id == review_id, TabularReview.user_id == user_id)
@@ -1665,7 +1684,17 @@ class TabularReviewService:
             
             # Execute tasks in parallel
             logger.info(f"Starting parallel extraction: {len(tasks)} tasks")
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            extraction = asyncio.ensure_future(asyncio.gather(*tasks, return_exceptions=True))
+            try:
+                while check_cancelled is not None and not extraction.done():
+                    await asyncio.wait({extraction}, timeout=CANCEL_CHECK_INTERVAL_SECONDS)
+                    check_cancelled()
+                results = await extraction
+            finally:
+                if not extraction.done():
+                    # Отменяем незавершённые ячейки и дожидаемся их остановки
+                    extraction.cancel()
+                    await asyncio.gather(extraction, return_exceptions=True)
             
             # Save results to database
             saved_count = 0
@@ -1818,6 +1847,7 @@ class TabularReviewService:
             self.db.commit()
             raise
     
+    @llm_priority(LLMPriority.BULK)
     async def run_column_extraction(self, review_id: str, column_id: str, user_id: str) -> Dict[str, Any]:
         """Run extraction for a specific column across all documents"""
         # Verify review belongs to user
@@ -2160,7 +2190,54 @@ class TabularReviewService:
         
         logger.info(f"Updated cell for file {file_id}, column {column_id} in review {review_id}")
         return cell
-    
+
+    def save_extracted_cell(
+        self,
+        review_id: str,
+        file_id: str,
+        column_id: str,
+        cell_value: Optional[str],
+        confidence: Optional[float] = None,
+        verbatim_extract: Optional[str] = None,
+        source_page: Optional[int] = None,
+        status: str = "completed"
+    ) -> TabularCell:
+        """
+        Save an AI-extracted cell value (create or update) and commit immediately.
+
+        Каждая ячейка коммитится отдельно - event bus раздаёт её подписчикам
+        сразу, не дожидаясь остальных. Ячейки, проверенные пользователем
+        (status=reviewed), не перезаписываются.
+        """
+        cell = self.db.query(TabularCell).filter(
+            and_(
+                TabularCell.tabular_review_id == review_id,
+                TabularCell.file_id == file_id,
+                TabularCell.column_id == column_id
+            )
+        ).first()
+
+        if cell and cell.status == "reviewed":
+            return cell
+
+        if not cell:
+            cell = TabularCell(
+                tabular_review_id=review_id,
+                file_id=file_id,
+                column_id=column_id,
+                primary_source_doc_id=file_id
+            )
+            self.db.add(cell)
+
+        cell.cell_value = cell_value
+        cell.confidence_score = confidence
+        cell.verbatim_extract = verbatim_extract
+        cell.source_page = source_page
+        cell.status = status
+        cell.updated_at = datetime.utcnow()
+        self.db.commit()
+        return cell
+
     def bulk_update_status(
         self,
         review_id: str,
@@ -2217,6 +2294,7 @@ class TabularReviewService:
         logger.info(f"Bulk updated status for {updated_count} files in review {review_id}")
         return updated_count
     
+    @llm_priority(LLMPriority.BULK)
     async def bulk_run_extraction(
         self,
         review_id: str,
@@ -1,8 +1,9 @@
 """Tabular Review Verifier service for validating cell extractions"""
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from app.models.tabular_review import TabularCell, TabularColumn
 from app.models.case import File
+from app.services.document_text_index import get_text_index
 import re
 import logging
 from datetime import datetime
@@ -16,11 +17,14 @@ class VerificationResult:
         self,
         is_valid: bool,
         issues: List[str],
-        suggested_status: str
+        suggested_status: str,
+        quote_span: Optional[Tuple[int, int]] = None
     ):
         self.is_valid = is_valid
         self.issues = issues
         self.suggested_status = suggested_status
+        # (start, end) цитаты в file.original_text - для подсветки в UI
+        self.quote_span = quote_span
 
 
 class TabularReviewVerifier:
@@ -49,6 +53,7 @@ class TabularReviewVerifier:
         """
         issues = []
         is_valid = True
+        quote_span = None
         
         # Check if cell has value
         if not cell.cell_value or cell.cell_value.strip() == "":
@@ -63,7 +68,8 @@ class TabularReviewVerifier:
         
         # Verify quote is contained in document (if file provided)
         if file and cell.verbatim_extract:
-            if not self._verify_quote_in_document(cell.verbatim_extract, file):
+            quote_span = self._find_quote_span(cell.verbatim_extract, file)
+            if quote_span is None:
                 issues.append("Verbatim extract not found in document text")
                 is_valid = False
         
@@ -99,20 +105,28 @@ class TabularReviewVerifier:
         return VerificationResult(
             is_valid=is_valid,
             issues=issues,
-            suggested_status=suggested_status
+            suggested_status=suggested_status,
+            quote_span=quote_span
         )
     
-    def _verify_quote_in_document(self, quote: str, file: File) -> bool:
-        """Verify that quote text is contained in document"""
-        if not file.original_text:
-            return False
+    def _find_quote_span(self, quote: str, file: File) -> Optional[Tuple[int, int]]:
+        """
+        Find quote in document text (whitespace-collapsed, case-insensitive).
         
-        # Normalize both texts for comparison (remove extra whitespace)
-        quote_normalized = re.sub(r'\s+', ' ', quote.strip())
-        doc_normalized = re.sub(r'\s+', ' ', file.original_text)
+        Uses the normalized text index cached by document content, so verifying
+        many cells of one file does not re-normalize the whole text each time.
         
-        # Check if quote is in document (case-insensitive for flexibility)
-        return quote_normalized.lower() in doc_normalized.lower()
+        Returns:
+            (start, end) span in file.original_text or None
+        """
+        if not file.original_text or not quote or not quote.strip():
+            return None
+        match = get_text_index(file.original_text).find_exact(quote)
+        return (match.start, match.end) if match else None
+    
+    def _verify_quote_in_document(self, quote: str, file: File) -> bool:
+        """Verify that quote text is contained in document"""
+        return self._find_quote_span(quote, file) is not None
     
     def _verify_value_from_quote(
         self,
@@ -1,80 +1,330 @@
-"""WebSocket Manager for managing WebSocket connections"""
-from typing import Dict, Set, List
+"""WebSocket Manager for managing WebSocket connections
+
+Рассылка не блокируется медленными клиентами: у каждого подключения своя
+ограниченная очередь и задача-писатель. Повторные сообщения об одной и той же
+ячейке/прогрессе/присутствии, ещё не отправленные клиенту, заменяются
+последним значением; при переполнении отбрасываются самые старые сообщения,
+а клиент, который не успевает читать, отключается (и переподключается).
+
+Между uvicorn-воркерами сообщения передаются через event_broker
+(Postgres NOTIFY или Redis pub/sub).
+"""
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Set
 from fastapi import WebSocket
+import json
 import logging
 import asyncio
+import uuid
+
+from app.config import config
+from app.services.streaming_optimizer import BackpressureHandler
 
 logger = logging.getLogger(__name__)
 
+CHANNEL = "websocket_broadcast"
+
+# Сколько сообщений подряд (с момента, когда очередь последний раз опустела) можно отбросить,
+# прежде чем медленный клиент будет отключён
+MAX_DROPPED_MESSAGES = 50
+
+
+def coalesce_key(message: dict) -> Optional[Hashable]:
+    """Ключ, по которому неотправленное сообщение заменяется более новым (None - не заменяется)"""
+    message_type = message.get("type")
+    if message_type == "cell_updated":
+        cell_id = message.get("cell_id") or (message.get("cell") or {}).get("id")
+        if cell_id:
+            return (message_type, cell_id)
+        if message.get("file_id") and message.get("column_id"):
+            return (message_type, message["file_id"], message["column_id"])
+    elif message_type == "extraction_progress":
+        return (message_type, (message.get("progress") or {}).get("column_id"))
+    elif message_type in ("presence_update", "review_status_changed"):
+        return (message_type,)
+    return None
+
+
+class ConnectionSender:
+    """
+    Bounded, coalescing outgoing queue with a dedicated writer task for one WebSocket.
+
+    Глубина очереди учитывается BackpressureHandler: record_send при постановке
+    в очередь, record_ack после отправки, record_drop при вытеснении.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        connection_id: str,
+        max_queue_size: Optional[int] = None,
+        send_timeout: Optional[float] = None,
+        on_close=None,
+    ):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.send_timeout = send_timeout or config.WEBSOCKET_SEND_TIMEOUT_SECONDS
+        self.backpressure = BackpressureHandler(max_queue_size=max_queue_size or config.WEBSOCKET_SEND_QUEUE_SIZE)
+        self.closed = False
+        self._on_close = on_close
+        # Элементы очереди - [key, message]; по key сообщение заменяется на месте
+        self._queue: Deque[List[Any]] = deque()
+        self._keyed: Dict[Hashable, List[Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._warned = False
+        # Отброшено с момента, когда очередь последний раз опустела
+        self._recent_drops = 0
+        self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, message: dict) -> None:
+        """Поставить сообщение в очередь без ожидания"""
+        if self.closed:
+            return
+        key = coalesce_key(message)
+        if key is not None and key in self._keyed:
+            # Клиент ещё не получил предыдущее значение - отправим только последнее
+            self._keyed[key][1] = message
+            return
+
+        if not self.backpressure.can_send():
+            self._drop_oldest()
+            if self.closed:
+                return
+
+        entry = [key, message]
+        self._queue.append(entry)
+        if key is not None:
+            self._keyed[key] = entry
+        self.backpressure.record_send()
+        if self.backpressure.should_warn() and not self._warned:
+            self._warned = True
+            logger.warning(f"WebSocket {self.connection_id} is slow: {self.backpressure.get_stats()}")
+        self._wakeup.set()
+
+    def _drop_oldest(self) -> None:
+        key, _ = self._queue.popleft()
+        if key is not None:
+            self._keyed.pop(key, None)
+        self.backpressure.record_ack()
+        self.backpressure.record_drop()
+        self._recent_drops += 1
+        if self._recent_drops > MAX_DROPPED_MESSAGES:
+            logger.warning(f"Disconnecting slow WebSocket {self.connection_id}: {self.backpressure.get_stats()}")
+            self.close(code=1013)
+
+    async def _writer(self) -> None:
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._queue and not self.closed:
+                    key, message = self._queue.popleft()
+                    if key is not None:
+                        self._keyed.pop(key, None)
+                    self.backpressure.record_ack()
+                    await asyncio.wait_for(self.websocket.send_json(message), timeout=self.send_timeout)
+                if not self._queue:
+                    # Клиент догнал поток - прежние переполнения ему не засчитываются
+                    self._warned = False
+                    self._recent_drops = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Error sending to WebSocket {self.connection_id}: {e}")
+            self.close()
+
+    def close(self, code: Optional[int] = None) -> None:
+        """Остановить писателя; code - закрыть и сам WebSocket (медленный клиент)"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._keyed.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        if code is not None:
+            asyncio.get_running_loop().create_task(self._close_socket(code))
+        if self._on_close is not None:
+            self._on_close(self.connection_id)
+
+    async def _close_socket(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def flush(self) -> None:
+        """Дождаться отправки очереди (для тестов и корректного завершения)"""
+        while self._queue and not self.closed:
+            await asyncio.sleep(0.01)
+
 
 class WebSocketManager:
     """Manager for WebSocket connections"""
-    
-    def __init__(self):
-        """Initialize WebSocket manager"""
+
+    def __init__(self, broker=None):
+        """
+        Initialize WebSocket manager
+
+        Args:
+            broker: Cross-worker transport (by default created from EVENT_BUS_BACKEND on start)
+        """
         # {review_id: {websocket_id: WebSocket}}
         self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
-        # {review_id: {websocket_id: user_id}}
-        self.user_mapping: Dict[str, Dict[str, str]] = {}
-    
-    async def connect(self, websocket: WebSocket, review_id: str, user_id: str) -> str:
+        # {review_id: {websocket_id: user_id}} (None для анонимных подключений)
+        self.user_mapping: Dict[str, Dict[str, Optional[str]]] = {}
+        # {websocket_id: ConnectionSender}
+        self.senders: Dict[str, ConnectionSender] = {}
+        self._connection_reviews: Dict[str, str] = {}
+        self.broker = broker
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ------------------------------------------------------------------
+    # Cross-worker broadcast
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Subscribe to broadcasts from other workers"""
+        if self._loop is not None:
+            return
+        if self.broker is None:
+            from app.services.event_broker import create_broker
+            self.broker = create_broker(CHANNEL)
+        self._loop = asyncio.get_running_loop()
+        self.broker.start(self._on_payload)
+        logger.info(f"WebSocket broadcast started ({self.broker.name})")
+
+    async def stop(self) -> None:
+        if self.broker is not None and self._loop is not None:
+            self.broker.stop()
+        self._loop = None
+        for sender in list(self.senders.values()):
+            sender.close()
+
+    def _on_payload(self, payload: str) -> None:
+        """Called by the broker from its listener thread"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            data = json.loads(payload)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid WebSocket broadcast payload: {payload[:200]!r}")
+            return
+        try:
+            loop.call_soon_threadsafe(
+                self._deliver_local, data.get("review_id"), data.get("message") or {}, data.get("exclude")
+            )
+        except RuntimeError:
+            # Loop уже закрыт
+            pass
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+
+    async def connect(self, websocket: WebSocket, review_id: str, user_id: Optional[str] = None) -> str:
         """Connect a WebSocket and return connection ID"""
         await websocket.accept()
-        
+
         # Generate connection ID
-        import uuid
         connection_id = str(uuid.uuid4())
-        
+
         if review_id not in self.active_connections:
             self.active_connections[review_id] = {}
             self.user_mapping[review_id] = {}
-        
+
         self.active_connections[review_id][connection_id] = websocket
         self.user_mapping[review_id][connection_id] = user_id
-        
+        self._connection_reviews[connection_id] = review_id
+        self.senders[connection_id] = ConnectionSender(
+            websocket,
+            connection_id,
+            on_close=self._on_sender_closed,
+        )
+
         logger.info(f"WebSocket connected: {connection_id} for review {review_id}, user {user_id}")
         return connection_id
-    
+
     def disconnect(self, review_id: str, connection_id: str) -> None:
         """Disconnect a WebSocket"""
+        sender = self.senders.pop(connection_id, None)
+        self._connection_reviews.pop(connection_id, None)
+        if sender is not None:
+            sender.close()
+
         if review_id in self.active_connections:
             self.active_connections[review_id].pop(connection_id, None)
             self.user_mapping[review_id].pop(connection_id, None)
-            
+
             # Clean up empty reviews
             if not self.active_connections[review_id]:
                 del self.active_connections[review_id]
                 del self.user_mapping[review_id]
-        
+
         logger.info(f"WebSocket disconnected: {connection_id} from review {review_id}")
-    
+
+    def _on_sender_closed(self, connection_id: str) -> None:
+        review_id = self._connection_reviews.get(connection_id)
+        if review_id is not None:
+            self.disconnect(review_id, connection_id)
+
     async def send_personal_message(self, message: dict, websocket: WebSocket) -> None:
         """Send a message to a specific WebSocket"""
         try:
             await websocket.send_json(message)
         except Exception as e:
             logger.error(f"Error sending personal message: {e}", exc_info=True)
-    
+
+    # ------------------------------------------------------------------
+    # Broadcast
+    # ------------------------------------------------------------------
+
     async def broadcast_to_review(self, review_id: str, message: dict, exclude_connection_id: str = None) -> None:
-        """Broadcast a message to all connections in a review"""
-        if review_id not in self.active_connections:
+        """Broadcast a message to all connections in a review (on all workers)"""
+        if self._loop is None or self.broker is None:
+            self._deliver_local(review_id, message, exclude_connection_id)
+            return
+
+        payload = json.dumps(
+            {"review_id": review_id, "message": message, "exclude": exclude_connection_id},
+            ensure_ascii=False,
+            default=str,
+        )
+        max_bytes = getattr(self.broker, "max_payload_bytes", None)
+        if max_bytes is not None and len(payload.encode("utf-8")) > max_bytes:
+            logger.warning(
+                f"WebSocket message '{message.get('type')}' for review {review_id} exceeds broker payload limit, "
+                "delivering to this worker only"
+            )
+            self._deliver_local(review_id, message, exclude_connection_id)
+            return
+        try:
+            # Опубликовавший воркер получит сообщение от брокера вместе с остальными
+            await asyncio.to_thread(self.broker.publish, payload)
+        except Exception as e:
+            logger.warning(f"Cross-worker broadcast failed, delivering locally: {e}")
+            self._deliver_local(review_id, message, exclude_connection_id)
+
+    async def broadcast_local(self, review_id: str, message: dict, exclude_connection_id: str = None) -> None:
+        """Broadcast a message to connections of this worker only"""
+        self._deliver_local(review_id, message, exclude_connection_id)
+
+    def _deliver_local(self, review_id: Optional[str], message: dict, exclude_connection_id: Optional[str] = None) -> None:
+        """Enqueue message for every local connection of a review (never blocks)"""
+        if not review_id or review_id not in self.active_connections:
             return
-        
-        disconnected = []
-        for connection_id, websocket in self.active_connections[review_id].items():
+        for connection_id in list(self.active_connections[review_id]):
             if connection_id == exclude_connection_id:
                 continue
-            
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.warning(f"Error broadcasting to connection {connection_id}: {e}")
-                disconnected.append(connection_id)
-        
-        # Clean up disconnected connections
-        for connection_id in disconnected:
-            self.disconnect(review_id, connection_id)
-    
+            sender = self.senders.get(connection_id)
+            if sender is not None:
+                sender.enqueue(message)
+
     async def broadcast_presence_update(self, review_id: str, presence_data: dict, exclude_connection_id: str = None) -> None:
         """Broadcast presence update to all connections in a review"""
         message = {
@@ -83,7 +333,7 @@ class WebSocketManager:
             **presence_data
         }
         await self.broadcast_to_review(review_id, message, exclude_connection_id)
-    
+
     async def broadcast_cell_update(self, review_id: str, cell_data: dict, exclude_connection_id: str = None) -> None:
         """Broadcast cell update to all connections in a review"""
         message = {
@@ -92,7 +342,7 @@ class WebSocketManager:
             **cell_data
         }
         await self.broadcast_to_review(review_id, message, exclude_connection_id)
-    
+
     async def broadcast_cell_lock(self, review_id: str, lock_data: dict, exclude_connection_id: str = None) -> None:
         """Broadcast cell lock update to all connections in a review"""
         message = {
@@ -101,15 +351,15 @@ class WebSocketManager:
             **lock_data
         }
         await self.broadcast_to_review(review_id, message, exclude_connection_id)
-    
+
     def get_connected_user_ids(self, review_id: str) -> Set[str]:
-        """Get set of user IDs currently connected to a review"""
+        """Get set of user IDs currently connected to a review (this worker)"""
         if review_id not in self.user_mapping:
             return set()
-        return set(self.user_mapping[review_id].values())
-    
+        return {user_id for user_id in self.user_mapping[review_id].values() if user_id}
+
     def get_connection_count(self, review_id: str) -> int:
-        """Get number of active connections for a review"""
+        """Get number of active connections for a review (this worker)"""
         if review_id not in self.active_connections:
             return 0
         return len(self.active_connections[review_id])
@@ -117,4 +367,3 @@ class WebSocketManager:
 
 # Global WebSocket manager instance
 websocket_manager = WebSocketManager()
-
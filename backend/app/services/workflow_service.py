@@ -7,6 +7,7 @@ from app.services.workflow_nl_parser import WorkflowNLParser
 from app.services.workflow_executor import WorkflowExecutor, WorkflowExecutionEvent
 from app.services.rag_service import RAGService
 from app.services.document_processor import DocumentProcessor
+from app.services.rate_limiter import LLMPriority, llm_priority
 from datetime import datetime
 import logging
 
@@ -396,6 +397,7 @@ class WorkflowService:
             self.db.rollback()
             raise
     
+    @llm_priority(LLMPriority.WORKFLOW)
     async def execute_workflow(
         self,
         workflow_id: str,
@@ -1,10 +1,12 @@
 """Execution Engine - движок выполнения Workflow"""
-from typing import List, Dict, Any, Optional, AsyncIterator
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable, Tuple
 from dataclasses import dataclass, field
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
 from app.models.workflow import WorkflowExecution, WorkflowStep, WorkflowDefinition, WORKFLOW_TOOLS
 from app.services.workflows.planning_agent import ExecutionPlan, PlanStep, PlanningAgent
 from app.services.workflows.tool_registry import ToolRegistry, ToolResult
+from app.services.rate_limiter import LLMPriority, llm_priority
+from app.config import config
 from datetime import datetime
 import logging
 import asyncio
@@ -16,7 +18,7 @@ logger = logging.getLogger(__name__)
 @dataclass
 class ExecutionEvent:
     """Event emitted during workflow execution"""
-    event_type: str  # started, step_started, step_completed, step_failed, completed, failed
+    event_type: str  # started, step_started, step_completed, step_failed, step_cancelled, completed, failed
     execution_id: str
     step_id: Optional[str] = None
     data: Dict[str, Any] = field(default_factory=dict)
@@ -25,13 +27,135 @@ class ExecutionEvent:
     message: str = ""
 
 
+def parse_tool_limits(spec: str) -> Dict[str, int]:
+    """Разобрать WORKFLOW_TOOL_CONCURRENCY_LIMITS ("tool=limit,tool=limit")"""
+    limits = {}
+    for item in (spec or "").split(","):
+        name, sep, value = item.partition("=")
+        if not sep:
+            continue
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            logger.warning(f"Invalid tool concurrency limit: {item!r}")
+    return limits
+
+
+class DagScheduler:
+    """
+    Планировщик шагов плана по графу зависимостей.
+    
+    Шаг запускается, как только завершены все его depends_on (счётчик
+    незавершённых зависимостей), а не после всего предыдущего "уровня":
+    медленный шаг задерживает только свои потомки. Одновременно выполняется
+    не больше max_parallel шагов и не больше лимита инструмента на каждый
+    инструмент. При ошибке шага его потомки отменяются (не запускаются).
+    
+    run() отдаёт события (kind, step, payload):
+    - ("started", step, None)
+    - ("completed", step, ToolResult)
+    - ("failed", step, ToolResult | Exception) - исключение или result.success == False
+    - ("cancelled", step, failed_step_id)
+    """
+    
+    def __init__(
+        self,
+        steps: List[PlanStep],
+        run_step: Callable[[PlanStep], Awaitable[ToolResult]],
+        max_parallel: Optional[int] = None,
+        tool_limits: Optional[Dict[str, int]] = None,
+        default_tool_limit: Optional[int] = None
+    ):
+        self.steps = steps
+        self.run_step = run_step
+        self.max_parallel = max(1, max_parallel or config.WORKFLOW_MAX_PARALLEL_STEPS)
+        self.tool_limits = tool_limits if tool_limits is not None else parse_tool_limits(config.WORKFLOW_TOOL_CONCURRENCY_LIMITS)
+        self.default_tool_limit = max(1, default_tool_limit or config.WORKFLOW_TOOL_CONCURRENCY)
+    
+    def _tool_limit(self, tool_name: Optional[str]) -> int:
+        if not tool_name:
+            return self.max_parallel
+        return self.tool_limits.get(tool_name, self.default_tool_limit)
+    
+    async def run(self) -> AsyncIterator[Tuple[str, PlanStep, Any]]:
+        order = {step.id: i for i, step in enumerate(self.steps)}
+        by_id = {step.id: step for step in self.steps}
+        remaining = {step.id: len(set(step.depends_on)) for step in self.steps}
+        dependents: Dict[str, List[str]] = {step.id: [] for step in self.steps}
+        for step in self.steps:
+            for dep in set(step.depends_on):
+                if dep in dependents:
+                    dependents[dep].append(step.id)
+        
+        ready = [step.id for step in self.steps if remaining[step.id] == 0]
+        finished = set()
+        running: Dict[asyncio.Task, PlanStep] = {}
+        tool_running: Dict[Optional[str], int] = {}
+        
+        try:
+            while len(finished) < len(self.steps):
+                # Запуск готовых шагов в порядке плана, пока есть слоты
+                ready.sort(key=order.__getitem__)
+                launched = []
+                for step_id in ready:
+                    if len(running) >= self.max_parallel:
+                        break
+                    step = by_id[step_id]
+                    if tool_running.get(step.tool_name, 0) >= self._tool_limit(step.tool_name):
+                        continue
+                    tool_running[step.tool_name] = tool_running.get(step.tool_name, 0) + 1
+                    running[asyncio.ensure_future(self.run_step(step))] = step
+                    launched.append(step_id)
+                    yield "started", step, None
+                ready = [step_id for step_id in ready if step_id not in launched]
+                
+                if not running:
+                    # Остались шаги с неудовлетворимыми зависимостями (цикл или неизвестный шаг)
+                    raise RuntimeError("Workflow deadlock: no steps can be executed")
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: order[running[t].id]):
+                    step = running.pop(task)
+                    tool_running[step.tool_name] -= 1
+                    finished.add(step.id)
+                    
+                    error = task.exception()
+                    result = None if error else task.result()
+                    if error is None and getattr(result, "success", True):
+                        yield "completed", step, result
+                        for child_id in dependents[step.id]:
+                            remaining[child_id] -= 1
+                            if remaining[child_id] == 0 and child_id not in finished:
+                                ready.append(child_id)
+                        continue
+                    
+                    yield "failed", step, error or result
+                    # Отмена всех потомков упавшего шага
+                    stack = list(dependents[step.id])
+                    while stack:
+                        child_id = stack.pop()
+                        if child_id in finished:
+                            continue
+                        finished.add(child_id)
+                        if child_id in ready:
+                            ready.remove(child_id)
+                        stack.extend(dependents[child_id])
+                        yield "cancelled", by_id[child_id], step.id
+        finally:
+            # Потребитель прервал итерацию (отмена, ошибка) - не оставляем висящих задач
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+
 class ExecutionEngine:
     """
     Движок выполнения Workflow.
     
     Выполняет план с использованием инструментов.
     Поддерживает:
-    - Параллельное выполнение независимых шагов
+    - Параллельное выполнение независимых шагов (DagScheduler)
     - Streaming событий для real-time прогресса
     - Обработку ошибок и retry
     - Валидацию результатов
@@ -42,7 +166,15 @@ class ExecutionEngine:
         self.db = db
         self.tool_registry = ToolRegistry(db)
         self.planning_agent = PlanningAgent()
+        # Шаги DAG выполняются параллельно: у каждого своя сессия и свой ToolRegistry
+        self.step_session_factory = sessionmaker(bind=db.get_bind())
     
+    def _open_step(self) -> Tuple[Session, ToolRegistry]:
+        """Session and tool registry for one concurrently running step"""
+        step_db = self.step_session_factory()
+        return step_db, ToolRegistry(step_db)
+    
+    @llm_priority(LLMPriority.WORKFLOW, user_arg="execution")
     async def execute(
         self,
         execution: WorkflowExecution,
@@ -94,80 +226,93 @@ class ExecutionEngine:
             
             self.db.commit()
             
-            # Execute steps
-            completed_steps = set()
+            # Execute steps: шаг стартует, как только готовы его зависимости.
+            # Шаги пишут в БД через свои сессии; self.db использует только этот цикл
             step_results = {}
+            finished_steps = 0
             total_steps = len(plan.steps)
+            step_record_ids = {step_id: record.id for step_id, record in step_records.items()}
+            base_context = {
+                "user_id": execution.user_id,
+                "case_id": execution.case_id,
+                "execution_id": execution_id,
+            }
             
-            while len(completed_steps) < total_steps:
-                # Find steps that can be executed (all dependencies satisfied)
-                ready_steps = []
-                for step in plan.steps:
-                    if step.id in completed_steps:
-                        continue
-                    
-                    if all(dep in completed_steps for dep in step.depends_on):
-                        ready_steps.append(step)
+            async def run_step(step: PlanStep) -> ToolResult:
+                return await self._execute_step(
+                    step=step,
+                    step_record_id=step_record_ids[step.id],
+                    base_context=base_context,
+                    previous_results=step_results
+                )
+            
+            scheduler = DagScheduler(plan.steps, run_step)
+            async for kind, step, payload in scheduler.run():
+                if kind == "started":
+                    yield ExecutionEvent(
+                        event_type="step_started",
+                        execution_id=execution_id,
+                        step_id=step.id,
+                        message=f"Выполнение шага: {step.name}",
+                        progress_percent=int((finished_steps / total_steps) * 100)
+                    )
+                    continue
                 
-                if not ready_steps:
-                    # Deadlock - no steps can be executed
-                    raise RuntimeError("Workflow deadlock: no steps can be executed")
+                finished_steps += 1
+                execution.progress_percent = int((finished_steps / total_steps) * 100)
+                if isinstance(payload, ToolResult):
+                    execution.total_llm_calls = (execution.total_llm_calls or 0) + payload.llm_calls
+                    execution.total_tokens_used = (execution.total_tokens_used or 0) + payload.tokens_used
                 
-                # Execute ready steps in parallel
-                tasks = []
-                for step in ready_steps:
-                    task = self._execute_step(
-                        step=step,
-                        step_record=step_records[step.id],
-                        execution=execution,
-                        previous_results=step_results
+                if kind == "completed":
+                    step_results[step.id] = payload
+                    execution.current_step_id = step.id
+                    execution.total_steps_completed = (execution.total_steps_completed or 0) + 1
+                    self.db.commit()
+                    
+                    yield ExecutionEvent(
+                        event_type="step_completed",
+                        execution_id=execution_id,
+                        step_id=step.id,
+                        data={"success": payload.success, "summary": payload.output_summary},
+                        message=f"Шаг завершён: {step.name}",
+                        progress_percent=execution.progress_percent
                     )
-                    tasks.append((step, task))
                 
-                # Wait for all parallel steps
-                for step, task in tasks:
+                elif kind == "failed":
+                    if isinstance(payload, ToolResult):
+                        step_results[step.id] = payload
+                        error = payload.error or payload.output_summary
+                    else:
+                        error = str(payload)
+                    logger.error(f"Step {step.id} failed: {error}")
+                    
+                    execution.total_steps_failed = (execution.total_steps_failed or 0) + 1
+                    self.db.commit()
+                    
                     yield ExecutionEvent(
-                        event_type="step_started",
+                        event_type="step_failed",
                         execution_id=execution_id,
                         step_id=step.id,
-                        message=f"Выполнение шага: {step.name}",
-                        progress_percent=int((len(completed_steps) / total_steps) * 100)
+                        data={"error": error},
+                        message=f"Ошибка в шаге: {step.name}",
+                        progress_percent=execution.progress_percent
                     )
+                
+                else:  # cancelled - зависимость упала
+                    step_record = step_records[step.id]
+                    step_record.status = "cancelled"
+                    step_record.error = f"Dependency {payload} failed"
+                    self.db.commit()
                     
-                    try:
-                        result = await task
-                        step_results[step.id] = result
-                        completed_steps.add(step.id)
-                        
-                        # Update execution progress
-                        execution.progress_percent = int((len(completed_steps) / total_steps) * 100)
-                        execution.current_step_id = step.id
-                        execution.total_steps_completed = len(completed_steps)
-                        self.db.commit()
-                        
-                        yield ExecutionEvent(
-                            event_type="step_completed",
-                            execution_id=execution_id,
-                            step_id=step.id,
-                            data={"success": result.success, "summary": result.output_summary},
-                            message=f"Шаг завершён: {step.name}",
-                            progress_percent=execution.progress_percent
-                        )
-                        
-                    except Exception as e:
-                        logger.error(f"Step {step.id} failed: {e}")
-                        completed_steps.add(step.id)  # Mark as done (failed)
-                        
-                        execution.total_steps_failed = (execution.total_steps_failed or 0) + 1
-                        self.db.commit()
-                        
-                        yield ExecutionEvent(
-                            event_type="step_failed",
-                            execution_id=execution_id,
-                            step_id=step.id,
-                            data={"error": str(e)},
-                            message=f"Ошибка в шаге: {step.name}"
-                        )
+                    yield ExecutionEvent(
+                        event_type="step_cancelled",
+                        execution_id=execution_id,
+                        step_id=step.id,
+                        data={"failed_dependency": payload},
+                        message=f"Шаг отменён: {step.name} (ошибка в зависимости)",
+                        progress_percent=execution.progress_percent
+                    )
             
             # All steps completed - generate summary
             execution.status = "generating_report"
@@ -217,66 +362,65 @@ class ExecutionEngine:
     async def _execute_step(
         self,
         step: PlanStep,
-        step_record: WorkflowStep,
-        execution: WorkflowExecution,
+        step_record_id: str,
+        base_context: Dict[str, Any],
         previous_results: Dict[str, ToolResult]
     ) -> ToolResult:
-        """Execute a single step"""
-        step_record.status = "running"
-        step_record.started_at = datetime.utcnow()
-        self.db.commit()
-        
+        """Execute a single step in its own DB session"""
+        step_db, tool_registry = self._open_step()
         try:
-            # Build context
-            context = {
-                "user_id": execution.user_id,
-                "case_id": execution.case_id,
-                "execution_id": execution.id,
-                "step_id": step.id,
-                "previous_results": {
-                    k: v.data for k, v in previous_results.items()
+            step_record = step_db.get(WorkflowStep, step_record_id)
+            step_record.status = "running"
+            step_record.started_at = datetime.utcnow()
+            step_db.commit()
+            
+            try:
+                # Build context
+                context = {
+                    **base_context,
+                    "step_id": step.id,
+                    "previous_results": {
+                        k: v.data for k, v in previous_results.items()
+                    }
                 }
-            }
-            
-            # Execute tool
-            if step.tool_name:
-                result = await self.tool_registry.execute_tool(
-                    tool_name=step.tool_name,
-                    params=step.tool_params,
-                    context=context
-                )
-            else:
-                # Non-tool step (analysis, validation)
-                result = ToolResult(
-                    success=True,
-                    data={"message": "Step completed"},
-                    output_summary="Non-tool step completed"
-                )
-            
-            # Update step record
-            step_record.status = "completed" if result.success else "failed"
-            step_record.result = result.data
-            step_record.output_summary = result.output_summary
-            step_record.error = result.error
-            step_record.completed_at = datetime.utcnow()
-            step_record.duration_seconds = int((step_record.completed_at - step_record.started_at).total_seconds())
-            step_record.llm_calls = result.llm_calls
-            step_record.tokens_used = result.tokens_used
-            
-            # Update execution metrics
-            execution.total_llm_calls = (execution.total_llm_calls or 0) + result.llm_calls
-            execution.total_tokens_used = (execution.total_tokens_used or 0) + result.tokens_used
-            
-            self.db.commit()
-            
-            return result
-            
-        except Exception as e:
-            step_record.status = "failed"
-            step_record.error = str(e)
-            step_record.completed_at = datetime.utcnow()
-            self.db.commit()
-            raise
+                
+                # Execute tool
+                if step.tool_name:
+                    result = await tool_registry.execute_tool(
+                        tool_name=step.tool_name,
+                        params=step.tool_params,
+                        context=context
+                    )
+                else:
+                    # Non-tool step (analysis, validation)
+                    result = ToolResult(
+                        success=True,
+                        data={"message": "Step completed"},
+                        output_summary="Non-tool step completed"
+                    )
+                
+                # Update step record
+                step_record.status = "completed" if result.success else "failed"
+                step_record.result = result.data
+                step_record.output_summary = result.output_summary
+                step_record.error = result.error
+                step_record.completed_at = datetime.utcnow()
+                step_record.duration_seconds = int((step_record.completed_at - step_record.started_at).total_seconds())
+                step_record.llm_calls = result.llm_calls
+                step_record.tokens_used = result.tokens_used
+                step_db.commit()
+                
+                return result
+                
+            except Exception as e:
+                step_db.rollback()
+                step_record.status = "failed"
+                step_record.error = str(e)
+                step_record.completed_at = datetime.utcnow()
+                step_db.commit()
+                raise
+        finally:
+            step_db.close()
     
     def _aggregate_results(self, step_results: Dict[str, ToolResult]) -> Dict[str, Any]:
         """Aggregate results from all steps"""
@@ -421,6 +565,7 @@ class ExecutionEngine:
         
         return execution
     
+    @llm_priority(LLMPriority.WORKFLOW, user_arg="execution")
     async def plan_and_execute(
         self,
         execution: WorkflowExecution,
@@ -485,6 +630,7 @@ class ExecutionEngine:
                 message=f"Ошибка: {str(e)}"
             )
     
+    @llm_priority(LLMPriority.WORKFLOW, user_arg="execution")
     async def execute_with_supervisor(
         self,
         execution: WorkflowExecution,
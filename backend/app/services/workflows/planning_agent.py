@@ -2,6 +2,7 @@
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass, field
 from langchain_core.prompts import ChatPromptTemplate
+from app.config import config
 from app.services.llm_factory import create_llm
 from app.models.workflow import WorkflowDefinition, WORKFLOW_TOOLS
 import logging
@@ -176,10 +177,12 @@ class PlanningAgent:
     def _init_llm(self):
         """Initialize LLM"""
         try:
-            # Use create_llm with use_rate_limiting=False for LangChain compatibility
-            # RateLimitedLLMWrapper is not compatible with LangChain's | operator
-            self.llm = create_llm(temperature=0.2, use_rate_limiting=False)
-            logger.info("PlanningAgent: LLM initialized (without rate limiting wrapper)")
+            # План для той же задачи, документов и инструментов берётся из кэша ответов
+            self.llm = create_llm(
+                temperature=0.2,
+                cache_ttl=config.LLM_RESPONSE_CACHE_TTL_SECONDS
+            )
+            logger.info("PlanningAgent: LLM initialized")
         except Exception as e:
             logger.warning(f"PlanningAgent: Failed to initialize LLM: {e}")
             self.llm = None
@@ -2,8 +2,6 @@
 from typing import List, Any, Optional
 import logging
 from langchain_core.embeddings import Embeddings
-from yandex_cloud_ml_sdk import YCloudML
-from yandex_cloud_ml_sdk.auth import APIKeyAuth
 from app.config import config
 
 logger = logging.getLogger(__name__)
@@ -21,6 +19,10 @@ class YandexEmbeddings(Embeddings):
         self.iam_token = kwargs.get("iam_token", config.YANDEX_IAM_TOKEN)
         self.folder_id = kwargs.get("folder_id", config.YANDEX_FOLDER_ID)
         
+        # SDK импортируется при создании клиента, а не при импорте модуля (быстрый старт приложения)
+        from yandex_cloud_ml_sdk import YCloudML
+        from yandex_cloud_ml_sdk.auth import APIKeyAuth
+        
         # Инициализируем SDK
         auth = None
         if self.api_key:
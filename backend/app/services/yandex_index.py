@@ -8,8 +8,6 @@ import requests
 from typing import List, Dict, Any, Optional
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
-from yandex_cloud_ml_sdk import YCloudML
-from yandex_cloud_ml_sdk.auth import APIKeyAuth
 from app.config import config
 
 logger = logging.getLogger(__name__)
@@ -94,8 +92,10 @@ class YandexIndexService:
                 f"Убедитесь, что в Render установлена правильная переменная окружения."
             )
         
-        # Инициализируем SDK
+        # Инициализируем SDK (импорт при создании клиента - быстрый старт приложения)
         try:
+            from yandex_cloud_ml_sdk import YCloudML
+            from yandex_cloud_ml_sdk.auth import APIKeyAuth
             auth = APIKeyAuth(self.api_key) if self.use_api_key else self.iam_token
             self.sdk = YCloudML(folder_id=self.folder_id, auth=auth)
             logger.info(f"✅ Yandex Cloud ML SDK initialized for Vector Store with folder_id: {self.folder_id}")
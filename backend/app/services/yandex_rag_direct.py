@@ -1,8 +1,6 @@
 """Прямой RAG через Responses API с file_search tool (без создания assistant)"""
 from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
-from yandex_cloud_ml_sdk import YCloudML
-from yandex_cloud_ml_sdk.auth import APIKeyAuth
 from app.config import config
 import logging
 
@@ -27,7 +25,9 @@ class YandexRAGDirect:
         if not self.folder_id:
             raise ValueError("YANDEX_FOLDER_ID must be set")
         
-        # Инициализируем SDK
+        # Инициализируем SDK (импорт при создании клиента - быстрый старт приложения)
+        from yandex_cloud_ml_sdk import YCloudML
+        from yandex_cloud_ml_sdk.auth import APIKeyAuth
         auth = APIKeyAuth(self.api_key) if self.api_key else self.iam_token
         self.sdk = YCloudML(folder_id=self.folder_id, auth=auth)
         
@@ -8,6 +8,9 @@ from app.models.analysis import AnalysisResult, Discrepancy, TimelineEvent, Docu
 from app.models.tabular_review import TabularReview, TabularColumn, TabularCell, TabularColumnTemplate, TabularDocumentStatus, CellComment  # Import tabular review models to register them
 from app.models.document_editor import Document, DocumentVersion  # Import document editor models to register them
 from app.models.document_template import DocumentTemplate  # Import document template model to register it
+from app.models.job import BackgroundJob  # Import background job model to register it
+from pathlib import Path
+from typing import List
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,6 +30,10 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Нумерованные SQL-миграции backend/migrations, которые применяет init_db (более ранние применялись вручную)
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent.parent / "migrations"
+FIRST_APPLIED_MIGRATION = 23
+
 
 def ensure_schema():
     """Ensure required columns and indexes exist"""
@@ -408,6 +415,82 @@ def ensure_schema():
                 logger.debug("✅ needs_human_review column already exists")
     except Exception as e:
         logger.error(f"Error checking/adding needs_human_review column: {e}", exc_info=True)
+    
+    # Ensure document_classifications.classifier column exists (Migration 032)
+    try:
+        if "document_classifications" in inspector.get_table_names():
+            columns = {col["name"] for col in inspector.get_columns("document_classifications")}
+            if "classifier" not in columns:
+                logger.info("⚠️  Applying migration 032: adding classifier column to document_classifications")
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(
+                            text(
+                                "ALTER TABLE document_classifications "
+                                "ADD COLUMN IF NOT EXISTS classifier VARCHAR(20)"
+                            )
+                        )
+                    logger.info("✅ Added classifier column to document_classifications")
+                except Exception as e:
+                    logger.error(f"❌ Could not add classifier column: {e}", exc_info=True)
+            else:
+                logger.debug("✅ classifier column already exists")
+    except Exception as e:
+        logger.error(f"Error checking/adding classifier column: {e}", exc_info=True)
+    
+    # Ensure relationship_nodes.degree / community and unique (case_id, node_id) exist (Migration 031)
+    try:
+        if "relationship_nodes" in inspector.get_table_names():
+            columns = {col["name"] for col in inspector.get_columns("relationship_nodes")}
+            unique_constraints = {uc["name"] for uc in inspector.get_unique_constraints("relationship_nodes")}
+            if "degree" not in columns or "community" not in columns:
+                logger.info("⚠️  Applying migration 031: adding degree and community columns to relationship_nodes")
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text(
+                            "ALTER TABLE relationship_nodes ADD COLUMN IF NOT EXISTS degree INTEGER NOT NULL DEFAULT 0"
+                        ))
+                        conn.execute(text("ALTER TABLE relationship_nodes ADD COLUMN IF NOT EXISTS community VARCHAR"))
+                        # Степени существующих узлов по их рёбрам
+                        conn.execute(text(
+                            "UPDATE relationship_nodes n SET degree = ("
+                            "SELECT COUNT(*) FROM relationship_edges e WHERE e.case_id = n.case_id "
+                            "AND (e.source_node_id = n.node_id OR e.target_node_id = n.node_id))"
+                        ))
+                    logger.info("✅ Added degree and community columns to relationship_nodes")
+                except Exception as e:
+                    logger.error(f"❌ Could not add degree/community columns: {e}", exc_info=True)
+            if "uq_relationship_nodes_case_node" not in unique_constraints:
+                logger.info("⚠️  Applying migration 031: unique (case_id, node_id) on relationship_nodes")
+                try:
+                    with engine.begin() as conn:
+                        # Дубликаты node_id в деле: оставляем самый ранний узел
+                        conn.execute(text(
+                            "DELETE FROM relationship_nodes n USING relationship_nodes d "
+                            "WHERE n.case_id = d.case_id AND n.node_id = d.node_id "
+                            "AND (n.created_at, n.id) > (d.created_at, d.id)"
+                        ))
+                        conn.execute(text(
+                            "ALTER TABLE relationship_nodes "
+                            "ADD CONSTRAINT uq_relationship_nodes_case_node UNIQUE (case_id, node_id)"
+                        ))
+                    logger.info("✅ Added unique constraint uq_relationship_nodes_case_node")
+                except Exception as e:
+                    logger.error(f"❌ Could not add unique constraint on relationship_nodes: {e}", exc_info=True)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS idx_relationship_nodes_case_degree "
+                        "ON relationship_nodes(case_id, degree DESC, node_id)"
+                    ))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS idx_relationship_nodes_case_community "
+                        "ON relationship_nodes(case_id, community)"
+                    ))
+            except Exception as e:
+                logger.warning(f"Could not create relationship_nodes indexes: {e}")
+    except Exception as e:
+        logger.error(f"Error checking relationship_nodes schema: {e}", exc_info=True)
 
 
 def init_db():
@@ -417,8 +500,8 @@ def init_db():
     from app.models.user import User, UserSession
     from app.models.analysis import (
         AnalysisResult, Discrepancy, TimelineEvent, DocumentChunk,
-        DocumentClassification, ExtractedEntity, PrivilegeCheck,
-        RelationshipNode, RelationshipEdge, Risk
+        DocumentClassification, ExtractedEntity, EntityPosting, PrivilegeCheck,
+        RelationshipNode, RelationshipEdge, RelationshipGraphState, Risk
     )
     from app.models.tabular_review import (
         TabularReview, TabularColumn, TabularCell,
@@ -426,6 +509,7 @@ def init_db():
     )
     from app.models.document_editor import Document, DocumentVersion
     from app.models.document_template import DocumentTemplate
+    from app.models.job import BackgroundJob
     
     # Check if tabular_reviews table exists with wrong schema and fix it
     try:
@@ -655,6 +739,54 @@ def init_db():
         setup_checkpointer()
     except Exception as e:
         logger.warning(f"Failed to setup LangGraph checkpointer: {e}. Will use fallback.")
+    
+    apply_sql_migrations()
+
+
+def apply_sql_migrations() -> List[str]:
+    """
+    Apply pending numbered SQL migrations (NNN_*.sql, начиная с FIRST_APPLIED_MIGRATION)
+    
+    Каждый файл выполняется целиком в своей транзакции и записывается в
+    schema_migrations, поэтому одноразовые backfill'ы не повторяются. Сами
+    миграции идемпотентны: база, где их уже прогнали вручную, проходит их
+    повторно без ошибок. Ошибка миграции пробрасывается - команда
+    app.migrate завершается с ненулевым кодом, и деплой не стартует на
+    несовместимой схеме.
+    
+    Returns:
+        Имена применённых файлов
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "filename VARCHAR(255) PRIMARY KEY, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT filename FROM schema_migrations"))}
+    
+    pending = sorted(
+        path for path in MIGRATIONS_DIR.glob("[0-9][0-9][0-9]_*.sql")
+        if int(path.name[:3]) >= FIRST_APPLIED_MIGRATION and path.name not in applied
+    )
+    for path in pending:
+        logger.info(f"⚠️  Applying migration {path.name}")
+        # DBAPI-соединение: файл из нескольких операторов уходит одним execute без параметров,
+        # так что % в LIKE-шаблонах не принимается драйвером за плейсхолдер
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute(path.read_text(encoding="utf-8"))
+            cursor.execute("INSERT INTO schema_migrations (filename) VALUES ('%s')" % path.name.replace("'", "''"))
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            logger.error(f"❌ Migration {path.name} failed", exc_info=True)
+            raise
+        finally:
+            raw.close()
+        logger.info(f"✅ Applied migration {path.name}")
+    return [path.name for path in pending]
 
 
 def get_db() -> Session:
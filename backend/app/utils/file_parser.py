@@ -1,6 +1,7 @@
 """File parsing utilities for Legal AI Vault"""
+import io
 import os
-from typing import Tuple
+from typing import List, Optional, Tuple
 from pypdf import PdfReader
 from docx import Document
 import openpyxl
@@ -13,16 +14,28 @@ def _clean_text(text: str) -> str:
     return text.replace("\x00", "").replace("\ufeff", "")
 
 
+def count_pdf_pages(file_content: bytes) -> int:
+    """Return number of pages in PDF (reads only the page tree)"""
+    return len(PdfReader(io.BytesIO(file_content)).pages)
+
+
+def extract_pdf_pages(file_content: bytes, start: int = 0, end: Optional[int] = None) -> List[str]:
+    """
+    Extract text of PDF pages [start, end) from in-memory content.
+
+    Used both for whole-document parsing and for page batches processed
+    in parallel by ParsingExecutor.
+    """
+    reader = PdfReader(io.BytesIO(file_content))
+    pages = reader.pages
+    end = len(pages) if end is None else min(end, len(pages))
+    return [_clean_text(pages[i].extract_text() or "") for i in range(start, end)]
+
+
 def parse_pdf(file_content: bytes, filename: str) -> str:
     """Extract text from PDF file"""
     try:
-        import io
-        pdf_file = io.BytesIO(file_content)
-        reader = PdfReader(pdf_file)
-        text_parts = []
-        for page in reader.pages:
-            text_parts.append(page.extract_text())
-        return _clean_text("\n".join(text_parts))
+        return "\n".join(extract_pdf_pages(file_content))
     except Exception as e:
         raise ValueError(f"Ошибка при чтении PDF файла {filename}: {str(e)}")
 
@@ -30,9 +43,6 @@ def parse_pdf(file_content: bytes, filename: str) -> str:
 def parse_docx(file_content: bytes, filename: str) -> str:
     """Extract text from DOCX file"""
     try:
-        import io
-        import zipfile
-        
         # Parse DOCX (python-docx library will validate the file format)
         docx_file = io.BytesIO(file_content)
         doc = Document(docx_file)
@@ -75,7 +85,6 @@ def parse_txt(file_content: bytes, filename: str) -> str:
 def parse_xlsx(file_content: bytes, filename: str) -> str:
     """Extract text from XLSX file"""
     try:
-        import io
         xlsx_file = io.BytesIO(file_content)
         workbook = openpyxl.load_workbook(xlsx_file, data_only=True)
         text_parts = []
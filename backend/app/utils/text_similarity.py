@@ -0,0 +1,112 @@
+"""Утилиты для поиска почти-дубликатов текста (shingles + MinHash)"""
+import hashlib
+import re
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Большое простое число Мерсенна для универсального хеширования
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _stable_hash(value: str) -> int:
+    """Стабильный между процессами 32-битный хеш строки (в отличие от hash())"""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def shingles(text: str, size: int = 3) -> Set[int]:
+    """
+    Множество словесных шинглов текста (хешированных).
+
+    Args:
+        text: Исходный текст
+        size: Количество слов в шингле
+
+    Returns:
+        Множество 32-битных хешей шинглов
+    """
+    words = _WORD_RE.findall((text or "").lower())
+    if not words:
+        return set()
+    if len(words) <= size:
+        return {_stable_hash(" ".join(words))}
+    return {
+        _stable_hash(" ".join(words[i:i + size]))
+        for i in range(len(words) - size + 1)
+    }
+
+
+class MinHasher:
+    """
+    MinHash-сигнатуры для оценки Jaccard-сходства множеств шинглов.
+
+    Параметры перестановок детерминированы seed'ом, поэтому сигнатуры,
+    посчитанные в разных процессах, сравнимы между собой.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._params = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(f"{seed}:{i}".encode(), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], "big") % (_MERSENNE_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], "big") % _MERSENNE_PRIME
+            self._params.append((a, b))
+
+    def signature_from_shingles(self, items: Iterable[int]) -> List[int]:
+        """MinHash-сигнатура для готового множества шинглов"""
+        items = list(items)
+        if not items:
+            return [_MAX_HASH] * self.num_perm
+        return [
+            min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in items)
+            for a, b in self._params
+        ]
+
+    def signature(self, text: str) -> List[int]:
+        """MinHash-сигнатура текста"""
+        return self.signature_from_shingles(shingles(text, self.shingle_size))
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        """Оценка Jaccard-сходства по двум сигнатурам"""
+        if not sig_a or len(sig_a) != len(sig_b):
+            return 0.0
+        matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+        return matches / len(sig_a)
+
+
+def lsh_candidate_pairs(signatures: List[List[int]], bands: int = 16) -> Set[Tuple[int, int]]:
+    """
+    Пары-кандидаты в почти-дубликаты по LSH (banding) над MinHash-сигнатурами.
+
+    Сигнатура делится на bands полос; элементы, совпавшие хотя бы в одной
+    полосе, становятся кандидатами. Порог срабатывания примерно
+    (1 / bands) ** (1 / rows), для 64 перестановок и 16 полос - Jaccard ~0.5.
+
+    Args:
+        signatures: Сигнатуры одинаковой длины (MinHasher.signature)
+        bands: Количество полос, должно делить длину сигнатуры
+
+    Returns:
+        Множество пар индексов (i, j), i < j
+    """
+    if not signatures:
+        return set()
+    rows = len(signatures[0]) // bands
+    if rows == 0 or rows * bands != len(signatures[0]):
+        raise ValueError(f"Signature length {len(signatures[0])} is not divisible into {bands} bands")
+
+    pairs: Set[Tuple[int, int]] = set()
+    for band in range(bands):
+        buckets: Dict[Tuple[int, ...], List[int]] = {}
+        start = band * rows
+        for index, signature in enumerate(signatures):
+            buckets.setdefault(tuple(signature[start:start + rows]), []).append(index)
+        for members in buckets.values():
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    pairs.add((members[a], members[b]))
+    return pairs
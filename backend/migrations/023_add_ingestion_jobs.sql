@@ -0,0 +1,38 @@
+-- Migration: Add ingestion job tables
+-- Description: Background ingestion pipeline for uploaded files (parse -> classify -> index)
+
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    case_id VARCHAR(36) NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+    user_id VARCHAR(36) REFERENCES users(id) ON DELETE SET NULL,
+    status VARCHAR(50) NOT NULL DEFAULT 'pending',
+    total_files INTEGER NOT NULL DEFAULT 0,
+    processed_files INTEGER NOT NULL DEFAULT 0,
+    failed_files INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    completed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_case_id ON ingestion_jobs(case_id);
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_user_id ON ingestion_jobs(user_id);
+
+CREATE TABLE IF NOT EXISTS ingestion_files (
+    id VARCHAR(36) PRIMARY KEY,
+    job_id VARCHAR(36) NOT NULL REFERENCES ingestion_jobs(id) ON DELETE CASCADE,
+    case_id VARCHAR(36) NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+    filename VARCHAR(255) NOT NULL,
+    file_type VARCHAR(50) NOT NULL,
+    storage_path VARCHAR(512) NOT NULL,
+    stage VARCHAR(50) NOT NULL DEFAULT 'received',
+    status VARCHAR(50) NOT NULL DEFAULT 'pending',
+    file_id VARCHAR(36) REFERENCES files(id) ON DELETE SET NULL,
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingestion_files_job_id ON ingestion_files(job_id);
+CREATE INDEX IF NOT EXISTS idx_ingestion_files_case_id ON ingestion_files(case_id);
+CREATE INDEX IF NOT EXISTS idx_ingestion_files_status ON ingestion_files(status);
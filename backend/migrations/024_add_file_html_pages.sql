@@ -0,0 +1,16 @@
+-- Migration: Add file_html_pages table
+-- Purpose: Pre-rendered HTML of documents stored per page/section for paginated viewing
+
+CREATE TABLE IF NOT EXISTS file_html_pages (
+    id VARCHAR(36) PRIMARY KEY,
+    file_id VARCHAR(36) NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    html TEXT NOT NULL,
+    etag VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    CONSTRAINT uq_file_html_page UNIQUE (file_id, page_number)
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_html_pages_file_id ON file_html_pages(file_id);
+
+COMMENT ON TABLE file_html_pages IS 'Pre-rendered HTML per PDF page or DOCX/TXT/XLSX section, served by GET /api/cases/{case_id}/files/{file_id}/html/pages';
@@ -0,0 +1,14 @@
+-- Migration: Add rate_limit_buckets table
+-- Purpose: Token buckets for HTTP rate limiting shared by all API workers (PostgresRateLimitBackend)
+
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    key VARCHAR(512) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    allowed BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_expires_at ON rate_limit_buckets(expires_at);
+
+COMMENT ON TABLE rate_limit_buckets IS 'Token buckets refilled and consumed atomically by INSERT ... ON CONFLICT; rows past expires_at are full and are deleted periodically';
@@ -0,0 +1,14 @@
+-- Migration: Add llm_response_cache table
+-- Purpose: Persistent tier of the LLM response cache (answers of deterministic calls shared by all workers)
+
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+    key VARCHAR(64) PRIMARY KEY,
+    namespace VARCHAR(255) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_expires_at ON llm_response_cache(expires_at);
+
+COMMENT ON TABLE llm_response_cache IS 'sha256(model + params + messages) -> serialized LLM answer; expired rows are deleted periodically by the app';
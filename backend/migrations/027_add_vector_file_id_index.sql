@@ -0,0 +1,13 @@
+-- Migration: Index chunk vectors by file_id
+-- Purpose: Incremental reindexing reads, upserts and deletes chunks per file (document->'metadata'->>'file_id')
+
+-- Таблицу векторов создаёт CaseVectorStore при первом использовании (вместе с этим индексом),
+-- поэтому на новой базе её может ещё не быть
+DO $$
+BEGIN
+    IF to_regclass('langchain_pg_embedding') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS idx_langchain_pg_embedding_file_id
+            ON langchain_pg_embedding ((document->'metadata'->>'file_id'));
+        COMMENT ON INDEX idx_langchain_pg_embedding_file_id IS 'Per-file chunk lookup for incremental reindexing (content_hash diff, chunk upsert by chunk_id)';
+    END IF;
+END $$;
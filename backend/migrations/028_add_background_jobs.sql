@@ -0,0 +1,31 @@
+-- Migration: Add background_jobs table
+-- Description: Durable job queue for long-running LLM work (case analysis, tabular extraction).
+-- Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED and hold a lease renewed by heartbeats.
+
+CREATE TABLE IF NOT EXISTS background_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    job_type VARCHAR(100) NOT NULL,
+    case_id VARCHAR(36) REFERENCES cases(id) ON DELETE CASCADE,
+    user_id VARCHAR(36) REFERENCES users(id) ON DELETE SET NULL,
+    payload JSON NOT NULL DEFAULT '{}',
+    status VARCHAR(50) NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    worker_id VARCHAR(255),
+    lease_expires_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    result JSON,
+    error_message TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_background_jobs_case_id ON background_jobs(case_id);
+CREATE INDEX IF NOT EXISTS idx_background_jobs_user_id ON background_jobs(user_id);
+-- Claim query: queued jobs that are due, and running jobs whose lease expired
+CREATE INDEX IF NOT EXISTS idx_background_jobs_queued ON background_jobs(priority DESC, run_after) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_background_jobs_running_lease ON background_jobs(lease_expires_at) WHERE status = 'running';
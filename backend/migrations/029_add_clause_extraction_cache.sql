@@ -0,0 +1,12 @@
+-- Migration: Add clause_extraction_cache table
+-- Purpose: Clauses extracted by ClauseExtractor are reused across playbook checks of the same document text
+
+CREATE TABLE IF NOT EXISTS clause_extraction_cache (
+    document_hash VARCHAR(64) NOT NULL,
+    extractor_version VARCHAR(32) NOT NULL,
+    extraction JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (document_hash, extractor_version)
+);
+
+COMMENT ON TABLE clause_extraction_cache IS 'sha256(document text) + ClauseExtractor version -> ClauseExtractionResult; stale versions are simply never read';
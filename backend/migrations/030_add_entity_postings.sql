@@ -0,0 +1,25 @@
+-- Migration: Add entity_postings table
+-- Purpose: Inverted index of extracted entities (normalized entity -> files) for related-document lookup
+
+CREATE TABLE IF NOT EXISTS entity_postings (
+    case_id VARCHAR NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+    entity_key VARCHAR(500) NOT NULL,
+    file_id VARCHAR NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    mentions INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (case_id, entity_key, file_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_entity_postings_file_id ON entity_postings(file_id);
+
+-- Backfill from existing entities; key normalization matches app.services.entity_index.entity_key
+INSERT INTO entity_postings (case_id, entity_key, file_id, mentions)
+SELECT case_id,
+       left(lower(regexp_replace(btrim(entity_text), '\s+', ' ', 'g')), 500) AS entity_key,
+       file_id,
+       COUNT(*)
+FROM extracted_entities
+WHERE file_id IS NOT NULL AND btrim(entity_text) <> ''
+GROUP BY case_id, 2, file_id
+ON CONFLICT (case_id, entity_key, file_id) DO UPDATE SET mentions = EXCLUDED.mentions;
+
+COMMENT ON TABLE entity_postings IS 'normalized entity text -> file ids with mention counts; maintained by ExtractedEntity insert/delete hooks';
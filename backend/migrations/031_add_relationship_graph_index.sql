@@ -0,0 +1,72 @@
+-- Migration: Materialized relationship graph
+-- Purpose: Node degree and community columns, unique node ids per case, graph version tracking,
+-- indexes for neighbourhood queries and cursor pagination (ORDER BY degree DESC, node_id)
+
+ALTER TABLE relationship_nodes ADD COLUMN IF NOT EXISTS degree INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE relationship_nodes ADD COLUMN IF NOT EXISTS community VARCHAR;
+
+-- node_id должен быть уникален в деле: удаляем дубликаты, оставляя самый ранний узел
+DELETE FROM relationship_nodes n
+USING relationship_nodes d
+WHERE n.case_id = d.case_id AND n.node_id = d.node_id
+  AND (n.created_at, n.id) > (d.created_at, d.id);
+
+ALTER TABLE relationship_nodes DROP CONSTRAINT IF EXISTS uq_relationship_nodes_case_node;
+ALTER TABLE relationship_nodes ADD CONSTRAINT uq_relationship_nodes_case_node UNIQUE (case_id, node_id);
+
+CREATE INDEX IF NOT EXISTS idx_relationship_nodes_case_degree
+    ON relationship_nodes(case_id, degree DESC, node_id);
+CREATE INDEX IF NOT EXISTS idx_relationship_nodes_case_community
+    ON relationship_nodes(case_id, community);
+CREATE INDEX IF NOT EXISTS idx_relationship_edges_case_source
+    ON relationship_edges(case_id, source_node_id);
+CREATE INDEX IF NOT EXISTS idx_relationship_edges_case_target
+    ON relationship_edges(case_id, target_node_id);
+
+-- Backfill degree from existing edges
+UPDATE relationship_nodes n
+SET degree = (
+    SELECT COUNT(*) FROM relationship_edges e
+    WHERE e.case_id = n.case_id AND (e.source_node_id = n.node_id OR e.target_node_id = n.node_id)
+);
+
+CREATE TABLE IF NOT EXISTS relationship_graph_state (
+    case_id VARCHAR PRIMARY KEY REFERENCES cases(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 0,
+    communities_version INTEGER NOT NULL DEFAULT -1
+);
+
+-- Entity -> document mention edges for entities extracted before this migration
+-- (node ids and edge ids match app.services.relationship_graph)
+INSERT INTO relationship_nodes (id, case_id, node_id, node_type, node_label, degree, created_at)
+SELECT DISTINCT ON (p.case_id, p.entity_key)
+       gen_random_uuid()::text, p.case_id, 'entity:' || p.entity_key, e.entity_type, left(e.entity_text, 255), 0, NOW()
+FROM entity_postings p
+JOIN extracted_entities e
+  ON e.case_id = p.case_id AND e.file_id = p.file_id
+ AND left(lower(regexp_replace(btrim(e.entity_text), '\s+', ' ', 'g')), 500) = p.entity_key
+ORDER BY p.case_id, p.entity_key
+ON CONFLICT (case_id, node_id) DO NOTHING;
+
+INSERT INTO relationship_nodes (id, case_id, node_id, node_type, node_label, source_document, degree, created_at)
+SELECT gen_random_uuid()::text, f.case_id, 'document:' || f.id, 'Document', left(f.filename, 255), left(f.filename, 255), 0, NOW()
+FROM files f
+WHERE EXISTS (SELECT 1 FROM entity_postings p WHERE p.file_id = f.id)
+ON CONFLICT (case_id, node_id) DO NOTHING;
+
+INSERT INTO relationship_edges (id, case_id, source_node_id, target_node_id, relationship_type, relationship_label, created_at)
+SELECT md5(p.case_id || '|' || p.entity_key || '|' || p.file_id), p.case_id, 'entity:' || p.entity_key, 'document:' || p.file_id,
+       'mentioned_in', 'упоминается в', NOW()
+FROM entity_postings p
+ON CONFLICT (id) DO NOTHING;
+
+UPDATE relationship_nodes n
+SET degree = (
+    SELECT COUNT(*) FROM relationship_edges e
+    WHERE e.case_id = n.case_id AND (e.source_node_id = n.node_id OR e.target_node_id = n.node_id)
+)
+WHERE n.node_id LIKE 'entity:%' OR n.node_id LIKE 'document:%';
+
+INSERT INTO relationship_graph_state (case_id, version, communities_version)
+SELECT DISTINCT case_id, 1, -1 FROM relationship_nodes
+ON CONFLICT (case_id) DO UPDATE SET version = relationship_graph_state.version + 1;
@@ -0,0 +1,10 @@
+-- Migration: Classification source
+-- Purpose: Record which classifier produced a document classification, so the local
+-- classifier trains only on LLM-labelled or user-corrected rows, not on its own output
+
+ALTER TABLE document_classifications ADD COLUMN IF NOT EXISTS classifier VARCHAR(20);
+
+-- Ответы локального классификатора до миграции узнаются по reasoning
+UPDATE document_classifications
+SET classifier = 'local'
+WHERE classifier IS NULL AND reasoning LIKE 'Локальн%';
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark of timeline event deduplication.
+
+Сравнивает прежнее попарное сравнение (embed_query для обоих описаний каждой
+пары с одинаковой датой) с deduplicate_timeline_events (один пакетный проход
+эмбеддингов, матрица сходства по блокам дат, union-find).
+
+Эмбеддинги - детерминированный мешок слов; задержка API моделируется
+sleep(latency) на каждый эмбеддируемый текст.
+
+Usage:
+    python scripts/bench_deduplication.py [num_events] [latency_seconds]
+"""
+
+import hashlib
+import os
+import random
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+
+import numpy as np
+
+from app.services.deduplication import (
+    calculate_cosine_similarity,
+    deduplicate_timeline_events,
+    merge_timeline_events,
+)
+
+logging.disable(logging.CRITICAL)
+
+WORDS = ("договор поставка оплата акт претензия иск суд уведомление расторжение счёт "
+         "неустойка поставщик покупатель товар партия срок гарантия приёмка").split()
+
+
+class SlowEmbeddings:
+    def __init__(self, latency: float, dim: int = 256):
+        self.latency = latency
+        self.dim = dim
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim)
+        for word in text.split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.texts += 1
+        time.sleep(self.latency)
+        return self._vector(text)
+
+
+def synthetic_events(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    dates = [f"2024-{m:02d}-{d:02d}" for m in range(1, 13) for d in (1, 10, 20)]
+    events = []
+    while len(events) < count:
+        base = " ".join(rng.sample(WORDS, 8)) + f" №{len(events)}"
+        date = rng.choice(dates)
+        events.append({"date": date, "description": base, "event_type": "contract"})
+        # Около трети событий повторяются из других документов с небольшими отличиями
+        if rng.random() < 0.35 and len(events) < count:
+            events.append({"date": date, "description": base + " (копия)", "event_type": "contract"})
+    return events
+
+
+def legacy_deduplicate(events, threshold, embeddings):
+    """Прежний алгоритм: O(n²) пар, два embed_query на пару"""
+    deduplicated, seen = [], set()
+    for i, first in enumerate(events):
+        if i in seen:
+            continue
+        similar = [first]
+        for j in range(i + 1, len(events)):
+            second = events[j]
+            if j in seen or first["date"] != second["date"]:
+                continue
+            a = np.array(embeddings.embed_query(first["description"]))
+            b = np.array(embeddings.embed_query(second["description"]))
+            if calculate_cosine_similarity(a, b) >= threshold:
+                similar.append(second)
+                seen.add(j)
+        deduplicated.append(merge_timeline_events(similar) if len(similar) > 1 else first)
+        seen.add(i)
+    return deduplicated
+
+
+def measure(name, run, events, latency):
+    embeddings = SlowEmbeddings(latency)
+    copies = [dict(e) for e in events]
+    started = time.perf_counter()
+    result = run(copies, 0.85, embeddings)
+    seconds = time.perf_counter() - started
+    print(f"  {name:10} {seconds:7.2f} s  calls={embeddings.calls:6}  texts={embeddings.texts:6}  kept={len(result)}")
+    return seconds
+
+
+def main(count: int, latency: float) -> None:
+    events = synthetic_events(count)
+    print(f"{len(events)} events, {latency * 1000:.2f} ms per embedded text:")
+    legacy = measure("legacy", legacy_deduplicate, events, latency)
+    batched = measure("batched", lambda e, t, m: deduplicate_timeline_events(e, t, m), events, latency)
+    print(f"  speedup    x{legacy / batched:.1f}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.0002,
+    )
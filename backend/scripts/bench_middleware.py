@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the HTTP middleware stack.
+
+Сравнивает накладные расходы на запрос: приложение без middleware,
+RequestContextMiddleware (pure ASGI) и прежний стек из трёх BaseHTTPMiddleware
+(логирование, метрики, CSP). Запросы подаются напрямую в ASGI, без сети.
+
+Usage:
+    python scripts/bench_middleware.py [requests]
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.middleware.request_context import CSP_POLICY, RequestContextMiddleware
+
+logging.disable(logging.CRITICAL)
+
+
+async def json_endpoint(request):
+    return JSONResponse({"ok": True})
+
+
+async def stream_endpoint(request):
+    async def chunks():
+        for i in range(20):
+            yield f"data: {i}\n\n"
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+def build_app(stack: str) -> Starlette:
+    app = Starlette(routes=[Route("/json", json_endpoint), Route("/stream", stream_endpoint)])
+    if stack == "asgi":
+        app.add_middleware(RequestContextMiddleware)
+    elif stack == "legacy":
+        async def log_requests(request, call_next):
+            start = time.perf_counter()
+            response = await call_next(request)
+            logging.getLogger("http").info(f"{request.method} {request.url.path} {time.perf_counter() - start}")
+            return response
+
+        async def metrics(request, call_next):
+            start = time.perf_counter()
+            response = await call_next(request)
+            response.headers["X-Process-Time"] = str(time.perf_counter() - start)
+            return response
+
+        async def csp(request, call_next):
+            response = await call_next(request)
+            response.headers["Content-Security-Policy"] = CSP_POLICY
+            return response
+
+        for dispatch in (log_requests, metrics, csp):
+            app.add_middleware(BaseHTTPMiddleware, dispatch=dispatch)
+    return app
+
+
+async def call(app, path: str) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    sent = False
+    disconnect = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(app, path: str, requests: int) -> float:
+    """Mean seconds per request"""
+    for _ in range(50):
+        await call(app, path)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.perf_counter() - started) / requests
+
+
+async def main(requests: int) -> None:
+    for path in ("/json", "/stream"):
+        results = {stack: await measure(build_app(stack), path, requests) for stack in ("bare", "asgi", "legacy")}
+        bare = results["bare"]
+        print(f"{path}:")
+        for stack, seconds in results.items():
+            print(f"  {stack:7} {seconds * 1e6:8.1f} us/request  overhead {(seconds - bare) * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark of related-document lookup by shared entities.
+
+Синтетическое дело (по умолчанию 5000 файлов, ~20 сущностей на файл: стороны
+дела во всех файлах + сущности с распределением Ципфа) в SQLite. Сравнивает
+прежний обработчик /files/{file_id}/related (загрузка всех ExtractedEntity
+дела и подсчёт пересечений в Python) с find_related_by_entities
+(одна SQL-агрегация по entity_postings с весами TF-IDF).
+
+Usage:
+    python scripts/bench_related_documents.py [num_files] [queries]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.analysis import (
+    EntityPosting, ExtractedEntity, RelationshipEdge, RelationshipGraphState, RelationshipNode,
+)
+from app.models.case import Base, Case, File
+from app.models.user import User
+from app.services.entity_index import find_related_by_entities, reindex_file
+
+logging.disable(logging.CRITICAL)
+
+PARTIES = ["ООО Ромашка", "АО Лютик", "Иванов Иван Иванович"]
+TYPES = ["ORG", "PERSON", "DATE", "AMOUNT", "CONTRACT_TERM"]
+
+
+def build_case(db, num_files: int, seed: int = 3) -> None:
+    rng = random.Random(seed)
+    vocabulary = [f"Сущность {i}" for i in range(num_files * 4)]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    db.add(Case(id="case-1", full_text="", num_documents=num_files, file_names=[]))
+    db.add_all([File(id=f"f{i}", case_id="case-1", filename=f"f{i}.pdf", file_type="pdf", original_text="")
+                for i in range(num_files)])
+    entities = []
+    for i in range(num_files):
+        names = PARTIES + rng.choices(vocabulary, weights=weights, k=17)
+        entities.extend(
+            ExtractedEntity(case_id="case-1", file_id=f"f{i}", entity_text=name, entity_type=rng.choice(TYPES))
+            for name in names
+        )
+    db.bulk_save_objects(entities)
+    db.commit()
+    for i in range(num_files):
+        reindex_file(db, "case-1", f"f{i}")
+    db.commit()
+
+
+def legacy_related(db, case_id: str, file_id: str, limit: int):
+    """Прежний алгоритм обработчика (с исправленным entity_text)"""
+    source_entities = db.query(ExtractedEntity).filter(
+        ExtractedEntity.file_id == file_id, ExtractedEntity.case_id == case_id
+    ).all()
+    source_types = set(e.entity_type for e in source_entities)
+    source_texts = set(e.entity_text.lower() for e in source_entities)
+    all_entities = db.query(ExtractedEntity).filter(
+        ExtractedEntity.case_id == case_id, ExtractedEntity.file_id != file_id
+    ).all()
+    by_file = {}
+    for entity in all_entities:
+        by_file.setdefault(entity.file_id, []).append(entity)
+    scores = {}
+    for other_id, entities in by_file.items():
+        score = 0.0
+        for entity in entities:
+            if entity.entity_type in source_types:
+                score += 0.5
+            if entity.entity_text.lower() in source_texts:
+                score += 1.0
+        if score > 0:
+            scores[other_id] = min(100, (score / max(len(source_entities), 1)) * 100)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+
+def measure(name, run, file_ids):
+    timings = []
+    for file_id in file_ids:
+        started = time.perf_counter()
+        run(file_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"  {name:8} median {statistics.median(timings):8.1f} ms   max {max(timings):8.1f} ms")
+    return statistics.median(timings)
+
+
+def main(num_files: int, queries: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine, tables=[
+            User.__table__, Case.__table__, File.__table__, ExtractedEntity.__table__, EntityPosting.__table__,
+            RelationshipNode.__table__, RelationshipEdge.__table__, RelationshipGraphState.__table__,
+        ])
+        db = sessionmaker(bind=engine)()
+        build_case(db, num_files)
+        file_ids = [f"f{i}" for i in random.Random(1).sample(range(num_files), queries)]
+
+        print(f"{num_files} files, {db.query(ExtractedEntity).count()} entities, {queries} queries:")
+        legacy = measure("legacy", lambda f: legacy_related(db, "case-1", f, 5), file_ids)
+        indexed = measure("postings", lambda f: find_related_by_entities(db, "case-1", f, 5), file_ids)
+        print(f"  speedup  x{legacy / indexed:.1f}")
+
+        # Оценка прежнего алгоритма: стороны дела и совпадение типов поднимают почти любой файл
+        sample = file_ids[0]
+        print(f"  top-3 legacy:   {legacy_related(db, 'case-1', sample, 3)}")
+        print(f"  top-3 postings: {[(r.file_id, round(r.score, 1)) for r in find_related_by_entities(db, 'case-1', sample, 3)]}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark of workflow step scheduling.
+
+Сравнивает время выполнения синтетических планов с инструментами-заглушками
+(asyncio.sleep): прежний цикл ExecutionEngine (готовые шаги уровня
+ожидаются по очереди), барьер по уровням с asyncio.gather и DagScheduler.
+
+- wide: корень -> 8 независимых веток из 3 шагов разной длительности -> join
+- deep: цепочка из 6 шагов, от каждого шага отходит медленная боковая ветка
+
+Usage:
+    python scripts/bench_workflow_scheduler.py [time_scale]
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+
+from app.services.workflows.execution_engine import DagScheduler
+from app.services.workflows.planning_agent import PlanStep
+from app.services.workflows.tool_registry import ToolResult
+
+logging.disable(logging.CRITICAL)
+
+
+def make_step(step_id, depends_on, seconds, tool="rag"):
+    return PlanStep(id=step_id, name=step_id, description="", step_type="tool_call",
+                    tool_name=tool, depends_on=depends_on, estimated_duration_seconds=seconds)
+
+
+def wide_dag(scale):
+    steps = [make_step("root", [], 0.05 * scale)]
+    tools = ["rag", "summarize", "extract_entities", "playbook_check"]
+    for b in range(8):
+        prev = "root"
+        for level in range(3):
+            step_id = f"b{b}_{level}"
+            # Ветки разной длины: одна медленная ветка не должна тормозить остальные
+            seconds = (0.3 if (b + level) % 4 == 0 else 0.05) * scale
+            steps.append(make_step(step_id, [prev], seconds, tools[b % len(tools)]))
+            prev = step_id
+    steps.append(make_step("join", [f"b{b}_2" for b in range(8)], 0.05 * scale, "summarize"))
+    return steps
+
+
+def deep_dag(scale):
+    steps = []
+    prev = []
+    for i in range(6):
+        steps.append(make_step(f"chain{i}", prev, 0.05 * scale, "rag"))
+        steps.append(make_step(f"side{i}", [f"chain{i}"], 0.25 * scale, "summarize"))
+        prev = [f"chain{i}"]
+    steps.append(make_step("report", [f"side{i}" for i in range(6)], 0.05 * scale, "document_draft"))
+    return steps
+
+
+async def fake_tool(step):
+    await asyncio.sleep(step.estimated_duration_seconds)
+    return ToolResult(success=True, output_summary=step.id)
+
+
+def levels(steps):
+    done = set()
+    pending = list(steps)
+    while pending:
+        level = [s for s in pending if all(d in done for d in s.depends_on)]
+        yield level
+        done.update(s.id for s in level)
+        pending = [s for s in pending if s.id not in done]
+
+
+async def run_legacy(steps):
+    # Прежний ExecutionEngine.execute: корутины уровня ожидаются одна за другой
+    for level in levels(steps):
+        for step in level:
+            await fake_tool(step)
+
+
+async def run_level_gather(steps):
+    for level in levels(steps):
+        await asyncio.gather(*(fake_tool(step) for step in level))
+
+
+async def run_dag(steps):
+    async for _ in DagScheduler(steps, fake_tool, max_parallel=8, tool_limits={}, default_tool_limit=4).run():
+        pass
+
+
+async def measure(runner, steps) -> float:
+    started = time.perf_counter()
+    await runner(steps)
+    return time.perf_counter() - started
+
+
+async def main(scale: float) -> None:
+    for name, build in (("wide", wide_dag), ("deep", deep_dag)):
+        steps = build(scale)
+        print(f"{name} ({len(steps)} steps):")
+        results = {}
+        for runner_name, runner in (("legacy", run_legacy), ("levels", run_level_gather), ("dag", run_dag)):
+            results[runner_name] = await measure(runner, steps)
+        for runner_name, seconds in results.items():
+            print(f"  {runner_name:7} {seconds:6.2f} s  x{results['legacy'] / seconds:5.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0))
@@ -0,0 +1,135 @@
+"""Тесты асинхронного извлечения Tabular Review: весь граф работает на одном event loop"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+try:
+    from app.services.langchain_agents.agents import tabular_extraction_agent as agent_module
+    from app.services.langchain_agents.agents.tabular_extraction_agent import (
+        ExtractionColumn,
+        TabularExtractionAgent,
+        TabularExtractionConfig,
+    )
+except ImportError as e:  # langgraph/langchain несовместимых версий
+    pytest.skip(f"langchain agents unavailable: {e}", allow_module_level=True)
+
+FILES = [f"file-{i}" for i in range(20)]
+COLUMNS = [{"id": f"col-{i}", "label": f"Колонка {i}", "column_type": "text", "prompt": "Извлеки"} for i in range(10)]
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeAsyncLLM:
+    """LLM с нативным ainvoke: фиксирует loop и поток каждого вызова"""
+
+    def __init__(self):
+        self.loops = set()
+        self.threads = set()
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    def invoke(self, messages):
+        raise AssertionError("sync invoke must not be used")
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        self.loops.add(id(asyncio.get_running_loop()))
+        self.threads.add(threading.get_ident())
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        return FakeMessage(json.dumps({"value": "ООО Ромашка", "confidence": 0.95, "source_quote": "ООО Ромашка"}))
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    llm = FakeAsyncLLM()
+    monkeypatch.setattr(agent_module, "create_llm", lambda **kwargs: llm)
+    monkeypatch.setattr(TabularExtractionAgent, "_get_document_text",
+                        lambda self, file_id: (f"{file_id}.pdf", "Договор с ООО Ромашка"))
+    return llm
+
+
+@pytest.fixture
+def runtime_counters(monkeypatch):
+    """Считает созданные event loop'ы и запущенные потоки"""
+    counters = {"loops": 0, "threads": 0}
+    loop_init = asyncio.BaseEventLoop.__init__
+    thread_start = threading.Thread.start
+
+    def counting_loop_init(self, *args, **kwargs):
+        counters["loops"] += 1
+        loop_init(self, *args, **kwargs)
+
+    def counting_thread_start(self, *args, **kwargs):
+        counters["threads"] += 1
+        thread_start(self, *args, **kwargs)
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "__init__", counting_loop_init)
+    monkeypatch.setattr(threading.Thread, "start", counting_thread_start)
+    return counters
+
+
+class TestAsyncTabularExtraction:
+    """Извлечение 200 ячеек без пулов потоков и вложенных event loop'ов"""
+
+    def test_agent_extract_all_runs_on_callers_loop(self, fake_llm, runtime_counters):
+        config = TabularExtractionConfig(
+            review_id="r1", case_id="c1", user_id="u1",
+            columns=[ExtractionColumn(**{k: c[k] for k in ("id", "label", "column_type", "prompt")}) for c in COLUMNS],
+            file_ids=FILES, max_parallel_cells=8,
+        )
+
+        result = asyncio.run(TabularExtractionAgent(config, db=None).extract_all())
+
+        assert result["total_cells"] == 200 and len(result["successful"]) == 200
+        assert [(r["file_id"], r["column_id"]) for r in result["successful"][:2]] == [("file-0", "col-0"), ("file-0", "col-1")]
+        assert fake_llm.calls == 200
+        assert runtime_counters == {"loops": 1, "threads": 0}
+        assert len(fake_llm.loops) == 1 and fake_llm.threads == {threading.get_ident()}
+        assert 1 < fake_llm.peak <= 8
+
+    def test_map_extract_node_is_native_async(self, fake_llm, runtime_counters):
+        from app.services.langchain_agents.graphs.tabular_graph import (
+            create_initial_tabular_state,
+            map_extract_node,
+        )
+
+        assert asyncio.iscoroutinefunction(map_extract_node)
+        state = create_initial_tabular_state("r1", "c1", "u1", COLUMNS, FILES)
+
+        new_state = asyncio.run(map_extract_node(state))
+
+        assert len(new_state["extraction_results"]) == 200
+        assert runtime_counters == {"loops": 1, "threads": 0}
+        assert len(fake_llm.loops) == 1 and fake_llm.threads == {threading.get_ident()}
+
+    def test_map_extract_node_persists_cells_off_the_loop(self, fake_llm, monkeypatch):
+        from app.services import tabular_review_service
+        from app.services.langchain_agents.graphs.tabular_graph import (
+            create_initial_tabular_state,
+            map_extract_node,
+        )
+
+        saved = []
+
+        def save_extracted_cell(self, **kwargs):
+            saved.append((threading.get_ident(), kwargs["cell_value"]))
+
+        monkeypatch.setattr(tabular_review_service.TabularReviewService, "save_extracted_cell", save_extracted_cell)
+        state = create_initial_tabular_state("r1", "c1", "u1", COLUMNS, FILES)
+
+        new_state = asyncio.run(map_extract_node(state, db=object()))
+
+        # Коммит каждой ячейки выполняется в потоке, а не на event loop
+        assert len(saved) == 200
+        assert threading.get_ident() not in {thread for thread, _ in saved}
+        assert {value for _, value in saved} == {"ООО Ромашка"}
+        assert all(cell["persisted"] for cell in new_state["extraction_results"])
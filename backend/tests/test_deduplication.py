@@ -0,0 +1,133 @@
+"""Тесты дедупликации событий хронологии и противоречий"""
+import hashlib
+
+import numpy as np
+
+from app.services import deduplication
+from app.services.deduplication import deduplicate_discrepancies, deduplicate_timeline_events
+from app.utils.text_similarity import MinHasher, lsh_candidate_pairs
+
+
+class BagOfWordsEmbeddings:
+    """Детерминированные эмбеддинги (мешок слов), считает вызовы и тексты"""
+
+    def __init__(self, dim=4096):
+        self.dim = dim
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.texts += 1
+        return self._vector(text)
+
+
+class BrokenEmbeddings:
+    def embed_documents(self, texts):
+        raise RuntimeError("embeddings API unavailable")
+
+
+def event(date, description, event_type="", **extra):
+    return {"date": date, "description": description, "event_type": event_type, **extra}
+
+
+class TestDeduplicateTimelineEvents:
+    """Тесты deduplicate_timeline_events"""
+
+    def test_single_batched_embedding_pass(self):
+        embeddings = BagOfWordsEmbeddings()
+        events = [
+            event("2024-01-10", "Подписан договор поставки между сторонами"),
+            event("2024-01-10", "Подписан договор поставки между сторонами"),
+            event("2024-01-10", "Получено уведомление о расторжении"),
+            event("2024-02-01", "Подписан договор поставки между сторонами"),
+        ]
+
+        result = deduplicate_timeline_events(events, embeddings_model=embeddings)
+
+        assert embeddings.calls == 1
+        # Одинаковые тексты эмбеддятся один раз
+        assert embeddings.texts == 2
+        assert [e["description"] for e in result] == [
+            "Подписан договор поставки между сторонами",
+            "Получено уведомление о расторжении",
+            "Подписан договор поставки между сторонами",
+        ]
+        assert [e["date"] for e in result] == ["2024-01-10", "2024-01-10", "2024-02-01"]
+
+    def test_transitive_clusters_and_type_compatibility(self):
+        embeddings = BagOfWordsEmbeddings()
+        events = [
+            event("2024-03-01", "a b c d e f g h i j", "payment"),
+            event("2024-03-01", "a b c d e f g h i j k", ""),
+            event("2024-03-01", "a b c d e f g h i j k l", "payment"),
+            event("2024-03-01", "a b c d e f g h i j", "court"),
+        ]
+
+        result = deduplicate_timeline_events(events, similarity_threshold=0.9, embeddings_model=embeddings)
+
+        # 0~1~2 объединены транзитивно, событие другого типа осталось отдельным
+        assert result == [events[0], events[3]]
+
+    def test_falls_back_to_text_similarity(self):
+        events = [
+            event("2024-01-10", "Подписан договор поставки"),
+            event("2024-01-10", "Подписан договор поставки"),
+            event("2024-01-10", "Иск подан в арбитражный суд"),
+        ]
+
+        result = deduplicate_timeline_events(events, embeddings_model=BrokenEmbeddings())
+
+        assert len(result) == 2
+
+    def test_large_bucket_uses_lsh(self, monkeypatch):
+        monkeypatch.setattr(deduplication, "MATRIX_BLOCK_LIMIT", 10)
+        embeddings = BagOfWordsEmbeddings()
+        events = [event("2024-01-01", f"Событие номер {i} по делу о поставке товара") for i in range(30)]
+        events += [event("2024-01-01", "Событие номер 5 по делу о поставке товара")]
+
+        result = deduplicate_timeline_events(events, similarity_threshold=0.99, embeddings_model=embeddings)
+
+        assert len(result) == 30
+        assert embeddings.calls == 1
+
+
+class TestDeduplicateDiscrepancies:
+    """Тесты deduplicate_discrepancies"""
+
+    def test_merges_source_documents(self):
+        embeddings = BagOfWordsEmbeddings()
+        discrepancies = [
+            {"type": "date", "description": "Разные даты подписания договора", "source_documents": ["a.pdf"]},
+            {"type": "amount", "description": "Сумма в акте не совпадает", "source_documents": ["b.pdf"]},
+            {"type": "date", "description": "Разные даты подписания договора", "source_documents": ["c.pdf"]},
+        ]
+
+        result = deduplicate_discrepancies(discrepancies, embeddings_model=embeddings)
+
+        assert embeddings.calls == 1
+        assert len(result) == 2
+        assert sorted(result[0]["source_documents"]) == ["a.pdf", "c.pdf"]
+
+
+class TestLshCandidatePairs:
+    def test_similar_texts_become_candidates(self):
+        hasher = MinHasher(num_perm=64, shingle_size=1)
+        signatures = [hasher.signature(t) for t in (
+            "договор поставки товара номер один",
+            "договор поставки товара номер один",
+            "исковое заявление в арбитражный суд",
+        )]
+
+        assert lsh_candidate_pairs(signatures, bands=16) == {(0, 1)}
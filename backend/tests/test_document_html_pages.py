@@ -0,0 +1,126 @@
+"""Тесты постраничного HTML для просмотрщика документов"""
+import asyncio
+import gzip
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from reportlab.pdfgen import canvas
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.models import Base, Case, File, FileHtmlPage, User
+from app.routes.cases import get_file_html_pages
+from app.services.document_converter_service import DocumentConverterService, split_html_blocks
+from app.services.document_html_cache import DocumentHtmlCacheService
+
+
+def make_pdf(num_pages: int) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for i in range(num_pages):
+        pdf.drawString(72, 720, f"Page number {i + 1}")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'html.db'}")
+    Base.metadata.create_all(engine, tables=[User.__table__, Case.__table__, File.__table__, FileHtmlPage.__table__])
+    session = sessionmaker(bind=engine)()
+    session.add(Case(id="case-1", user_id="user-1", full_text="", num_documents=1, file_names=["a.pdf"]))
+    session.add(File(id="file-1", case_id="case-1", filename="a.pdf", file_type="pdf", original_text=""))
+    session.commit()
+    yield session
+    session.close()
+
+
+def make_request(headers=None) -> Request:
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+
+def fetch_pages(db, headers=None, start=1, limit=10):
+    return asyncio.run(get_file_html_pages(
+        "case-1", "file-1", make_request(headers), start=start, limit=limit,
+        db=db, current_user=SimpleNamespace(id="user-1"),
+    ))
+
+
+class TestHtmlPageSplitting:
+    """Тесты разбиения HTML на страницы"""
+
+    def test_top_level_blocks_keep_tables_intact(self):
+        """Вложенные элементы не разрываются между блоками"""
+        html = "<h1>Договор</h1><table><tr><td><p>1</p></td></tr></table>текст<br/><p>Конец</p>"
+
+        blocks = split_html_blocks(html)
+
+        assert blocks == ["<h1>Договор</h1>", "<table><tr><td><p>1</p></td></tr></table>", "текст<br/>", "<p>Конец</p>"]
+
+    def test_pdf_split_by_physical_pages(self):
+        """PDF делится на страницы по физическим страницам"""
+        pages = DocumentConverterService().convert_to_html_pages(make_pdf(3), "a.pdf", "pdf")
+
+        assert len(pages) == 3
+        assert 'data-page="2"' in pages[1] and "Page number 2" in pages[1]
+
+    def test_text_split_into_sections(self):
+        """Текстовые документы делятся на секции ограниченного размера"""
+        text = "\n\n".join(f"Пункт {i}. " + "текст " * 20 for i in range(30)).encode("utf-8")
+
+        pages = DocumentConverterService().convert_to_html_pages(text, "a.txt", "txt", section_max_chars=1000)
+
+        assert len(pages) > 3
+        assert all(page.startswith("<p>") and page.endswith("</p>") for page in pages)
+
+
+class TestHtmlPagesEndpoint:
+    """Тесты эндпоинта /files/{file_id}/html/pages"""
+
+    def test_returns_requested_range(self, db):
+        """Возвращаются только запрошенные страницы"""
+        DocumentHtmlCacheService(db).store_pages("file-1", [f"<p>{i}</p>" for i in range(1, 301)])
+
+        response = fetch_pages(db, start=11, limit=5)
+        data = json.loads(response.body)
+
+        assert data["total_pages"] == 300
+        assert [p["page"] for p in data["pages"]] == [11, 12, 13, 14, 15]
+        assert data["container_class"] == "pdf-content"
+
+    def test_etag_not_modified(self, db):
+        """Совпадающий If-None-Match возвращает 304, изменение страниц меняет ETag"""
+        cache = DocumentHtmlCacheService(db)
+        cache.store_pages("file-1", ["<p>1</p>", "<p>2</p>"])
+        etag = fetch_pages(db).headers["etag"]
+
+        assert fetch_pages(db, {"If-None-Match": etag}).status_code == 304
+
+        cache.store_pages("file-1", ["<p>1</p>", "<p>2 изменено</p>"])
+        assert fetch_pages(db, {"If-None-Match": etag}).status_code == 200
+
+    def test_gzip_when_accepted(self, db):
+        """Большие ответы сжимаются при Accept-Encoding: gzip"""
+        DocumentHtmlCacheService(db).store_pages("file-1", ["<p>" + "текст " * 500 + "</p>"])
+
+        response = fetch_pages(db, {"Accept-Encoding": "gzip, deflate"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert json.loads(gzip.decompress(response.body))["pages"][0]["page"] == 1
+
+    def test_legacy_file_rendered_on_first_open(self, db):
+        """Файл без пререндеринга конвертируется при первом запросе и сохраняется"""
+        file = db.query(File).filter(File.id == "file-1").one()
+        file.file_content = make_pdf(4)
+        db.commit()
+
+        data = json.loads(fetch_pages(db, start=1, limit=2).body)
+
+        assert data["total_pages"] == 4
+        assert len(data["pages"]) == 2
+        assert DocumentHtmlCacheService(db).get_page_count("file-1") == 4
@@ -0,0 +1,135 @@
+"""Тесты индекса нормализованного текста и проверки цитат по нему"""
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from app.services import citation_verifier as citation_verifier_module
+from app.services import document_text_index
+from app.services.citation_verifier import CitationVerifier
+from app.services.document_text_index import DocumentTextIndex, get_text_index
+from app.services.tabular_review_verifier import TabularReviewVerifier
+
+CONTRACT = (
+    "ДОГОВОР ПОСТАВКИ № 15\n\n"
+    "1.1.   Поставщик   обязуется поставить\tтовар в срок до 31.12.2024.\n"
+    "2.1. Цена договора составляет 1 500 000 (один миллион пятьсот тысяч) рублей.\n"
+    "3.1. Покупатель оплачивает товар в течение 10 банковских дней."
+)
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[1.0, 0.5] for _ in texts]
+
+    def embed_query(self, text):
+        raise AssertionError("semantic checks must be batched")
+
+
+class TestDocumentTextIndex:
+    """Тесты DocumentTextIndex"""
+
+    def test_exact_match_maps_back_to_original(self):
+        index = DocumentTextIndex(CONTRACT)
+
+        match = index.find_exact("поставщик обязуется поставить товар")
+
+        assert match.exact and match.similarity == 1.0
+        assert CONTRACT[match.start:match.end] == "Поставщик   обязуется поставить\tтовар"
+        assert index.normalized.startswith("договор поставки № 15 1.1. поставщик")
+
+    def test_fuzzy_match_returns_aligned_span(self):
+        index = DocumentTextIndex(CONTRACT)
+
+        # Опечатка и пропущенное слово: точного вхождения нет
+        quote = "Цена договра составляет 1 500 000 рублей"
+        assert index.find_exact(quote) is None
+        match = index.find_fuzzy(quote, min_similarity=0.5, tolerance=10)
+
+        assert match is not None and not match.exact
+        assert CONTRACT[match.start:match.end].startswith("Цена договора составляет 1 500 000")
+
+    def test_fuzzy_no_match_below_threshold(self):
+        index = DocumentTextIndex(CONTRACT)
+
+        assert index.find_fuzzy("арбитражный суд города Москвы", min_similarity=0.7) is None
+
+    def test_index_cached_by_content(self, monkeypatch):
+        monkeypatch.setattr(document_text_index, "_index_cache", document_text_index.OrderedDict())
+
+        first = get_text_index(CONTRACT)
+
+        assert get_text_index(str(CONTRACT)) is first
+        assert get_text_index(CONTRACT + " ") is not first
+
+
+class TestCitationVerifier:
+    """CitationVerifier поверх индекса"""
+
+    @pytest.fixture
+    def embeddings(self, monkeypatch):
+        fake = CountingEmbeddings()
+        monkeypatch.setattr(citation_verifier_module, "_yandex_embeddings", fake)
+        return fake
+
+    def test_citation_span_and_single_embedding_call(self, embeddings):
+        verifier = CitationVerifier(similarity_threshold=0.7)
+        documents = [
+            Document(page_content="Посторонний документ без совпадений", metadata={"source_file": "other.pdf"}),
+            Document(page_content=CONTRACT, metadata={"source_file": "contract.pdf", "source_page": 1}),
+        ]
+
+        result = verifier.verify_citation("покупатель оплачивает товар в течение 10 банковских дней", documents)
+
+        best = result["best_match"]
+        assert result["verified"]
+        assert best["source_file"] == "contract.pdf"
+        assert best["match_type"] == "exact_semantic"
+        assert CONTRACT[best["char_start"]:best["char_end"]] == "Покупатель оплачивает товар в течение 10 банковских дней"
+        assert embeddings.calls == 1
+
+    def test_multiple_facts_share_one_embedding_call(self, embeddings):
+        verifier = CitationVerifier(similarity_threshold=0.7)
+        facts = [
+            {"description": "Цена договора составляет 1 500 000"},
+            {"description": "товар в срок до 31.12.2024"},
+            {"value": ""},
+            {"description": "Иск подан в суд"},
+        ]
+
+        result = verifier.verify_multiple_facts(facts, [Document(page_content=CONTRACT, metadata={})])
+
+        assert embeddings.calls == 1
+        assert result["verified_count"] == 2
+        assert result["verification_results"][2]["verification"]["error"] == "No text found in fact for verification"
+
+    def test_without_embeddings(self, monkeypatch):
+        monkeypatch.setattr(citation_verifier_module, "_yandex_embeddings", False)
+        verifier = CitationVerifier(similarity_threshold=0.7)
+
+        result = verifier.verify_citation("ЦЕНА ДОГОВОРА составляет", [Document(page_content=CONTRACT, metadata={})])
+
+        assert result["best_match"]["match_type"] == "exact"
+        assert result["confidence"] == 1.0
+        assert verifier.verify_citation("  ", [Document(page_content=CONTRACT)])["error"] == "Empty citation text"
+
+
+class TestTabularQuoteVerification:
+    def test_quote_span_returned(self):
+        verifier = TabularReviewVerifier(db=None)
+        cell = SimpleNamespace(cell_value="1500000", verbatim_extract="составляет 1 500 000",
+                               normalized_value=None, status="completed", confidence_score=0.9)
+        column = SimpleNamespace(column_type="text")
+        file = SimpleNamespace(original_text=CONTRACT)
+
+        result = verifier.verify_cell(cell, column, file)
+
+        assert result.is_valid
+        start, end = result.quote_span
+        assert CONTRACT[start:end] == "составляет 1 500 000"
+        cell.verbatim_extract = "составляет 2 000 000"
+        assert verifier.verify_cell(cell, column, file).quote_span is None
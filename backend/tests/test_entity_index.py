@@ -0,0 +1,102 @@
+"""Тесты инвертированного индекса сущностей (entity_postings)"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.analysis import (
+    EntityPosting, ExtractedEntity, RelationshipEdge, RelationshipGraphState, RelationshipNode,
+)
+from app.models.case import Base, Case, File
+from app.models.user import User
+from app.services.entity_index import (
+    entity_key,
+    find_related_by_entities,
+    install_entity_index_hooks,
+    reindex_file,
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    install_entity_index_hooks()
+    engine = create_engine(f"sqlite:///{tmp_path / 'entities.db'}")
+    Base.metadata.create_all(engine, tables=[
+        User.__table__, Case.__table__, File.__table__, ExtractedEntity.__table__, EntityPosting.__table__,
+        RelationshipNode.__table__, RelationshipEdge.__table__, RelationshipGraphState.__table__,
+    ])
+    session = sessionmaker(bind=engine)()
+    session.add(Case(id="case-1", full_text="", num_documents=0, file_names=[]))
+    session.add_all([File(id=f"f{i}", case_id="case-1", filename=f"f{i}.pdf", file_type="pdf",
+                         original_text="") for i in range(6)])
+    session.commit()
+    yield session
+    session.close()
+
+
+def add_entities(db, file_id, texts, entity_type="ORG"):
+    entities = [ExtractedEntity(case_id="case-1", file_id=file_id, entity_text=t, entity_type=entity_type)
+                for t in texts]
+    db.add_all(entities)
+    db.commit()
+    return entities
+
+
+def postings(db):
+    return {(p.entity_key, p.file_id): p.mentions for p in db.query(EntityPosting).all()}
+
+
+class TestEntityPostings:
+    """Инкрементальное обновление постингов"""
+
+    def test_insert_update_delete(self, db):
+        first, second, _ = add_entities(db, "f0", ["ООО  Ромашка", "ооо ромашка", "Иванов И.И."])
+        assert postings(db) == {("ооо ромашка", "f0"): 2, ("иванов и.и.", "f0"): 1}
+
+        second.entity_text = "Петров П.П."
+        db.commit()
+        assert postings(db) == {("ооо ромашка", "f0"): 1, ("иванов и.и.", "f0"): 1, ("петров п.п.", "f0"): 1}
+
+        db.delete(first)
+        db.commit()
+        assert ("ооо ромашка", "f0") not in postings(db)
+
+    def test_reindex_file(self, db):
+        db.bulk_save_objects([
+            ExtractedEntity(case_id="case-1", file_id="f1", entity_text=t, entity_type="ORG")
+            for t in ["ПАО Банк", "пао банк", "ООО Лютик"]
+        ])
+        db.commit()
+        assert postings(db) == {}
+
+        assert reindex_file(db, "case-1", "f1") == 2
+        db.commit()
+        assert postings(db) == {("пао банк", "f1"): 2, ("ооо лютик", "f1"): 1}
+
+    def test_entity_key(self):
+        assert entity_key("  ООО\n«Ромашка» ") == "ооо «ромашка»"
+        assert entity_key("   ") == ""
+
+
+class TestRelatedDocuments:
+    """Поиск связанных документов с весами TF-IDF"""
+
+    def test_rare_entities_outweigh_ubiquitous_parties(self, db):
+        # Стороны дела упомянуты во всех файлах
+        for i in range(6):
+            add_entities(db, f"f{i}", ["ООО Ромашка", "ООО Лютик"])
+        add_entities(db, "f0", ["Договор № 17/3", "Склад на Лесной"])
+        add_entities(db, "f3", ["Договор № 17/3", "Склад на Лесной"])
+        add_entities(db, "f4", ["Склад на Лесной"])
+
+        related = find_related_by_entities(db, "case-1", "f0", limit=3)
+
+        assert [r.file_id for r in related] == ["f3", "f4", "f1"]
+        assert related[0].shared_entities == 4
+        assert related[0].score == pytest.approx(100.0)
+        # Общие только стороны - небольшая оценка
+        assert related[2].score < related[1].score / 2
+
+    def test_file_without_entities(self, db):
+        add_entities(db, "f1", ["ООО Ромашка"])
+
+        assert find_related_by_entities(db, "case-1", "f0") == []
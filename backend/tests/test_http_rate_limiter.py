@@ -0,0 +1,128 @@
+"""Тесты HTTP rate limiter с общим backend"""
+import asyncio
+from types import SimpleNamespace
+
+from app.core.rate_limiter import LocalRateLimitBackend, RateLimiter, RateLimitExceeded, rate_limit
+
+
+class SharedBackend(LocalRateLimitBackend):
+    """Общий backend с подсчётом обращений (как Redis/Postgres для нескольких воркеров)"""
+
+    name = "shared"
+    is_local = False
+
+    def __init__(self, max_keys=10000):
+        super().__init__(max_keys)
+        self.calls = 0
+
+    def consume(self, key, capacity, refill_rate, tokens=1):
+        self.calls += 1
+        return super().consume(key, capacity, refill_rate, tokens)
+
+
+class FailingBackend(SharedBackend):
+    def consume(self, key, capacity, refill_rate, tokens=1):
+        raise ConnectionError("backend down")
+
+
+class TestHTTPRateLimiter:
+    """Тесты RateLimiter"""
+
+    def test_lru_bounds_memory(self):
+        """Число бакетов в памяти ограничено max_keys"""
+        backend = LocalRateLimitBackend(max_keys=100)
+        limiter = RateLimiter(backend=backend, max_keys=100)
+
+        for i in range(1000):
+            limiter.check_rate_limit(user_id=f"user-{i}")
+
+        assert backend.stats()["keys"] == 100
+        # Недавно использованный ключ не вытеснен
+        assert "user:user-999" in backend._buckets
+        assert "global" in backend._buckets
+
+    def test_limit_is_shared_between_workers(self):
+        """Два воркера с общим backend вместе не превышают лимит"""
+        backend = SharedBackend()
+        workers = [RateLimiter(backend=backend), RateLimiter(backend=backend)]
+        for limiter in workers:
+            limiter._endpoint_configs["/api/upload"] = {"window_size": 3600, "max_requests": 20}
+
+        allowed = sum(
+            workers[i % 2].check_rate_limit(endpoint="/api/upload")[0]
+            for i in range(60)
+        )
+
+        assert allowed == 20
+
+    def test_lease_reduces_backend_calls(self):
+        """Токены берутся пачкой, backend вызывается не на каждый запрос"""
+        backend = SharedBackend()
+        limiter = RateLimiter(backend=backend)
+
+        for _ in range(50):
+            allowed, info = limiter.check_rate_limit(endpoint="/api/cases")
+            assert allowed
+
+        # global + endpoint, пачки по 10 токенов
+        assert backend.calls == 10
+        assert info["endpoint_remaining"] == 50
+
+    def test_denial_is_cached(self):
+        """После отказа backend не опрашивается до retry_after"""
+        backend = SharedBackend()
+        limiter = RateLimiter(backend=backend)
+        limiter._endpoint_configs["/api/upload"] = {"window_size": 3600, "max_requests": 2}
+
+        results = [limiter.check_rate_limit(endpoint="/api/upload") for _ in range(5)]
+        calls = backend.calls
+
+        assert [allowed for allowed, _ in results] == [True, True, False, False, False]
+        assert results[-1][1]["endpoint_allowed"] is False
+        assert results[-1][1]["retry_after"] >= 1
+        assert limiter.check_rate_limit(endpoint="/api/upload")[0] is False
+        assert backend.calls == calls
+
+    def test_backend_failure_fails_open(self):
+        """Недоступный backend не блокирует запросы"""
+        limiter = RateLimiter(backend=FailingBackend())
+
+        allowed, info = limiter.check_rate_limit(user_id="u1", endpoint="/api/upload")
+
+        assert allowed
+        assert info["user_allowed"] and info["endpoint_allowed"]
+
+    def test_async_check(self):
+        """acheck_rate_limit применяет те же лимиты"""
+        limiter = RateLimiter(backend=SharedBackend())
+        limiter._endpoint_configs["/json"] = {"window_size": 60, "max_requests": 3}
+
+        async def run():
+            return [(await limiter.acheck_rate_limit(endpoint="/json"))[0] for _ in range(4)]
+
+        assert asyncio.run(run()) == [True, True, True, False]
+        assert limiter.get_status()["backend"] == "shared"
+
+    def test_decorator_limit_shared_between_workers(self, monkeypatch):
+        """Ключ декоратора одинаков во всех процессах - лимит endpoint общий"""
+        backend = SharedBackend()
+        workers = [RateLimiter(backend=backend), RateLimiter(backend=backend)]
+
+        async def endpoint(request):
+            return "ok"
+
+        # Каждый воркер декорирует endpoint при импорте своего модуля
+        handlers = [rate_limit(max_requests=2, window_seconds=60)(endpoint) for _ in workers]
+        request = SimpleNamespace(client=SimpleNamespace(host="10.0.0.1"), state=SimpleNamespace())
+
+        async def run():
+            results = []
+            for i in range(4):
+                monkeypatch.setattr("app.core.rate_limiter.get_rate_limiter", lambda worker=workers[i % 2]: worker)
+                try:
+                    results.append(await handlers[i % 2](request))
+                except RateLimitExceeded:
+                    results.append("limited")
+            return results
+
+        assert asyncio.run(run()) == ["ok", "ok", "limited", "limited"]
@@ -0,0 +1,137 @@
+"""Тесты инкрементальной переиндексации"""
+import hashlib
+from types import SimpleNamespace
+
+from app.services.bm25_retriever import BM25Retriever
+from app.services.document_processor import DocumentProcessor
+from app.services.incremental_indexer import IncrementalIndexer
+from app.services.legal_splitter import LegalTextSplitter
+
+
+class FakeVectorStore:
+    """PGVector в памяти: uuid -> (case_id, file_id, embedding, document)"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get_indexed_files(self, case_id):
+        files = {}
+        for row_case, file_id, _, document in self.rows.values():
+            if row_case != case_id:
+                continue
+            hashes, count = files.get(file_id, (set(), 0))
+            hashes.add(document["metadata"].get("content_hash"))
+            files[file_id] = (hashes, count + 1)
+        return {
+            file_id: (next(iter(hashes)) if len(hashes) == 1 else None, count)
+            for file_id, (hashes, count) in files.items()
+        }
+
+    def get_file_chunk_embeddings(self, case_id, file_id):
+        return {
+            hashlib.md5(document["page_content"].encode("utf-8")).hexdigest(): embedding
+            for row_case, row_file, embedding, document in self.rows.values()
+            if row_case == case_id and row_file == file_id
+        }
+
+    def replace_file_chunks(self, case_id, file_id, chunks):
+        keep = set()
+        for chunk_id, embedding, document in chunks:
+            keep.add(chunk_id)
+            self.rows[chunk_id] = (case_id, file_id, embedding, document)
+        stale = [key for key, row in self.rows.items() if row[:2] == (case_id, file_id) and key not in keep]
+        for key in stale:
+            del self.rows[key]
+        return len(stale)
+
+    def delete_orphan_vectors(self, case_id, file_ids):
+        orphans = [key for key, row in self.rows.items() if row[0] == case_id and row[1] not in file_ids]
+        for key in orphans:
+            del self.rows[key]
+        return len(orphans)
+
+
+class FakeProcessor(DocumentProcessor):
+    def __init__(self):
+        self.text_splitter = LegalTextSplitter(chunk_size=200, chunk_overlap=0)
+        self.vector_store = FakeVectorStore()
+        self.bm25_retriever = BM25Retriever()
+        self.embedded = []
+
+    def create_embeddings(self, documents, batch_size=100):
+        self.embedded.extend(doc.page_content for doc in documents)
+        return [[0.1, 0.2] for _ in documents]
+
+
+def paragraph(n):
+    return f"Статья {n}. Стороны обязуются исполнить обязательства по договору номер {n} в срок."
+
+
+def make_file(file_id, paragraphs):
+    text = "\n\n".join(paragraph(n) for n in paragraphs)
+    return SimpleNamespace(id=file_id, filename=f"{file_id}.txt", file_type="txt", original_text=text)
+
+
+class TestIncrementalIndexer:
+    """Тесты IncrementalIndexer"""
+
+    def test_only_changed_file_is_touched(self):
+        """После изменения одного файла переиндексируется только он"""
+        processor = FakeProcessor()
+        indexer = IncrementalIndexer(processor)
+        files = [make_file(f"f{i}", range(i, i + 3)) for i in range(20)]
+
+        first = indexer.reindex_case("case-1", files)
+        rows_after_first = len(processor.vector_store.rows)
+        processor.embedded.clear()
+
+        files[7].original_text += "\n\nДополнительное соглашение о неустойке в размере одного процента."
+        second = indexer.reindex_case("case-1", files)
+
+        assert first["files_reindexed"] == 20
+        statuses = {f["file_id"]: f["status"] for f in second["files"]}
+        assert statuses.pop("f7") == "updated"
+        assert set(statuses.values()) == {"unchanged"}
+        # Переэмбеддится только новый текст, неизменённые чанки файла переиспользуют вектора
+        assert processor.embedded and all("неустойке" in text for text in processor.embedded)
+        assert len(processor.vector_store.rows) >= rows_after_first
+
+    def test_reindex_is_idempotent(self):
+        """Повторная переиндексация не плодит дубликаты и ничего не эмбеддит"""
+        processor = FakeProcessor()
+        indexer = IncrementalIndexer(processor)
+        files = [make_file("a", range(5))]
+
+        indexer.reindex_case("case-1", files)
+        rows = dict(processor.vector_store.rows)
+        processor.embedded.clear()
+        result = indexer.reindex_case("case-1", files, force=True)
+
+        assert processor.vector_store.rows.keys() == rows.keys()
+        assert processor.embedded == []
+        assert result["files"][0]["reused"] == result["files"][0]["chunks"]
+
+    def test_removed_text_and_files_are_deleted(self):
+        """Исчезнувшие чанки и чанки удалённых файлов удаляются"""
+        processor = FakeProcessor()
+        indexer = IncrementalIndexer(processor)
+        files = [make_file("a", range(6)), make_file("b", range(2))]
+        indexer.reindex_case("case-1", files)
+
+        shrunk = make_file("a", range(2))
+        result = indexer.reindex_case("case-1", [shrunk])
+
+        assert result["files"][0]["deleted"] > 0
+        assert result["orphan_chunks_removed"] > 0
+        assert {row[1] for row in processor.vector_store.rows.values()} == {"a"}
+        assert result["changed"]
+
+    def test_skips_files_without_text(self):
+        """Файлы без текста пропускаются со статусом skipped"""
+        processor = FakeProcessor()
+        empty = SimpleNamespace(id="e", filename="e.pdf", file_type="pdf", original_text=None)
+
+        result = IncrementalIndexer(processor).reindex_case("case-1", [empty])
+
+        assert result["files"] == [{"file_id": "e", "filename": "e.pdf", "status": "skipped", "chunks": 0}]
+        assert not result["changed"]
@@ -0,0 +1,187 @@
+"""Тесты фонового пайплайна загрузки (parse -> classify -> index)"""
+import asyncio
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Case, File, User, DocumentClassification, IngestionJob, IngestionFile
+from app.services.ingestion_pipeline import IngestionItem, IngestionPipeline
+
+
+def make_session_factory(db_path):
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(engine, tables=[
+        User.__table__, Case.__table__, File.__table__, DocumentClassification.__table__,
+        IngestionJob.__table__, IngestionFile.__table__,
+    ])
+    return sessionmaker(bind=engine)
+
+
+def create_job(session_factory, filenames):
+    db = session_factory()
+    case = Case(id="case-1", full_text="", num_documents=len(filenames), file_names=filenames)
+    job = IngestionJob(case_id=case.id, total_files=len(filenames))
+    db.add_all([case, job])
+    db.flush()
+    for name in filenames:
+        db.add(IngestionFile(job_id=job.id, case_id=case.id, filename=name, file_type="txt", storage_path=f"case-1/{name}"))
+    db.commit()
+    job_id = job.id
+    db.close()
+    return job_id
+
+
+class FakePipeline(IngestionPipeline):
+    """Пайплайн с поддельными стадиями вместо парсеров, LLM и pgvector"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stage_threads = set()
+
+    def parse_file(self, item):
+        self.stage_threads.add(threading.get_ident())
+        if item.filename == "broken.txt":
+            raise ValueError("cannot parse")
+        time.sleep(0.05)
+        item.text = f"text of {item.filename}"
+
+    def classify_file(self, item):
+        item.classification = {"doc_type": "contract", "tags": [], "confidence": 0.9, "needs_human_review": False}
+
+    def index_file(self, item):
+        db = self.session_factory()
+        try:
+            file_model = File(case_id=item.case_id, filename=item.filename, file_type=item.file_type, original_text=item.text)
+            db.add(file_model)
+            db.commit()
+            item.file_id = file_model.id
+        finally:
+            db.close()
+
+
+class TestIngestionPipeline:
+    """Тесты IngestionPipeline"""
+
+    def test_files_processed_and_case_finalized(self, tmp_path):
+        """Все файлы проходят стадии, Case.full_text собирается после завершения"""
+        session_factory = make_session_factory(tmp_path / "ingestion.db")
+        job_id = create_job(session_factory, ["a.txt", "b.txt", "broken.txt"])
+        pipeline = FakePipeline(session_factory=session_factory, workers_per_stage=2, queue_size=1, max_threads=2)
+
+        async def run():
+            events = pipeline.progress.subscribe(job_id)
+            await pipeline.submit(job_id)
+            await pipeline.join()
+            await pipeline.stop()
+            collected = []
+            while not events.empty():
+                collected.append(events.get_nowait())
+            return collected
+
+        events = asyncio.run(run())
+
+        db = session_factory()
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).one()
+        case = db.query(Case).filter(Case.id == "case-1").one()
+        statuses = {f.filename: f.status for f in job.files}
+        db.close()
+
+        assert job.status == "completed"
+        assert job.processed_files == 2
+        assert job.failed_files == 1
+        assert statuses == {"a.txt": "completed", "b.txt": "completed", "broken.txt": "failed"}
+        assert "[a.txt]" in case.full_text and "[b.txt]" in case.full_text
+        assert events[-1]["type"] == "job_completed"
+        assert any(e.get("stage") == "parsing" and e.get("status") == "processing" for e in events)
+
+    def test_submit_does_not_block_event_loop(self, tmp_path):
+        """submit возвращается сразу, блокирующие стадии выполняются вне event loop"""
+        session_factory = make_session_factory(tmp_path / "ingestion.db")
+        job_id = create_job(session_factory, [f"f{i}.txt" for i in range(6)])
+        pipeline = FakePipeline(session_factory=session_factory, workers_per_stage=1, queue_size=1, max_threads=2)
+
+        async def run():
+            loop_thread = threading.get_ident()
+            start = time.monotonic()
+            await pipeline.submit(job_id)
+            submit_time = time.monotonic() - start
+
+            # Event loop остаётся отзывчивым, пока идёт парсинг
+            ticks = 0
+            while pipeline._feeders or any(q.qsize() for q in pipeline._queues.values()):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            await pipeline.join()
+            await pipeline.stop()
+            return loop_thread, submit_time, ticks
+
+        loop_thread, submit_time, ticks = asyncio.run(run())
+
+        assert submit_time < 0.1
+        assert ticks > 0
+        assert loop_thread not in pipeline.stage_threads
+
+    def test_resumed_indexing_reuses_file_records(self, tmp_path):
+        """Повторная индексация файла после рестарта не дублирует File и классификацию"""
+        session_factory = make_session_factory(tmp_path / "ingestion.db")
+        job_id = create_job(session_factory, ["a.txt"])
+        pipeline = IngestionPipeline(session_factory=session_factory)
+        db = session_factory()
+        ingestion_file = db.query(IngestionFile).filter(IngestionFile.job_id == job_id).one()
+        item = IngestionItem(
+            ingestion_file_id=ingestion_file.id, job_id=job_id, case_id="case-1",
+            filename="a.txt", file_type="txt", storage_path="case-1/a.txt", text="text",
+            classification={"doc_type": "contract", "tags": [], "confidence": 0.9},
+        )
+        db.close()
+
+        for confidence in (0.9, 0.95):
+            item.classification["confidence"] = confidence
+            db = session_factory()
+            pipeline._save_file_records(db, item, b"text")
+            db.close()
+
+        db = session_factory()
+        files = db.query(File).all()
+        classifications = db.query(DocumentClassification).all()
+        linked = db.query(IngestionFile).filter(IngestionFile.job_id == job_id).one().file_id
+        db.close()
+        assert len(files) == 1 and linked == files[0].id == item.file_id
+        assert len(classifications) == 1 and classifications[0].confidence == "0.95"
+
+    def test_local_classifier_refetched_per_job(self, tmp_path, monkeypatch):
+        """Каждое новое задание запрашивает локальный классификатор заново (переобучение по расписанию)"""
+        from app.services import document_classifier_service, local_document_classifier
+
+        fetched = []
+
+        class FakeClassifierService:
+            def __init__(self, db=None):
+                self.local_classifier = "initial"
+
+            def classify_document(self, text, filename, case_context=None):
+                return {"doc_type": "contract", "local": self.local_classifier}
+
+        def fake_get_local_classifier(db=None):
+            fetched.append(db is not None)
+            return f"refreshed-{len(fetched)}"
+
+        monkeypatch.setattr(document_classifier_service, "DocumentClassifierService", FakeClassifierService)
+        monkeypatch.setattr(local_document_classifier, "get_local_classifier", fake_get_local_classifier)
+        pipeline = IngestionPipeline(session_factory=make_session_factory(tmp_path / "ingestion.db"))
+
+        def classify(job_id):
+            item = IngestionItem(ingestion_file_id="f", job_id=job_id, case_id="case-1", filename="a.txt",
+                                 file_type="txt", storage_path="case-1/a.txt", text="text")
+            pipeline.classify_file(item)
+            return item.classification["local"]
+
+        assert [classify("job-1"), classify("job-1"), classify("job-2"), classify("job-2")] == [
+            "initial", "initial", "refreshed-1", "refreshed-1",
+        ]
+        assert fetched == [True]
@@ -0,0 +1,293 @@
+"""Тесты durable-очереди задач"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Case, File, User, TabularReview, TabularColumn, TabularCell
+from app.services import tabular_review_service
+from app.services.job_queue import (
+    ClaimedJob,
+    JobCancelled,
+    JobContext,
+    JobQueue,
+    JobWorker,
+    PermanentJobError,
+)
+
+
+class FakeQueue:
+    """Очередь в памяти: фиксирует переходы статусов, heartbeat возвращает заданный ответ"""
+
+    def __init__(self, jobs, heartbeat_answer=False, lease_seconds=0.15):
+        self.jobs = list(jobs)
+        self.heartbeat_answer = heartbeat_answer
+        self.lease_seconds = lease_seconds
+        self.events = []
+        self.heartbeats = 0
+
+    def claim(self, worker_id):
+        return self.jobs.pop(0) if self.jobs else None
+
+    def heartbeat(self, job_id, worker_id):
+        self.heartbeats += 1
+        return self.heartbeat_answer
+
+    def complete(self, job_id, worker_id, result=None):
+        self.events.append(("completed", job_id, result))
+
+    def fail(self, job_id, worker_id, error, retry=True, delay=0.0):
+        self.events.append(("failed", job_id, retry, delay))
+        return "queued" if retry else "failed"
+
+    def mark_cancelled(self, job_id, worker_id):
+        self.events.append(("cancelled", job_id))
+
+    def retry_delay(self, attempts):
+        return JobQueue(retry_base_seconds=10).retry_delay(attempts)
+
+
+def job(job_type="test", attempts=1, payload=None):
+    return ClaimedJob(id=f"job-{job_type}", job_type=job_type, payload=payload or {}, case_id="c1",
+                      user_id="u1", attempts=attempts, max_attempts=3)
+
+
+class TestJobWorker:
+    """Тесты JobWorker на очереди в памяти"""
+
+    def test_success_and_async_handler(self):
+        """Результат sync и async обработчиков сохраняется"""
+        async def extract(ctx):
+            return {"saved_count": 3, "review_id": ctx.payload["review_id"]}
+
+        queue = FakeQueue([job("sync"), job("async", payload={"review_id": "r1"})])
+        worker = JobWorker(queue, handlers={"sync": lambda ctx: "ok", "async": extract})
+
+        assert worker.run_once() and worker.run_once()
+        assert not worker.run_once()
+        assert queue.events == [
+            ("completed", "job-sync", "ok"),
+            ("completed", "job-async", {"saved_count": 3, "review_id": "r1"}),
+        ]
+
+    def test_retry_with_backoff(self):
+        """Ошибка - повтор с экспоненциальной задержкой, PermanentJobError - без повтора"""
+        def flaky(ctx):
+            raise ConnectionError("LLM timeout")
+
+        def missing(ctx):
+            raise PermanentJobError("review not found")
+
+        queue = FakeQueue([job("flaky", attempts=3), job("missing")])
+        worker = JobWorker(queue, handlers={"flaky": flaky, "missing": missing})
+        worker.run_once()
+        worker.run_once()
+
+        assert queue.events == [("failed", "job-flaky", True, 40), ("failed", "job-missing", False, 10)]
+
+    def test_cancellation_via_heartbeat(self):
+        """Запрос отмены приходит с heartbeat и прерывает обработчик"""
+        def long_running(ctx):
+            for _ in range(100):
+                ctx.check_cancelled()
+                time.sleep(0.02)
+            return "finished"
+
+        queue = FakeQueue([job("long")], heartbeat_answer=True, lease_seconds=0.09)
+        JobWorker(queue, handlers={"long": long_running}).run_once()
+
+        assert queue.events == [("cancelled", "job-long")]
+
+    def test_heartbeats_extend_lease(self):
+        """Во время выполнения воркер продлевает аренду"""
+        queue = FakeQueue([job("slow")], lease_seconds=0.06)
+        JobWorker(queue, handlers={"slow": lambda ctx: time.sleep(0.2)}).run_once()
+
+        assert queue.heartbeats >= 3
+        assert queue.events[0][0] == "completed"
+
+    def test_lost_lease_discards_result(self):
+        """Если задачу забрал другой воркер, результат не записывается"""
+        def handler(ctx):
+            time.sleep(0.1)
+            assert ctx.cancelled
+            return "stale"
+
+        queue = FakeQueue([job("lost")], heartbeat_answer=None, lease_seconds=0.06)
+        JobWorker(queue, handlers={"lost": handler}).run_once()
+
+        assert queue.events == []
+
+    def test_unknown_job_type_fails(self):
+        queue = FakeQueue([job("unknown")])
+        JobWorker(queue, handlers={}).run_once()
+
+        assert queue.events == [("failed", "job-unknown", False, 0.0)]
+
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def pg_queue():
+    """JobQueue на локальном Postgres (таблица background_jobs без внешних ключей)"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    engine = create_engine(TEST_DATABASE_URL)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS background_jobs"))
+        conn.execute(text("""
+            CREATE TABLE background_jobs (
+                id VARCHAR(36) PRIMARY KEY, job_type VARCHAR(100) NOT NULL, case_id VARCHAR(36),
+                user_id VARCHAR(36), payload JSON NOT NULL DEFAULT '{}', status VARCHAR(50) NOT NULL DEFAULT 'queued',
+                priority INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3, run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                worker_id VARCHAR(255), lease_expires_at TIMESTAMPTZ, heartbeat_at TIMESTAMPTZ,
+                cancel_requested BOOLEAN NOT NULL DEFAULT FALSE, result JSON, error_message TEXT,
+                created_at TIMESTAMPTZ DEFAULT NOW(), started_at TIMESTAMPTZ, finished_at TIMESTAMPTZ
+            )
+        """))
+    yield JobQueue(engine=engine, lease_seconds=0.5, case_concurrency=1, retry_base_seconds=0.2)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS background_jobs"))
+    engine.dispose()
+
+
+class TestPostgresJobQueue:
+    """Тесты JobQueue на реальном Postgres (нужен TEST_DATABASE_URL)"""
+
+    def test_skip_locked_and_case_cap(self, pg_queue):
+        """Задачу забирает один воркер, на одно дело - не больше case_concurrency"""
+        a1 = pg_queue.enqueue("t", case_id="a")
+        pg_queue.enqueue("t", case_id="a")
+        b1 = pg_queue.enqueue("t", case_id="b")
+
+        first = pg_queue.claim("w1")
+        second = pg_queue.claim("w2")
+
+        assert {first.id, second.id} == {a1, b1}
+        assert pg_queue.claim("w3") is None
+
+    def test_expired_lease_is_reclaimed(self, pg_queue):
+        """Задача упавшего воркера забирается заново после истечения аренды"""
+        job_id = pg_queue.enqueue("t")
+        assert pg_queue.claim("crashed").id == job_id
+        assert pg_queue.claim("w2") is None
+
+        time.sleep(0.6)
+        reclaimed = pg_queue.claim("w2")
+
+        assert reclaimed.id == job_id and reclaimed.attempts == 2
+        assert pg_queue.heartbeat(job_id, "crashed") is None
+        assert pg_queue.complete(job_id, "w2", {"ok": True})
+        assert pg_queue.get_status(job_id)["result"] == {"ok": True}
+
+    def test_retry_backoff_and_cancel(self, pg_queue):
+        """Повтор откладывается на run_after, queued-задача отменяется сразу"""
+        job_id = pg_queue.enqueue("t", max_attempts=2)
+        claimed = pg_queue.claim("w1")
+        assert pg_queue.fail(job_id, "w1", "boom", delay=pg_queue.retry_delay(claimed.attempts)) == "queued"
+        assert pg_queue.claim("w1") is None
+
+        time.sleep(0.25)
+        assert pg_queue.claim("w1").attempts == 2
+        assert pg_queue.fail(job_id, "w1", "boom again") == "failed"
+
+        queued = pg_queue.enqueue("t")
+        assert pg_queue.cancel(queued) == "cancelled"
+        assert pg_queue.claim("w1") is None
+
+    def test_failure_after_cancel_request_is_cancelled(self, pg_queue):
+        """Ошибка running-задачи с запрошенной отменой не возвращает её в queued"""
+        job_id = pg_queue.enqueue("t", max_attempts=3)
+        pg_queue.claim("w1")
+        assert pg_queue.cancel(job_id) == "running"
+
+        assert pg_queue.fail(job_id, "w1", "interrupted") == "cancelled"
+        assert pg_queue.get_status(job_id)["status"] == "cancelled"
+
+    def test_worker_in_process_with_fake_llm(self, pg_queue):
+        """Воркер выполняет задачи, ретраит сбой LLM и отменяет running-задачу"""
+        calls = {"flaky": 0}
+        started = threading.Event()
+
+        def flaky_llm(ctx):
+            calls["flaky"] += 1
+            if calls["flaky"] == 1:
+                raise TimeoutError("LLM timeout")
+            return {"answer": "ok"}
+
+        def long_llm(ctx):
+            started.set()
+            while True:
+                ctx.check_cancelled()
+                time.sleep(0.02)
+
+        worker = JobWorker(pg_queue, concurrency=2, poll_interval=0.05,
+                           handlers={"flaky": flaky_llm, "long": long_llm})
+        flaky_id = pg_queue.enqueue("flaky", case_id="a")
+        long_id = pg_queue.enqueue("long", case_id="b")
+        worker.start()
+        try:
+            assert started.wait(5)
+            assert pg_queue.cancel(long_id) == "running"
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                statuses = {pg_queue.get_status(i)["status"] for i in (flaky_id, long_id)}
+                if statuses == {"completed", "cancelled"}:
+                    break
+                time.sleep(0.05)
+        finally:
+            worker.stop(5)
+
+        assert pg_queue.get_status(flaky_id)["result"] == {"answer": "ok"}
+        assert pg_queue.get_status(long_id)["status"] == "cancelled"
+        assert calls["flaky"] == 2
+
+    def test_job_cancelled_is_exception(self):
+        assert issubclass(JobCancelled, Exception)
+
+
+class TestHandlerCancellation:
+    """Обработчики прерываются по отмене, не дожидаясь конца работы"""
+
+    def test_tabular_extraction_cancelled_between_cells(self, tmp_path, monkeypatch):
+        engine = create_engine(f"sqlite:///{tmp_path / 'tabular.db'}")
+        Base.metadata.create_all(engine, tables=[
+            User.__table__, Case.__table__, File.__table__,
+            TabularReview.__table__, TabularColumn.__table__, TabularCell.__table__,
+        ])
+        db = sessionmaker(bind=engine)()
+        db.add(Case(id="case-1", full_text="", num_documents=1, file_names=["a.pdf"]))
+        db.add(File(id="file-a", case_id="case-1", filename="a.pdf", file_type="pdf", original_text=""))
+        db.add(TabularReview(id="review-1", case_id="case-1", user_id="user-1", name="Review"))
+        db.add(TabularColumn(id="col-1", tabular_review_id="review-1", column_label="Сумма", column_type="currency",
+                             prompt="?", order_index=0))
+        db.commit()
+        monkeypatch.setattr(tabular_review_service, "CANCEL_CHECK_INTERVAL_SECONDS", 0.05)
+        service = tabular_review_service.TabularReviewService(db)
+        interrupted = []
+
+        async def slow_cell(file, column):
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                interrupted.append(file.id)
+                raise
+
+        monkeypatch.setattr(service, "extract_cell_value_smart", slow_cell)
+        ctx = JobContext(job("tabular.run_extraction"))
+        threading.Timer(0.2, ctx._cancel.set).start()
+        started = time.monotonic()
+
+        with pytest.raises(JobCancelled):
+            asyncio.run(service.run_extraction("review-1", "user-1", check_cancelled=ctx.check_cancelled))
+
+        assert time.monotonic() - started < 5
+        assert interrupted == ["file-a"]
+        assert db.get(TabularReview, "review-1").status == "draft"
+        db.close()
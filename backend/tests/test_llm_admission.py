@@ -0,0 +1,276 @@
+"""Тесты admission controller для вызовов LLM"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.rate_limiter import (
+    AdmissionControlledLLM,
+    LLMAdmissionController,
+    LLMPriority,
+    current_llm_priority,
+    llm_priority,
+)
+
+
+async def hold(controller, order, name, priority, user_id=None, duration=0.0):
+    async with controller.admit(priority=priority, user_id=user_id):
+        order.append(name)
+        await asyncio.sleep(duration)
+
+
+class FakeLLM:
+    """LLM с фиксированной задержкой ответа"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lanes = []
+
+    def invoke(self, prompt, config=None, **kwargs):
+        self.lanes.append(current_llm_priority())
+        time.sleep(self.delay)
+        return "ok"
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        self.lanes.append(current_llm_priority())
+        await asyncio.sleep(self.delay)
+        return "ok"
+
+
+class TestLLMAdmissionController:
+    """Тесты LLMAdmissionController"""
+
+    def test_waiting_does_not_block_event_loop(self):
+        """Ожидание бюджета запросов не блокирует event loop"""
+        controller = LLMAdmissionController(requests_per_second=10, max_bucket_size=1)
+        ticks = []
+
+        async def ticker():
+            for _ in range(10):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def run():
+            ticker_task = asyncio.create_task(ticker())
+            for _ in range(3):
+                async with controller.admit():
+                    pass
+            await ticker_task
+
+        started = time.monotonic()
+        asyncio.run(run())
+
+        # 3 запроса при 10 rps и ведре 1 - около 0.2 с ожидания, ticker при этом работал
+        assert time.monotonic() - started >= 0.15
+        assert len(ticks) == 10
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1
+
+    def test_priority_lanes(self):
+        """Интерактивный вызов допускается раньше ожидающих фоновых"""
+        controller = LLMAdmissionController(max_concurrent=1)
+        order = []
+
+        async def run():
+            blocker = asyncio.create_task(hold(controller, order, "blocker", LLMPriority.BULK, duration=0.05))
+            await asyncio.sleep(0)
+            tasks = [asyncio.create_task(hold(controller, order, f"bulk-{i}", LLMPriority.BULK)) for i in range(3)]
+            tasks.append(asyncio.create_task(hold(controller, order, "workflow", LLMPriority.WORKFLOW)))
+            tasks.append(asyncio.create_task(hold(controller, order, "chat", LLMPriority.INTERACTIVE)))
+            await asyncio.sleep(0.01)
+            assert controller.queue_depth() == {"interactive": 1, "workflow": 1, "bulk": 3}
+            await asyncio.gather(blocker, *tasks)
+
+        asyncio.run(run())
+
+        assert order == ["blocker", "chat", "workflow", "bulk-0", "bulk-1", "bulk-2"]
+
+    def test_fair_queuing_between_users(self):
+        """Внутри полосы пользователи обслуживаются по кругу"""
+        controller = LLMAdmissionController(max_concurrent=1)
+        order = []
+
+        async def run():
+            blocker = asyncio.create_task(hold(controller, order, "blocker", LLMPriority.BULK, duration=0.02))
+            await asyncio.sleep(0)
+            tasks = [asyncio.create_task(hold(controller, order, f"a{i}", LLMPriority.BULK, "user-a")) for i in range(3)]
+            tasks.append(asyncio.create_task(hold(controller, order, "b0", LLMPriority.BULK, "user-b")))
+            await asyncio.gather(blocker, *tasks)
+
+        asyncio.run(run())
+
+        assert order == ["blocker", "a0", "b0", "a1", "a2"]
+
+    def test_interactive_latency_during_bulk_extraction(self):
+        """Массовое извлечение не занимает зарезервированные слоты чата"""
+        controller = LLMAdmissionController(max_concurrent=4, reserved_interactive_slots=1)
+        llm = AdmissionControlledLLM(FakeLLM(delay=0.02), controller)
+        peak_bulk = []
+
+        @llm_priority(LLMPriority.BULK)
+        async def extract_cells(user_id):
+            async def cell():
+                await llm.ainvoke("Извлеки значение")
+                peak_bulk.append(controller.in_flight)
+            await asyncio.gather(*(cell() for _ in range(60)))
+
+        async def run():
+            extraction = asyncio.create_task(extract_cells("user-1"))
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            await llm.ainvoke("Вопрос из чата")
+            chat_latency = time.monotonic() - started
+            await extraction
+            return chat_latency
+
+        chat_latency = asyncio.run(run())
+
+        assert chat_latency < 0.05
+        assert max(peak_bulk) <= 3
+        stats = controller.get_stats()
+        assert stats["lanes"]["bulk"]["admitted"] == 60
+        assert stats["lanes"]["interactive"]["admitted"] == 1
+
+    def test_token_budget(self):
+        """Вызов ждёт пополнения бюджета токенов"""
+        controller = LLMAdmissionController(tokens_per_minute=6000)
+
+        async def run():
+            first = await controller.acquire(estimated_tokens=6000)
+            controller.release(first)
+            with pytest.raises(asyncio.TimeoutError):
+                await controller.acquire(estimated_tokens=50, timeout=0.1)
+            assert controller.queue_depth()["interactive"] == 0
+            second = await controller.acquire(estimated_tokens=50, timeout=1.0)
+            controller.release(second, used_tokens=30)
+
+        asyncio.run(run())
+
+    def test_sync_invoke_from_thread_is_admitted(self):
+        """Синхронный invoke из рабочего потока проходит через общую очередь"""
+        controller = LLMAdmissionController(max_concurrent=1)
+        fake = FakeLLM(delay=0.02)
+        llm = AdmissionControlledLLM(fake, controller)
+
+        @llm_priority(LLMPriority.WORKFLOW)
+        async def step():
+            return await asyncio.gather(*(asyncio.to_thread(llm.invoke, "prompt") for _ in range(3)))
+
+        async def run():
+            await llm.ainvoke("warmup")
+            return await step()
+
+        assert asyncio.run(run()) == ["ok"] * 3
+        stats = controller.get_stats()
+        assert stats["lanes"]["workflow"]["admitted"] == 3
+        assert stats["in_flight"] == 0
+        assert fake.lanes[1:] == [LLMPriority.WORKFLOW] * 3
+
+    def test_cancelled_waiter_leaves_queue(self):
+        """Отменённый вызов удаляется из очереди"""
+        controller = LLMAdmissionController(max_concurrent=1)
+
+        async def run():
+            first = await controller.acquire()
+            waiter = asyncio.create_task(controller.acquire(priority=LLMPriority.BULK))
+            await asyncio.sleep(0)
+            assert controller.queue_depth()["bulk"] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert controller.queue_depth()["bulk"] == 0
+            controller.release(first)
+            assert controller.in_flight == 0
+
+        asyncio.run(run())
+
+    def test_waiters_in_different_loops(self):
+        """Ожидающий в другом event loop будится при освобождении слота"""
+        controller = LLMAdmissionController(max_concurrent=1)
+        first_admitted = threading.Event()
+        release_first = threading.Event()
+        latency = []
+
+        def holder():
+            async def run():
+                ticket = await controller.acquire(priority=LLMPriority.BULK)
+                first_admitted.set()
+                await asyncio.to_thread(release_first.wait)
+                controller.release(ticket)
+            asyncio.run(run())
+
+        def waiter():
+            async def run():
+                ticket = await controller.acquire(timeout=2.0)
+                latency.append(time.monotonic() - released_at)
+                controller.release(ticket)
+            asyncio.run(run())
+
+        threads = [threading.Thread(target=holder)]
+        threads[0].start()
+        assert first_admitted.wait(1.0)
+        threads.append(threading.Thread(target=waiter))
+        threads[1].start()
+        time.sleep(0.05)
+        assert controller.queue_depth()["interactive"] == 1
+        released_at = time.monotonic()
+        release_first.set()
+        for thread in threads:
+            thread.join(2.0)
+
+        assert len(latency) == 1 and latency[0] < 0.5
+        assert controller.in_flight == 0
+
+    def test_sync_acquire_without_loop_waits_for_slot(self):
+        """acquire_sync без event loop не обходит очередь"""
+        controller = LLMAdmissionController(max_concurrent=1)
+        first = controller.acquire_sync()
+        admitted = threading.Event()
+
+        def second():
+            ticket = controller.acquire_sync(priority=LLMPriority.BULK)
+            admitted.set()
+            controller.release(ticket)
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not admitted.wait(0.1)
+        assert controller.queue_depth()["bulk"] == 1
+
+        controller.release(first)
+        thread.join(1.0)
+        assert admitted.is_set()
+        assert controller.in_flight == 0
+        assert controller.get_stats()["lanes"]["bulk"]["admitted"] == 1
+
+    def test_sync_acquire_in_loop_thread_does_not_block(self):
+        """Синхронный вызов из потока event loop не ждёт слот, но учитывается"""
+        controller = LLMAdmissionController(max_concurrent=1)
+        llm = AdmissionControlledLLM(FakeLLM(), controller)
+
+        async def run():
+            first = await controller.acquire()
+            started = time.monotonic()
+            assert llm.invoke("prompt") == "ok"
+            assert time.monotonic() - started < 0.5
+            assert controller.in_flight == 1
+            controller.release(first)
+
+        asyncio.run(run())
+        assert controller.in_flight == 0
+        assert controller.get_stats()["lanes"]["interactive"]["admitted"] == 2
+
+    def test_chain_with_prompt_template(self):
+        """Обёртка работает в цепочке prompt | llm | parser и проходит допуск"""
+        from langchain_core.language_models import FakeListChatModel
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate
+
+        controller = LLMAdmissionController(max_concurrent=1)
+        llm = AdmissionControlledLLM(FakeListChatModel(responses=["план", "план"]), controller)
+        chain = ChatPromptTemplate.from_messages([("human", "{task}")]) | llm | StrOutputParser()
+
+        assert chain.invoke({"task": "задача"}) == "план"
+        assert asyncio.run(chain.ainvoke({"task": "задача"})) == "план"
+        assert controller.get_stats()["lanes"]["interactive"]["admitted"] == 2
+        assert controller.in_flight == 0
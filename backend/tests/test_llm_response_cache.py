@@ -0,0 +1,166 @@
+"""Тесты кэша ответов LLM"""
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+
+from app.services import llm_response_cache
+from app.services.llm_response_cache import CachedLLM, LLMResponseCache
+from app.services.query_condenser import QueryCondenserService
+
+
+class Classification(BaseModel):
+    label: str
+    confidence: float
+
+
+class FakeLLM:
+    """LLM, считающий обращения"""
+
+    def __init__(self, answer="ответ"):
+        self.answer = answer
+        self.calls = 0
+
+    def invoke(self, input, config=None, **kwargs):
+        self.calls += 1
+        return AIMessage(content=self.answer)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return self.invoke(input, config, **kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        parent = self
+
+        class Structured:
+            def invoke(self, input, config=None, **kwargs):
+                parent.calls += 1
+                return {"raw": AIMessage(content="{}"), "parsed": schema(label="task", confidence=0.9), "parsing_error": None}
+
+        return Structured()
+
+
+class FakeStore:
+    """Persistent tier в памяти (общий для нескольких LLMResponseCache)"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def set(self, key, namespace, payload, ttl):
+        self.rows[key] = payload
+
+
+def cached(llm, cache=None, namespace="gigachat:0.0", ttl=60):
+    return CachedLLM(llm, cache or LLMResponseCache(max_entries=100), namespace=namespace, ttl=ttl)
+
+
+class TestLLMResponseCache:
+    """Тесты LLMResponseCache и CachedLLM"""
+
+    def test_repeated_call_costs_no_tokens(self):
+        """Повторный вызов с теми же сообщениями не обращается к модели"""
+        fake = FakeLLM()
+        llm = cached(fake)
+        messages = [SystemMessage(content="Классифицируй"), HumanMessage(content="Извлеки даты")]
+
+        first = llm.invoke(messages)
+        second = llm.invoke(list(messages))
+        other = llm.invoke([SystemMessage(content="Классифицируй"), HumanMessage(content="Что в договоре?")])
+
+        assert fake.calls == 2
+        assert second.content == first.content
+        assert second is not first
+        assert other.content == "ответ"
+
+    def test_namespace_and_params_are_part_of_key(self):
+        """Другая температура/модель и параметры вызова - другой ключ"""
+        fake = FakeLLM()
+        cache = LLMResponseCache()
+
+        cached(fake, cache, namespace="gigachat:0.0").invoke("вопрос")
+        cached(fake, cache, namespace="gigachat:0.7").invoke("вопрос")
+        cached(fake, cache, namespace="gigachat:0.0").invoke("вопрос", stop=["\n"])
+        cached(fake, cache, namespace="gigachat:0.0").invoke("вопрос")
+
+        assert fake.calls == 3
+
+    def test_structured_output_is_cached(self):
+        """Structured output (pydantic + raw message) восстанавливается из кэша"""
+        fake = FakeLLM()
+        llm = cached(fake).with_structured_output(Classification, include_raw=True)
+
+        first = llm.invoke("Извлеки даты")
+        second = llm.invoke("Извлеки даты")
+
+        assert fake.calls == 1
+        assert isinstance(second["parsed"], Classification)
+        assert second["parsed"] == first["parsed"]
+        assert isinstance(second["raw"], AIMessage)
+
+    def test_persistent_tier_is_shared(self):
+        """Ответ, сохранённый одним воркером, находится другим"""
+        store = FakeStore()
+        fake = FakeLLM()
+
+        cached(fake, LLMResponseCache(store=store)).invoke("вопрос")
+        other_worker = LLMResponseCache(store=store)
+        cached(fake, other_worker).invoke("вопрос")
+
+        assert fake.calls == 1
+        assert other_worker.get_stats()["persistent_hits"] == 1
+
+    def test_lru_and_ttl(self, monkeypatch):
+        """Память ограничена max_entries, записи истекают по TTL"""
+        now = [1000.0]
+        monkeypatch.setattr(llm_response_cache.time, "time", lambda: now[0])
+        fake = FakeLLM()
+        cache = LLMResponseCache(max_entries=2)
+        llm = cached(fake, cache, ttl=10)
+
+        for question in ("a", "b", "c"):
+            llm.invoke(question)
+        assert cache.get_stats()["entries"] == 2
+        llm.invoke("a")
+        assert fake.calls == 4
+
+        llm.invoke("c")
+        assert fake.calls == 4
+        now[0] += 11
+        llm.invoke("c")
+        assert fake.calls == 5
+
+    def test_bypass_with_zero_ttl(self):
+        """cache_ttl=0 в вызове идёт мимо кэша"""
+        fake = FakeLLM()
+        llm = cached(fake)
+
+        llm.invoke("вопрос")
+        llm.invoke("вопрос", cache_ttl=0)
+
+        assert fake.calls == 2
+
+    def test_chain_with_prompt(self):
+        """CachedLLM работает в цепочке prompt | llm (sync и async)"""
+        fake = FakeLLM()
+        chain = ChatPromptTemplate.from_template("Задача: {task}") | cached(fake)
+
+        async def run():
+            return await chain.ainvoke({"task": "сравни документы"})
+
+        assert chain.invoke({"task": "сравни документы"}).content == "ответ"
+        assert asyncio.run(run()).content == "ответ"
+        assert fake.calls == 1
+
+    def test_multi_query_expansion_reuses_answers(self):
+        """Повторное расширение запроса не тратит токены"""
+        fake = FakeLLM(answer="Какие сроки в договоре?\nСроки исполнения обязательств")
+        condenser = QueryCondenserService(llm=cached(fake))
+
+        first = condenser.generate_multi_queries("Какие сроки?", 2)
+        second = condenser.generate_multi_queries("Какие сроки?", 2)
+
+        assert first == second == ["Какие сроки?", "Какие сроки в договоре?", "Сроки исполнения обязательств"]
+        assert fake.calls == 1
@@ -0,0 +1,162 @@
+"""Тесты локального классификатора документов и эскалации к LLM"""
+import random
+from unittest.mock import Mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.analysis import DocumentClassification
+from app.models.case import Base, Case, File
+from app.models.user import User
+from app.services.local_document_classifier import (
+    UNCALIBRATED_MODEL_CONFIDENCE,
+    LocalDocumentClassifier,
+    content_hash,
+)
+from app.services.document_classifier_service import DocumentClassifierService
+from app.services.external_sources.cache_manager import CacheManager
+
+
+CLAIM_TEXT = """В Арбитражный суд города Москвы
+Истец: ООО "Ромашка"
+Ответчик: ООО "Лютик"
+
+ИСКОВОЕ ЗАЯВЛЕНИЕ
+о взыскании задолженности по договору поставки
+"""
+
+UNCLEAR_TEXT = "Просим рассмотреть прилагаемые материалы и сообщить позицию по существу вопроса."
+
+
+def make_service(local_classifier=None):
+    service = DocumentClassifierService(cache=CacheManager())
+    if local_classifier is not None:
+        service.local_classifier = local_classifier
+    return service
+
+
+class TestLocalDocumentClassifier:
+    """Тесты LocalDocumentClassifier"""
+
+    def test_rules_detect_statement_of_claim(self):
+        """Заголовок искового заявления распознаётся правилами"""
+        result = LocalDocumentClassifier().predict(CLAIM_TEXT)
+
+        assert result["doc_type"] == "statement_of_claim"
+        assert result["confidence"] >= 0.85
+
+    def test_counterclaim_beats_generic_claim(self):
+        """Более специфичное правило выигрывает у общего"""
+        result = LocalDocumentClassifier().predict("ВСТРЕЧНОЕ ИСКОВОЕ ЗАЯВЛЕНИЕ\nо признании договора недействительным")
+
+        assert result["doc_type"] == "counterclaim"
+
+    def test_model_trained_on_history(self):
+        """Модель, обученная на истории, классифицирует документы без правил"""
+        classifier = LocalDocumentClassifier()
+        classifier.fit(
+            [("Счёт на оплату товара поставщик покупатель итого НДС", "invoice")] * 5
+            + [("Уважаемый коллега направляем письмо ответ на ваш запрос", "correspondence")] * 5
+        )
+
+        result = classifier.predict("Счёт на оплату: поставщик, покупатель, итого с НДС")
+
+        assert classifier.is_trained
+        assert result["doc_type"] == "invoice"
+
+    def test_confidence_calibrated_on_holdout(self):
+        """Уверенность модели - доля верных ответов на отложенной выборке, а не ~1.0"""
+        rng = random.Random(7)
+        shared = ["договор", "стороны", "оплата", "срок", "поставка", "претензии", "услуги", "сумма"]
+        invoice = ["счёт", "итого", "ндс", "покупатель"]
+        letter = ["уважаемый", "письмо", "запрос", "коллега"]
+
+        def sample(words):
+            # Часть документов почти без признаков класса
+            return " ".join(rng.choices(shared, k=10) + rng.choices(words, k=rng.randint(0, 2)))
+
+        samples = [(sample(invoice), "invoice") for _ in range(200)]
+        samples += [(sample(letter), "correspondence") for _ in range(200)]
+        classifier = LocalDocumentClassifier()
+        classifier.fit(samples)
+
+        clear = classifier.predict("счёт итого ндс покупатель итого ндс")
+        ambiguous = classifier.predict(" ".join(shared) + " счёт письмо")
+        assert clear["doc_type"] == "invoice"
+        assert ambiguous["confidence"] < 0.85 <= clear["confidence"] < 1.0
+
+    def test_uncalibrated_model_escalates(self):
+        """Без отложенной выборки уверенность модели ниже порога эскалации"""
+        classifier = LocalDocumentClassifier()
+        classifier.fit([("счёт итого ндс", "invoice")] * 3 + [("уважаемый коллега письмо", "correspondence")] * 3)
+
+        assert classifier.predict("счёт итого")["confidence"] == UNCALIBRATED_MODEL_CONFIDENCE
+
+    def test_history_excludes_own_predictions(self, tmp_path):
+        """Обучение только на разметке LLM и ручных исправлениях"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+        Base.metadata.create_all(engine, tables=[
+            User.__table__, Case.__table__, File.__table__, DocumentClassification.__table__,
+        ])
+        db = sessionmaker(bind=engine)()
+        db.add(Case(id="case-1", full_text="", num_documents=0, file_names=[]))
+        rows = [("счёт итого ндс", "invoice", "gigachat"), ("уважаемый коллега письмо", "correspondence", "user"),
+                ("счёт итого ндс", "contract", "local"), ("претензия оплата", "pre_claim", None)]
+        for i, (text, doc_type, source) in enumerate(rows):
+            db.add(File(id=f"f{i}", case_id="case-1", filename=f"f{i}.pdf", file_type="pdf", original_text=text))
+            db.add(DocumentClassification(case_id="case-1", file_id=f"f{i}", doc_type=doc_type, relevance_score=0,
+                                          confidence="0.9", classifier=source))
+        db.commit()
+
+        classifier = LocalDocumentClassifier()
+        assert classifier.train_from_history(db) == 3
+        assert classifier.predict("счёт итого")["doc_type"] == "invoice"
+        db.close()
+
+    def test_no_signal_returns_none(self):
+        """Без признаков локальный классификатор не отвечает"""
+        assert LocalDocumentClassifier().predict(UNCLEAR_TEXT) is None
+
+
+class TestDocumentClassifierServiceEscalation:
+    """Тесты эскалации к LLM и кэша по хешу содержимого"""
+
+    def test_confident_local_result_skips_llm(self):
+        """Уверенный локальный результат не вызывает LLM"""
+        service = make_service(LocalDocumentClassifier())
+        service._init_classifiers = Mock()
+
+        result = service.classify_document(CLAIM_TEXT, "claim.docx")
+
+        assert result["classifier"] == "local"
+        assert result["doc_type"] == "statement_of_claim"
+        service._init_classifiers.assert_not_called()
+
+    def test_low_confidence_escalates_to_llm(self):
+        """При низкой уверенности вызывается удалённый классификатор"""
+        service = make_service(LocalDocumentClassifier())
+        service._init_classifiers = Mock()
+        service._classify_remote = Mock(return_value={
+            "doc_type": "correspondence", "tags": [], "confidence": 0.9,
+            "needs_human_review": False, "reasoning": "llm", "classifier": "gigachat",
+        })
+
+        result = service.classify_document(UNCLEAR_TEXT, "letter.pdf")
+
+        assert result["classifier"] == "gigachat"
+        service._classify_remote.assert_called_once()
+
+    def test_result_cached_by_content_hash(self):
+        """Повторная классификация того же содержимого берётся из кэша"""
+        service = make_service(LocalDocumentClassifier())
+        service._init_classifiers = Mock()
+        service._classify_remote = Mock(return_value={
+            "doc_type": "other", "tags": [], "confidence": 0.8,
+            "needs_human_review": False, "reasoning": "llm", "classifier": "gigachat",
+        })
+
+        service.classify_document(UNCLEAR_TEXT, "a.pdf")
+        service.classify_document(UNCLEAR_TEXT, "copy_of_a.pdf")
+
+        assert service._classify_remote.call_count == 1
+        assert service.cache.get("document_classification", content_hash(UNCLEAR_TEXT))["doc_type"] == "other"
@@ -0,0 +1,120 @@
+"""Тесты параллельного multi-query retrieval"""
+import threading
+import time
+
+import pytest
+
+from langchain_core.documents import Document
+
+from app.services.bm25_retriever import BM25Retriever
+from app.services.document_processor import DocumentProcessor
+from app.services.rag_service import RAGService
+
+
+def chunk(chunk_id, text=None):
+    return Document(page_content=text or chunk_id, metadata={"chunk_id": chunk_id, "source_file": "a.pdf"})
+
+
+class FakeCondenser:
+    def generate_multi_queries(self, query, num_queries):
+        return [query, "вариант 1", "вариант 2"]
+
+
+class FakeProcessor(DocumentProcessor):
+    """hybrid_search с задержкой, как у embed + pgvector + BM25"""
+
+    def __init__(self, results, delay=0.1):
+        self.results = results
+        self.delay = delay
+        self.searches = []
+        self.lock = threading.Lock()
+
+    def hybrid_search(self, case_id, query, k=10, alpha=0.7, db=None):
+        time.sleep(self.delay)
+        with self.lock:
+            self.searches.append(query)
+        return self.results[query]
+
+
+def make_service(processor):
+    service = RAGService.__new__(RAGService)
+    service.document_processor = processor
+    service._query_condenser = FakeCondenser()
+    service._reranker = None
+    return service
+
+
+class TestMultiQueryRetrieval:
+    """Тесты RAGService.retrieve_with_multi_query"""
+
+    def test_variants_run_concurrently(self):
+        """Поиски по вариантам (вместе с их эмбеддингами) идут параллельно"""
+        processor = FakeProcessor({
+            "сроки": [chunk("c1")],
+            "вариант 1": [chunk("c2")],
+            "вариант 2": [chunk("c3")],
+        })
+        service = make_service(processor)
+
+        started = time.perf_counter()
+        docs = service.retrieve_with_multi_query("case-1", "сроки", final_k=5)
+        elapsed = time.perf_counter() - started
+
+        assert sorted(processor.searches) == ["вариант 1", "вариант 2", "сроки"]
+        assert elapsed < 0.25
+        assert [doc.metadata["chunk_id"] for doc in docs] == ["c1", "c2", "c3"]
+
+    def test_weighted_rrf_and_chunk_id_dedup(self):
+        """Чанк из нескольких вариантов поднимается выше, дубликаты по chunk_id схлопываются"""
+        processor = FakeProcessor({
+            "сроки": [chunk("a"), chunk("b")],
+            "вариант 1": [chunk("b", "b (другой экземпляр)"), chunk("c")],
+            "вариант 2": [chunk("c"), chunk("b")],
+        }, delay=0)
+        service = make_service(processor)
+
+        docs = service.retrieve_with_multi_query("case-1", "сроки", final_k=5)
+
+        assert [doc.metadata["chunk_id"] for doc in docs] == ["b", "c", "a"]
+        assert docs[0].page_content == "b"
+        assert docs[0].metadata["multi_query_score"] > docs[1].metadata["multi_query_score"]
+
+    def test_original_query_outweighs_variant(self):
+        """При равном ранге документ исходного запроса выше документа переформулировки"""
+        processor = FakeProcessor({
+            "сроки": [chunk("orig")],
+            "вариант 1": [chunk("var")],
+            "вариант 2": [],
+        }, delay=0)
+
+        docs = make_service(processor).retrieve_with_multi_query("case-1", "сроки", final_k=5)
+
+        assert [doc.metadata["chunk_id"] for doc in docs] == ["orig", "var"]
+
+
+class TestBM25IndexBuild:
+    """Холодный BM25 индекс строится один раз при параллельных поисках"""
+
+    def test_concurrent_searches_build_index_once(self):
+        processor = DocumentProcessor.__new__(DocumentProcessor)
+        processor.bm25_retriever = BM25Retriever()
+        if not processor.bm25_retriever.available:
+            pytest.skip("rank_bm25 not installed")
+        processor._bm25_build_locks = {}
+        processor._bm25_locks_guard = threading.Lock()
+        fetches = []
+
+        def retrieve_relevant_chunks(case_id, query, k=10, db=None):
+            fetches.append(k)
+            time.sleep(0.05)
+            return [chunk(f"c{i}", f"пункт {i} договора поставки") for i in range(12)]
+
+        processor.retrieve_relevant_chunks = retrieve_relevant_chunks
+        threads = [threading.Thread(target=processor._ensure_bm25_index, args=("case-1", [], None)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert fetches == [1000]
+        assert processor.bm25_retriever.has_index("case-1")
@@ -0,0 +1,101 @@
+"""Тесты пула процессов для разбора документов"""
+import io
+import signal
+import threading
+import time
+
+import pytest
+from reportlab.pdfgen import canvas
+
+from app.services import parsing_executor
+from app.services.parsing_executor import ParsingExecutor, ParsingError
+
+
+def make_pdf(num_pages: int) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for i in range(num_pages):
+        pdf.drawString(72, 720, f"Page number {i + 1}")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def hang(seconds: float) -> float:
+    """Задача, которая не реагирует на SIGALRM (как воркер, зависший в C-коде)"""
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def executor():
+    executor = ParsingExecutor(max_workers=2, timeout=30, memory_limit_mb=0, page_parallel_threshold=5, pages_per_task=3)
+    yield executor
+    executor.shutdown()
+
+
+class TestParsingExecutor:
+    """Тесты ParsingExecutor"""
+
+    def test_page_batches(self):
+        """Большой PDF делится на пакеты страниц, маленький - нет"""
+        executor = ParsingExecutor(max_workers=4, page_parallel_threshold=10, pages_per_task=5, use_process_pool=False)
+
+        assert executor.page_batches(8) == [(0, 8)]
+        assert executor.page_batches(23) == [(0, 6), (6, 12), (12, 18), (18, 23)]
+
+    def test_large_pdf_parsed_in_parallel_batches(self, executor):
+        """Страницы из разных пакетов собираются по порядку с метаданными"""
+        documents = executor.load_document_sync(make_pdf(12), "filing.pdf")
+
+        assert len(documents) == 12
+        assert [doc.metadata["source_page"] for doc in documents] == list(range(1, 13))
+        assert "Page number 7" in documents[6].page_content
+        assert documents[0].metadata["source_file"] == "filing.pdf"
+
+    def test_timeout_raises_parsing_error(self, executor):
+        """Задача, превысившая таймаут, прерывается с ParsingError"""
+        executor.timeout = 0.5
+        start = time.monotonic()
+
+        with pytest.raises(ParsingError):
+            executor._run("slow.pdf", time.sleep, 10)
+
+        assert time.monotonic() - start < 8
+
+    def test_stuck_file_does_not_break_other_files(self, monkeypatch):
+        """Зависший файл не роняет разбор других файлов в том же пуле"""
+        monkeypatch.setattr(parsing_executor, "TIMEOUT_GRACE_SECONDS", 0.5)
+        executor = ParsingExecutor(max_workers=2, timeout=2, memory_limit_mb=0)
+        results = {}
+
+        def parse_other():
+            time.sleep(3.5)  # стартует незадолго до дедлайна зависшего файла (2 * 2 + 0.5 с)
+            results["other"] = executor._run("other.pdf", time.sleep, 1.8)
+
+        other = threading.Thread(target=parse_other)
+        other.start()
+        try:
+            with pytest.raises(ParsingError, match="Превышено время"):
+                executor._run("stuck.pdf", hang, 30)
+            stuck_pool = next(iter(executor._retired.keys()))
+            other.join(timeout=30)
+
+            assert "other" in results
+            assert executor._run("next.pdf", time.sleep, 0) is None
+            deadline = time.monotonic() + 10
+            while any(p.is_alive() for p in (stuck_pool._processes or {}).values()) and time.monotonic() < deadline:
+                time.sleep(0.1)
+            assert not any(p.is_alive() for p in (stuck_pool._processes or {}).values())
+        finally:
+            other.join(timeout=30)
+            executor.shutdown()
+
+    def test_inline_mode_parses_text(self):
+        """Без пула процессов разбор выполняется в вызывающем потоке"""
+        executor = ParsingExecutor(use_process_pool=False)
+
+        assert executor.parse_text_sync("Договор поставки".encode("utf-8"), "a.txt") == "Договор поставки"
+        with pytest.raises(ParsingError):
+            executor.parse_text_sync(b"data", "a.exe")
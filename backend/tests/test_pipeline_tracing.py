@@ -0,0 +1,141 @@
+"""Тесты трейсинга этапов RAG/чат-пайплайна"""
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from langchain_core.documents import Document
+from starlette.testclient import TestClient
+
+from app.middleware import metrics, request_context
+from app.middleware.request_context import RequestContextMiddleware
+from app.services.document_processor import DocumentProcessor
+from app.services.metrics import tracing
+from app.services.metrics.tracing import (
+    get_current_trace,
+    mark_stage,
+    start_trace,
+    finish_trace,
+    trace_span,
+    trace_sse_stream,
+    traced,
+)
+
+
+class FakeBM25:
+    def has_index(self, case_id):
+        return True
+
+    def retrieve(self, case_id, query, k=10):
+        return [Document(page_content="b", metadata={"source_file": "b.pdf", "chunk_index": 0})]
+
+
+class TestPipelineTracing:
+    """Тесты трейсинга этапов"""
+
+    def test_spans_are_linked_to_request(self):
+        """Этапы попадают в трейс запроса с correlation ID и шаблоном маршрута"""
+        app = FastAPI()
+        seen = {}
+
+        @traced("condense")
+        def condense():
+            return "q"
+
+        @app.get("/cases/{case_id}/search")
+        async def search(case_id: str):
+            condense()
+            with trace_span("embed"):
+                pass
+            trace = get_current_trace()
+            seen["route"] = trace.route
+            seen["correlation_id"] = trace.correlation_id
+            return {"ok": True}
+
+        app.add_middleware(RequestContextMiddleware)
+        response = TestClient(app).get("/cases/42/search", headers={"X-Correlation-ID": "corr-7"})
+
+        assert response.status_code == 200
+        assert seen == {"route": "/cases/{case_id}/search", "correlation_id": "corr-7"}
+        timing = response.headers["Server-Timing"]
+        assert "condense;dur=" in timing and "embed;dur=" in timing
+        assert get_current_trace() is None
+
+    def test_sse_first_and_last_token(self):
+        """first_token отмечается на первом textDelta, last_token - в конце потока"""
+        async def events():
+            yield 'data: {"type": "reasoning"}\n\n'
+            await asyncio.sleep(0.01)
+            yield 'data: {"textDelta": "a"}\n\n'
+            yield 'data: {"textDelta": "b"}\n\n'
+            await asyncio.sleep(0.01)
+
+        async def run():
+            token = start_trace("corr-sse")
+            chunks = [chunk async for chunk in trace_sse_stream(events())]
+            return chunks, finish_trace(token)
+
+        chunks, trace = asyncio.run(run())
+
+        assert len(chunks) == 3
+        stages = {stage: duration for stage, _, duration in trace.spans}
+        assert list(stages) == ["first_token", "last_token"]
+        assert 0.01 <= stages["first_token"] < stages["last_token"]
+
+    def test_streaming_response_records_tokens(self, monkeypatch):
+        """Отметки SSE доходят до трейса запроса через StreamingResponse"""
+        app = FastAPI()
+        traces = []
+        original_finish = tracing.finish_trace
+
+        async def events():
+            yield 'data: {"textDelta": "x"}\n\n'
+
+        @app.post("/chat")
+        async def chat():
+            return StreamingResponse(trace_sse_stream(events()), media_type="text/event-stream")
+
+        def capture(token):
+            trace = original_finish(token)
+            traces.append(trace)
+            return trace
+
+        app.add_middleware(RequestContextMiddleware)
+        monkeypatch.setattr(request_context, "finish_trace", capture)
+        TestClient(app).post("/chat")
+
+        assert [stage for stage, _, _ in traces[0].spans] == ["first_token", "last_token"]
+        assert traces[0].route == "/chat"
+
+    def test_mark_outside_request_is_noop(self):
+        """Вне запроса отметки игнорируются, span'ы пишутся только в гистограмму"""
+        assert mark_stage("first_token") is None
+        with trace_span("rerank"):
+            pass
+
+    def test_hybrid_search_stages(self):
+        """hybrid_search пишет этапы bm25 и rrf"""
+        processor = DocumentProcessor.__new__(DocumentProcessor)
+        processor.bm25_retriever = FakeBM25()
+        processor.retrieve_relevant_chunks = lambda **kwargs: [Document(page_content="a", metadata={"source_file": "a.pdf", "chunk_index": 0})]
+
+        token = start_trace("corr-hybrid")
+        docs = processor.hybrid_search(case_id="c1", query="q", k=2)
+        trace = finish_trace(token)
+
+        assert len(docs) == 2
+        assert [stage for stage, _, _ in trace.spans] == ["bm25", "rrf"]
+
+    def test_request_duration_quantiles_use_buckets(self):
+        """avg/p95 считаются по бакетам без хранения сырых длительностей"""
+        metrics.reset_metrics()
+        for _ in range(90):
+            metrics.record_request(0.02, method="GET", route="/api/x", status=200)
+        for _ in range(10):
+            metrics.record_request(2.0, method="GET", route="/api/x", status=200)
+
+        result = metrics.get_metrics()
+
+        assert result["request_count"] == 100
+        assert result["avg_request_duration"] == round((90 * 0.02 + 10 * 2.0) / 100, 3)
+        assert result["p95_request_duration"] == 2.5
+        metrics.reset_metrics()
@@ -0,0 +1,174 @@
+"""Тесты PlaybookChecker: кэш извлечения пунктов и параллельная проверка"""
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.config import config
+from app.models.case import Base, Case, File
+from app.models.playbook import ClauseExtractionCache, Playbook, PlaybookCheck, PlaybookRule
+from app.models.user import User
+from app.services import clause_extractor as clause_extractor_module
+from app.services import playbook_checker as playbook_checker_module
+from app.services.playbook_checker import PlaybookChecker
+
+CONTRACT_A = "Договор поставки №1. Стороны обязуются сохранять конфиденциальность."
+CONTRACT_B = "Договор услуг №2. Договор может быть расторгнут с уведомлением за 30 дней."
+
+
+class CountingLLM:
+    """Фейковая LLM: считает полные извлечения и извлечения по категории"""
+
+    def __init__(self, delay=0.01, broken=False):
+        self.delay = delay
+        self.broken = broken
+        self.full_extractions = 0
+        self.category_extractions = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def _respond(self, prompt_value):
+        prompt = prompt_value.to_string()
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if "Извлеки ВСЕ значимые пункты" not in prompt:
+            self.category_extractions += 1
+            return AIMessage(content=json.dumps({"found": False, "reason": "нет"}))
+        self.full_extractions += 1
+        if self.broken:
+            return AIMessage(content="не JSON")
+        return AIMessage(content=json.dumps({
+            "document_type": "contract",
+            "parties": ["ООО Ромашка", "ООО Лютик"],
+            "clauses": [
+                {"category": "confidentiality", "title": "п. 1", "text": "Стороны сохраняют конфиденциальность"},
+                {"category": "termination", "title": "п. 2", "text": "Расторжение с уведомлением за 30 дней"},
+            ],
+        }, ensure_ascii=False))
+
+    def runnable(self):
+        return RunnableLambda(self._respond)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'playbooks.db'}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def register_now(dbapi_connection, _):
+        dbapi_connection.create_function("NOW", 0, lambda: datetime.utcnow().isoformat())
+
+    Base.metadata.create_all(engine, tables=[
+        User.__table__, Case.__table__, File.__table__,
+        Playbook.__table__, PlaybookRule.__table__, PlaybookCheck.__table__, ClauseExtractionCache.__table__,
+    ])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(Case(id="case-1", user_id="user-1", full_text="", num_documents=3, file_names=[]))
+    db.add_all([
+        File(id="file-a", case_id="case-1", filename="a.pdf", file_type="pdf", original_text=CONTRACT_A),
+        File(id="file-a-copy", case_id="case-1", filename="a-copy.pdf", file_type="pdf", original_text=CONTRACT_A),
+        File(id="file-b", case_id="case-1", filename="b.pdf", file_type="pdf", original_text=CONTRACT_B),
+    ])
+    playbook = Playbook(id="pb-1", name="nda", display_name="NDA", document_type="contract", user_id="user-1")
+    playbook.rules = [
+        PlaybookRule(id=f"rule-{category}", rule_type="red_line", clause_category=category,
+                     rule_name=category, condition_type="must_exist", condition_config={}, priority=i)
+        for i, category in enumerate(["confidentiality", "termination"])
+    ]
+    db.add(playbook)
+    db.commit()
+    db.close()
+    return factory
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = CountingLLM()
+    for module in (clause_extractor_module, playbook_checker_module):
+        monkeypatch.setattr(module, "create_llm", lambda **kwargs: fake.runnable())
+    return fake
+
+
+def run_batch(factory, document_ids):
+    db = factory()
+    try:
+        return asyncio.run(PlaybookChecker(db).batch_check(document_ids, "pb-1", "user-1", "case-1"))
+    finally:
+        db.close()
+
+
+class TestClauseExtractionCache:
+    """Пункты извлекаются один раз на уникальный текст документа"""
+
+    def test_extraction_once_per_unique_document(self, session_factory, llm):
+        documents = ["file-a", "file-a-copy", "file-b"]
+
+        first = run_batch(session_factory, documents)
+        second = run_batch(session_factory, documents)
+
+        assert llm.full_extractions == 2
+        assert [r.document_id for r in first] == documents
+        assert all(r.overall_status == "compliant" for r in first + second)
+        assert [len(r.extracted_clauses) for r in second] == [2, 2, 2]
+        db = session_factory()
+        assert db.query(ClauseExtractionCache).count() == 2
+        assert db.query(PlaybookCheck).filter(PlaybookCheck.overall_status == "compliant").count() == 6
+
+    def test_extractor_version_is_part_of_key(self, session_factory, llm, monkeypatch):
+        run_batch(session_factory, ["file-a"])
+        monkeypatch.setattr(playbook_checker_module, "CLAUSE_EXTRACTOR_VERSION", "2-test")
+
+        run_batch(session_factory, ["file-a"])
+
+        assert llm.full_extractions == 2
+
+    def test_failed_extraction_is_not_cached(self, session_factory, llm):
+        llm.broken = True
+
+        run_batch(session_factory, ["file-a"])
+        run_batch(session_factory, ["file-a"])
+
+        assert llm.full_extractions == 2
+        assert session_factory().query(ClauseExtractionCache).count() == 0
+
+
+class TestParallelChecks:
+    """Правила и документы проверяются параллельно с ограничением"""
+
+    def test_rules_bounded_by_semaphore(self, session_factory, llm, monkeypatch):
+        monkeypatch.setattr(config, "PLAYBOOK_RULE_CONCURRENCY", 2)
+        db = session_factory()
+        # Категорий нет среди извлечённых - каждое правило делает LLM-вызов
+        for i in range(5):
+            db.add(PlaybookRule(id=f"rule-missing-{i}", playbook_id="pb-1", rule_type="fallback",
+                                clause_category=f"missing_{i}", rule_name=f"missing {i}",
+                                condition_type="must_exist", condition_config={}, priority=10 + i))
+        db.commit()
+        db.close()
+
+        [result] = run_batch(session_factory, ["file-b"])
+
+        assert llm.category_extractions == 5
+        assert llm.peak == 2
+        assert [r.rule_id for r in result.results] == (
+            ["rule-confidentiality", "rule-termination"] + [f"rule-missing-{i}" for i in range(5)]
+        )
+        assert result.overall_status == "needs_review"
+
+    def test_documents_checked_concurrently(self, session_factory, llm, monkeypatch):
+        monkeypatch.setattr(config, "PLAYBOOK_DOCUMENT_CONCURRENCY", 3)
+
+        results = run_batch(session_factory, ["file-a", "file-b", "missing"])
+
+        assert llm.peak == 2
+        assert [r.overall_status for r in results] == ["compliant", "compliant", "failed"]
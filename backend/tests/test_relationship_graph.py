@@ -0,0 +1,224 @@
+"""Тесты материализованного графа связей: степени, страницы, эго-граф, сообщества"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.analysis import (
+    EntityPosting, ExtractedEntity, RelationshipEdge, RelationshipGraphState, RelationshipNode,
+)
+from app.models.case import Base, Case, File
+from app.models.user import User
+from app.services.entity_index import install_entity_index_hooks, reindex_file
+from app.services.relationship_graph import (
+    StaleCursorError,
+    decode_cursor,
+    ensure_communities,
+    get_communities,
+    get_graph_page,
+    get_neighborhood,
+    install_relationship_graph_hooks,
+    label_propagation,
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    install_entity_index_hooks()
+    install_relationship_graph_hooks()
+    engine = create_engine(f"sqlite:///{tmp_path / 'graph.db'}")
+    Base.metadata.create_all(engine, tables=[
+        User.__table__, Case.__table__, File.__table__, ExtractedEntity.__table__, EntityPosting.__table__,
+        RelationshipNode.__table__, RelationshipEdge.__table__, RelationshipGraphState.__table__,
+    ])
+    session = sessionmaker(bind=engine)()
+    session.add(Case(id="case-1", full_text="", num_documents=0, file_names=[]))
+    session.add_all([File(id=f"f{i}", case_id="case-1", filename=f"f{i}.pdf", file_type="pdf",
+                         original_text="") for i in range(4)])
+    session.commit()
+    yield session
+    session.close()
+
+
+def add_graph(db, edges):
+    """Узлы a..z и рёбра через ORM"""
+    names = sorted({name for edge in edges for name in edge})
+    db.add_all([RelationshipNode(case_id="case-1", node_id=name, node_type="Person", node_label=name.upper())
+                for name in names])
+    db.add_all([RelationshipEdge(case_id="case-1", source_node_id=source, target_node_id=target,
+                                 relationship_type="knows") for source, target in edges])
+    db.commit()
+
+
+def degrees(db):
+    return {node.node_id: node.degree for node in db.query(RelationshipNode).all()}
+
+
+def version(db):
+    db.expire_all()
+    return db.get(RelationshipGraphState, "case-1").version
+
+
+class TestMaterializedGraph:
+    """Степени и рёбра упоминаний поддерживаются инкрементально"""
+
+    def test_orm_edges_maintain_degree(self, db):
+        add_graph(db, [("a", "b"), ("a", "c")])
+        assert degrees(db) == {"a": 2, "b": 1, "c": 1}
+
+        before = version(db)
+        db.delete(db.query(RelationshipEdge).filter_by(target_node_id="c").one())
+        db.commit()
+        db.expire_all()
+        assert degrees(db) == {"a": 1, "b": 1, "c": 0}
+        assert version(db) > before
+
+        # Узел, сохранённый после своих рёбер, получает степень из БД
+        db.add(RelationshipEdge(case_id="case-1", source_node_id="a", target_node_id="d", relationship_type="knows"))
+        db.commit()
+        db.add(RelationshipNode(case_id="case-1", node_id="d", node_type="Person", node_label="D"))
+        db.commit()
+        db.expire_all()
+        assert degrees(db)["d"] == 1 and degrees(db)["a"] == 2
+
+    def test_entity_extraction_builds_mention_edges(self, db):
+        entities = [ExtractedEntity(case_id="case-1", file_id=file_id, entity_text=text, entity_type="ORG")
+                    for file_id, text in [("f0", "ООО Ромашка"), ("f0", "ооо  ромашка"), ("f1", "ООО Ромашка")]]
+        db.add_all(entities)
+        db.commit()
+
+        assert degrees(db) == {"entity:ооо ромашка": 2, "document:f0": 1, "document:f1": 1}
+        node = db.query(RelationshipNode).filter_by(node_id="entity:ооо ромашка").one()
+        assert (node.node_type, node.node_label) == ("ORG", "ООО Ромашка")
+        assert db.query(RelationshipNode).filter_by(node_id="document:f0").one().node_label == "f0.pdf"
+
+        # Ребро исчезает вместе с последним упоминанием, осиротевший узел документа удаляется
+        db.delete(entities[0])
+        db.commit()
+        assert db.query(RelationshipEdge).count() == 2
+        db.delete(entities[1])
+        db.commit()
+        db.expire_all()
+        assert degrees(db) == {"entity:ооо ромашка": 1, "document:f1": 1}
+
+    def test_reindex_file_syncs_mentions(self, db):
+        db.bulk_save_objects([
+            ExtractedEntity(case_id="case-1", file_id="f2", entity_text=text, entity_type="PERSON")
+            for text in ["Иванов И.И.", "Петров П.П."]
+        ])
+        db.commit()
+        assert db.query(RelationshipEdge).count() == 0
+
+        reindex_file(db, "case-1", "f2")
+        db.commit()
+        assert degrees(db) == {"entity:иванов и.и.": 1, "entity:петров п.п.": 1, "document:f2": 2}
+
+        db.query(ExtractedEntity).filter_by(entity_text="Петров П.П.").delete()
+        reindex_file(db, "case-1", "f2")
+        db.commit()
+        db.expire_all()
+        assert degrees(db) == {"entity:иванов и.и.": 1, "document:f2": 1}
+
+
+class TestGraphQueries:
+    """Страницы, эго-граф и сообщества"""
+
+    EDGES = [("a", "b"), ("a", "c"), ("a", "d"), ("b", "c"), ("d", "e"), ("e", "f"), ("x", "y")]
+
+    def test_pages_return_every_edge_once(self, db):
+        add_graph(db, self.EDGES)
+
+        nodes, links, cursor = [], [], None
+        while True:
+            page = get_graph_page(db, "case-1", limit=3, cursor=cursor)
+            nodes += [node["id"] for node in page["nodes"]]
+            # Ребро приходит только когда оба конца уже отданы
+            links += [(link["source"], link["target"]) for link in page["links"]]
+            assert all(source in nodes and target in nodes for source, target in links)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert nodes[:2] == ["a", "b"] and sorted(nodes) == sorted("abcdefxy")
+        assert sorted(links) == sorted(self.EDGES)
+        assert page["total_nodes"] == 8
+        with pytest.raises(ValueError):
+            decode_cursor("not-a-cursor")
+
+    def test_cursor_expires_when_graph_changes(self, db):
+        add_graph(db, self.EDGES)
+        page = get_graph_page(db, "case-1", limit=3)
+
+        db.add(RelationshipEdge(case_id="case-1", source_node_id="y", target_node_id="b", relationship_type="knows"))
+        db.commit()
+
+        with pytest.raises(StaleCursorError):
+            get_graph_page(db, "case-1", limit=3, cursor=page["next_cursor"])
+        assert get_graph_page(db, "case-1", limit=3)["version"] == version(db)
+
+    def test_communities_of_unversioned_graph(self, db):
+        db.add_all([RelationshipNode(case_id="case-1", node_id=name, node_type="Person", node_label=name)
+                    for name in "ab"])
+        db.commit()
+        db.query(RelationshipGraphState).delete()
+        db.commit()
+
+        ensure_communities(db, "case-1")
+        ensure_communities(db, "case-1")
+
+        state = db.get(RelationshipGraphState, "case-1")
+        assert (state.version, state.communities_version) == (0, 0)
+
+    def test_min_degree_prunes_nodes_and_edges(self, db):
+        add_graph(db, self.EDGES)
+
+        page = get_graph_page(db, "case-1", min_degree=2)
+
+        assert sorted(node["id"] for node in page["nodes"]) == ["a", "b", "c", "d", "e"]
+        assert ("d", "e") in [(link["source"], link["target"]) for link in page["links"]]
+        assert all(link["target"] != "f" for link in page["links"])
+
+    def test_neighborhood(self, db):
+        add_graph(db, self.EDGES)
+
+        result = get_neighborhood(db, "case-1", "d", depth=2)
+
+        distances = {node["id"]: node["distance"] for node in result["nodes"]}
+        assert distances == {"d": 0, "a": 1, "e": 1, "b": 2, "c": 2, "f": 2}
+        assert len(result["links"]) == 6 and not result["truncated"]
+
+        limited = get_neighborhood(db, "case-1", "d", depth=2, max_nodes=3)
+        assert limited["truncated"] and {node["id"] for node in limited["nodes"]} == {"d", "a", "e"}
+        assert get_neighborhood(db, "case-1", "missing") is None
+
+    def test_communities_cached_until_graph_changes(self, db):
+        add_graph(db, self.EDGES)
+
+        result = get_communities(db, "case-1")
+
+        # Треугольник abc, цепочка def (мост a-d) и отдельная пара xy
+        communities = {community["representative"]: community for community in result["communities"]}
+        assert {name: community["size"] for name, community in communities.items()} == {"a": 3, "d": 3, "x": 2}
+        assert [({link["source"], link["target"]}, link["weight"]) for link in result["links"]] == [
+            ({communities["a"]["id"], communities["d"]["id"]}, 1)
+        ]
+        state = db.get(RelationshipGraphState, "case-1")
+        assert state.communities_version == state.version
+
+        members = get_graph_page(db, "case-1", community=communities["x"]["id"])
+        assert sorted(node["id"] for node in members["nodes"]) == ["x", "y"]
+        assert [(link["source"], link["target"]) for link in members["links"]] == [("x", "y")]
+
+        db.add(RelationshipEdge(case_id="case-1", source_node_id="f", target_node_id="x", relationship_type="knows"))
+        db.commit()
+        assert version(db) > state.communities_version
+        assert sum(community["size"] for community in get_communities(db, "case-1")["communities"]) == 8
+
+    def test_label_propagation_splits_bridged_cliques(self):
+        edges = [("a1", "a2"), ("a1", "a3"), ("a2", "a3"), ("b1", "b2"), ("b1", "b3"), ("b2", "b3"), ("a3", "b1")]
+        nodes = sorted({node for edge in edges for node in edge})
+
+        labels = label_propagation(nodes, edges)
+
+        assert labels["a1"] == labels["a2"] == labels["a3"]
+        assert labels["b1"] == labels["b2"] == labels["b3"]
+        assert labels["a1"] != labels["b1"]
@@ -0,0 +1,155 @@
+"""Тесты RequestContextMiddleware (pure ASGI)"""
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.logging import get_correlation_id
+from app.core.rate_limiter import RateLimiter
+from app.middleware import request_context
+from app.middleware.request_context import RequestContextMiddleware
+
+
+async def json_endpoint(request):
+    return JSONResponse({"correlation_id": get_correlation_id()})
+
+
+def build_app(middleware=True, stream=None, **kwargs):
+    routes = [Route("/json", json_endpoint)]
+    if stream is not None:
+        routes.append(Route("/stream", stream))
+    app = Starlette(routes=routes)
+    if middleware:
+        app.add_middleware(RequestContextMiddleware, **kwargs)
+    return app
+
+
+async def call(app, path, on_message=None):
+    """Вызвать ASGI-приложение напрямую, без сети"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"test")],
+        "client": ("127.0.0.1", 1234), "server": ("test", 80),
+    }
+    received = False
+    disconnect = asyncio.Event()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if on_message:
+            on_message(message)
+
+    await app(scope, receive, send)
+
+
+class TestRequestContextMiddleware:
+    """Тесты RequestContextMiddleware"""
+
+    def test_correlation_id_and_headers(self):
+        """Correlation ID из запроса доступен в обработчике и возвращается в заголовках"""
+        client = TestClient(build_app())
+
+        response = client.get("/json", headers={"X-Correlation-ID": "corr-1"})
+
+        assert response.json() == {"correlation_id": "corr-1"}
+        assert response.headers["X-Correlation-ID"] == "corr-1"
+        assert "X-Process-Time" in response.headers
+        assert "unsafe-eval" in response.headers["Content-Security-Policy"]
+        assert get_correlation_id() is None
+
+        generated = client.get("/json")
+        assert generated.headers["X-Correlation-ID"] == generated.json()["correlation_id"]
+
+    def test_streaming_body_is_not_buffered(self):
+        """Чанки SSE доходят до клиента до завершения генератора"""
+        first_chunk_sent = asyncio.Event()
+
+        async def stream(request):
+            async def chunks():
+                yield "data: 1\n\n"
+                # Продолжаем только после того, как клиент получил первый чанк
+                await asyncio.wait_for(first_chunk_sent.wait(), timeout=1.0)
+                yield "data: 2\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        bodies = []
+
+        def on_message(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                bodies.append(message["body"])
+                first_chunk_sent.set()
+
+        asyncio.run(call(build_app(stream=stream), "/stream", on_message))
+
+        assert bodies == [b"data: 1\n\n", b"data: 2\n\n"]
+
+    def test_rate_limit(self, monkeypatch):
+        """При превышении лимита возвращается 429 с Retry-After"""
+        limiter = RateLimiter()
+        limiter._endpoint_configs["/json"] = {"window_size": 60, "max_requests": 2}
+        monkeypatch.setattr(request_context, "get_rate_limiter", lambda: limiter)
+        client = TestClient(build_app(rate_limit=True))
+
+        statuses = [client.get("/json").status_code for _ in range(3)]
+        limited = client.get("/json")
+
+        assert statuses == [200, 200, 429]
+        assert limited.status_code == 429
+        assert "Retry-After" in limited.headers
+        assert "X-Correlation-ID" in limited.headers
+
+    def test_rate_limited_response_has_cors_headers(self, monkeypatch):
+        """CORS снаружи RequestContextMiddleware: браузер видит 429, а не ошибку CORS"""
+        limiter = RateLimiter()
+        limiter._endpoint_configs["/json"] = {"window_size": 60, "max_requests": 1}
+        monkeypatch.setattr(request_context, "get_rate_limiter", lambda: limiter)
+        app = build_app(rate_limit=True)
+        app.add_middleware(CORSMiddleware, allow_origins=["http://frontend"], allow_credentials=True,
+                           allow_methods=["*"], allow_headers=["*"])
+        client = TestClient(app)
+
+        client.get("/json", headers={"Origin": "http://frontend"})
+        limited = client.get("/json", headers={"Origin": "http://frontend"})
+
+        assert limited.status_code == 429
+        assert limited.headers["Access-Control-Allow-Origin"] == "http://frontend"
+
+    def test_overhead_microbenchmark(self):
+        """Накладные расходы на запрос меньше, чем у одного BaseHTTPMiddleware"""
+        async def passthrough(request, call_next):
+            return await call_next(request)
+
+        legacy = build_app(middleware=False)
+        legacy.add_middleware(BaseHTTPMiddleware, dispatch=passthrough)
+        apps = {"bare": build_app(middleware=False), "asgi": build_app(), "legacy": legacy}
+
+        async def measure(app, requests=300):
+            for _ in range(30):
+                await call(app, "/json")
+            started = time.perf_counter()
+            for _ in range(requests):
+                await call(app, "/json")
+            return (time.perf_counter() - started) / requests
+
+        async def run():
+            return {name: min([await measure(app) for _ in range(3)]) for name, app in apps.items()}
+
+        results = asyncio.run(run())
+        asgi_overhead = results["asgi"] - results["bare"]
+        legacy_overhead = results["legacy"] - results["bare"]
+
+        assert asgi_overhead < legacy_overhead
+        assert asgi_overhead < 0.001
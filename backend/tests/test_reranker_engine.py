@@ -0,0 +1,94 @@
+"""Тесты батчевого reranking с кэшем скоров"""
+import threading
+
+from langchain_core.documents import Document
+
+from app.services.reranker_service import RerankEngine, RerankerService
+
+
+class FakeCrossEncoder:
+    """Cross-encoder: скор = число слов запроса в чанке, запоминает вызовы"""
+
+    def __init__(self):
+        self.calls = []
+        self.threads = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append((list(pairs), batch_size))
+        self.threads.append(threading.current_thread().name)
+        return [float(sum(word in text for word in query.split())) for query, text in pairs]
+
+
+def doc(text, index):
+    return Document(page_content=text, metadata={"source_file": "contract.pdf", "chunk_index": index})
+
+
+class TestRerankEngine:
+    """Тесты RerankEngine и RerankerService"""
+
+    def test_truncates_and_sorts_by_length(self):
+        """Чанки обрезаются до max_length, пары идут в модель по длине, скоры - в исходном порядке"""
+        model = FakeCrossEncoder()
+        engine = RerankEngine(model, max_length=8, batch_size=4)
+        docs = [doc("срок " * 50, 0), doc("срок", 1), doc("срок оплаты", 2)]
+
+        scores = engine.score("срок оплаты", docs)
+
+        pairs, batch_size = model.calls[0]
+        assert batch_size == 4
+        assert [len(text) for _, text in pairs] == sorted(len(text) for _, text in pairs)
+        assert max(len(text) for _, text in pairs) == 8 * 4
+        assert scores == [1.0, 1.0, 2.0]
+        assert model.threads == [threading.current_thread().name]
+
+    def test_score_cache(self):
+        """Повторные пары (query, chunk) не пересчитываются"""
+        model = FakeCrossEncoder()
+        engine = RerankEngine(model)
+        docs = [doc("штраф за просрочку", i) for i in range(3)]
+
+        first = engine.score("штраф", docs)
+        second = engine.score("штраф", docs + [doc("неустойка", 3)])
+        engine.score("неустойка", docs[:1])
+
+        assert second[:3] == first
+        assert [len(pairs) for pairs, _ in model.calls] == [3, 1, 1]
+        assert engine.get_stats()["hits"] == 3
+
+    def test_changed_chunk_text_is_rescored(self):
+        """Чанк с тем же индексом, но новым текстом (переиндексация) пересчитывается"""
+        model = FakeCrossEncoder()
+        engine = RerankEngine(model)
+
+        engine.score("штраф", [doc("штраф за просрочку", 0)])
+        scores = engine.score("штраф", [doc("неустойка за просрочку", 0)])
+
+        assert scores == [0.0]
+        assert len(model.calls) == 2
+
+    def test_cache_is_bounded(self):
+        """Кэш скоров ограничен cache_size"""
+        engine = RerankEngine(FakeCrossEncoder(), cache_size=5)
+
+        engine.score("q", [doc(f"чанк {i}", i) for i in range(20)])
+
+        assert engine.get_stats()["cached_scores"] == 5
+
+    def test_service_ranks_with_engine(self):
+        """RerankerService сортирует по скорам движка и применяет порог"""
+        service = RerankerService(model=FakeCrossEncoder())
+        docs = [doc("аренда", 0), doc("срок аренды оплаты", 1), doc("оплаты", 2)]
+
+        ranked = service.rerank("срок оплаты", docs, top_k=2, score_threshold=1.0)
+
+        assert [d.metadata["chunk_index"] for d, _ in ranked] == [1, 2]
+
+    def test_fallback_without_model(self, monkeypatch):
+        """Без модели используется лексический fallback"""
+        monkeypatch.setattr("app.services.reranker_service.CROSS_ENCODER_AVAILABLE", False)
+        service = RerankerService()
+
+        ranked = service.rerank("срок оплаты", [doc("срок оплаты", 0), doc("прочее", 1)], top_k=1)
+
+        assert service._engine is None
+        assert ranked[0][0].metadata["chunk_index"] == 0
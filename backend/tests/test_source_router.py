@@ -0,0 +1,123 @@
+"""Тесты SourceRouter: потоковый поиск, дедлайны, hedging и дедупликация"""
+import asyncio
+import time
+
+from app.services.external_sources.base_source import BaseSource, SourceResult
+from app.services.external_sources.source_router import SourceRouter
+
+
+class FakeSource(BaseSource):
+    """Источник с управляемой задержкой и ошибками"""
+
+    def __init__(self, name, delays, fail_first=False):
+        super().__init__(name=name, enabled=True)
+        self.delays = list(delays)
+        self.fail_first = fail_first
+        self.calls = 0
+
+    async def initialize(self) -> bool:
+        return True
+
+    async def search(self, query, max_results=10, filters=None, use_cache=True):
+        call = self.calls
+        self.calls += 1
+        delay = self.delays[min(call, len(self.delays) - 1)]
+        await asyncio.sleep(delay)
+        if self.fail_first and call == 0:
+            raise RuntimeError("flaky")
+        return [SourceResult(content=f"{self.name} result {call}", title=self.name, source_name=self.name)]
+
+    async def health_check(self) -> bool:
+        return True
+
+
+class TestSearchStream:
+    """Тесты search_stream"""
+
+    def test_results_arrive_in_completion_order(self):
+        """Быстрые источники отдаются раньше медленных"""
+        router = SourceRouter()
+        router.register_source(FakeSource("slow", [0.2]))
+        router.register_source(FakeSource("fast", [0.01]))
+
+        async def collect():
+            return [name async for name, _ in router.search_stream("q", source_names=["slow", "fast"])]
+
+        assert asyncio.run(collect()) == ["fast", "slow"]
+
+    def test_global_deadline_drops_hung_source(self):
+        """Зависший источник не задерживает ответ дольше дедлайна"""
+        router = SourceRouter()
+        router.register_source(FakeSource("hung", [10]))
+        router.register_source(FakeSource("fast", [0.01]))
+
+        start = time.monotonic()
+        results = asyncio.run(router.search("q", source_names=["hung", "fast"], deadline=0.2))
+
+        assert time.monotonic() - start < 1.0
+        assert len(results["fast"]) == 1
+        assert results["hung"] == []
+
+    def test_per_source_budget(self):
+        """Бюджет источника ограничивает его независимо от дедлайна"""
+        router = SourceRouter()
+        router.register_source(FakeSource("slow", [10]), timeout=0.05)
+
+        results = asyncio.run(router.search("q", source_names=["slow"], deadline=5))
+
+        assert results["slow"] == []
+
+    def test_hedged_request_wins_when_first_is_slow(self):
+        """Hedged-запрос отвечает, пока первый ещё висит"""
+        source = FakeSource("kad", [10, 0.01])
+        router = SourceRouter()
+        router.register_source(source, hedge_after=0.05)
+
+        start = time.monotonic()
+        results = asyncio.run(router.search("q", source_names=["kad"], deadline=5))
+
+        assert time.monotonic() - start < 1.0
+        assert results["kad"][0].content == "kad result 1"
+        assert source.calls == 2
+
+    def test_hedged_request_after_failure(self):
+        """Ошибка первой попытки сразу запускает hedged-запрос"""
+        source = FakeSource("vsrf", [0.0, 0.0], fail_first=True)
+        router = SourceRouter()
+        router.register_source(source, hedge_after=5)
+
+        results = asyncio.run(router.search("q", source_names=["vsrf"]))
+
+        assert len(results["vsrf"]) == 1
+        assert source.calls == 2
+
+
+class TestAggregateResults:
+    """Тесты дедупликации в aggregate_results"""
+
+    def test_near_duplicates_are_removed(self):
+        """Почти одинаковые тексты из разных источников схлопываются"""
+        router = SourceRouter()
+        base = " ".join(f"слово{i}" for i in range(60))
+        results = {
+            "garant": [SourceResult(content=base, title="a", source_name="garant", relevance_score=0.9)],
+            "web": [SourceResult(content=base + " дополнение", title="b", source_name="web", relevance_score=0.5)],
+            "vsrf": [SourceResult(content="совсем другой текст постановления", title="c", source_name="vsrf", relevance_score=0.4)],
+        }
+
+        aggregated = router.aggregate_results(results, dedup_threshold=0.8)
+
+        assert [r.source_name for r in aggregated] == ["garant", "vsrf"]
+
+    def test_distinct_prefix_duplicates_kept(self):
+        """Разные документы с одинаковым началом не считаются дубликатами"""
+        router = SourceRouter()
+        prefix = "Решение арбитражного суда " * 20
+        results = {
+            "kad": [
+                SourceResult(content=prefix + " ".join(f"а{i}" for i in range(200)), title="1", source_name="kad", relevance_score=0.9),
+                SourceResult(content=prefix + " ".join(f"б{i}" for i in range(200)), title="2", source_name="kad", relevance_score=0.8),
+            ]
+        }
+
+        assert len(router.aggregate_results(results)) == 2
@@ -0,0 +1,46 @@
+"""Тесты применения нумерованных SQL-миграций командой app.migrate"""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.utils import database
+
+
+@pytest.fixture
+def migrations(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    directory = tmp_path / "migrations"
+    directory.mkdir()
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "MIGRATIONS_DIR", directory)
+    return engine, directory
+
+
+class TestSqlMigrations:
+    """Миграции с 023 применяются по порядку и ровно один раз"""
+
+    def test_pending_migrations_applied_once(self, migrations):
+        engine, directory = migrations
+        (directory / "022_manual.sql").write_text("CREATE TABLE manual (id INTEGER)")
+        (directory / "024_second.sql").write_text("INSERT INTO counters (name) VALUES ('second')")
+        (directory / "023_first.sql").write_text("CREATE TABLE counters (name VARCHAR(20))")
+        (directory / "README.md").write_text("not a migration")
+
+        assert database.apply_sql_migrations() == ["023_first.sql", "024_second.sql"]
+        assert database.apply_sql_migrations() == []
+
+        with engine.connect() as conn:
+            # Backfill не повторился
+            assert conn.execute(text("SELECT COUNT(*) FROM counters")).scalar() == 1
+        assert "manual" not in inspect(engine).get_table_names()
+
+    def test_failed_migration_is_not_recorded(self, migrations):
+        engine, directory = migrations
+        (directory / "023_broken.sql").write_text("ALTER TABLE missing ADD COLUMN x INTEGER")
+
+        with pytest.raises(Exception):
+            database.apply_sql_migrations()
+
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM schema_migrations")).scalar() == 0
+        (directory / "023_broken.sql").write_text("CREATE TABLE missing (x INTEGER)")
+        assert database.apply_sql_migrations() == ["023_broken.sql"]
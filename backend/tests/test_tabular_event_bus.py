@@ -0,0 +1,200 @@
+"""Тесты шины событий табличного ревью (push вместо polling)"""
+import asyncio
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Case, File, User, TabularReview, TabularColumn, TabularCell
+from app.services import tabular_event_bus
+from app.services.event_broker import InMemoryBroker, PostgresNotifyBroker
+from app.services.tabular_event_bus import (
+    TabularEventBus,
+    install_session_hooks,
+    MAX_IDS_PER_EVENT,
+    _split_event,
+)
+
+
+class FakeManager:
+    """WebSocketManager с фиксированным числом подписчиков"""
+
+    def __init__(self, viewers):
+        self.viewers = viewers
+        self.broadcasts = []
+
+    def get_connection_count(self, review_id):
+        return self.viewers.get(review_id, 0)
+
+    async def broadcast_local(self, review_id, message, exclude_connection_id=None):
+        # Одна рассылка доходит до всех подписчиков таблицы
+        self.broadcasts.append((review_id, message))
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tabular.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[
+        User.__table__, Case.__table__, File.__table__,
+        TabularReview.__table__, TabularColumn.__table__, TabularCell.__table__,
+    ])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(Case(id="case-1", full_text="", num_documents=2, file_names=["a.pdf", "b.pdf"]))
+    db.add_all([
+        File(id="file-a", case_id="case-1", filename="a.pdf", file_type="pdf", original_text=""),
+        File(id="file-b", case_id="case-1", filename="b.pdf", file_type="pdf", original_text=""),
+    ])
+    db.add(TabularReview(id="review-1", case_id="case-1", user_id="user-1", name="Review"))
+    db.add(TabularColumn(id="col-1", tabular_review_id="review-1", column_label="Сумма", column_type="currency", prompt="?", order_index=0))
+    db.commit()
+    db.close()
+    return factory
+
+
+@pytest.fixture
+def make_bus(session_factory, monkeypatch):
+    install_session_hooks()
+    loaded_sessions = []
+
+    def counting_factory():
+        loaded_sessions.append(1)
+        return session_factory()
+
+    def factory(viewers):
+        manager = FakeManager(viewers)
+        bus = TabularEventBus(broker=InMemoryBroker(), session_factory=counting_factory, manager=manager)
+        monkeypatch.setattr(tabular_event_bus, "_tabular_event_bus", bus)
+        return bus, manager, loaded_sessions
+
+    return factory
+
+
+def write_cells(session_factory, values):
+    db = session_factory()
+    for file_id, value in values.items():
+        db.add(TabularCell(tabular_review_id="review-1", file_id=file_id, column_id="col-1", cell_value=value, status="completed"))
+    db.commit()
+    db.close()
+
+
+class TestTabularEventBus:
+    """Тесты TabularEventBus"""
+
+    def test_commit_is_pushed_once_regardless_of_viewers(self, session_factory, make_bus):
+        """Изменения загружаются один раз на пакет, независимо от числа зрителей"""
+        bus, manager, loaded_sessions = make_bus({"review-1": 10})
+
+        async def run():
+            await bus.start()
+            await asyncio.to_thread(write_cells, session_factory, {"file-a": "100", "file-b": "200"})
+            await asyncio.sleep(0.05)
+            await bus.join()
+            await bus.stop()
+
+        asyncio.run(run())
+
+        types = [message["type"] for _, message in manager.broadcasts]
+        assert types.count("cell_updated") == 2
+        assert len(loaded_sessions) == 1
+        progress = [m for _, m in manager.broadcasts if m["type"] == "extraction_progress"]
+        assert progress[0]["progress"] == {"column_id": "col-1", "progress": 2, "total": 2}
+
+    def test_column_added_and_review_status(self, session_factory, make_bus):
+        """Новая колонка и смена статуса таблицы публикуются при commit"""
+        bus, manager, _ = make_bus({"review-1": 1})
+
+        def write():
+            db = session_factory()
+            db.add(TabularColumn(id="col-2", tabular_review_id="review-1", column_label="Дата", column_type="date", prompt="?", order_index=1))
+            db.query(TabularReview).filter(TabularReview.id == "review-1").one().status = "processing"
+            db.commit()
+            db.close()
+
+        async def run():
+            await bus.start()
+            await asyncio.to_thread(write)
+            await asyncio.sleep(0.05)
+            await bus.join()
+            await bus.stop()
+
+        asyncio.run(run())
+
+        messages = {message["type"]: message for _, message in manager.broadcasts}
+        assert messages["column_added"]["column"]["id"] == "col-2"
+        assert messages["review_status_changed"]["status"] == "processing"
+
+    def test_no_viewers_no_db_load(self, session_factory, make_bus):
+        """Без подписчиков в воркере события не загружаются из БД"""
+        bus, manager, loaded_sessions = make_bus({})
+
+        async def run():
+            await bus.start()
+            write_cells(session_factory, {"file-a": "100"})
+            await bus.join()
+            await bus.stop()
+
+        asyncio.run(run())
+
+        assert manager.broadcasts == []
+        assert loaded_sessions == []
+
+    def test_rollback_is_not_published(self, session_factory, make_bus):
+        """Откаченные изменения не публикуются"""
+        bus, manager, _ = make_bus({"review-1": 1})
+
+        async def run():
+            await bus.start()
+            db = session_factory()
+            db.add(TabularCell(tabular_review_id="review-1", file_id="file-a", column_id="col-1", cell_value="x"))
+            db.flush()
+            db.rollback()
+            db.close()
+            await bus.join()
+            await bus.stop()
+
+        asyncio.run(run())
+
+        assert manager.broadcasts == []
+
+    def test_large_batches_split_for_notify_payload(self):
+        """Большие пакеты id делятся на несколько событий"""
+        cells = [f"cell-{i}" for i in range(MAX_IDS_PER_EVENT * 2 + 5)]
+
+        events = _split_event("review-1", {"cells": cells, "review_status": "completed"})
+
+        assert len(events) == 3
+        assert sum(len(e["cells"]) for e in events) == len(cells)
+        assert events[0]["review_status"] == "completed" and "review_status" not in events[1]
+
+
+class TestPostgresNotifyBroker:
+    """pg_notify уходит из фонового потока, URL SQLAlchemy приводится к libpq"""
+
+    def test_driver_suffix_stripped_for_listener(self):
+        for url in ("postgresql+psycopg://u:p@db:5432/app", "postgresql+psycopg2://u:p@db:5432/app",
+                    "postgresql://u:p@db:5432/app"):
+            assert PostgresNotifyBroker("events", url).database_url == "postgresql://u:p@db:5432/app"
+
+    def test_publish_does_not_block_caller(self, monkeypatch):
+        broker = PostgresNotifyBroker("events", "postgresql://u:p@db/app", poll_interval=0.05)
+        sent, release = [], threading.Event()
+
+        def send(payloads):
+            release.wait(timeout=5)
+            sent.append((threading.get_ident(), list(payloads)))
+
+        monkeypatch.setattr(broker, "_send", send)
+
+        started = time.perf_counter()
+        for i in range(3):
+            broker.publish(f"event-{i}")
+        elapsed = time.perf_counter() - started
+        release.set()
+        broker.stop()
+
+        assert elapsed < 0.5
+        assert [payload for _, batch in sent for payload in batch] == ["event-0", "event-1", "event-2"]
+        assert threading.get_ident() not in {thread for thread, _ in sent}
@@ -0,0 +1,93 @@
+"""Тесты TabularExtractionAgent: обработка ячеек в порядке завершения и дедлайны"""
+import asyncio
+import json
+import time
+
+import pytest
+
+try:
+    from app.services.langchain_agents.agents import tabular_extraction_agent as agent_module
+    from app.services.langchain_agents.agents.tabular_extraction_agent import (
+        ExtractionColumn,
+        TabularExtractionAgent,
+        TabularExtractionConfig,
+    )
+except ImportError as e:  # langgraph/langchain несовместимых версий
+    pytest.skip(f"langchain agents unavailable: {e}", allow_module_level=True)
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class DelayedLLM:
+    """Задержка ответа по имени файла из промпта"""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def ainvoke(self, messages):
+        prompt = messages[0].content
+        delay = next((d for name, d in self.delays.items() if f"Имя файла: {name}.pdf" in prompt), 0.001)
+        await asyncio.sleep(delay)
+        return FakeMessage(json.dumps({"value": "42", "confidence": 0.9, "source_quote": "42"}))
+
+
+def make_agent(monkeypatch, delays, files, timeout=1.0):
+    monkeypatch.setattr(agent_module, "create_llm", lambda **kwargs: DelayedLLM(delays))
+    monkeypatch.setattr(TabularExtractionAgent, "_get_document_text",
+                        lambda self, file_id: (f"{file_id}.pdf", "" if file_id == "empty" else "Сумма 42"))
+    config = TabularExtractionConfig(
+        review_id="r1", case_id="c1", user_id="u1",
+        columns=[ExtractionColumn(id=f"col-{i}", label=f"Колонка {i}", column_type="number", prompt="Сумма")
+                 for i in range(2)],
+        file_ids=files, max_parallel_cells=4, cell_timeout_seconds=timeout,
+    )
+    return TabularExtractionAgent(config, db=None)
+
+
+class TestCompletionOrderExtraction:
+    """Тесты extract_all"""
+
+    def test_results_delivered_in_completion_order(self, monkeypatch):
+        """Медленный первый документ не задерживает остальные ячейки"""
+        agent = make_agent(monkeypatch, {"slow": 0.2}, ["slow", "fast1", "fast2"])
+        delivered = []
+
+        result = asyncio.run(agent.extract_all(on_result=lambda cell: delivered.append(cell.file_id)))
+
+        assert delivered[-2:] == ["slow", "slow"]
+        assert set(delivered[:4]) == {"fast1", "fast2"}
+        # Итоговый порядок - по документам и колонкам
+        assert [r["file_id"] for r in result["successful"]] == ["slow", "slow", "fast1", "fast1", "fast2", "fast2"]
+
+    def test_stuck_cell_times_out_and_is_marked_for_retry(self, monkeypatch):
+        """Дедлайн действует на каждую ячейку; зависшие помечаются для повтора"""
+        agent = make_agent(monkeypatch, {"stuck": 10}, ["stuck", "ok", "empty"], timeout=0.1)
+
+        started = time.perf_counter()
+        result = asyncio.run(agent.extract_all())
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < 1.0
+        assert {(r["file_id"], r["column_id"]) for r in result["needs_retry"]} == {("stuck", "col-0"), ("stuck", "col-1")}
+        assert all(r["needs_retry"] for r in result["needs_retry"])
+        assert [r["file_id"] for r in result["successful"]] == ["ok", "ok"]
+        assert [r["file_id"] for r in result["needs_clarification"]] == ["empty", "empty"]
+        assert result["total_cells"] == 6
+        assert len(agent.pending_retries) == 2
+
+    def test_async_callback_errors_do_not_fail_batch(self, monkeypatch):
+        agent = make_agent(monkeypatch, {}, ["a", "b"])
+        persisted = []
+
+        async def persist(cell):
+            if cell.file_id == "a" and cell.column_id == "col-0":
+                raise RuntimeError("db unavailable")
+            persisted.append((cell.file_id, cell.column_id))
+
+        result = asyncio.run(agent.extract_all(on_result=persist))
+
+        assert len(result["successful"]) == 4
+        assert len(persisted) == 3
@@ -0,0 +1,200 @@
+"""Тесты WebSocketManager: очереди подключений, коалесцирование и рассылка между воркерами"""
+import asyncio
+
+from app.services.event_broker import InMemoryBroker
+from app.services import websocket_manager as websocket_manager_module
+from app.services.websocket_manager import WebSocketManager, coalesce_key
+
+
+class FakeWebSocket:
+    """WebSocket с настраиваемой задержкой отправки"""
+
+    def __init__(self, delay=0.0, block=False):
+        self.delay = delay
+        self.block = block
+        self.sent = []
+        self.closed_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        if self.block:
+            await asyncio.Event().wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_code = code
+
+
+class TestConnectionQueues:
+    """Тесты очередей отправки"""
+
+    def test_slow_client_does_not_block_others(self):
+        """Медленный клиент не задерживает рассылку остальным"""
+        manager = WebSocketManager()
+        slow, fast = FakeWebSocket(block=True), FakeWebSocket()
+
+        async def run():
+            await manager.connect(slow, "review-1", "user-1")
+            await manager.connect(fast, "review-1", "user-2")
+            await asyncio.wait_for(
+                manager.broadcast_to_review("review-1", {"type": "cell_locked", "cell_id": "c1"}),
+                timeout=0.5,
+            )
+            await asyncio.sleep(0.05)
+            await manager.stop()
+
+        asyncio.run(run())
+
+        assert fast.sent == [{"type": "cell_locked", "cell_id": "c1"}]
+        assert slow.sent == []
+
+    def test_cell_updates_are_coalesced(self):
+        """Неотправленные обновления одной ячейки заменяются последним значением"""
+        manager = WebSocketManager()
+        websocket = FakeWebSocket(delay=0.05)
+
+        async def run():
+            connection_id = await manager.connect(websocket, "review-1")
+            await manager.broadcast_local("review-1", {"type": "cell_locked", "cell_id": "c0"})
+            await asyncio.sleep(0.01)
+            for value in range(5):
+                await manager.broadcast_cell_update("review-1", {"cell_id": "c1", "cell_value": str(value)})
+            await manager.broadcast_cell_update("review-1", {"cell_id": "c2", "cell_value": "x"})
+            await manager.senders[connection_id].flush()
+            await asyncio.sleep(0.1)
+            await manager.stop()
+
+        asyncio.run(run())
+
+        updates = [(m["cell_id"], m["cell_value"]) for m in websocket.sent if m["type"] == "cell_updated"]
+        assert updates == [("c1", "4"), ("c2", "x")]
+
+    def test_overflow_drops_oldest_and_disconnects(self, monkeypatch):
+        """При переполнении отбрасываются старые сообщения, затем медленный клиент отключается"""
+        monkeypatch.setattr(websocket_manager_module, "MAX_DROPPED_MESSAGES", 3)
+        monkeypatch.setattr(websocket_manager_module.config, "WEBSOCKET_SEND_QUEUE_SIZE", 4)
+        manager = WebSocketManager()
+        websocket = FakeWebSocket(block=True)
+
+        async def run():
+            connection_id = await manager.connect(websocket, "review-1")
+            sender = manager.senders[connection_id]
+            for i in range(6):
+                await manager.broadcast_local("review-1", {"type": "cell_locked", "cell_id": f"c{i}"})
+            stats = sender.backpressure.get_stats()
+            assert sender.queue_size == 4
+            assert stats["dropped_count"] == 2
+            assert manager.get_connection_count("review-1") == 1
+
+            for i in range(6, 10):
+                await manager.broadcast_local("review-1", {"type": "cell_locked", "cell_id": f"c{i}"})
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+
+        assert manager.get_connection_count("review-1") == 0
+        assert websocket.closed_code == 1013
+
+    def test_drop_budget_resets_when_client_catches_up(self, monkeypatch):
+        """Клиент, догоняющий поток между всплесками, не отключается по суммарному числу потерь"""
+        monkeypatch.setattr(websocket_manager_module, "MAX_DROPPED_MESSAGES", 3)
+        monkeypatch.setattr(websocket_manager_module.config, "WEBSOCKET_SEND_QUEUE_SIZE", 4)
+        manager = WebSocketManager()
+        websocket = FakeWebSocket()
+        gate = asyncio.Event()
+        send_json = websocket.send_json
+
+        async def gated_send_json(message):
+            await gate.wait()
+            await send_json(message)
+
+        websocket.send_json = gated_send_json
+
+        async def run():
+            connection_id = await manager.connect(websocket, "review-1")
+            sender = manager.senders[connection_id]
+            for burst in range(3):
+                for i in range(6):
+                    await manager.broadcast_local("review-1", {"type": "cell_locked", "cell_id": f"b{burst}c{i}"})
+                gate.set()
+                await asyncio.sleep(0.01)
+                gate.clear()
+            return sender.backpressure.get_stats()["dropped_count"]
+
+        dropped = asyncio.run(run())
+
+        assert dropped > 3
+        assert manager.get_connection_count("review-1") == 1
+        assert websocket.closed_code is None
+
+    def test_coalesce_keys(self):
+        """Ключи коалесцирования"""
+        assert coalesce_key({"type": "cell_updated", "cell_id": "c1"}) == ("cell_updated", "c1")
+        assert coalesce_key({"type": "extraction_progress", "progress": {"column_id": "col"}}) == ("extraction_progress", "col")
+        assert coalesce_key({"type": "presence_update"}) == ("presence_update",)
+        assert coalesce_key({"type": "column_added"}) is None
+
+
+class TestCrossWorkerBroadcast:
+    """Тесты рассылки между воркерами"""
+
+    def test_broadcast_reaches_other_worker(self):
+        """Сообщение доходит до подписчиков другого воркера, exclude соблюдается"""
+        # Общий брокер имитирует Postgres NOTIFY: доставка всем подписчикам, включая отправителя
+        subscribers = []
+
+        class SharedBroker(InMemoryBroker):
+            def start(self, callback):
+                subscribers.append(callback)
+
+            def publish(self, payload):
+                for callback in subscribers:
+                    callback(payload)
+
+        worker_a, worker_b = WebSocketManager(SharedBroker()), WebSocketManager(SharedBroker())
+        ws_a, ws_b, ws_sender = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+
+        async def run():
+            await worker_a.start()
+            await worker_b.start()
+            sender_id = await worker_a.connect(ws_sender, "review-1", "user-1")
+            await worker_a.connect(ws_a, "review-1", "user-2")
+            await worker_b.connect(ws_b, "review-1", "user-3")
+            await worker_a.broadcast_cell_lock("review-1", {"cell_id": "c1"}, exclude_connection_id=sender_id)
+            await asyncio.sleep(0.05)
+            await worker_a.stop()
+            await worker_b.stop()
+
+        asyncio.run(run())
+
+        assert ws_a.sent == ws_b.sent == [{"type": "cell_locked", "review_id": "review-1", "cell_id": "c1"}]
+        assert ws_sender.sent == []
+
+    def test_oversized_payload_delivered_locally(self):
+        """Сообщение больше лимита брокера доставляется только в текущем воркере"""
+        published = []
+
+        class LimitedBroker(InMemoryBroker):
+            max_payload_bytes = 100
+
+            def publish(self, payload):
+                published.append(payload)
+
+        manager = WebSocketManager(LimitedBroker())
+        websocket = FakeWebSocket()
+
+        async def run():
+            await manager.start()
+            await manager.connect(websocket, "review-1")
+            await manager.broadcast_to_review("review-1", {"type": "column_added", "column": {"prompt": "x" * 500}})
+            await asyncio.sleep(0.05)
+            await manager.stop()
+
+        asyncio.run(run())
+
+        assert published == []
+        assert len(websocket.sent) == 1
@@ -0,0 +1,148 @@
+"""Тесты DagScheduler (планирование шагов workflow по графу зависимостей)"""
+import asyncio
+import time
+
+import pytest
+
+from app.services.workflows.execution_engine import DagScheduler, parse_tool_limits
+from app.services.workflows.planning_agent import PlanStep
+from app.services.workflows.tool_registry import ToolResult
+
+
+def step(step_id, depends_on=(), tool="rag"):
+    return PlanStep(id=step_id, name=step_id, description="", step_type="tool_call",
+                    tool_name=tool, depends_on=list(depends_on))
+
+
+def run(scheduler):
+    async def collect():
+        return [(kind, s.id, payload) async for kind, s, payload in scheduler.run()]
+    return asyncio.run(collect())
+
+
+class TestDagScheduler:
+    """Тесты DagScheduler"""
+
+    def test_step_starts_when_own_dependencies_ready(self):
+        """Быстрая ветка не ждёт медленного шага другой ветки"""
+        durations = {"slow": 0.3, "fast": 0.01, "after_fast": 0.01}
+        finished_at = {}
+        started = time.perf_counter()
+
+        async def run_step(s):
+            await asyncio.sleep(durations[s.id])
+            finished_at[s.id] = time.perf_counter() - started
+            return ToolResult(success=True)
+
+        steps = [step("slow"), step("fast"), step("after_fast", ["fast"])]
+        events = run(DagScheduler(steps, run_step, max_parallel=4, tool_limits={}, default_tool_limit=4))
+
+        assert finished_at["after_fast"] < finished_at["slow"]
+        assert [e[1] for e in events if e[0] == "completed"] == ["fast", "after_fast", "slow"]
+
+    def test_global_and_per_tool_limits(self):
+        """Одновременно выполняется не больше max_parallel шагов и лимита инструмента"""
+        running = {"all": 0, "tabular_review": 0}
+        peak = {"all": 0, "tabular_review": 0}
+
+        async def run_step(s):
+            keys = ["all"] + ([s.tool_name] if s.tool_name == "tabular_review" else [])
+            for key in keys:
+                running[key] += 1
+                peak[key] = max(peak[key], running[key])
+            await asyncio.sleep(0.02)
+            for key in keys:
+                running[key] -= 1
+            return ToolResult(success=True)
+
+        steps = [step(f"t{i}", tool="tabular_review") for i in range(4)] + [step(f"r{i}") for i in range(6)]
+        events = run(DagScheduler(steps, run_step, max_parallel=3, tool_limits={"tabular_review": 1},
+                                  default_tool_limit=5))
+
+        assert peak == {"all": 3, "tabular_review": 1}
+        assert sum(1 for e in events if e[0] == "completed") == 10
+
+    def test_failure_cancels_descendants_only(self):
+        """Ошибка шага отменяет его потомков, независимые ветки выполняются"""
+        executed = []
+
+        async def run_step(s):
+            executed.append(s.id)
+            if s.id == "a":
+                raise RuntimeError("tool crashed")
+            if s.id == "x":
+                return ToolResult(success=False, error="no documents")
+            return ToolResult(success=True)
+
+        steps = [step("a"), step("b", ["a"]), step("c", ["b"]), step("x"), step("y", ["x"]),
+                 step("z"), step("z2", ["z"])]
+        events = run(DagScheduler(steps, run_step, max_parallel=4, tool_limits={}, default_tool_limit=4))
+        by_kind = {}
+        for kind, step_id, payload in events:
+            by_kind.setdefault(kind, set()).add(step_id)
+
+        assert by_kind["failed"] == {"a", "x"}
+        assert by_kind["cancelled"] == {"b", "c", "y"}
+        assert by_kind["completed"] == {"z", "z2"}
+        assert sorted(executed) == ["a", "x", "z", "z2"]
+
+    def test_deadlock_raises(self):
+        async def run_step(s):
+            return ToolResult(success=True)
+
+        steps = [step("a", ["b"]), step("b", ["a"])]
+        with pytest.raises(RuntimeError, match="deadlock"):
+            run(DagScheduler(steps, run_step, max_parallel=2, tool_limits={}, default_tool_limit=2))
+
+    def test_parse_tool_limits(self):
+        assert parse_tool_limits("tabular_review=1, rag=3,bad,x=y") == {"tabular_review": 1, "rag": 3}
+
+
+class TestExecutionEngineScheduling:
+    """ExecutionEngine.execute поверх DagScheduler"""
+
+    def test_execute_emits_cancelled_steps(self):
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock
+        from app.services.workflows.execution_engine import ExecutionEngine
+        from app.services.workflows.planning_agent import ExecutionPlan
+
+        class FakeRegistry:
+            async def execute_tool(self, tool_name, params, context):
+                if params.get("fail"):
+                    return ToolResult(success=False, error="boom", output_summary="boom")
+                return ToolResult(success=True, data={"step": context["step_id"]}, output_summary="ok")
+
+        engine = ExecutionEngine.__new__(ExecutionEngine)
+        engine.db = MagicMock()
+        engine.planning_agent = MagicMock()
+        step_sessions = []
+
+        def open_step():
+            step_sessions.append(MagicMock())
+            return step_sessions[-1], FakeRegistry()
+
+        engine._open_step = open_step
+        execution = SimpleNamespace(
+            id="exec-1", user_id="u1", case_id="c1", status="pending", started_at=None, completed_at=None,
+            execution_plan=None, progress_percent=0, current_step_id=None, total_steps_completed=0,
+            total_steps_failed=0, total_llm_calls=0, total_tokens_used=0, results=None, artifacts=None,
+            summary=None, error_message=None,
+        )
+        bad = step("bad")
+        bad.tool_params = {"fail": True}
+        plan = ExecutionPlan(goals=[], steps=[step("good"), bad, step("after_bad", ["bad"]), step("join", ["good"])])
+
+        async def collect():
+            return [(e.event_type, e.step_id) async for e in engine.execute(execution, plan)]
+
+        events = asyncio.run(collect())
+
+        assert ("step_failed", "bad") in events
+        assert ("step_cancelled", "after_bad") in events
+        assert ("step_completed", "join") in events
+        assert events[-1][0] == "completed"
+        assert execution.total_steps_completed == 2 and execution.total_steps_failed == 1
+        # Каждый выполненный шаг - в своей сессии, закрытой после шага
+        assert len(step_sessions) == 3
+        assert all(session.close.called for session in step_sessions)